@@ -1,3 +1,23 @@
 from django.contrib import admin
 
+from .models import TokenAPI
+
 # Register your models here.
+
+
+@admin.register(TokenAPI)
+class TokenAPIAdmin(admin.ModelAdmin):
+    """
+    Configura a interface de administração do Django para o modelo
+    TokenAPI.
+
+    Attributes:
+        list_display (tuple): Campos a serem exibidos na listagem
+        do modelo.
+        readonly_fields (tuple): Campos exibidos apenas para leitura.
+        list_filter (tuple): Campos pelos quais a lista pode ser
+        filtrada.
+    """
+    list_display = ('__str__', 'usuario', 'ativo', 'criado_em')
+    readonly_fields = ('chave',)
+    list_filter = ('ativo',)
@@ -0,0 +1,37 @@
+from functools import wraps
+
+from django.http import JsonResponse
+
+from .models import TokenAPI
+
+
+def token_required(view_func):
+    """
+    Decorador que autentica a requisição por token.
+
+    Espera o cabeçalho `Authorization: Token <chave>`. Se a chave
+    pertencer a um token ativo, o usuário do token é atribuído a
+    `request.user`; caso contrário, retorna 401 em JSON.
+
+    Args:
+        view_func (function): A view a ser protegida.
+
+    Returns:
+        function: A view decorada.
+    """
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        cabecalho = request.headers.get('Authorization', '')
+        tipo, _, chave = cabecalho.partition(' ')
+        token = None
+        if tipo == 'Token' and chave:
+            token = TokenAPI.objects.select_related('usuario').filter(
+                chave=chave.strip(),
+                ativo=True,
+                usuario__is_active=True,
+            ).first()
+        if token is None:
+            return JsonResponse({'erro': 'Token inválido.'}, status=401)
+        request.user = token.usuario
+        return view_func(request, *args, **kwargs)
+    return _wrapped_view
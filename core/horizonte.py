@@ -0,0 +1,44 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+
+def horizonte():
+    """
+    Retorna o instante antes do qual todas as alterações datadas já
+    foram confirmadas, para as leituras incrementais por data de
+    alteração ou de criação.
+
+    A data de um registro é preenchida antes da confirmação da sua
+    transação, então uma leitura que avança o cursor até agora pode
+    pular uma transação longa confirmada depois dela. Registros com
+    data anterior ao horizonte, ao contrário, não aparecem mais depois
+    de uma leitura.
+
+    No PostgreSQL, o horizonte é o início da transação de escrita
+    aberta mais antiga (ou agora, se não houver), menos
+    `PRODUTO_ALTERACOES_ATRASO_SEGUNDOS`, que cobre o intervalo entre
+    o preenchimento da data e a primeira escrita da transação. Nos
+    demais bancos, que não informam as transações abertas, é agora
+    menos o atraso, e só transações mais curtas que ele são cobertas.
+
+    Returns:
+        datetime: O horizonte.
+    """
+    inicio = timezone.now()
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT min(xact_start) FROM pg_stat_activity '
+                'WHERE backend_xid IS NOT NULL '
+                'AND datname = current_database() '
+                'AND pid <> pg_backend_pid()'
+            )
+            aberta = cursor.fetchone()[0]
+        if aberta is not None:
+            inicio = min(inicio, aberta)
+    return inicio - timedelta(
+        seconds=settings.PRODUTO_ALTERACOES_ATRASO_SEGUNDOS
+    )
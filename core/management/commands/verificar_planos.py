@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.planos import verificar_consultas
+
+
+class Command(BaseCommand):
+    """
+    Mostra o plano de execução das consultas críticas registradas nos
+    módulos `planos` dos apps e falha se alguma ler uma tabela inteira
+    sem índice.
+
+    Deve rodar depois das migrações, no banco de produção ou em uma
+    cópia, e também roda nos testes do app core.
+
+    Exemplo:
+        python manage.py verificar_planos
+    """
+    help = 'Verifica se as consultas críticas usam índices.'
+
+    def handle(self, *args, **options):
+        falhas = []
+        for nome, (plano, varreduras) in verificar_consultas().items():
+            estilo = self.style.ERROR if varreduras else self.style.SUCCESS
+            self.stdout.write(estilo(nome))
+            for passo in plano:
+                self.stdout.write(f'    {passo}')
+            if varreduras:
+                falhas.append(nome)
+
+        if falhas:
+            raise CommandError(
+                f'Varredura completa em {len(falhas)} consultas: '
+                f'{", ".join(falhas)}.'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            'Nenhuma consulta crítica lê uma tabela inteira.'
+        ))
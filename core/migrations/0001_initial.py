@@ -0,0 +1,33 @@
+# Generated by Django 5.0.7 on 2026-10-18 18:58
+
+import core.models
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenAPI',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('criado_em', models.DateTimeField(auto_now_add=True, verbose_name='criado_em')),
+                ('atualizado_em', models.DateTimeField(auto_now=True, verbose_name='atualizado_em')),
+                ('chave', models.CharField(default=core.models.gerar_chave, editable=False, max_length=40, unique=True)),
+                ('ativo', models.BooleanField(default=True)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tokens_api', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'token da API',
+                'verbose_name_plural': 'tokens da API',
+            },
+        ),
+    ]
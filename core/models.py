@@ -1,3 +1,6 @@
+import secrets
+
+from django.contrib.auth.models import User
 from django.db import models
 
 # Create your models here.
@@ -39,3 +42,53 @@ class TimeStampModel(models.Model):
             abstrato e não será criado no banco de dados. (Opcional)
         """
         abstract = True
+
+
+
+def gerar_chave():
+    """
+    Gera uma chave aleatória para autenticação na API.
+
+    Returns:
+        str: Uma string hexadecimal com 40 caracteres.
+    """
+    return secrets.token_hex(20)
+
+
+class TokenAPI(TimeStampModel):
+    """
+    Token usado por integrações (coletores, ERP) para acessar os
+    endpoints JSON em nome de um usuário.
+
+    Attributes:
+        usuario (ForeignKey): Usuário em nome de quem as requisições
+        são feitas.
+        chave (CharField): Chave enviada no cabeçalho
+        `Authorization: Token <chave>`. Deve ser única.
+        ativo (BooleanField): Indica se o token pode ser usado.
+    """
+    usuario = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='tokens_api'
+    )
+    chave = models.CharField(
+        max_length=40,
+        unique=True,
+        default=gerar_chave,
+        editable=False
+    )
+    ativo = models.BooleanField(default=True)
+
+    class Meta:
+        verbose_name = 'token da API'
+        verbose_name_plural = 'tokens da API'
+
+    def __str__(self):
+        """
+        Retorna a representação em string do token.
+
+        Returns:
+            str: O usuário e o início da chave.
+        """
+        return f'{self.usuario} - {self.chave[:8]}...'
@@ -0,0 +1,65 @@
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+
+class _OrcamentoDeConsultas(CaptureQueriesContext):
+    """
+    Captura as consultas de um bloco e falha se elas passarem do
+    orçamento.
+    """
+
+    def __init__(self, testcase, limite, conexao):
+        self.testcase = testcase
+        self.limite = limite
+        super().__init__(conexao)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        super().__exit__(exc_type, exc_value, traceback)
+        if exc_type is not None:
+            return
+        executadas = len(self)
+        self.testcase.assertLessEqual(
+            executadas,
+            self.limite,
+            f'{executadas} consultas executadas, acima do orçamento de '
+            f'{self.limite}:\n' + '\n'.join(
+                f'{i}. {consulta["sql"]}'
+                for i, consulta in enumerate(self.captured_queries, 1)
+            )
+        )
+
+
+class OrcamentoDeConsultasMixin:
+    """
+    Mixin de TestCase que falha quando um trecho executa mais consultas
+    que o orçamento declarado, listando as consultas executadas.
+
+    Diferente de `assertNumQueries`, o teste não quebra quando uma
+    otimização reduz as consultas; ele pega as regressões, como uma
+    consulta por linha da listagem.
+
+    Exemplo:
+        with self.assertMaximoDeConsultas(5):
+            self.client.get(url)
+    """
+
+    def assertMaximoDeConsultas(self, limite, func=None, *args,
+                                using='default', **kwargs):
+        """
+        Verifica que `func` ou o bloco `with` executa no máximo
+        `limite` consultas.
+
+        Args:
+            limite (int): O orçamento de consultas.
+            func (callable): Função executada com `args` e `kwargs`.
+            Quando None, retorna um gerenciador de contexto.
+            using (str): O alias do banco observado.
+
+        Returns:
+            O resultado de `func`, ou o gerenciador de contexto.
+        """
+        contexto = _OrcamentoDeConsultas(self, limite, connections[using])
+        if func is None:
+            return contexto
+        with contexto:
+            return func(*args, **kwargs)
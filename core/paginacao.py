@@ -0,0 +1,274 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+# Acima dessa quantidade, a listagem informa só que há mais registros,
+# sem contá-los, a não ser que a contagem exata seja pedida.
+CONTAGEM_MAXIMA = 1000
+
+
+def gerar_cursor(valor, pk):
+    """
+    Gera um cursor opaco que aponta para um registro da listagem.
+
+    Args:
+        valor: O valor do campo de ordenação no registro.
+        pk (int): A pk do registro.
+
+    Returns:
+        str: O cursor, em base64 próprio para URLs.
+    """
+    # Datas vão com os microssegundos, para não pular registros do
+    # mesmo milissegundo; decimais vão como texto, sem arredondamento
+    if hasattr(valor, 'isoformat'):
+        valor = valor.isoformat()
+    texto = json.dumps([valor, pk], cls=DjangoJSONEncoder)
+    return base64.urlsafe_b64encode(texto.encode()).decode()
+
+
+def ler_cursor(texto):
+    """
+    Lê um cursor gerado por `gerar_cursor`.
+
+    Args:
+        texto (str): O cursor.
+
+    Returns:
+        tuple: (valor, pk), ou None se o cursor estiver vazio ou for
+        inválido. Datas e decimais voltam como texto, que o ORM aceita
+        nos filtros.
+    """
+    try:
+        valor, pk = json.loads(base64.urlsafe_b64decode(texto.encode()))
+        return valor, int(pk)
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class PaginaCursor:
+    """
+    Uma página de uma listagem paginada por cursor.
+
+    Attributes:
+        object_list (list): Os registros da página.
+        anterior (str): Cursor da página anterior, ou None na primeira.
+        proximo (str): Cursor da página seguinte, ou None na última.
+        total (int): Quantidade de registros da listagem, limitada a
+        `CONTAGEM_MAXIMA` quando a contagem exata não é pedida.
+        total_exato (bool): Se `total` é a contagem exata.
+    """
+
+    def __init__(self, object_list, anterior, proximo, total, total_exato):
+        self.object_list = object_list
+        self.anterior = anterior
+        self.proximo = proximo
+        self.total = total
+        self.total_exato = total_exato
+
+    def has_other_pages(self):
+        return self.anterior is not None or self.proximo is not None
+
+
+class PaginacaoPorCursor:
+    """
+    Mixin de ListView que pagina pelo cursor (keyset) em vez do número
+    da página.
+
+    A listagem é ordenada por `campo_cursor` e pela pk, na mesma
+    direção. O parâmetro `depois` traz a página seguinte ao registro do
+    cursor e `antes`, a anterior. Cada página é um intervalo do índice
+    a partir do cursor, sem OFFSET, então qualquer página custa o mesmo
+    que a primeira.
+
+    A contagem é limitada a `CONTAGEM_MAXIMA` registros; com
+    `contar=1` a listagem é contada inteira.
+
+    Atributos:
+        campo_cursor (str): Campo de ordenação, com '-' para ordem
+        decrescente.
+    """
+    campo_cursor = 'pk'
+
+    def get_consultas(self, queryset):
+        """
+        Retorna as consultas cujos registros formam a listagem. Views
+        que juntam mais de uma tabela retornam uma consulta por tabela,
+        para que o cursor seja aplicado em cada uma antes da união.
+
+        Args:
+            queryset (QuerySet): A consulta de `get_queryset`.
+
+        Returns:
+            list: Os QuerySets da listagem.
+        """
+        return [queryset]
+
+    def _ordem(self, inverter):
+        """
+        Retorna o campo, se a ordem é decrescente e a ordenação da
+        consulta, invertida para ler a página anterior.
+        """
+        campo = self.campo_cursor.lstrip('-')
+        decrescente = self.campo_cursor.startswith('-') != inverter
+        sinal = '-' if decrescente else ''
+        return campo, decrescente, (f'{sinal}{campo}', f'{sinal}id')
+
+    def validar_cursor(self, consultas, cursor):
+        """
+        Converte o valor do cursor para o tipo do campo de ordenação,
+        como o formulário converteria o valor digitado.
+
+        O cursor vem da URL e pode ter sido alterado, então um valor
+        que não pode ser convertido, como texto num campo numérico ou
+        nulo, é tratado como se não houvesse cursor, em vez de chegar
+        ao banco.
+
+        Args:
+            consultas (list): Os QuerySets de `get_consultas`.
+            cursor (tuple): (valor, pk) lido com `ler_cursor`, ou None.
+
+        Returns:
+            tuple: (valor convertido, pk), ou None se o cursor estiver
+            vazio ou for inválido.
+        """
+        if cursor is None:
+            return None
+        campo = self.campo_cursor.lstrip('-')
+        valor, pk = cursor
+        for consulta in consultas:
+            anotacao = consulta.query.annotations.get(campo)
+            if anotacao is not None:
+                modelo = anotacao.output_field
+            else:
+                modelo = consulta.model._meta.get_field(campo)
+            try:
+                valor = modelo.to_python(valor)
+            except (TypeError, ValueError, ValidationError):
+                return None
+        if valor is None:
+            return None
+        return valor, pk
+
+    def consulta_pagina(self, consultas, cursor, tamanho, inverter):
+        """
+        Monta, sem executar, a consulta de até `tamanho` registros a
+        partir do cursor, na ordem da listagem ou, ao voltar, na ordem
+        inversa.
+
+        Args:
+            consultas (list): Os QuerySets de `get_consultas`.
+            cursor (tuple): (valor, pk) lido com `ler_cursor`, ou None
+            para a primeira página.
+            tamanho (int): Quantidade máxima de registros.
+            inverter (bool): Se a página é lida em ordem inversa.
+
+        Returns:
+            QuerySet: A consulta da página.
+        """
+        campo, decrescente, ordenacao = self._ordem(inverter)
+        ordenadas = []
+        for consulta in consultas:
+            if cursor is not None:
+                valor, pk = cursor
+                if decrescente:
+                    consulta = consulta.filter(
+                        **{f'{campo}__lte': valor}
+                    ).exclude(**{campo: valor, 'pk__gte': pk})
+                else:
+                    consulta = consulta.filter(
+                        **{f'{campo}__gte': valor}
+                    ).exclude(**{campo: valor, 'pk__lte': pk})
+            ordenadas.append(consulta.order_by(*ordenacao))
+        if len(ordenadas) > 1:
+            consulta = ordenadas[0].order_by().union(
+                *(outra.order_by() for outra in ordenadas[1:]), all=True
+            ).order_by(*ordenacao)
+        else:
+            consulta = ordenadas[0]
+        return consulta[:tamanho]
+
+    def _contar(self, consultas, exato):
+        """
+        Conta os registros da listagem, até `CONTAGEM_MAXIMA` quando a
+        contagem exata não é pedida.
+        """
+        total = 0
+        for consulta in consultas:
+            if exato:
+                total += consulta.order_by().count()
+            else:
+                limite = CONTAGEM_MAXIMA + 1 - total
+                total += len(
+                    consulta.order_by().values_list('pk', flat=True)[:limite]
+                )
+                if total > CONTAGEM_MAXIMA:
+                    return CONTAGEM_MAXIMA, False
+        return total, exato or total <= CONTAGEM_MAXIMA
+
+    def _cursor_de(self, objeto):
+        campo = self.campo_cursor.lstrip('-')
+        return gerar_cursor(getattr(objeto, campo), objeto.pk)
+
+    def paginate_queryset(self, queryset, page_size):
+        """
+        Lê a página pedida pelos parâmetros `depois` ou `antes`.
+
+        Substitui a paginação por número de página do ListView.
+
+        Returns:
+            tuple: (None, a página, os registros, se há outras
+            páginas), no formato esperado por
+            `MultipleObjectMixin.get_context_data`.
+        """
+        parametros = self.request.GET
+        consultas = self.get_consultas(queryset)
+        antes = self.validar_cursor(
+            consultas, ler_cursor(parametros.get('antes', ''))
+        )
+        depois = self.validar_cursor(
+            consultas, ler_cursor(parametros.get('depois', ''))
+        )
+        voltando = antes is not None
+
+        registros = list(self.consulta_pagina(
+            consultas, antes if voltando else depois, page_size + 1,
+            voltando
+        ))
+        mais = len(registros) > page_size
+        registros = registros[:page_size]
+        if voltando:
+            registros.reverse()
+
+        if voltando:
+            anterior = self._cursor_de(registros[0]) if mais else None
+            proximo = self._cursor_de(registros[-1]) if registros else None
+        else:
+            anterior = (
+                self._cursor_de(registros[0])
+                if depois is not None and registros else None
+            )
+            proximo = self._cursor_de(registros[-1]) if mais else None
+
+        total, exato = self._contar(
+            consultas, parametros.get('contar') == '1'
+        )
+        pagina = PaginaCursor(registros, anterior, proximo, total, exato)
+        return None, pagina, registros, pagina.has_other_pages()
+
+    def get_context_data(self, **kwargs):
+        """
+        Adiciona ao contexto os parâmetros da listagem sem os cursores,
+        repassados pelos links de página.
+
+        Returns:
+            dict: Contexto com `parametros_cursor`.
+        """
+        context = super().get_context_data(**kwargs)
+        parametros = self.request.GET.copy()
+        for nome in ('antes', 'depois', 'page'):
+            parametros.pop(nome, None)
+        context['parametros_cursor'] = parametros.urlencode()
+        return context
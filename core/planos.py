@@ -0,0 +1,196 @@
+import json
+
+from django.db import connection, transaction
+from django.http import HttpRequest
+from django.utils.module_loading import autodiscover_modules
+
+from .paginacao import ler_cursor
+
+
+# Consultas críticas registradas pelos módulos `planos` dos apps,
+# indexadas pelo nome.
+CONSULTAS = {}
+
+
+def consulta_critica(nome):
+    """
+    Decorador que registra uma consulta crítica para a verificação dos
+    planos de execução.
+
+    A função decorada não recebe argumentos e retorna o QuerySet com
+    a forma da consulta usada em produção; os valores dos filtros não
+    precisam existir no banco.
+
+    Args:
+        nome (str): Nome da consulta nos relatórios.
+
+    Returns:
+        function: O decorador.
+    """
+    def registrar(funcao):
+        CONSULTAS[nome] = funcao
+        return funcao
+    return registrar
+
+
+def carregar_consultas():
+    """
+    Importa o módulo `planos` de cada app instalado, que registra as
+    suas consultas críticas.
+
+    Returns:
+        dict: As consultas registradas, indexadas pelo nome.
+    """
+    autodiscover_modules('planos')
+    return CONSULTAS
+
+
+def pagina_da_listagem(view, **parametros):
+    """
+    Monta a consulta de uma página de uma listagem paginada por cursor
+    como a view a faz numa requisição com os parâmetros dados, para
+    que a consulta registrada seja a da própria view.
+
+    Args:
+        view (class): A view, com `PaginacaoPorCursor`.
+        **parametros: Os parâmetros da requisição, como `depois` ou
+        `search`.
+
+    Returns:
+        QuerySet: A consulta da página, como lida em
+        `paginate_queryset`.
+    """
+    requisicao = HttpRequest()
+    requisicao.GET.update(parametros)
+    instancia = view()
+    instancia.setup(requisicao)
+    queryset = instancia.get_queryset()
+    consultas = instancia.get_consultas(queryset)
+    return instancia.consulta_pagina(
+        consultas,
+        instancia.validar_cursor(
+            consultas, ler_cursor(parametros.get('depois', ''))
+        ),
+        instancia.get_paginate_by(queryset) + 1, False
+    )
+
+
+def _nos_postgresql(plano):
+    """
+    Percorre os nós de um plano do PostgreSQL em formato JSON.
+    """
+    yield plano
+    for filho in plano.get('Plans', ()):
+        yield from _nos_postgresql(filho)
+
+
+def explicar(consulta):
+    """
+    Retorna o plano de execução de uma consulta.
+
+    No SQLite usa `EXPLAIN QUERY PLAN`. No PostgreSQL usa `EXPLAIN`
+    com as varreduras sequenciais desabilitadas na transação, para
+    que o plano mostre um índice sempre que houver um utilizável,
+    mesmo com as tabelas vazias dos testes.
+
+    Args:
+        consulta (QuerySet): A consulta.
+
+    Returns:
+        list: Uma descrição por passo do plano. No PostgreSQL, a
+        condição usada no índice vem entre colchetes.
+    """
+    sql, parametros = consulta.query.sql_with_params()
+    with transaction.atomic(), connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', parametros)
+            plano = cursor.fetchone()[0]
+            if isinstance(plano, str):
+                plano = json.loads(plano)
+            passos = []
+            for no in _nos_postgresql(plano[0]['Plan']):
+                passo = f"{no['Node Type']} {no.get('Relation Name', '')}"
+                if 'Index Name' in no:
+                    passo += f" USING {no['Index Name']}"
+                if 'Index Cond' in no:
+                    passo += f" [{no['Index Cond']}]"
+                passos.append(passo.strip())
+            return passos
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', parametros)
+        return [linha[-1] for linha in cursor.fetchall()]
+
+
+def _indices_parciais():
+    """
+    Retorna os nomes dos índices parciais do banco.
+    """
+    if connection.vendor == 'postgresql':
+        sql = (
+            "SELECT indexname FROM pg_indexes "
+            "WHERE indexdef LIKE '%% WHERE %%'"
+        )
+    else:
+        sql = (
+            "SELECT name FROM sqlite_master "
+            "WHERE type = 'index' AND sql LIKE '%% WHERE %%'"
+        )
+    with connection.cursor() as cursor:
+        cursor.execute(sql)
+        return {linha[0] for linha in cursor.fetchall()}
+
+
+def varreduras_completas(plano):
+    """
+    Filtra os passos do plano que leem uma tabela inteira: sem índice
+    ou percorrendo um índice completo, como na ordenação de uma
+    consulta sem filtro indexado.
+
+    Percorrer um índice parcial inteiro não conta, pois ele só tem as
+    linhas procuradas, nem ler uma tabela virtual (como um índice de
+    busca FTS5) com alguma restrição.
+
+    Args:
+        plano (list): O plano retornado por `explicar`.
+
+    Returns:
+        list: Os passos com varredura completa.
+    """
+    parciais = _indices_parciais()
+    varreduras = []
+    for passo in plano:
+        if connection.vendor == 'postgresql':
+            completa = passo.startswith('Seq Scan') or (
+                passo.startswith(('Index Scan', 'Index Only Scan'))
+                and '[' not in passo
+            )
+        else:
+            completa = (
+                passo.startswith('SCAN ')
+                and not passo.startswith('SCAN CONSTANT ROW')
+            )
+        # Nas tabelas virtuais do SQLite, o plano termina com as
+        # restrições repassadas à tabela, vazias numa leitura completa
+        if ' VIRTUAL TABLE INDEX ' in passo and not passo.endswith(':'):
+            continue
+        # Numa varredura por índice, o nome do índice é a última palavra
+        if ' USING ' in passo and passo.split()[-1] in parciais:
+            continue
+        if completa:
+            varreduras.append(passo)
+    return varreduras
+
+
+def verificar_consultas():
+    """
+    Explica todas as consultas críticas registradas.
+
+    Returns:
+        dict: Tuplas (plano, varreduras completas) indexadas pelo nome
+        da consulta.
+    """
+    resultado = {}
+    for nome, funcao in sorted(carregar_consultas().items()):
+        plano = explicar(funcao())
+        resultado[nome] = (plano, varreduras_completas(plano))
+    return resultado
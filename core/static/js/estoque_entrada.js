@@ -3,14 +3,14 @@ $(document).ready(function() {
     // Insere classe no primeiro item de produto
     $('#id_estoque-0-produto').addClass('clProduto');
     $('#id_estoque-0-quantidade').addClass('clQuantidade');
-    // Desabilita o primeiro campo 'Saldo'
-    $('#id_estoque-0-saldo').prop('type', 'hidden')
     // Cria um span para mostrar o saldo na tela.
-    $('label[for="id_estoque-0-saldo"]').append('<span id="id_estoque-0-saldo-span" class="lead" style="padding-left: 10px;"></span>')
+    $('label[for="id_estoque-0-quantidade"]').append('<span id="id_estoque-0-saldo-span" class="lead" style="padding-left: 10px;"></span>')
     // Cria um campo com o estoque inicial.
-    $('label[for="id_estoque-0-saldo"]').append('<input id="id_estoque-0-inicial" class="form-control" type="hidden" />')
-    // Select2
-    $('.clProduto').select2()
+    $('label[for="id_estoque-0-quantidade"]').append('<input id="id_estoque-0-inicial" class="form-control" type="hidden" />')
+    // Select2 com as opções buscadas no servidor
+    $('.clProduto').each(function() {
+      autocompletarProduto(this)
+    })
   });
   
     $('#add-item').click(function(ev) {
@@ -23,9 +23,6 @@ $(document).ready(function() {
       // update form count
       $('#id_estoque-TOTAL_FORMS').attr('value', count + 1);
   
-      // Desabilita o campo 'Saldo'
-      $('#id_estoque-' + (count) + '-saldo').prop('type', 'hidden')
-  
       // some animate to scroll to view our new form
       $('html, body').animate({
         scrollTop: $("#add-item").position().top - 200
@@ -35,11 +32,11 @@ $(document).ready(function() {
       $('#id_estoque-' + (count) + '-quantidade').addClass('clQuantidade');
   
       // Cria um span para mostrar o saldo na tela.
-      $('label[for="id_estoque-' + (count) + '-saldo"]').append('<span id="id_estoque-' + (count) + '-saldo-span" class="lead" style="padding-left: 10px;"></span>')
+      $('label[for="id_estoque-' + (count) + '-quantidade"]').append('<span id="id_estoque-' + (count) + '-saldo-span" class="lead" style="padding-left: 10px;"></span>')
       // Cria um campo com o estoque inicial.
-      $('label[for="id_estoque-' + (count) + '-saldo"]').append('<input id="id_estoque-' + (count) + '-inicial" class="form-control" type="hidden" />')
-      // Select2
-      $('.clProduto').select2()
+      $('label[for="id_estoque-' + (count) + '-quantidade"]').append('<input id="id_estoque-' + (count) + '-inicial" class="form-control" type="hidden" />')
+      // Select2 com as opções buscadas no servidor
+      autocompletarProduto('#id_estoque-' + (count) + '-produto')
     });
   
   let estoque
@@ -75,14 +72,10 @@ $(document).ready(function() {
     quantidade = $(this).val();
     // Aqui é feito o cálculo de soma do estoque
     // saldo = Number(quantidade) + Number(estoque);
-    campo = $(this).attr('id').replace('quantidade', 'saldo')
+    // O saldo é apenas uma prévia, o valor gravado é calculado no servidor.
     campo_estoque_inicial = $(this).attr('id').replace('quantidade', 'inicial')
     estoque_inicial = $('#'+campo_estoque_inicial).val()
     saldo = Number(quantidade) + Number(estoque_inicial)
-    // Desabilita o 'Saldo'
-    $('#'+campo).prop('type', 'hidden')
-    // Atribui o saldo ao campo 'saldo'
-    $('#'+campo).val(saldo)
     campo2 = $(this).attr('id').replace('quantidade', 'saldo-span')
     // Atrubui o saldo ao campo 'id_estoque-x-saldo-span'
     $('#'+campo2).text(saldo)
@@ -0,0 +1,36 @@
+// Autocompletar do campo de produto dos formulários de estoque.
+// O select vem do servidor só com o produto escolhido; as opções são
+// buscadas no endpoint do atributo 'data-url', página a página.
+function autocompletarProduto(campo) {
+  // Cursor de cada página já lida, por texto digitado
+  let cursores = {}
+
+  $(campo).select2({
+    minimumInputLength: 1,
+    ajax: {
+      url: $(campo).data('url'),
+      dataType: 'json',
+      delay: 250,
+      data: function(params) {
+        let pagina = params.page || 1
+        return {
+          q: params.term,
+          cursor: cursores[params.term + '|' + pagina] || ''
+        }
+      },
+      processResults: function(data, params) {
+        let pagina = params.page || 1
+        cursores[params.term + '|' + (pagina + 1)] = data.cursor
+        return {
+          results: $.map(data.registros, function(produto) {
+            return {
+              id: produto.pk,
+              text: produto.produto + ' (' + produto.estoque + ')'
+            }
+          }),
+          pagination: {more: data.mais}
+        }
+      }
+    }
+  })
+}
@@ -1,3 +1,146 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from django.views.generic import ListView
+
+from produto.models import Produto
+
+from . import paginacao
+from .horizonte import horizonte
+from .paginacao import PaginacaoPorCursor, gerar_cursor, ler_cursor
+from .planos import carregar_consultas, explicar, varreduras_completas
+
+
+class PlanosDeConsultaTest(TestCase):
+    """
+    As consultas críticas registradas pelos apps usam índices.
+    """
+
+    def test_consultas_criticas_usam_indices(self):
+        self.assertTrue(carregar_consultas())
+        saida = StringIO()
+        call_command('verificar_planos', stdout=saida)
+        self.assertIn('Nenhuma consulta crítica', saida.getvalue())
+
+    def test_detecta_varredura_completa(self):
+        plano = explicar(Produto.objects.filter(ncm='1'))
+        self.assertTrue(varreduras_completas(plano))
+
+
+class HorizonteTest(TestCase):
+    """
+    O horizonte das leituras incrementais fica antes de qualquer
+    alteração ainda não confirmada.
+    """
+
+    @override_settings(PRODUTO_ALTERACOES_ATRASO_SEGUNDOS=30)
+    def test_atraso(self):
+        antes = timezone.now()
+        valor = horizonte()
+        self.assertLessEqual(valor, timezone.now() - timedelta(seconds=30))
+        self.assertGreaterEqual(valor, antes - timedelta(seconds=30))
+
+    @override_settings(PRODUTO_ALTERACOES_ATRASO_SEGUNDOS=2)
+    def test_transacao_aberta_no_postgresql(self):
+        aberta = timezone.now() - timedelta(minutes=5)
+        with mock.patch('core.horizonte.connection') as conexao:
+            conexao.vendor = 'postgresql'
+            cursor = conexao.cursor.return_value.__enter__.return_value
+            cursor.fetchone.return_value = (aberta,)
+            self.assertEqual(horizonte(), aberta - timedelta(seconds=2))
+
+            cursor.fetchone.return_value = (None,)
+            self.assertGreater(horizonte(), aberta)
+
+
+class ListaDeProdutos(PaginacaoPorCursor, ListView):
+    model = Produto
+    paginate_by = 2
+    campo_cursor = 'produto'
+
+
+class PaginacaoPorCursorTest(TestCase):
+    """
+    A paginação por cursor avança e volta pelas páginas sem pular nem
+    repetir registros, inclusive com valores repetidos no campo de
+    ordenação.
+    """
+
+    def setUp(self):
+        # Dois produtos com o mesmo preço, para o desempate pela pk
+        for nome, preco in (('A', 1), ('B', 2), ('C', 2), ('D', 3),
+                            ('E', 4)):
+            Produto.objects.create(
+                produto=nome, ncm='1', preco=preco, estoque=0
+            )
+
+    def pagina(self, campo='produto', **parametros):
+        requisicao = RequestFactory().get('/', parametros)
+        view = ListaDeProdutos.as_view(campo_cursor=campo)
+        contexto = view(requisicao).context_data
+        return (
+            [produto.produto for produto in contexto['object_list']],
+            contexto['page_obj'],
+        )
+
+    def test_avanca_e_volta(self):
+        nomes, pagina = self.pagina()
+        self.assertEqual(nomes, ['A', 'B'])
+        self.assertIsNone(pagina.anterior)
+        nomes, pagina = self.pagina(depois=pagina.proximo)
+        self.assertEqual(nomes, ['C', 'D'])
+        ultima, fim = self.pagina(depois=pagina.proximo)
+        self.assertEqual((ultima, fim.proximo), (['E'], None))
+
+        nomes, pagina = self.pagina(antes=fim.anterior)
+        self.assertEqual(nomes, ['C', 'D'])
+        nomes, pagina = self.pagina(antes=pagina.anterior)
+        self.assertEqual((nomes, pagina.anterior), (['A', 'B'], None))
+
+    def test_desempate_e_ordem_decrescente(self):
+        vistos = []
+        cursor = {}
+        while True:
+            nomes, pagina = self.pagina('-preco', **cursor)
+            vistos += nomes
+            if pagina.proximo is None:
+                break
+            cursor = {'depois': pagina.proximo}
+        self.assertEqual(vistos, ['E', 'D', 'C', 'B', 'A'])
+
+    def test_pagina_exatamente_cheia(self):
+        Produto.objects.filter(produto='E').delete()
+        _, pagina = self.pagina()
+        nomes, pagina = self.pagina(depois=pagina.proximo)
+        self.assertEqual((nomes, pagina.proximo), (['C', 'D'], None))
+
+    def test_cursor_invalido_ou_alem_do_fim(self):
+        nomes, _ = self.pagina(depois='x')
+        self.assertEqual(nomes, ['A', 'B'])
+        nomes, pagina = self.pagina(depois=gerar_cursor('Z', 99))
+        self.assertEqual((nomes, pagina.proximo), ([], None))
+        self.assertIsNone(ler_cursor(None))
+        self.assertIsNone(ler_cursor(gerar_cursor('A', 'x')))
+
+    def test_cursor_adulterado(self):
+        nomes, _ = self.pagina(depois=gerar_cursor(None, 1))
+        self.assertEqual(nomes, ['A', 'B'])
+        for valor in (None, 'x', [1], {'a': 1}):
+            nomes, _ = self.pagina('-preco', depois=gerar_cursor(valor, 1))
+            self.assertEqual(nomes, ['E', 'D'])
+
+    def test_cursor_com_data(self):
+        data = timezone.now()
+        valor, pk = ler_cursor(gerar_cursor(data, 1))
+        self.assertEqual((valor, pk), (data.isoformat(), 1))
+
+    def test_contagem_limitada(self):
+        with mock.patch.object(paginacao, 'CONTAGEM_MAXIMA', 3):
+            _, pagina = self.pagina()
+            self.assertEqual((pagina.total, pagina.total_exato), (3, False))
+            _, pagina = self.pagina(contar='1')
+            self.assertEqual((pagina.total, pagina.total_exato), (5, True))
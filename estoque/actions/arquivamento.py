@@ -0,0 +1,194 @@
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from ..models import (
+    AberturaEstoque,
+    Arquivamento,
+    Estoque,
+    EstoqueArquivo,
+    EstoqueItens,
+    EstoqueItensArquivo,
+)
+from .baixa_estoque import LIQUIDO
+
+
+# Quantidade de movimentos arquivados em cada transação.
+MOVIMENTOS_POR_LOTE = 5000
+
+
+def corte_atual():
+    """
+    Retorna o instante até o qual os movimentos foram arquivados.
+
+    Returns:
+        datetime: O corte do último arquivamento, ou None se nada foi
+        arquivado.
+    """
+    return Arquivamento.objects.aggregate(corte=Max('corte'))['corte']
+
+
+def razoes(desde=None):
+    """
+    Retorna os modelos de itens que podem conter movimentos a partir
+    de um instante: sempre a tabela atual e, se o instante for
+    anterior ao corte do arquivamento, também o arquivo.
+
+    Os dois modelos têm os mesmos campos, então as mesmas consultas
+    servem para ambos.
+
+    Args:
+        desde (datetime): Início das movimentações procuradas. Quando
+        None, inclui todo o histórico.
+
+    Returns:
+        list: `EstoqueItens` e, se necessário, `EstoqueItensArquivo`.
+    """
+    corte = corte_atual()
+    if corte is not None and (desde is None or desde < corte):
+        return [EstoqueItens, EstoqueItensArquivo]
+    return [EstoqueItens]
+
+
+def _copiar(origem, destino, coluna, pks):
+    """
+    Copia linhas de uma tabela para a tabela de arquivo com um
+    `INSERT ... SELECT`, sem trazer as linhas para o Python.
+
+    Args:
+        origem (Model): Modelo da tabela atual.
+        destino (Model): Modelo do arquivo, com as mesmas colunas.
+        coluna (str): Coluna da tabela atual usada no filtro.
+        pks (list): Valores aceitos na coluna do filtro.
+
+    Returns:
+        int: Número de linhas copiadas.
+    """
+    nome = connection.ops.quote_name
+    colunas = ', '.join(
+        nome(campo.column) for campo in destino._meta.concrete_fields
+    )
+    marcadores = ', '.join(['%s'] * len(pks))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {nome(destino._meta.db_table)} ({colunas}) '
+            f'SELECT {colunas} FROM {nome(origem._meta.db_table)} '
+            f'WHERE {nome(coluna)} IN ({marcadores})',
+            pks
+        )
+        return cursor.rowcount
+
+
+def _somar_aberturas(liquidos, corte):
+    """
+    Soma o saldo líquido dos itens arquivados ao saldo de abertura de
+    cada produto.
+
+    Args:
+        liquidos (dict): Saldo líquido indexado pela pk do produto.
+        corte (datetime): O corte do arquivamento.
+    """
+    saldos = dict(
+        AberturaEstoque.objects.select_for_update()
+        .filter(produto__in=list(liquidos))
+        .values_list('produto', 'saldo')
+    )
+    AberturaEstoque.objects.bulk_create(
+        [
+            AberturaEstoque(
+                produto_id=pk, saldo=saldos.get(pk, 0) + liquido, corte=corte
+            )
+            for pk, liquido in liquidos.items()
+        ],
+        update_conflicts=True,
+        unique_fields=('produto',),
+        update_fields=('saldo', 'corte'),
+    )
+
+
+def registrar_aberturas(produtos):
+    """
+    Grava o estoque com que os produtos foram cadastrados como saldo
+    de abertura, já que ele não vem de nenhuma entrada do razão. Sem
+    ele, o reprocessamento e a conferência partiriam de zero.
+
+    Deve ser chamada na mesma transação do cadastro.
+
+    Args:
+        produtos (iterable): Os produtos recém-cadastrados, já salvos.
+    """
+    estoques = {
+        produto.pk: int(produto.estoque)
+        for produto in produtos if produto.estoque
+    }
+    if estoques:
+        _somar_aberturas(estoques, timezone.now())
+
+
+def arquivar(corte, movimentos_por_lote=MOVIMENTOS_POR_LOTE):
+    """
+    Move os movimentos anteriores ao corte, com os seus itens, para as
+    tabelas de arquivo.
+
+    Cada lote é uma transação: os movimentos e itens são copiados com
+    `INSERT ... SELECT`, o saldo líquido dos itens é somado ao saldo
+    de abertura dos produtos e as linhas são removidas das tabelas
+    atuais. O estoque dos produtos não muda, e a abertura mais os
+    itens não arquivados continua explicando o estoque de cada um.
+
+    As chaves de idempotência dos movimentos arquivados continuam
+    valendo até expirar, e devolvem a pk do movimento no arquivo; as
+    reservas confirmadas deixam de apontar para a saída.
+
+    Args:
+        corte (datetime): Os movimentos anteriores a este instante são
+        arquivados.
+        movimentos_por_lote (int): Quantidade de movimentos por
+        transação.
+
+    Returns:
+        Arquivamento: O registro do arquivamento.
+
+    Raises:
+        ValueError: Se o corte for futuro ou anterior ao último
+        arquivamento.
+    """
+    if corte > timezone.now():
+        raise ValueError('O corte do arquivamento não pode ser futuro.')
+    anterior = corte_atual()
+    if anterior is not None and corte < anterior:
+        raise ValueError(
+            'O corte deve ser posterior ao do último arquivamento '
+            f'({timezone.localtime(anterior):%d/%m/%Y}).'
+        )
+
+    # O corte é registrado antes da cópia, para que as consultas que
+    # dependem dele já procurem no arquivo durante o arquivamento
+    registro = Arquivamento.objects.create(corte=corte)
+    antigos = Estoque.objects.filter(criado_em__lt=corte).order_by('pk')
+    while True:
+        with transaction.atomic():
+            pks = list(
+                antigos.values_list('pk', flat=True)[:movimentos_por_lote]
+            )
+            if not pks:
+                break
+            liquidos = dict(
+                EstoqueItens.objects.filter(estoque__in=pks)
+                .values('produto')
+                .annotate(liquido=LIQUIDO)
+                .values_list('produto', 'liquido')
+                .order_by()
+            )
+            _somar_aberturas(liquidos, corte)
+
+            _copiar(Estoque, EstoqueArquivo, 'id', pks)
+            registro.itens += _copiar(
+                EstoqueItens, EstoqueItensArquivo, 'estoque_id', pks
+            )
+            registro.movimentos += len(pks)
+            # Remove os itens e o vínculo das reservas junto com os
+            # movimentos; as chaves de idempotência são mantidas
+            Estoque.objects.filter(pk__in=pks).delete()
+            registro.save(update_fields=('movimentos', 'itens'))
+    return registro
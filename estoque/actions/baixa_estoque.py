@@ -0,0 +1,287 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Sum, Value, When
+
+from produto.actions.alertas import registrar_cruzamentos
+from produto.actions.alteracoes import registrar_movimentos
+from produto.actions.fragmentos import (
+    fragmentados_em_cache,
+    movimentar,
+    produtos_fragmentados,
+    somar,
+)
+from produto.models import Produto
+
+from ..models import EstoqueItens
+from .movimentos_diarios import acumular
+
+
+# Quantidade máxima de produtos por UPDATE, para não estourar o limite
+# de variáveis e de profundidade de expressão do SQLite.
+TAMANHO_LOTE = 250
+
+# Variação de estoque de um item: positiva nas entradas e negativa nas
+# saídas, como em `sinal`.
+VARIACAO = Case(
+    When(estoque__movimento='s', then=-F('quantidade')),
+    default=F('quantidade'),
+    output_field=IntegerField()
+)
+
+# Soma das variações de estoque dos itens.
+LIQUIDO = Sum(VARIACAO)
+
+
+class EstoqueInsuficiente(Exception):
+    """
+    Exceção levantada quando uma saída deixaria o estoque de um ou
+    mais produtos negativo.
+
+    Attributes:
+        produtos (list): Lista de tuplas (pk, nome, estoque atual)
+        dos produtos sem saldo suficiente.
+    """
+
+    def __init__(self, produtos):
+        self.produtos = produtos
+        nomes = ', '.join(
+            f'{nome} (disponível: {estoque})' for _, nome, estoque in produtos
+        )
+        super().__init__(f'Estoque insuficiente para: {nomes}')
+
+
+def sinal(movimento):
+    """
+    Retorna o sinal aplicado à quantidade de acordo com o movimento.
+
+    Args:
+        movimento (str): 'e' para entrada ou 's' para saída.
+
+    Returns:
+        int: 1 para entrada e -1 para saída.
+    """
+    return -1 if movimento == 's' else 1
+
+
+def calcular_deltas(itens):
+    """
+    Soma a variação de estoque de cada produto nos itens informados.
+
+    Args:
+        itens (list): Itens de estoque com `estoque` (movimento),
+        `produto_id` e `quantidade` definidos.
+
+    Returns:
+        dict: Variação líquida de estoque indexada pela pk do produto.
+    """
+    deltas = defaultdict(int)
+    for item in itens:
+        deltas[item.produto_id] += (
+            sinal(item.estoque.movimento) * item.quantidade
+        )
+    return dict(deltas)
+
+
+def _atualizar_lote(deltas):
+    """
+    Executa um único UPDATE condicional para um lote de produtos.
+
+    Cada produto só é atualizado se o estoque resultante não ficar
+    abaixo das reservas ativas, equivalente a
+    `UPDATE produto SET estoque = estoque + delta
+    WHERE estoque >= reservado - delta`.
+    Produtos fragmentados nunca são atualizados aqui.
+
+    Args:
+        deltas (dict): Variação de estoque indexada pela pk do produto.
+
+    Returns:
+        int: Número de produtos efetivamente atualizados.
+    """
+    condicao = Q()
+    casos = []
+    for pk, delta in deltas.items():
+        filtro = Q(pk=pk)
+        if delta < 0:
+            filtro &= Q(estoque__gte=F('reservado') - delta)
+        condicao |= filtro
+        casos.append(When(pk=pk, then=Value(delta)))
+
+    return Produto.objects.filter(condicao, fragmentado=False).update(
+        estoque=F('estoque') + Case(
+            *casos, default=Value(0), output_field=IntegerField()
+        )
+    )
+
+
+def _aplicar(deltas, fragmentados):
+    """
+    Aplica as variações nos produtos simples, em lotes, e nos
+    fragmentos dos produtos fragmentados.
+
+    Args:
+        deltas (dict): Variação de estoque indexada pela pk do produto.
+        fragmentados (set): Pks dos produtos tratados como fragmentados.
+
+    Raises:
+        EstoqueInsuficiente: Sem produtos, se algum produto não pôde
+        ser atualizado, para que o savepoint seja desfeito.
+    """
+    pks = [pk for pk in deltas if pk not in fragmentados]
+    for i in range(0, len(pks), TAMANHO_LOTE):
+        lote = {pk: deltas[pk] for pk in pks[i:i + TAMANHO_LOTE]}
+        if _atualizar_lote(lote) != len(lote):
+            raise EstoqueInsuficiente([])
+    for pk in fragmentados:
+        if pk in deltas and not movimentar(pk, deltas[pk]):
+            raise EstoqueInsuficiente([])
+
+
+def _estoques(pks, fragmentados):
+    """
+    Lê o estoque, as reservas e o estoque mínimo dos produtos, somando
+    os fragmentos dos produtos fragmentados.
+
+    Args:
+        pks (iterable): As pks dos produtos.
+        fragmentados (set): Pks dos produtos fragmentados.
+
+    Returns:
+        dict: Tupla (estoque, reservado, estoque mínimo) indexada pela
+        pk do produto.
+    """
+    pks = list(pks)
+    estoques = {
+        pk: (estoque, reservado, minimo)
+        for pk, estoque, reservado, minimo in
+        Produto.objects.filter(pk__in=pks)
+        .values_list('pk', 'estoque', 'reservado', 'estoque_minimo')
+    }
+    # Nos produtos fragmentados, as reservas ficam fora dos fragmentos
+    for pk, total in somar(fragmentados & set(estoques)).items():
+        _, reservado, minimo = estoques[pk]
+        estoques[pk] = (total + reservado, reservado, minimo)
+    return estoques
+
+
+def aplicar_deltas(deltas):
+    """
+    Aplica as variações de estoque de forma atômica e condicional.
+
+    Os produtos são atualizados em lotes de `TAMANHO_LOTE` por UPDATE,
+    e os produtos fragmentados em um dos seus fragmentos. Saídas não
+    podem consumir as quantidades reservadas. Se algum produto não
+    tiver saldo suficiente, nenhuma alteração é mantida e
+    `EstoqueInsuficiente` é levantada. Os produtos que cruzarem o
+    estoque mínimo geram alertas, e o estoque final dos produtos
+    movimentados é registrado para os sistemas externos.
+
+    Args:
+        deltas (dict): Variação de estoque indexada pela pk do produto.
+
+    Returns:
+        dict: Estoque final de cada produto, indexado pela pk.
+
+    Raises:
+        EstoqueInsuficiente: Se alguma saída deixaria o estoque
+        negativo.
+    """
+    todos = list(deltas)
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    fragmentados = fragmentados_em_cache() & set(todos)
+    while True:
+        try:
+            with transaction.atomic():
+                _aplicar(deltas, fragmentados)
+            break
+        except EstoqueInsuficiente:
+            # O cache de produtos fragmentados pode estar desatualizado;
+            # só há falta de estoque se ele estiver correto
+            reais = produtos_fragmentados(todos)
+            if reais != fragmentados:
+                fragmentados = reais
+                continue
+            disponiveis = {
+                pk: estoque - reservado for pk, (estoque, reservado, _)
+                in _estoques(deltas, fragmentados).items()
+            }
+            nomes = dict(
+                Produto.objects.filter(pk__in=list(deltas))
+                .values_list('pk', 'produto')
+            )
+            # Um produto excluído durante a movimentação também impede
+            # a atualização, qualquer que seja o movimento
+            raise EstoqueInsuficiente([
+                (pk, f'produto {pk} (excluído)', 0) for pk in deltas
+                if pk not in disponiveis
+            ] + [
+                (pk, nomes[pk], disponiveis[pk])
+                for pk, delta in deltas.items()
+                if pk in disponiveis and disponiveis[pk] < -delta
+            ])
+
+    finais = _estoques(todos, fragmentados)
+    registrar_cruzamentos(
+        (pk, estoque - deltas.get(pk, 0) < minimo, estoque, minimo)
+        for pk, (estoque, _, minimo) in finais.items()
+    )
+    estoques = {pk: estoque for pk, (estoque, _, _) in finais.items()}
+    registrar_movimentos(estoques, deltas)
+    return estoques
+
+
+def atualizar_estoque(itens):
+    """
+    Atualiza o estoque dos produtos e preenche o saldo de cada item.
+
+    O saldo de cada item é calculado a partir do estoque retornado pelo
+    banco após o UPDATE, e não do valor enviado pelo navegador. Quando
+    o mesmo produto aparece em mais de uma linha, o saldo de cada linha
+    reflete o estoque logo após aquela linha.
+
+    Deve ser chamada dentro de uma transação.
+
+    Args:
+        itens (list): Itens de estoque (salvos ou não) com `estoque`,
+        `produto_id` e `quantidade` definidos.
+
+    Raises:
+        EstoqueInsuficiente: Se alguma saída deixaria o estoque
+        negativo.
+    """
+    deltas = calcular_deltas(itens)
+    finais = aplicar_deltas(deltas)
+
+    # Estoque antes da movimentação, reconstruído a partir do final
+    correntes = {
+        pk: finais[pk] - delta for pk, delta in deltas.items()
+    }
+    for item in itens:
+        correntes[item.produto_id] += (
+            sinal(item.estoque.movimento) * item.quantidade
+        )
+        item.saldo = correntes[item.produto_id]
+
+
+def registrar_itens(itens):
+    """
+    Atualiza o estoque e grava os itens de uma ou mais movimentações.
+
+    Os itens são gravados com um único `bulk_create`, depois que o
+    saldo de cada um foi preenchido por `atualizar_estoque`, e somados
+    aos totais diários de movimentação.
+
+    Deve ser chamada dentro de uma transação.
+
+    Args:
+        itens (list): Itens de estoque ainda não salvos, já associados
+        a registros de Estoque salvos.
+
+    Raises:
+        EstoqueInsuficiente: Se alguma saída deixaria o estoque
+        negativo.
+    """
+    atualizar_estoque(itens)
+    EstoqueItens.objects.bulk_create(itens)
+    acumular(itens)
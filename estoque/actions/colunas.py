@@ -0,0 +1,386 @@
+import json
+import os
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from core.horizonte import horizonte
+
+from ..models import EstoqueItens, EstoqueItensArquivo
+
+
+# Colunas do razão colunar e o tipo de cada uma. A quantidade é
+# positiva nas entradas e negativa nas saídas, e `criado_em` guarda os
+# microssegundos desde 1970 em UTC. As chaves e a quantidade têm 64
+# bits, pois o banco aceita valores além de 2**31, e a quantidade
+# ainda leva o sinal.
+COLUNAS = (
+    ('item', np.int64),
+    ('produto', np.int64),
+    ('criado_em', np.int64),
+    ('quantidade', np.int64),
+    ('movimento', 'S1'),
+    ('funcionario', np.int64),
+)
+
+# Versão do formato dos arquivos. Um razão gravado em outro formato é
+# gravado de novo na próxima atualização.
+FORMATO = 2
+
+# Itens lidos do banco e gravados nos arquivos de uma vez.
+ITENS_POR_LOTE = 100000
+
+# Agrupamentos aceitos por `RazaoColunar.agrupar`.
+AGRUPAMENTOS = ('produto', 'funcionario', 'dia')
+
+# Campos lidos de cada item, na ordem das `COLUNAS`.
+CAMPOS = (
+    'pk', 'produto_id', 'estoque__criado_em', 'quantidade',
+    'estoque__movimento', 'estoque__funcionario_id',
+)
+
+EPOCA = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSSEGUNDO = timedelta(microseconds=1)
+MICROSSEGUNDOS_POR_DIA = 86400 * 10 ** 6
+
+
+def _diretorio(diretorio):
+    return diretorio or settings.ESTOQUE_COLUNAS_DIR
+
+
+def _ler_estado(diretorio):
+    """
+    Lê a quantidade de linhas válidas e a posição do último item
+    gravado.
+
+    Args:
+        diretorio (str): O diretório do razão colunar.
+
+    Returns:
+        dict: `formato`, `linhas` e `ultimo`, com os microssegundos de
+        `criado_em` e a pk do último item gravado, ou None. Zerados se
+        o razão não existe ou se o estado é de um formato anterior,
+        para que o razão seja gravado de novo.
+    """
+    try:
+        with open(os.path.join(diretorio, 'estado.json')) as arquivo:
+            estado = json.load(arquivo)
+    except FileNotFoundError:
+        estado = {}
+    if estado.get('formato') != FORMATO or 'ultimo' not in estado:
+        return {'formato': FORMATO, 'linhas': 0, 'ultimo': None}
+    return estado
+
+
+def _gravar_estado(diretorio, estado):
+    """
+    Grava o estado em um arquivo temporário e o troca pelo atual, para
+    que os leitores nunca vejam um estado pela metade.
+    """
+    caminho = os.path.join(diretorio, 'estado.json')
+    with open(caminho + '.tmp', 'w') as arquivo:
+        json.dump(estado, arquivo)
+        arquivo.flush()
+        os.fsync(arquivo.fileno())
+    os.replace(caminho + '.tmp', caminho)
+
+
+def _acrescentar(diretorio, estado, linhas):
+    """
+    Acrescenta um lote de itens ao fim de cada coluna e avança o
+    estado. As linhas só ficam visíveis aos leitores depois que o
+    estado é gravado.
+
+    Args:
+        diretorio (str): O diretório do razão colunar.
+        estado (dict): O estado atual, alterado no lugar.
+        linhas (list): Tuplas com os valores de cada item, na ordem
+        das `COLUNAS`.
+    """
+    valores = list(zip(*linhas))
+    for (nome, tipo), coluna in zip(COLUNAS, valores):
+        caminho = os.path.join(diretorio, f'{nome}.bin')
+        with open(caminho, 'ab') as arquivo:
+            np.asarray(coluna, dtype=tipo).tofile(arquivo)
+            arquivo.flush()
+            os.fsync(arquivo.fileno())
+    estado['linhas'] += len(linhas)
+    estado['ultimo'] = [int(linhas[-1][2]), int(linhas[-1][0])]
+    _gravar_estado(diretorio, estado)
+
+
+def pendentes(ultimo, limite):
+    """
+    Retorna os itens ainda não gravados, atuais e arquivados, em ordem
+    de criação do movimento e de pk.
+
+    Args:
+        ultimo (list): Microssegundos de `criado_em` e pk do último
+        item gravado, ou None.
+        limite (datetime): Os itens de movimentos criados a partir
+        deste instante ficam para a próxima atualização.
+
+    Returns:
+        QuerySet: Os valores dos `CAMPOS` de cada item.
+    """
+    consultas = []
+    for modelo in (EstoqueItensArquivo, EstoqueItens):
+        itens = modelo.objects.filter(estoque__criado_em__lt=limite)
+        if ultimo is not None:
+            criado_em = EPOCA + ultimo[0] * MICROSSEGUNDO
+            itens = itens.filter(
+                estoque__criado_em__gte=criado_em
+            ).exclude(estoque__criado_em=criado_em, pk__lte=ultimo[1])
+        consultas.append(itens.order_by().values_list(*CAMPOS))
+    # Uma só consulta, para que um arquivamento simultâneo não mova
+    # itens de uma tabela para a outra entre as leituras
+    return consultas[0].union(consultas[1], all=True).order_by(
+        'estoque__criado_em', 'pk'
+    )
+
+
+def atualizar(diretorio=None, tamanho_lote=ITENS_POR_LOTE):
+    """
+    Acrescenta ao razão colunar os itens gravados desde a última
+    atualização, incluindo os arquivados que ainda não foram lidos.
+
+    Os itens são lidos em ordem de criação do movimento a partir do
+    último gravado, até o `horizonte`: uma transação ainda aberta
+    tem movimentos criados depois dele, então é lida numa próxima
+    atualização em vez de ficar para trás. Só um processo deve
+    atualizar o razão por vez.
+
+    Args:
+        diretorio (str): O diretório do razão colunar. Quando None,
+        usa `ESTOQUE_COLUNAS_DIR`.
+        tamanho_lote (int): Quantidade de itens por gravação.
+
+    Returns:
+        int: Quantidade de itens acrescentados.
+    """
+    diretorio = _diretorio(diretorio)
+    os.makedirs(diretorio, exist_ok=True)
+    estado = _ler_estado(diretorio)
+
+    # Descarta o que uma atualização interrompida gravou além do estado
+    for nome, tipo in COLUNAS:
+        caminho = os.path.join(diretorio, f'{nome}.bin')
+        with open(caminho, 'ab') as arquivo:
+            arquivo.truncate(estado['linhas'] * np.dtype(tipo).itemsize)
+
+    itens = pendentes(estado['ultimo'], horizonte()).iterator(
+        chunk_size=tamanho_lote
+    )
+    total = 0
+    lote = []
+    for pk, produto, criado_em, quantidade, movimento, funcionario in itens:
+        lote.append((
+            pk,
+            produto,
+            (criado_em - EPOCA) // MICROSSEGUNDO,
+            quantidade if movimento == 'e' else -quantidade,
+            movimento.encode(),
+            funcionario,
+        ))
+        if len(lote) == tamanho_lote:
+            _acrescentar(diretorio, estado, lote)
+            total += len(lote)
+            lote = []
+    if lote:
+        _acrescentar(diretorio, estado, lote)
+        total += len(lote)
+    return total
+
+
+def reconstruir(diretorio=None, tamanho_lote=ITENS_POR_LOTE):
+    """
+    Apaga o razão colunar e o grava de novo a partir do banco.
+
+    Args:
+        diretorio (str): O diretório do razão colunar. Quando None,
+        usa `ESTOQUE_COLUNAS_DIR`.
+        tamanho_lote (int): Quantidade de itens por gravação.
+
+    Returns:
+        int: Quantidade de itens gravados.
+    """
+    diretorio = _diretorio(diretorio)
+    if os.path.isdir(diretorio):
+        _gravar_estado(
+            diretorio, {'formato': FORMATO, 'linhas': 0, 'ultimo': None}
+        )
+    return atualizar(diretorio, tamanho_lote)
+
+
+def _deslocamentos(inicio, fim):
+    """
+    Retorna as mudanças de deslocamento do fuso horário atual entre
+    dois instantes, como o início e o fim do horário de verão.
+
+    O deslocamento é consultado a cada dia do intervalo, e cada
+    mudança é localizada por busca binária até o microssegundo.
+
+    Args:
+        inicio (int): Microssegundos desde 1970 do primeiro instante.
+        fim (int): Microssegundos desde 1970 do último instante.
+
+    Returns:
+        tuple: Matrizes com o instante de cada mudança, começando por
+        `inicio`, e o deslocamento, em microssegundos, a partir dele.
+    """
+    def deslocamento(instante):
+        data = timezone.localtime(EPOCA + int(instante) * MICROSSEGUNDO)
+        return data.utcoffset() // MICROSSEGUNDO
+
+    instantes = [inicio]
+    deslocamentos = [deslocamento(inicio)]
+    anterior = inicio
+    while anterior < fim:
+        proximo = min(anterior + MICROSSEGUNDOS_POR_DIA, fim)
+        if deslocamento(proximo) != deslocamentos[-1]:
+            antes, depois = anterior, proximo
+            while depois - antes > 1:
+                meio = (antes + depois) // 2
+                if deslocamento(meio) == deslocamentos[-1]:
+                    antes = meio
+                else:
+                    depois = meio
+            instantes.append(depois)
+            deslocamentos.append(deslocamento(depois))
+        anterior = proximo
+    return (
+        np.array(instantes, dtype=np.int64),
+        np.array(deslocamentos, dtype=np.int64),
+    )
+
+
+class RazaoColunar:
+    """
+    Leitura do razão colunar, com uma matriz NumPy por coluna mapeada
+    do disco.
+
+    Os arquivos são mapeados somente para leitura, então processos
+    diferentes compartilham as mesmas páginas do cache do sistema
+    operacional, e só as colunas usadas numa consulta são lidas.
+    As linhas acrescentadas depois da abertura não são vistas; basta
+    abrir o razão de novo para vê-las.
+
+    Attributes:
+        linhas (int): Quantidade de itens.
+        item, produto, criado_em, quantidade, movimento, funcionario
+        (numpy.ndarray): As colunas, conforme `COLUNAS`.
+    """
+
+    def __init__(self, diretorio=None):
+        diretorio = _diretorio(diretorio)
+        self.linhas = _ler_estado(diretorio)['linhas']
+        for nome, tipo in COLUNAS:
+            if self.linhas:
+                coluna = np.memmap(
+                    os.path.join(diretorio, f'{nome}.bin'),
+                    dtype=tipo, mode='r', shape=(self.linhas,)
+                )
+            else:
+                coluna = np.empty(0, dtype=tipo)
+            setattr(self, nome, coluna)
+
+    def _mascara(self, inicio, fim, movimento, produtos):
+        """
+        Monta o filtro das linhas, ou None se não há filtro.
+        """
+        condicoes = []
+        if inicio is not None:
+            condicoes.append(
+                self.criado_em >= (inicio - EPOCA) // MICROSSEGUNDO
+            )
+        if fim is not None:
+            condicoes.append(self.criado_em < (fim - EPOCA) // MICROSSEGUNDO)
+        if movimento is not None:
+            condicoes.append(self.movimento == movimento.encode())
+        if produtos is not None:
+            condicoes.append(np.isin(self.produto, list(produtos)))
+        if not condicoes:
+            return None
+        return np.logical_and.reduce(condicoes)
+
+    def agrupar(self, por='produto', inicio=None, fim=None, movimento=None,
+                produtos=None):
+        """
+        Soma as entradas e saídas por produto, funcionário ou dia.
+
+        A soma é feita com `numpy.bincount` sobre as chaves, em uma
+        passada pelas colunas, sem ordenar as linhas.
+
+        Args:
+            por (str): 'produto', 'funcionario' ou 'dia'. Os dias são
+            contados no fuso horário atual, com o deslocamento do
+            instante de cada linha.
+            inicio (datetime): Início do período, inclusivo. Opcional.
+            fim (datetime): Fim do período, exclusivo. Opcional.
+            movimento (str): 'e' ou 's'. Opcional.
+            produtos (iterable): Limita a soma a essas pks de produto.
+            Opcional.
+
+        Returns:
+            dict: Matrizes `chave` (pk, ou datetime64 no agrupamento
+            por dia), `entradas`, `saidas` e `itens`, alinhadas e em
+            ordem de chave. Chaves sem itens não aparecem.
+
+        Raises:
+            ValueError: Se o agrupamento for inválido.
+        """
+        if por not in AGRUPAMENTOS:
+            raise ValueError(
+                f'Agrupamento deve ser um de {", ".join(AGRUPAMENTOS)}.'
+            )
+        mascara = self._mascara(inicio, fim, movimento, produtos)
+        quantidade = self.quantidade
+        chaves = self.criado_em if por == 'dia' else getattr(self, por)
+        if mascara is not None:
+            chaves = chaves[mascara]
+            quantidade = quantidade[mascara]
+        if por == 'dia' and len(chaves):
+            # Cada linha usa o deslocamento do seu instante, que muda
+            # no horário de verão
+            instantes, deslocamentos = _deslocamentos(
+                int(chaves.min()), int(chaves.max())
+            )
+            if len(instantes) > 1:
+                deslocamento = deslocamentos[
+                    np.searchsorted(instantes, chaves, side='right') - 1
+                ]
+            else:
+                deslocamento = deslocamentos[0]
+            chaves = (chaves + deslocamento) // MICROSSEGUNDOS_POR_DIA
+
+        vazio = np.empty(0, dtype=np.int64)
+        if not len(chaves):
+            chave = vazio.astype('datetime64[D]') if por == 'dia' else vazio
+            return {
+                'chave': chave, 'entradas': vazio, 'saidas': vazio,
+                'itens': vazio,
+            }
+
+        base = chaves.min()
+        indices = (chaves - base).astype(np.intp)
+        tamanho = int(indices.max()) + 1
+        entradas = np.bincount(
+            indices, weights=np.maximum(quantidade, 0), minlength=tamanho
+        )
+        saidas = np.bincount(
+            indices, weights=np.maximum(-quantidade, 0), minlength=tamanho
+        )
+        itens = np.bincount(indices, minlength=tamanho)
+
+        presentes = np.flatnonzero(itens)
+        chave = presentes.astype(np.int64) + base
+        if por == 'dia':
+            chave = chave.astype('datetime64[D]')
+        return {
+            'chave': chave,
+            'entradas': entradas[presentes].astype(np.int64),
+            'saidas': saidas[presentes].astype(np.int64),
+            'itens': itens[presentes].astype(np.int64),
+        }
@@ -0,0 +1,98 @@
+import time
+
+from django.db.models.functions import Coalesce
+
+from produto.actions.fragmentos import somar
+from produto.models import Produto
+
+from ..models import ConferenciaEstoque, EstoqueItens
+from .baixa_estoque import LIQUIDO
+
+
+# Quantidade máxima de divergências guardadas em cada conferência.
+MAX_DIVERGENCIAS = 1000
+
+# Quantidade de linhas lidas do banco por vez.
+TAMANHO_LEITURA = 20000
+
+
+def divergencias(contagem=None):
+    """
+    Compara o estoque de cada produto com o saldo líquido do razão.
+
+    O razão é somado com uma única consulta agrupada por produto, e o
+    resultado é percorrido junto com os produtos, ambos em ordem de pk
+    e lidos em blocos, então a memória usada não depende do número de
+    produtos. Nos produtos fragmentados, o estoque comparado é a soma
+    dos fragmentos mais as reservas. O saldo esperado parte do saldo
+    de abertura deixado pelo arquivamento.
+
+    Args:
+        contagem (dict): Quando informado, recebe em `produtos` o
+        número de produtos conferidos. Opcional.
+
+    Yields:
+        tuple: (pk do produto, estoque esperado pelo razão, estoque
+        atual) de cada produto divergente.
+    """
+    liquidos = (
+        EstoqueItens.objects.values('produto')
+        .annotate(liquido=LIQUIDO)
+        .order_by('produto_id')
+        .values_list('produto', 'liquido')
+        .iterator(chunk_size=TAMANHO_LEITURA)
+    )
+    produtos = (
+        Produto.objects.order_by('pk')
+        .annotate(inicial=Coalesce('abertura__saldo', 0))
+        .values_list('pk', 'estoque', 'reservado', 'fragmentado', 'inicial')
+        .iterator(chunk_size=TAMANHO_LEITURA)
+    )
+
+    fragmentados = {}
+    produto_liquido, liquido = next(liquidos, (None, 0))
+    total_produtos = 0
+    for pk, estoque, reservado, fragmentado, esperado in produtos:
+        total_produtos += 1
+        # Produtos sem movimentação não aparecem na soma do razão
+        while produto_liquido is not None and produto_liquido <= pk:
+            if produto_liquido == pk:
+                esperado += liquido
+            produto_liquido, liquido = next(liquidos, (None, 0))
+        if fragmentado:
+            fragmentados[pk] = (esperado, reservado)
+        elif estoque != esperado:
+            yield pk, esperado, estoque
+
+    for pk, total in sorted(somar(fragmentados).items()):
+        esperado, reservado = fragmentados[pk]
+        if total + reservado != esperado:
+            yield pk, esperado, total + reservado
+    if contagem is not None:
+        contagem['produtos'] = total_produtos
+
+
+def conferir():
+    """
+    Confere o estoque de todos os produtos com o razão e registra a
+    duração e as divergências encontradas.
+
+    Returns:
+        ConferenciaEstoque: O registro da conferência, com até
+        `MAX_DIVERGENCIAS` divergências.
+    """
+    inicio = time.perf_counter()
+    contagem = {}
+    encontradas = []
+    divergentes = 0
+    for divergencia in divergencias(contagem):
+        divergentes += 1
+        if len(encontradas) < MAX_DIVERGENCIAS:
+            encontradas.append(divergencia)
+
+    return ConferenciaEstoque.objects.create(
+        segundos=time.perf_counter() - inicio,
+        produtos=contagem['produtos'],
+        divergentes=divergentes,
+        divergencias=encontradas,
+    )
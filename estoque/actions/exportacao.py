@@ -0,0 +1,184 @@
+import csv
+import io
+import json
+import zlib
+
+from .arquivamento import razoes
+
+
+# Linhas lidas do banco por vez e enviadas em cada bloco da resposta.
+LINHAS_POR_BLOCO = 2000
+
+# Formatos aceitos e o tipo de conteúdo de cada um.
+FORMATOS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Colunas da exportação e o campo lido de cada uma. Os campos do
+# movimento, do produto e do funcionário vêm por JOIN na mesma consulta.
+COLUNAS = (
+    ('movimento_id', 'estoque_id'),
+    ('criado_em', 'estoque__criado_em'),
+    ('movimento', 'estoque__movimento'),
+    ('nf', 'estoque__nf'),
+    ('funcionario', 'estoque__funcionario__username'),
+    ('item_id', 'pk'),
+    ('produto_id', 'produto_id'),
+    ('produto', 'produto__produto'),
+    ('quantidade', 'quantidade'),
+    ('saldo', 'saldo'),
+)
+
+
+def linhas_razao(inicio=None, fim=None, produtos=None, movimento=None,
+                 tamanho_lote=LINHAS_POR_BLOCO):
+    """
+    Percorre os itens do razão, do movimento mais antigo para o mais
+    recente, incluindo os arquivados quando o período os alcança.
+
+    As linhas são lidas com `iterator`, em lotes de `tamanho_lote`:
+    no PostgreSQL por um cursor do servidor e no SQLite pelo próprio
+    cursor da consulta, então a memória não cresce com o período.
+
+    Args:
+        inicio (datetime): Início do período, inclusivo. Opcional.
+        fim (datetime): Fim do período, exclusivo. Opcional.
+        produtos (iterable): Limita a exportação a essas pks de
+        produto. Opcional.
+        movimento (str): 'e' ou 's' para exportar só entradas ou
+        saídas. Opcional.
+        tamanho_lote (int): Quantidade de linhas lidas por vez.
+
+    Yields:
+        tuple: Os valores das `COLUNAS` de cada item.
+    """
+    campos = [campo for _, campo in COLUNAS]
+    # O arquivo tem os movimentos mais antigos, então vem primeiro
+    for modelo in reversed(razoes(inicio)):
+        itens = modelo.objects.all()
+        if inicio is not None:
+            itens = itens.filter(estoque__criado_em__gte=inicio)
+        if fim is not None:
+            itens = itens.filter(estoque__criado_em__lt=fim)
+        if produtos is not None:
+            itens = itens.filter(produto__in=list(produtos))
+        if movimento is not None:
+            itens = itens.filter(estoque__movimento=movimento)
+        yield from (
+            itens.order_by('estoque_id', 'pk')
+            .values_list(*campos)
+            .iterator(chunk_size=tamanho_lote)
+        )
+
+
+def _blocos(linhas, tamanho_lote):
+    """
+    Agrupa as linhas em listas de até `tamanho_lote` linhas.
+    """
+    bloco = []
+    for linha in linhas:
+        bloco.append(linha)
+        if len(bloco) == tamanho_lote:
+            yield bloco
+            bloco = []
+    if bloco:
+        yield bloco
+
+
+def _valor(valor):
+    """
+    Converte datas para ISO 8601 e mantém os demais valores.
+    """
+    return valor.isoformat() if hasattr(valor, 'isoformat') else valor
+
+
+def gerar_csv(linhas, tamanho_lote=LINHAS_POR_BLOCO):
+    """
+    Serializa as linhas do razão em CSV, começando pelo cabeçalho.
+
+    Args:
+        linhas (iterable): Linhas geradas por `linhas_razao`.
+        tamanho_lote (int): Quantidade de linhas por bloco de texto.
+
+    Yields:
+        str: O cabeçalho e depois um bloco de linhas por vez.
+    """
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow([coluna for coluna, _ in COLUNAS])
+    yield buffer.getvalue()
+    for bloco in _blocos(linhas, tamanho_lote):
+        buffer.seek(0)
+        buffer.truncate()
+        escritor.writerows(
+            [[_valor(valor) for valor in linha] for linha in bloco]
+        )
+        yield buffer.getvalue()
+
+
+def gerar_ndjson(linhas, tamanho_lote=LINHAS_POR_BLOCO):
+    """
+    Serializa as linhas do razão em NDJSON, um objeto por linha.
+
+    Args:
+        linhas (iterable): Linhas geradas por `linhas_razao`.
+        tamanho_lote (int): Quantidade de linhas por bloco de texto.
+
+    Yields:
+        str: Um bloco de linhas por vez.
+    """
+    nomes = [coluna for coluna, _ in COLUNAS]
+    for bloco in _blocos(linhas, tamanho_lote):
+        yield ''.join(
+            json.dumps(
+                dict(zip(nomes, map(_valor, linha))), ensure_ascii=False
+            ) + '\n'
+            for linha in bloco
+        )
+
+
+def comprimir(partes):
+    """
+    Comprime um fluxo de texto em gzip, sem juntar o fluxo na memória.
+
+    Cada parte é enviada com `Z_SYNC_FLUSH`, para que o cliente receba
+    os dados à medida que são lidos do banco.
+
+    Args:
+        partes (iterable): Partes de texto, como as de `gerar_csv`.
+
+    Yields:
+        bytes: O fluxo gzip.
+    """
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for parte in partes:
+        yield (
+            compressor.compress(parte.encode('utf-8'))
+            + compressor.flush(zlib.Z_SYNC_FLUSH)
+        )
+    yield compressor.flush()
+
+
+def exportar_razao(formato='csv', gzip=False, **filtros):
+    """
+    Gera a exportação do razão no formato pedido.
+
+    Args:
+        formato (str): 'csv' ou 'ndjson'.
+        gzip (bool): Se o fluxo deve ser comprimido em gzip.
+        **filtros: Filtros repassados a `linhas_razao`.
+
+    Returns:
+        iterator: Partes do arquivo, em bytes.
+
+    Raises:
+        ValueError: Se o formato for inválido.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f'Formato deve ser um de {", ".join(FORMATOS)}.')
+    gerar = gerar_csv if formato == 'csv' else gerar_ndjson
+    partes = gerar(linhas_razao(**filtros))
+    if gzip:
+        return comprimir(partes)
+    return (parte.encode('utf-8') for parte in partes)
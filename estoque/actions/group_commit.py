@@ -0,0 +1,209 @@
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+
+class _Tarefa:
+    """
+    Uma gravação enfileirada, com o resultado preenchido pela thread
+    gravadora.
+
+    Attributes:
+        funcao (function): Função que faz a gravação.
+        args (tuple): Argumentos posicionais da função.
+        kwargs (dict): Argumentos nomeados da função.
+        resultado: Valor retornado pela função.
+        erro (Exception): Exceção levantada pela função ou pelo commit.
+        concluida (Event): Sinalizado após o commit do lote.
+    """
+
+    def __init__(self, funcao, args, kwargs):
+        self.funcao = funcao
+        self.args = args
+        self.kwargs = kwargs
+        self.resultado = None
+        self.erro = None
+        self.concluida = threading.Event()
+
+
+class GravadorEmGrupo:
+    """
+    Gravador com group commit: as requisições enfileiram suas
+    gravações e uma única thread as executa em lotes, com um único
+    commit (e um único fsync) por lote.
+
+    Cada gravação roda em seu próprio savepoint, então a falha de uma
+    não desfaz as demais do lote. Quem enfileira espera o commit do
+    seu lote e recebe o próprio resultado ou exceção.
+
+    Attributes:
+        janela (float): Tempo máximo, em segundos, para juntar
+        gravações em um lote após a primeira chegar.
+        max_lote (int): Quantidade máxima de gravações por lote.
+    """
+
+    def __init__(self, janela_ms=5, max_lote=100):
+        self.janela = janela_ms / 1000
+        self.max_lote = max_lote
+        self.fila = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def iniciar(self):
+        """
+        Inicia a thread gravadora, se ainda não estiver rodando.
+        """
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._loop,
+                    name='estoque-group-commit',
+                    daemon=True,
+                )
+                self._thread.start()
+
+    def executar(self, funcao, *args, **kwargs):
+        """
+        Enfileira uma gravação e espera o commit do lote.
+
+        Não deve ser chamada de dentro de uma gravação em andamento,
+        pois a thread gravadora ficaria esperando por si mesma.
+
+        Args:
+            funcao (function): Função que faz a gravação.
+            *args: Argumentos posicionais da função.
+            **kwargs: Argumentos nomeados da função.
+
+        Returns:
+            O valor retornado pela função.
+
+        Raises:
+            Exception: A exceção levantada pela função ou pelo commit.
+        """
+        tarefa = _Tarefa(funcao, args, kwargs)
+        self.iniciar()
+        self.fila.put(tarefa)
+        tarefa.concluida.wait()
+        if tarefa.erro is not None:
+            raise tarefa.erro
+        return tarefa.resultado
+
+    def parar(self):
+        """
+        Encerra a thread gravadora depois das gravações já enfileiradas
+        e fecha a sua conexão com o banco.
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self.fila.put(None)
+            thread.join()
+
+    def _coletar(self):
+        """
+        Espera a primeira gravação e junta as que chegarem dentro da
+        janela, até o tamanho máximo do lote.
+
+        Returns:
+            list: As tarefas do lote, que termina antes de um pedido
+            de parada (None).
+        """
+        lote = [self.fila.get()]
+        limite = time.monotonic() + self.janela
+        while len(lote) < self.max_lote and lote[-1] is not None:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                lote.append(self.fila.get(timeout=restante))
+            except queue.Empty:
+                break
+        return lote
+
+    def _executar_lote(self, lote):
+        """
+        Executa as gravações do lote em uma única transação.
+
+        Args:
+            lote (list): As tarefas a serem executadas.
+        """
+        close_old_connections()
+        try:
+            with transaction.atomic():
+                for tarefa in lote:
+                    try:
+                        with transaction.atomic():
+                            tarefa.resultado = tarefa.funcao(
+                                *tarefa.args, **tarefa.kwargs
+                            )
+                    except Exception as erro:
+                        tarefa.erro = erro
+        except Exception as erro:
+            # O commit falhou: nenhuma gravação do lote foi mantida
+            for tarefa in lote:
+                if tarefa.erro is None:
+                    tarefa.resultado = None
+                    tarefa.erro = erro
+        finally:
+            for tarefa in lote:
+                tarefa.concluida.set()
+
+    def _loop(self):
+        """
+        Laço da thread gravadora.
+        """
+        try:
+            while True:
+                lote = self._coletar()
+                parar = lote[-1] is None
+                if parar:
+                    lote.pop()
+                if lote:
+                    self._executar_lote(lote)
+                if parar:
+                    break
+        finally:
+            connection.close()
+
+
+_gravador = None
+_gravador_lock = threading.Lock()
+
+
+def obter_gravador():
+    """
+    Retorna o gravador do processo, criando-o com as configurações
+    `ESTOQUE_GROUP_COMMIT_JANELA_MS` e `ESTOQUE_GROUP_COMMIT_MAX_LOTE`.
+
+    Returns:
+        GravadorEmGrupo: O gravador compartilhado pelo processo.
+    """
+    global _gravador
+    with _gravador_lock:
+        if _gravador is None:
+            janela_ms = getattr(settings, 'ESTOQUE_GROUP_COMMIT_JANELA_MS', 5)
+            max_lote = getattr(settings, 'ESTOQUE_GROUP_COMMIT_MAX_LOTE', 100)
+            _gravador = GravadorEmGrupo(janela_ms=janela_ms, max_lote=max_lote)
+        return _gravador
+
+
+def executar_gravacao(funcao, *args, **kwargs):
+    """
+    Executa uma gravação de movimento, usando o group commit quando
+    `ESTOQUE_GROUP_COMMIT` estiver habilitado.
+
+    Args:
+        funcao (function): Função que faz a gravação.
+        *args: Argumentos posicionais da função.
+        **kwargs: Argumentos nomeados da função.
+
+    Returns:
+        O valor retornado pela função.
+    """
+    if getattr(settings, 'ESTOQUE_GROUP_COMMIT', False):
+        return obter_gravador().executar(funcao, *args, **kwargs)
+    with transaction.atomic():
+        return funcao(*args, **kwargs)
@@ -0,0 +1,102 @@
+from ..models import EstoqueItens, EstoqueItensArquivo
+
+
+# Quantidade de movimentos por página do histórico de um produto.
+ITENS_POR_PAGINA = 20
+
+# Colunas de cada linha do histórico.
+CAMPOS = (
+    'pk',
+    'estoque_id',
+    'estoque__criado_em',
+    'estoque__nf',
+    'estoque__movimento',
+    'quantidade',
+    'saldo',
+    'estoque__funcionario__first_name',
+    'estoque__funcionario__username',
+)
+
+
+def ler_cursor(valor):
+    """
+    Lê o cursor de uma página do histórico.
+
+    Args:
+        valor (str): O cursor no formato `<pk do movimento>-<pk do
+        item>`, como gerado por `historico_produto`.
+
+    Returns:
+        tuple: (pk do movimento, pk do item), ou None se o cursor
+        estiver vazio ou for inválido.
+    """
+    try:
+        estoque, item = (int(parte) for parte in valor.split('-'))
+    except (AttributeError, ValueError):
+        return None
+    return estoque, item
+
+
+def consulta_pagina(modelo, produto, cursor):
+    """
+    Monta, sem executar, a consulta de uma página do histórico de um
+    produto em uma tabela de itens.
+
+    A consulta é um único intervalo do índice (produto, estoque),
+    percorrido do movimento mais recente para o mais antigo: o cursor
+    limita o intervalo, e não há OFFSET nem contagem.
+
+    Args:
+        modelo (Model): `EstoqueItens` ou `EstoqueItensArquivo`.
+        produto (int): A pk do produto.
+        cursor (tuple): (pk do movimento, pk do item) da última linha
+        da página anterior, ou None na primeira página.
+
+    Returns:
+        QuerySet: Os `CAMPOS` de cada linha, em ordem.
+    """
+    itens = modelo.objects.filter(produto=produto)
+    if cursor is not None:
+        estoque, item = cursor
+        # Itens do mesmo movimento que o cursor continuam pela pk
+        itens = itens.filter(estoque_id__lte=estoque).exclude(
+            estoque_id=estoque, pk__gte=item
+        )
+    return itens.order_by('-estoque_id', '-pk').values(*CAMPOS)
+
+
+def historico_produto(produto, cursor=None, limite=ITENS_POR_PAGINA):
+    """
+    Retorna uma página do histórico de movimentações de um produto,
+    do movimento mais recente para o mais antigo.
+
+    Quando as movimentações não arquivadas acabam, a página continua
+    pelos itens arquivados, que têm pks de movimento menores.
+
+    Args:
+        produto (int): A pk do produto.
+        cursor (tuple): Posição de início, lida com `ler_cursor`.
+        Quando None, retorna a primeira página.
+        limite (int): Quantidade de linhas por página.
+
+    Returns:
+        tuple: A lista de linhas da página e o cursor da página
+        seguinte, ou None se esta for a última.
+    """
+    linhas = list(
+        consulta_pagina(EstoqueItens, produto, cursor)[:limite + 1]
+    )
+    if len(linhas) <= limite:
+        ultima = linhas[-1] if linhas else None
+        posicao = (
+            (ultima['estoque_id'], ultima['pk']) if ultima else cursor
+        )
+        linhas += consulta_pagina(
+            EstoqueItensArquivo, produto, posicao
+        )[:limite + 1 - len(linhas)]
+
+    proximo = None
+    if len(linhas) > limite:
+        linhas = linhas[:limite]
+        proximo = f"{linhas[-1]['estoque_id']}-{linhas[-1]['pk']}"
+    return linhas, proximo
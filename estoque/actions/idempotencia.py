@@ -0,0 +1,180 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from ..models import ChaveIdempotencia
+
+
+# Nome do cabeçalho e do campo de formulário com a chave.
+CABECALHO = 'Idempotency-Key'
+CAMPO = 'idempotency_key'
+
+# Tamanho máximo aceito para a chave.
+TAMANHO_MAXIMO = 255
+
+
+def obter_chave(request):
+    """
+    Lê a chave de idempotência enviada na requisição.
+
+    Args:
+        request (HttpRequest): O objeto de solicitação HTTP.
+
+    Returns:
+        str: A chave enviada no cabeçalho `Idempotency-Key` ou no
+        campo `idempotency_key`, ou None se não houver chave válida.
+    """
+    chave = request.headers.get(CABECALHO) or request.POST.get(CAMPO)
+    return normalizar_chave(chave)
+
+
+def normalizar_chave(chave):
+    """
+    Remove espaços da chave e descarta valores vazios ou longos demais.
+
+    Args:
+        chave (str): A chave recebida.
+
+    Returns:
+        str: A chave normalizada, ou None se for inválida.
+    """
+    if not isinstance(chave, str):
+        return None
+    chave = chave.strip()
+    if not chave or len(chave) > TAMANHO_MAXIMO:
+        return None
+    return chave
+
+
+def expiracao():
+    """
+    Calcula a data de expiração de uma nova chave, de acordo com
+    `ESTOQUE_IDEMPOTENCIA_TTL_HORAS`.
+
+    Returns:
+        datetime: Data e hora em que a chave deixará de valer.
+    """
+    horas = getattr(settings, 'ESTOQUE_IDEMPOTENCIA_TTL_HORAS', 24)
+    return timezone.now() + timedelta(hours=horas)
+
+
+def buscar_movimentos(funcionario, chaves):
+    """
+    Busca as movimentações já criadas pelo funcionário com as chaves
+    informadas.
+
+    Usa o índice único das chaves, com uma consulta por chamada, e não
+    altera o banco: as chaves expiradas são ignoradas aqui e removidas
+    por `registrar_chaves` ou por `limpar_expiradas`.
+
+    Args:
+        funcionario (User): Usuário que enviou as chaves.
+        chaves (iterable): Tuplas (movimento, chave) a serem buscadas.
+
+    Returns:
+        dict: Pk do Estoque indexada pela tupla (movimento, chave),
+        somente para as chaves ainda válidas.
+    """
+    chaves = set(chaves)
+    if not chaves:
+        return {}
+
+    registros = ChaveIdempotencia.objects.filter(
+        funcionario=funcionario,
+        chave__in={chave for _, chave in chaves},
+        expira_em__gt=timezone.now(),
+    )
+    return {
+        (movimento, chave): estoque_id
+        for movimento, chave, estoque_id in registros.values_list(
+            'movimento', 'chave', 'estoque_id'
+        )
+        if (movimento, chave) in chaves
+    }
+
+
+def buscar_movimento(funcionario, movimento, chave):
+    """
+    Busca a movimentação já criada pelo funcionário com a chave
+    informada.
+
+    Args:
+        funcionario (User): Usuário que enviou a chave.
+        movimento (str): 'e' para entrada ou 's' para saída.
+        chave (str): A chave de idempotência.
+
+    Returns:
+        int: A pk do Estoque, ou None se a chave não existir ou
+        estiver expirada.
+    """
+    return buscar_movimentos(
+        funcionario, [(movimento, chave)]
+    ).get((movimento, chave))
+
+
+def registrar_chaves(pares):
+    """
+    Grava as chaves das movimentações criadas, no escopo do
+    funcionário e do movimento de cada uma.
+
+    Deve ser chamada na mesma transação que cria as movimentações.
+    Chaves expiradas no mesmo escopo são removidas antes, para que
+    possam ser reutilizadas. Se outra requisição já gravou a mesma
+    chave, o índice único levanta IntegrityError e a transação é
+    desfeita.
+
+    Args:
+        pares (list): Tuplas (chave, Estoque salvo).
+    """
+    if not pares:
+        return
+    escopos = {
+        (estoque.funcionario_id, estoque.movimento, chave)
+        for chave, estoque in pares
+    }
+    expiradas = ChaveIdempotencia.objects.filter(
+        funcionario_id__in={funcionario for funcionario, _, _ in escopos},
+        chave__in={chave for _, _, chave in escopos},
+        expira_em__lte=timezone.now(),
+    ).values_list('pk', 'funcionario_id', 'movimento', 'chave')
+    pks = [pk for pk, *escopo in expiradas if tuple(escopo) in escopos]
+    if pks:
+        ChaveIdempotencia.objects.filter(pk__in=pks).delete()
+
+    validade = expiracao()
+    ChaveIdempotencia.objects.bulk_create([
+        ChaveIdempotencia(
+            funcionario_id=estoque.funcionario_id,
+            movimento=estoque.movimento,
+            chave=chave,
+            estoque=estoque,
+            expira_em=validade,
+        )
+        for chave, estoque in pares
+    ])
+
+
+def limpar_expiradas(tamanho_lote=1000):
+    """
+    Remove as chaves expiradas em lotes, usando o índice de expiração,
+    para não manter uma transação longa sobre a tabela.
+
+    Args:
+        tamanho_lote (int): Quantidade de chaves removidas por DELETE.
+
+    Returns:
+        int: Total de chaves removidas.
+    """
+    agora = timezone.now()
+    total = 0
+    while True:
+        pks = list(
+            ChaveIdempotencia.objects.filter(expira_em__lte=agora)
+            .order_by('expira_em')
+            .values_list('pk', flat=True)[:tamanho_lote]
+        )
+        if not pks:
+            return total
+        ChaveIdempotencia.objects.filter(pk__in=pks).delete()
+        total += len(pks)
@@ -0,0 +1,206 @@
+from collections import defaultdict
+from datetime import datetime, time
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from ..models import EstoqueItens, EstoqueItensArquivo, MovimentoDiario
+
+
+# Quantidade de linhas por INSERT, abaixo do limite de variáveis do
+# SQLite com as seis colunas da tabela.
+LINHAS_POR_INSERT = 100
+
+# Funções que agrupam os dias de cada período.
+PERIODOS = {
+    'dia': None,
+    'semana': TruncWeek,
+    'mes': TruncMonth,
+}
+
+# Campo de agrupamento de cada visão dos totais.
+AGRUPAMENTOS = {
+    'produto': 'produto',
+    'categoria': 'produto__categoria',
+    'funcionario': 'funcionario',
+}
+
+
+def _somar(totais):
+    """
+    Soma os totais às linhas existentes, criando as que faltam, com um
+    `INSERT ... ON CONFLICT DO UPDATE` por bloco de linhas. A soma é
+    feita pelo banco, então movimentações simultâneas do mesmo produto
+    e dia não se sobrescrevem.
+
+    Args:
+        totais (dict): Tuplas (quantidade, itens) indexadas por
+        (pk do produto, dia, movimento, pk do funcionário).
+    """
+    nome = connection.ops.quote_name
+    tabela = nome(MovimentoDiario._meta.db_table)
+    colunas = ('produto_id', 'dia', 'movimento', 'funcionario_id')
+    linhas = [
+        (
+            produto, connection.ops.adapt_datefield_value(dia), movimento,
+            funcionario, quantidade, itens,
+        )
+        for (produto, dia, movimento, funcionario), (quantidade, itens)
+        in totais.items()
+    ]
+    with connection.cursor() as cursor:
+        for i in range(0, len(linhas), LINHAS_POR_INSERT):
+            bloco = linhas[i:i + LINHAS_POR_INSERT]
+            valores = ', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(bloco))
+            cursor.execute(
+                f'INSERT INTO {tabela} '
+                f'({", ".join(colunas)}, quantidade, itens) '
+                f'VALUES {valores} '
+                f'ON CONFLICT ({", ".join(colunas)}) DO UPDATE SET '
+                f'quantidade = {tabela}.quantidade + excluded.quantidade, '
+                f'itens = {tabela}.itens + excluded.itens',
+                [valor for linha in bloco for valor in linha]
+            )
+
+
+def acumular(itens):
+    """
+    Soma os itens gravados aos totais diários.
+
+    Deve ser chamada na mesma transação que gravou os itens, para que
+    os totais nunca fiquem à frente ou atrás do razão.
+
+    Args:
+        itens (list): Itens de estoque associados a registros de
+        Estoque já salvos.
+    """
+    totais = defaultdict(lambda: [0, 0])
+    for item in itens:
+        estoque = item.estoque
+        chave = (
+            item.produto_id,
+            timezone.localdate(estoque.criado_em),
+            estoque.movimento,
+            estoque.funcionario_id,
+        )
+        totais[chave][0] += item.quantidade
+        totais[chave][1] += 1
+    if totais:
+        _somar(totais)
+
+
+def reconstruir(desde=None):
+    """
+    Refaz os totais diários a partir dos itens, incluindo os
+    arquivados, em uma transação.
+
+    Args:
+        desde (date): Primeiro dia refeito. Quando None, refaz todos
+        os dias.
+
+    Returns:
+        int: Número de linhas gravadas.
+    """
+    with transaction.atomic():
+        antigos = MovimentoDiario.objects.all()
+        if desde is not None:
+            antigos = antigos.filter(dia__gte=desde)
+        antigos.delete()
+
+        total = 0
+        for modelo in (EstoqueItens, EstoqueItensArquivo):
+            itens = modelo.objects.all()
+            if desde is not None:
+                itens = itens.filter(
+                    estoque__criado_em__gte=timezone.make_aware(
+                        datetime.combine(desde, time.min)
+                    )
+                )
+            linhas = (
+                itens.annotate(dia=TruncDate('estoque__criado_em'))
+                .values(
+                    'produto', 'dia', 'estoque__movimento',
+                    'estoque__funcionario'
+                )
+                .annotate(quantidade=Sum('quantidade'), itens=Count('pk'))
+                .values_list(
+                    'produto', 'dia', 'estoque__movimento',
+                    'estoque__funcionario', 'quantidade', 'itens'
+                )
+                .order_by()
+            )
+            totais = {}
+            for produto, dia, movimento, funcionario, quantidade, n in linhas:
+                totais[(produto, dia, movimento, funcionario)] = (
+                    quantidade, n
+                )
+            # Os dois modelos podem ter o mesmo dia quando o corte do
+            # arquivamento não cai à meia-noite
+            _somar(totais)
+            total += len(totais)
+    return total
+
+
+def consulta_totais(periodo='dia', por='produto', inicio=None, fim=None,
+                    filtro=None):
+    """
+    Monta, sem executar, a consulta das entradas e saídas por período,
+    que soma os totais diários.
+
+    Args:
+        periodo (str): 'dia', 'semana' ou 'mes'. Semanas começam na
+        segunda-feira.
+        por (str): 'produto', 'categoria' ou 'funcionario'.
+        inicio (date): Primeiro dia incluído. Opcional.
+        fim (date): Último dia incluído. Opcional.
+        filtro (iterable): Limita a leitura a essas pks de produto,
+        categoria ou funcionário, conforme `por`. Opcional.
+
+    Returns:
+        QuerySet: Dicionários com `periodo` (o primeiro dia do
+        período), `chave` (a pk do produto, categoria ou funcionário),
+        `entradas` e `saidas`, em ordem de período.
+
+    Raises:
+        ValueError: Se o período ou o agrupamento forem inválidos.
+    """
+    if periodo not in PERIODOS or por not in AGRUPAMENTOS:
+        raise ValueError(
+            f'Período deve ser um de {", ".join(PERIODOS)} e o '
+            f'agrupamento um de {", ".join(AGRUPAMENTOS)}.'
+        )
+    campo = AGRUPAMENTOS[por]
+    linhas = MovimentoDiario.objects.all()
+    if inicio is not None:
+        linhas = linhas.filter(dia__gte=inicio)
+    if fim is not None:
+        linhas = linhas.filter(dia__lte=fim)
+    if filtro is not None:
+        linhas = linhas.filter(**{f'{campo}__in': list(filtro)})
+
+    truncar = PERIODOS[periodo]
+    return linhas.values(
+        periodo=truncar('dia') if truncar else F('dia'),
+        chave=F(campo),
+    ).annotate(
+        entradas=Sum('quantidade', filter=Q(movimento='e'), default=0),
+        saidas=Sum('quantidade', filter=Q(movimento='s'), default=0),
+    ).order_by('periodo', 'chave')
+
+
+def totais(periodo='dia', por='produto', inicio=None, fim=None,
+           filtro=None):
+    """
+    Lê as entradas e saídas por período, somando os totais diários.
+
+    Recebe os mesmos argumentos de `consulta_totais`.
+
+    Returns:
+        list: As linhas de `consulta_totais`.
+
+    Raises:
+        ValueError: Se o período ou o agrupamento forem inválidos.
+    """
+    return list(consulta_totais(periodo, por, inicio, fim, filtro))
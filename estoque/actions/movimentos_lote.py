@@ -0,0 +1,278 @@
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+
+from produto.actions.fragmentos import somar
+from produto.models import Produto
+
+from ..models import Estoque, EstoqueItens, MOVIMENTO
+from .baixa_estoque import EstoqueInsuficiente, registrar_itens, sinal
+from .idempotencia import buscar_movimentos, normalizar_chave, registrar_chaves
+
+
+# Quantidade máxima de documentos aceitos em uma única requisição.
+MAX_DOCUMENTOS = 1000
+
+# Maior valor aceito nos campos inteiros do documento, o limite das
+# colunas inteiras do banco.
+MAIOR_INTEIRO = 2 ** 31 - 1
+
+# Número de vezes que o lote é reprocessado quando outro movimento
+# consome o saldo entre a leitura e a atualização do estoque.
+TENTATIVAS = 3
+
+
+def validar_documento(documento):
+    """
+    Valida a estrutura de um documento de movimentação recebido
+    em JSON.
+
+    Args:
+        documento (dict): Documento no formato
+        `{"movimento": "e"|"s", "nf": int|null, "chave": str|null,
+        "itens": [{"produto": int, "quantidade": int}, ...]}`, onde
+        `chave` é uma chave de idempotência opcional.
+
+    Returns:
+        tuple: O documento normalizado (ou None) e a lista de erros.
+    """
+    if not isinstance(documento, dict):
+        return None, ['Documento deve ser um objeto.']
+
+    erros = []
+    movimento = documento.get('movimento')
+    if movimento not in dict(MOVIMENTO):
+        erros.append("movimento deve ser 'e' ou 's'.")
+
+    nf = documento.get('nf')
+    if nf is not None and (
+            not isinstance(nf, int) or isinstance(nf, bool) or nf <= 0):
+        erros.append('nf deve ser um inteiro positivo.')
+    elif nf is not None and nf > MAIOR_INTEIRO:
+        erros.append(f'nf deve ser no máximo {MAIOR_INTEIRO}.')
+
+    chave = documento.get('chave')
+    if chave is not None and normalizar_chave(chave) is None:
+        erros.append('chave deve ser um texto de até 255 caracteres.')
+
+    itens = documento.get('itens')
+    if not isinstance(itens, list) or not itens:
+        erros.append('itens deve ser uma lista não vazia.')
+        itens = []
+
+    linhas = []
+    for indice, item in enumerate(itens):
+        produto = item.get('produto') if isinstance(item, dict) else None
+        quantidade = item.get('quantidade') if isinstance(item, dict) else None
+        if not isinstance(produto, int) or isinstance(produto, bool):
+            erros.append(f'itens[{indice}].produto deve ser um inteiro.')
+        elif not 0 < produto <= MAIOR_INTEIRO:
+            erros.append(
+                f'itens[{indice}].produto deve estar entre 1 e '
+                f'{MAIOR_INTEIRO}.'
+            )
+        elif (not isinstance(quantidade, int) or isinstance(quantidade, bool)
+                or quantidade <= 0):
+            erros.append(
+                f'itens[{indice}].quantidade deve ser um inteiro positivo.'
+            )
+        elif quantidade > MAIOR_INTEIRO:
+            erros.append(
+                f'itens[{indice}].quantidade deve ser no máximo '
+                f'{MAIOR_INTEIRO}.'
+            )
+        else:
+            linhas.append((produto, quantidade))
+
+    if erros:
+        return None, erros
+    return {
+        'movimento': movimento,
+        'nf': nf,
+        'chave': normalizar_chave(chave),
+        'itens': linhas,
+    }, []
+
+
+def _separar_aceitos(documentos, estoques):
+    """
+    Simula os documentos em ordem sobre o estoque lido do banco e
+    separa os que podem ser aplicados.
+
+    Args:
+        documentos (list): Tuplas (índice, documento normalizado).
+        estoques (dict): Estoque disponível indexado pela pk do produto.
+
+    Returns:
+        tuple: Lista de documentos aceitos e dicionário de erros
+        indexado pelo índice do documento.
+    """
+    correntes = dict(estoques)
+    aceitos = []
+    erros = {}
+    for indice, documento in documentos:
+        deltas = defaultdict(int)
+        for produto, quantidade in documento['itens']:
+            deltas[produto] += sinal(documento['movimento']) * quantidade
+
+        inexistentes = [pk for pk in deltas if pk not in correntes]
+        if inexistentes:
+            erros[indice] = [f'Produto {pk} não encontrado.'
+                             for pk in inexistentes]
+            continue
+
+        faltantes = [
+            pk for pk, delta in deltas.items() if correntes[pk] + delta < 0
+        ]
+        if faltantes:
+            erros[indice] = [
+                f'Estoque insuficiente para o produto {pk} '
+                f'(disponível: {correntes[pk]}).' for pk in faltantes
+            ]
+            continue
+
+        for pk, delta in deltas.items():
+            correntes[pk] += delta
+        aceitos.append((indice, documento))
+    return aceitos, erros
+
+
+def _escopo(documento):
+    """
+    Retorna o escopo da chave de idempotência de um documento: o
+    movimento e a chave, já que o funcionário é o mesmo em toda a
+    requisição.
+    """
+    return documento['movimento'], documento['chave']
+
+
+def _gravar(aceitos, funcionario):
+    """
+    Grava os cabeçalhos com um `bulk_create`, e os itens e o estoque
+    com `registrar_itens`.
+
+    Args:
+        aceitos (list): Tuplas (índice, documento normalizado).
+        funcionario (User): Usuário responsável pelas movimentações.
+
+    Returns:
+        dict: Pk do Estoque criado indexada pelo índice do documento.
+    """
+    cabecalhos = Estoque.objects.bulk_create([
+        Estoque(
+            funcionario=funcionario,
+            nf=documento['nf'],
+            movimento=documento['movimento'],
+        )
+        for _, documento in aceitos
+    ])
+
+    registrar_chaves([
+        (documento['chave'], cabecalho)
+        for cabecalho, (_, documento) in zip(cabecalhos, aceitos)
+        if documento['chave']
+    ])
+
+    itens = []
+    for cabecalho, (_, documento) in zip(cabecalhos, aceitos):
+        for produto, quantidade in documento['itens']:
+            itens.append(EstoqueItens(
+                estoque=cabecalho,
+                produto_id=produto,
+                quantidade=quantidade,
+            ))
+    registrar_itens(itens)
+
+    return {
+        indice: cabecalho.pk
+        for cabecalho, (indice, _) in zip(cabecalhos, aceitos)
+    }
+
+
+def registrar_movimentos(documentos, funcionario):
+    """
+    Registra várias movimentações de estoque em uma única transação.
+
+    Todos os produtos referenciados são lidos com uma consulta, os
+    documentos são simulados em ordem para decidir quais podem ser
+    aplicados, e os aceitos são gravados com `bulk_create` e uma
+    atualização de estoque em lote. Documentos inválidos ou sem saldo
+    são recusados individualmente, sem impedir os demais.
+
+    Args:
+        documentos (list): Documentos recebidos em JSON.
+        funcionario (User): Usuário responsável pelas movimentações.
+
+    Returns:
+        list: Um resultado por documento, na mesma ordem, com
+        `status` 'ok' e a `pk` criada ou `status` 'erro' e os `erros`.
+    """
+    resultados = [None] * len(documentos)
+    validos = []
+    chaves = set()
+    for indice, documento in enumerate(documentos):
+        normalizado, erros = validar_documento(documento)
+        if not erros and _escopo(normalizado) in chaves:
+            erros = ['chave repetida na requisição.']
+        if erros:
+            resultados[indice] = {'status': 'erro', 'erros': erros}
+        else:
+            validos.append((indice, normalizado))
+            if normalizado['chave']:
+                chaves.add(_escopo(normalizado))
+
+    for tentativa in range(TENTATIVAS):
+        try:
+            with transaction.atomic():
+                # Documentos já gravados com a mesma chave não são
+                # aplicados de novo; devolvem a movimentação original
+                repetidos = buscar_movimentos(funcionario, chaves)
+                novos = [
+                    (indice, documento) for indice, documento in validos
+                    if _escopo(documento) not in repetidos
+                ]
+                pks_produto = {
+                    produto for _, documento in novos
+                    for produto, _ in documento['itens']
+                }
+                linhas = (
+                    Produto.ativos.select_for_update()
+                    .filter(pk__in=pks_produto)
+                    .values_list(
+                        'pk', 'estoque', 'reservado', 'fragmentado'
+                    )
+                )
+                # Só o estoque não reservado pode sair; nos produtos
+                # fragmentados ele é a soma dos fragmentos
+                estoques = {
+                    pk: estoque - reservado
+                    for pk, estoque, reservado, _ in linhas
+                }
+                estoques.update(somar(
+                    pk for pk, _, _, fragmentado in linhas if fragmentado
+                ))
+                aceitos, erros = _separar_aceitos(novos, estoques)
+                criados = _gravar(aceitos, funcionario) if aceitos else {}
+            break
+        except (EstoqueInsuficiente, IntegrityError):
+            # O estoque mudou após a leitura ou outra requisição gravou
+            # uma das chaves; relê e simula de novo
+            if tentativa == TENTATIVAS - 1:
+                raise
+
+    for indice, documento in validos:
+        if _escopo(documento) in repetidos:
+            resultados[indice] = {
+                'status': 'ok',
+                'pk': repetidos[_escopo(documento)],
+                'repetido': True,
+            }
+    for indice, pk in criados.items():
+        resultados[indice] = {'status': 'ok', 'pk': pk}
+    for indice, mensagens in erros.items():
+        resultados[indice] = {'status': 'erro', 'erros': mensagens}
+
+    return [
+        dict(indice=indice, **resultado)
+        for indice, resultado in enumerate(resultados)
+    ]
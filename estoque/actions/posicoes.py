@@ -0,0 +1,255 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Case, F, OuterRef, Q, Subquery, Sum, When
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from produto.models import FragmentoEstoque, Produto
+
+from ..models import PosicaoEstoque
+from .arquivamento import razoes
+from .baixa_estoque import LIQUIDO
+
+
+# Quantidade de posições gravadas por INSERT.
+TAMANHO_LOTE = 1000
+
+
+def inicio_do_dia(dia):
+    """
+    Retorna o primeiro instante de um dia no fuso horário atual.
+
+    Args:
+        dia (date): O dia.
+
+    Returns:
+        datetime: A meia-noite do dia, com fuso horário.
+    """
+    return timezone.make_aware(datetime.combine(dia, time.min))
+
+
+def fechamento(dia):
+    """
+    Retorna o instante em que um dia termina, que é o início do dia
+    seguinte. As movimentações anteriores a ele entram na posição do
+    dia.
+
+    Args:
+        dia (date): O dia.
+
+    Returns:
+        datetime: A meia-noite do dia seguinte, com fuso horário.
+    """
+    return inicio_do_dia(dia + timedelta(days=1))
+
+
+def _estoques_depois(momento, pks=None):
+    """
+    Lê, com uma única consulta, o estoque atual de cada produto e a
+    variação causada pelas movimentações a partir do momento informado.
+
+    Por ser uma só consulta, as duas colunas enxergam o mesmo estado
+    do banco, mesmo com movimentações sendo gravadas ao mesmo tempo.
+    Se o momento for anterior ao corte do arquivamento, os itens
+    arquivados também são descontados.
+
+    Args:
+        momento (datetime): Início das movimentações somadas.
+        pks (iterable): Limita a leitura a esses produtos. Opcional.
+
+    Returns:
+        dict: Estoque no momento informado, indexado pela pk do produto.
+    """
+    fragmentos = (
+        FragmentoEstoque.objects.filter(produto=OuterRef('pk'))
+        .values('produto')
+        .annotate(total=Sum('quantidade'))
+        .values('total')
+    )
+    posteriores = 0
+    for modelo in razoes(momento):
+        posteriores += Coalesce(
+            Subquery(
+                modelo.objects.filter(
+                    produto=OuterRef('pk'), estoque__criado_em__gte=momento
+                )
+                .values('produto')
+                .annotate(liquido=LIQUIDO)
+                .values('liquido')
+            ),
+            0
+        )
+    produtos = Produto.objects.order_by()
+    if pks is not None:
+        produtos = produtos.filter(pk__in=list(pks))
+    # Nos produtos fragmentados o estoque atual é a soma dos
+    # fragmentos mais as reservas
+    linhas = produtos.annotate(
+        atual=Case(
+            When(
+                fragmentado=True,
+                then=Coalesce(Subquery(fragmentos), 0) + F('reservado')
+            ),
+            default=F('estoque'),
+        ),
+        posteriores=posteriores,
+    ).values_list('pk', 'atual', 'posteriores')
+    return {pk: atual - posteriores for pk, atual, posteriores in linhas}
+
+
+def registrar_posicoes(inicio, fim=None):
+    """
+    Grava a posição de estoque de todos os produtos no fechamento de
+    cada dia entre `inicio` e `fim`.
+
+    A posição do último dia é calculada a partir do estoque atual,
+    descontando as movimentações feitas depois dele; as dos dias
+    anteriores descontam, dia a dia, as movimentações de cada um,
+    lidas com uma consulta agrupada. Posições já gravadas são
+    substituídas.
+
+    Args:
+        inicio (date): Primeiro dia.
+        fim (date): Último dia, que deve ser anterior a hoje. Quando
+        None, grava somente o dia `inicio`.
+
+    Returns:
+        int: Número de posições gravadas.
+
+    Raises:
+        ValueError: Se o intervalo for inválido ou incluir o dia atual.
+    """
+    fim = fim or inicio
+    if fim < inicio:
+        raise ValueError(
+            'O dia final deve ser igual ou posterior ao inicial.'
+        )
+    if fim >= timezone.localdate():
+        raise ValueError(
+            'Só é possível registrar posições de dias encerrados.'
+        )
+
+    with transaction.atomic():
+        posicoes = _estoques_depois(fechamento(fim))
+        variacoes = defaultdict(lambda: defaultdict(int))
+        for modelo in razoes(inicio_do_dia(inicio)):
+            linhas = (
+                modelo.objects.filter(
+                    estoque__criado_em__gte=inicio_do_dia(inicio),
+                    estoque__criado_em__lt=fechamento(fim),
+                )
+                .annotate(dia=TruncDate('estoque__criado_em'))
+                .values('dia', 'produto')
+                .annotate(liquido=LIQUIDO)
+                .values_list('dia', 'produto', 'liquido')
+                .order_by()
+            )
+            for dia, produto, liquido in linhas:
+                variacoes[dia][produto] += liquido
+
+        total = 0
+        dia = fim
+        while dia >= inicio:
+            PosicaoEstoque.objects.bulk_create(
+                [
+                    PosicaoEstoque(produto_id=pk, data=dia, estoque=estoque)
+                    for pk, estoque in posicoes.items()
+                ],
+                batch_size=TAMANHO_LOTE,
+                update_conflicts=True,
+                unique_fields=('produto', 'data'),
+                update_fields=('estoque',),
+            )
+            total += len(posicoes)
+            # A posição do dia anterior é a deste dia sem as
+            # movimentações feitas nele
+            for pk, liquido in variacoes[dia].items():
+                if pk in posicoes:
+                    posicoes[pk] -= liquido
+            dia -= timedelta(days=1)
+    return total
+
+
+def estoques_em(pks, momento):
+    """
+    Calcula o estoque de vários produtos em um momento passado.
+
+    Parte da posição mais recente de cada produto fechada até o
+    momento e soma apenas as movimentações feitas depois dela, então
+    o custo depende do intervalo entre as posições, e não do tamanho
+    do histórico. Produtos sem posição anterior ao momento são
+    calculados a partir do estoque atual, descontando as movimentações
+    feitas depois do momento.
+
+    Args:
+        pks (iterable): As pks dos produtos.
+        momento (datetime): O momento da consulta, com fuso horário.
+
+    Returns:
+        dict: Estoque no momento, indexado pela pk do produto.
+        Produtos inexistentes ficam de fora.
+    """
+    pks = list(pks)
+    dia = timezone.localdate(momento)
+    mais_recente = (
+        PosicaoEstoque.objects.filter(
+            produto=OuterRef('produto'), data__lt=dia
+        )
+        .order_by('-data')
+        .values('data')[:1]
+    )
+    posicoes = {
+        produto: (data, estoque) for produto, data, estoque in
+        PosicaoEstoque.objects.filter(
+            produto__in=pks, data=Subquery(mais_recente)
+        ).values_list('produto', 'data', 'estoque')
+    }
+
+    estoques = {}
+    if posicoes:
+        # Como as posições são gravadas para todos os produtos de uma
+        # vez, quase sempre há uma única data e o filtro fica curto
+        por_data = defaultdict(list)
+        for produto, (data, _) in posicoes.items():
+            por_data[data].append(produto)
+        filtro = Q()
+        for data, produtos in por_data.items():
+            filtro |= Q(
+                produto__in=produtos, estoque__criado_em__gte=fechamento(data)
+            )
+        variacoes = defaultdict(int)
+        for modelo in razoes(fechamento(min(por_data))):
+            linhas = (
+                modelo.objects.filter(filtro, estoque__criado_em__lt=momento)
+                .values('produto')
+                .annotate(liquido=LIQUIDO)
+                .values_list('produto', 'liquido')
+                .order_by()
+            )
+            for produto, liquido in linhas:
+                variacoes[produto] += liquido
+        estoques = {
+            produto: estoque + variacoes.get(produto, 0)
+            for produto, (_, estoque) in posicoes.items()
+        }
+
+    sem_posicao = [pk for pk in pks if pk not in posicoes]
+    if sem_posicao:
+        estoques.update(_estoques_depois(momento, sem_posicao))
+    return estoques
+
+
+def estoque_em(produto, momento):
+    """
+    Calcula o estoque de um produto em um momento passado.
+
+    Args:
+        produto (int): A pk do produto.
+        momento (datetime): O momento da consulta, com fuso horário.
+
+    Returns:
+        int: O estoque no momento, ou None se o produto não existir.
+    """
+    return estoques_em([produto], momento).get(produto)
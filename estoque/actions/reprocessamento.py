@@ -0,0 +1,444 @@
+import multiprocessing
+import os
+
+import django
+from django.db import OperationalError, connection, transaction
+from django.db.models import (
+    Case, F, IntegerField, OuterRef, Subquery, Sum, Value, When, Window,
+)
+from django.db.models.expressions import RowRange
+from django.db.models.functions import Coalesce
+
+from produto.actions.alertas import registrar_cruzamentos
+from produto.actions.alteracoes import registrar_movimentos
+from produto.models import Produto
+
+from ..models import AberturaEstoque, EstoqueItens
+from .baixa_estoque import LIQUIDO, TAMANHO_LOTE, VARIACAO
+
+
+# Quantidade de produtos reprocessados em cada transação.
+PRODUTOS_POR_LOTE = 1000
+
+# Quantidade de itens lidos do banco por vez no reprocessamento em
+# Python.
+TAMANHO_LEITURA = 20000
+
+# Ordem dos itens no razão: a data da movimentação e, no mesmo
+# instante, a ordem de gravação.
+ORDEM = ('estoque__criado_em', 'estoque_id', 'pk')
+
+
+def _saldo_corrente():
+    """
+    Retorna a soma acumulada das variações de cada produto, na ordem
+    do razão, como função de janela, somada ao saldo de abertura do
+    produto deixado pelo arquivamento.
+
+    Returns:
+        Expression: A expressão do saldo corrente.
+    """
+    abertura = AberturaEstoque.objects.filter(
+        produto=OuterRef('produto')
+    ).values('saldo')
+    return Window(
+        Sum(VARIACAO),
+        partition_by=F('produto'),
+        order_by=[F(campo).asc() for campo in ORDEM],
+        frame=RowRange(start=None, end=0),
+    ) + Coalesce(Subquery(abertura), 0)
+
+
+def atualiza_no_banco():
+    """
+    Indica se o banco calcula e grava os saldos com um único
+    `UPDATE ... FROM` sobre uma função de janela, sem trazer os itens
+    para o Python.
+
+    Returns:
+        bool: True no PostgreSQL e no SQLite 3.33 ou mais recente.
+    """
+    if not connection.features.supports_over_clause:
+        return False
+    if connection.vendor == 'sqlite':
+        return connection.Database.sqlite_version_info >= (3, 33)
+    return connection.vendor == 'postgresql'
+
+
+def _negativos(itens):
+    """
+    Encontra os produtos cujo saldo corrente fica negativo em algum
+    ponto do razão.
+
+    Args:
+        itens (QuerySet): Itens dos produtos do lote.
+
+    Returns:
+        set: As pks dos produtos.
+    """
+    return set(
+        itens.annotate(corrente=_saldo_corrente())
+        .filter(corrente__lt=0)
+        .values_list('produto', flat=True)
+        .order_by()
+    )
+
+
+def _gravar_no_banco(itens):
+    """
+    Regrava os saldos divergentes com um único UPDATE, calculando o
+    saldo corrente com uma função de janela no próprio banco.
+
+    Args:
+        itens (QuerySet): Itens dos produtos do lote.
+
+    Returns:
+        int: Número de itens regravados.
+    """
+    janela = (
+        itens.annotate(corrente=_saldo_corrente())
+        .values('pk', 'corrente')
+        .order_by()
+    )
+    consulta, parametros = janela.query.sql_with_params()
+    tabela = connection.ops.quote_name(EstoqueItens._meta.db_table)
+    pk = connection.ops.quote_name(EstoqueItens._meta.pk.column)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {tabela} SET saldo = janela.corrente '
+            f'FROM ({consulta}) AS janela '
+            f'WHERE {tabela}.{pk} = janela.{pk} '
+            f'AND {tabela}.saldo <> janela.corrente',
+            parametros
+        )
+        return cursor.rowcount
+
+
+def _saldos_em_python(itens, aberturas):
+    """
+    Lê os itens em blocos, na ordem do razão, e calcula o saldo
+    corrente de cada um. Usa a função de janela quando o banco tem
+    suporte; caso contrário, acumula as variações no Python a partir
+    do saldo de abertura.
+
+    Args:
+        itens (QuerySet): Itens dos produtos do lote.
+        aberturas (dict): Saldo de abertura indexado pela pk do
+        produto.
+
+    Yields:
+        tuple: (pk do item, pk do produto, saldo gravado, saldo
+        corrente), agrupados por produto.
+    """
+    ordem = ('produto_id', *ORDEM)
+    if connection.features.supports_over_clause:
+        yield from (
+            itens.annotate(corrente=_saldo_corrente())
+            .values_list('pk', 'produto', 'saldo', 'corrente')
+            .order_by(*ordem)
+            .iterator(chunk_size=TAMANHO_LEITURA)
+        )
+        return
+
+    produto_atual, corrente = None, 0
+    for pk, produto, saldo, variacao in (
+            itens.annotate(variacao=VARIACAO)
+            .values_list('pk', 'produto', 'saldo', 'variacao')
+            .order_by(*ordem)
+            .iterator(chunk_size=TAMANHO_LEITURA)):
+        if produto != produto_atual:
+            produto_atual, corrente = produto, aberturas.get(produto, 0)
+        corrente += variacao
+        yield pk, produto, saldo, corrente
+
+
+def _regravar(itens):
+    """
+    Grava o saldo dos itens com `bulk_update`, em lotes.
+
+    Args:
+        itens (list): Itens com a pk e o novo saldo.
+
+    Returns:
+        int: Número de itens regravados.
+    """
+    EstoqueItens.objects.bulk_update(itens, ['saldo'], batch_size=TAMANHO_LOTE)
+    return len(itens)
+
+
+def _gravar_em_python(itens, aberturas):
+    """
+    Regrava os saldos divergentes com `bulk_update`, em lotes.
+
+    Os itens de um produto só são regravados depois de lido o razão
+    inteiro do produto, para que um saldo negativo descarte o produto
+    sem alterações.
+
+    Args:
+        itens (QuerySet): Itens dos produtos do lote.
+        aberturas (dict): Saldo de abertura indexado pela pk do
+        produto.
+
+    Returns:
+        tuple: Número de itens regravados e o conjunto das pks dos
+        produtos com saldo negativo.
+    """
+    total = 0
+    negativos = set()
+    pendentes = []
+    do_produto = []
+    produto_atual = None
+    for pk, produto, saldo, corrente in _saldos_em_python(itens, aberturas):
+        if produto != produto_atual:
+            if produto_atual not in negativos:
+                pendentes.extend(do_produto)
+            if len(pendentes) >= TAMANHO_LEITURA:
+                total += _regravar(pendentes)
+                pendentes = []
+            do_produto = []
+            produto_atual = produto
+        if corrente < 0:
+            negativos.add(produto)
+        elif saldo != corrente:
+            do_produto.append(EstoqueItens(pk=pk, saldo=corrente))
+    if produto_atual not in negativos:
+        pendentes.extend(do_produto)
+    if pendentes:
+        total += _regravar(pendentes)
+    return total, negativos
+
+
+class Resumo:
+    """
+    Resultado de um reprocessamento, somado entre lotes e processos.
+
+    Attributes:
+        itens (int): Itens com o saldo regravado.
+        produtos (int): Produtos com o estoque regravado.
+        fragmentados (int): Produtos fragmentados com o estoque
+        divergente do razão, que não são alterados.
+        negativos (list): Pks dos produtos cujo saldo fica negativo
+        no razão, que não são alterados.
+    """
+
+    def __init__(self, itens=0, produtos=0, fragmentados=0, negativos=()):
+        self.itens = itens
+        self.produtos = produtos
+        self.fragmentados = fragmentados
+        self.negativos = sorted(negativos)
+
+    def somar(self, outro):
+        """
+        Acrescenta o resultado de outro lote ou processo.
+
+        Args:
+            outro (Resumo): O resultado a ser somado.
+        """
+        self.itens += outro.itens
+        self.produtos += outro.produtos
+        self.fragmentados += outro.fragmentados
+        self.negativos = sorted(self.negativos + outro.negativos)
+
+
+def reprocessar_lote(primeiro, ultimo):
+    """
+    Recalcula os saldos do razão e o estoque dos produtos com pk entre
+    `primeiro` e `ultimo`, em uma transação.
+
+    O saldo de cada item passa a ser o saldo de abertura do produto
+    (o estoque do cadastro mais os movimentos arquivados) mais a soma
+    das entradas menos as saídas até ele, na ordem do razão, e o
+    estoque do produto passa a ser o saldo final. Só as linhas
+    divergentes são regravadas. Produtos cujo saldo fica negativo em
+    algum ponto não são alterados, pois o razão não explica o seu
+    estoque; produtos fragmentados só têm os saldos regravados.
+
+    Args:
+        primeiro (int): Menor pk de produto do lote.
+        ultimo (int): Maior pk de produto do lote.
+
+    Returns:
+        Resumo: O resultado do lote.
+    """
+    with transaction.atomic():
+        produtos = {
+            pk: (estoque, minimo, fragmentado)
+            for pk, estoque, minimo, fragmentado in
+            Produto.objects.select_for_update()
+            .filter(pk__gte=primeiro, pk__lte=ultimo)
+            .values_list('pk', 'estoque', 'estoque_minimo', 'fragmentado')
+        }
+        itens = EstoqueItens.objects.filter(
+            produto__gte=primeiro, produto__lte=ultimo
+        )
+        aberturas = dict(
+            AberturaEstoque.objects.filter(
+                produto__gte=primeiro, produto__lte=ultimo
+            ).values_list('produto', 'saldo')
+        )
+
+        if atualiza_no_banco():
+            negativos = _negativos(itens)
+            itens = itens.exclude(produto__in=negativos)
+            total_itens = _gravar_no_banco(itens)
+        else:
+            total_itens, negativos = _gravar_em_python(itens, aberturas)
+            itens = itens.exclude(produto__in=negativos)
+
+        # Produtos com todos os movimentos arquivados só têm o saldo
+        # de abertura
+        totais = {
+            pk: saldo for pk, saldo in aberturas.items()
+            if pk not in negativos
+        }
+        for pk, liquido in (
+                itens.values('produto').annotate(total=LIQUIDO)
+                .values_list('produto', 'total')
+                .order_by()):
+            totais[pk] = totais.get(pk, 0) + liquido
+        finais = {
+            pk: total for pk, total in totais.items()
+            if pk in produtos and total != produtos[pk][0]
+        }
+        fragmentados = [pk for pk in finais if produtos[pk][2]]
+        for pk in fragmentados:
+            del finais[pk]
+
+        pks = list(finais)
+        for i in range(0, len(pks), TAMANHO_LOTE):
+            lote = pks[i:i + TAMANHO_LOTE]
+            Produto.objects.filter(pk__in=lote).update(
+                estoque=Case(
+                    *[When(pk=pk, then=Value(finais[pk])) for pk in lote],
+                    default=F('estoque'),
+                    output_field=IntegerField()
+                )
+            )
+        registrar_cruzamentos(
+            (pk, produtos[pk][0] < produtos[pk][1], estoque, produtos[pk][1])
+            for pk, estoque in finais.items()
+        )
+        # A correção chega aos sistemas externos como uma movimentação
+        # com a diferença regravada
+        registrar_movimentos(finais, {
+            pk: estoque - produtos[pk][0] for pk, estoque in finais.items()
+        })
+
+    return Resumo(total_itens, len(finais), len(fragmentados), negativos)
+
+
+def _intervalos(produtos_por_lote):
+    """
+    Divide as pks dos produtos em intervalos contíguos.
+
+    Args:
+        produtos_por_lote (int): Quantidade de produtos por intervalo.
+
+    Returns:
+        list: Tuplas (menor pk, maior pk).
+    """
+    pks = list(
+        Produto.objects.order_by('pk').values_list('pk', flat=True)
+    )
+    return [
+        (pks[i], pks[min(i + produtos_por_lote, len(pks)) - 1])
+        for i in range(0, len(pks), produtos_por_lote)
+    ]
+
+
+def _processo(intervalos, verificar):
+    """
+    Ponto de entrada de cada processo do reprocessamento.
+
+    Returns:
+        Resumo: O resultado somado dos intervalos do processo.
+    """
+    try:
+        return _reprocessar_intervalos(intervalos, verificar)
+    finally:
+        connection.close()
+
+
+def _reprocessar_intervalos(intervalos, verificar):
+    """
+    Reprocessa os intervalos de produtos em sequência.
+
+    Args:
+        intervalos (list): Tuplas (menor pk, maior pk).
+        verificar (bool): Se True, desfaz cada lote após contar as
+        divergências.
+
+    Returns:
+        Resumo: O resultado somado dos lotes.
+    """
+    resultado = Resumo()
+    for primeiro, ultimo in intervalos:
+        while True:
+            try:
+                with transaction.atomic():
+                    resumo = reprocessar_lote(primeiro, ultimo)
+                    transaction.set_rollback(verificar)
+                break
+            except OperationalError as erro:
+                # No SQLite, outro processo está gravando o banco; o
+                # lote é repetido quando o bloqueio for liberado
+                if 'locked' not in str(erro):
+                    raise
+        resultado.somar(resumo)
+    return resultado
+
+
+def processos_padrao():
+    """
+    Retorna o número de processos usado por padrão.
+
+    No SQLite toda gravação bloqueia o banco inteiro, então processos
+    paralelos só disputariam o bloqueio.
+
+    Returns:
+        int: 1 no SQLite e o número de CPUs nos demais bancos.
+    """
+    if connection.vendor == 'sqlite':
+        return 1
+    return os.cpu_count() or 1
+
+
+def reprocessar(processos=None, produtos_por_lote=PRODUTOS_POR_LOTE,
+                verificar=False):
+    """
+    Recalcula o saldo de todos os itens do razão e o estoque de todos
+    os produtos a partir das entradas e saídas gravadas.
+
+    Os produtos são divididos em intervalos de pks, e os intervalos
+    distribuídos entre os processos; cada intervalo é uma transação
+    (ver `reprocessar_lote`).
+
+    Args:
+        processos (int): Número de processos. Quando None, usa
+        `processos_padrao()`.
+        produtos_por_lote (int): Quantidade de produtos por transação.
+        verificar (bool): Se True, só conta as divergências, sem
+        gravar nada.
+
+    Returns:
+        Resumo: O resultado somado; ao verificar, os itens e produtos
+        que seriam regravados.
+    """
+    processos = processos or processos_padrao()
+    intervalos = _intervalos(produtos_por_lote)
+    if processos <= 1 or len(intervalos) <= 1:
+        return _reprocessar_intervalos(intervalos, verificar)
+
+    # Os processos filhos são iniciados com 'spawn' e configuram o
+    # Django antes de importar este módulo, que depende dos modelos.
+    # Cada um abre as próprias conexões
+    connection.close()
+    contexto = multiprocessing.get_context('spawn')
+    with contexto.Pool(processos, initializer=django.setup) as pool:
+        parciais = pool.starmap(_processo, [
+            (intervalos[i::processos], verificar) for i in range(processos)
+        ])
+    resultado = Resumo()
+    for parcial in parciais:
+        resultado.somar(parcial)
+    return resultado
@@ -0,0 +1,301 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from produto.actions.fragmentos import movimentar, produtos_fragmentados
+from produto.models import Produto
+
+from ..models import Estoque, EstoqueItens, Reserva
+from .baixa_estoque import EstoqueInsuficiente, TAMANHO_LOTE, registrar_itens
+from .movimentos_lote import MAIOR_INTEIRO
+
+
+# Maior duração aceita para uma reserva, em minutos (30 dias).
+MAXIMO_MINUTOS = 30 * 24 * 60
+
+
+class ReservaInvalida(Exception):
+    """
+    Exceção levantada ao confirmar ou liberar uma reserva inexistente,
+    já encerrada ou expirada.
+    """
+
+    def __init__(self, pk):
+        self.pk = pk
+        super().__init__(
+            f'Reserva {pk} inexistente, encerrada ou expirada.'
+        )
+
+
+def validar_reserva(dados):
+    """
+    Valida o corpo JSON de uma nova reserva.
+
+    Args:
+        dados (dict): Documento no formato `{"produto": int,
+        "quantidade": int, "minutos": int|null}`, com `minutos` até
+        `MAXIMO_MINUTOS`.
+
+    Returns:
+        tuple: O documento normalizado (ou None) e a lista de erros.
+    """
+    if not isinstance(dados, dict):
+        return None, ['Documento deve ser um objeto.']
+
+    erros = []
+    campos = {}
+    for campo, obrigatorio, maximo in (
+            ('produto', True, MAIOR_INTEIRO),
+            ('quantidade', True, MAIOR_INTEIRO),
+            ('minutos', False, MAXIMO_MINUTOS)):
+        valor = dados.get(campo)
+        if valor is None and not obrigatorio:
+            campos[campo] = None
+        elif not isinstance(valor, int) or isinstance(valor, bool) \
+                or valor <= 0:
+            erros.append(f'{campo} deve ser um inteiro positivo.')
+        elif valor > maximo:
+            erros.append(f'{campo} deve ser no máximo {maximo}.')
+        else:
+            campos[campo] = valor
+
+    if erros:
+        return None, erros
+    return campos, []
+
+
+def validade(minutos=None):
+    """
+    Calcula a expiração de uma nova reserva.
+
+    Args:
+        minutos (int): Duração da reserva. Quando None, usa
+        `ESTOQUE_RESERVA_TTL_MINUTOS`.
+
+    Returns:
+        datetime: Data e hora em que a reserva expira.
+    """
+    if minutos is None:
+        minutos = getattr(settings, 'ESTOQUE_RESERVA_TTL_MINUTOS', 30)
+    return timezone.now() + timedelta(minutes=minutos)
+
+
+def _reservar(pk, quantidade):
+    """
+    Soma a quantidade em `Produto.reservado` se houver estoque
+    disponível, com um UPDATE condicional.
+
+    Em produtos fragmentados a quantidade é retirada dos fragmentos,
+    que guardam somente o estoque não reservado.
+
+    Args:
+        pk (int): A pk do produto.
+        quantidade (int): A quantidade a reservar.
+
+    Returns:
+        bool: False se não houver estoque disponível.
+    """
+    produto = Produto.objects.filter(pk=pk)
+    if produto.filter(
+            fragmentado=False,
+            estoque__gte=F('reservado') + quantidade).update(
+            reservado=F('reservado') + quantidade):
+        return True
+    if pk in produtos_fragmentados([pk]) and movimentar(pk, -quantidade):
+        produto.update(reservado=F('reservado') + quantidade)
+        return True
+    return False
+
+
+def _devolver(quantidades):
+    """
+    Desconta de `Produto.reservado` as quantidades de reservas
+    encerradas, com um UPDATE por lote de produtos, e devolve aos
+    fragmentos a parte dos produtos fragmentados.
+
+    Args:
+        quantidades (dict): Quantidade indexada pela pk do produto.
+    """
+    pks = list(quantidades)
+    for i in range(0, len(pks), TAMANHO_LOTE):
+        lote = pks[i:i + TAMANHO_LOTE]
+        Produto.objects.filter(pk__in=lote).update(
+            reservado=F('reservado') - Case(
+                *[When(pk=pk, then=Value(quantidades[pk])) for pk in lote],
+                default=Value(0),
+                output_field=IntegerField()
+            )
+        )
+    for pk in produtos_fragmentados(pks):
+        movimentar(pk, quantidades[pk])
+
+
+def criar_reserva(produto, quantidade, funcionario, minutos=None):
+    """
+    Reserva uma quantidade de um produto para um pedido pendente.
+
+    Reservas vencidas continuam somadas em `Produto.reservado` até a
+    limpeza periódica; se faltar estoque, as do produto são liberadas
+    antes de recusar a reserva.
+
+    Args:
+        produto (int): A pk do produto.
+        quantidade (int): A quantidade a reservar.
+        funcionario (User): Usuário que cria a reserva.
+        minutos (int): Duração da reserva. Opcional.
+
+    Returns:
+        Reserva: A reserva criada.
+
+    Raises:
+        Produto.DoesNotExist: Se o produto não existir.
+        EstoqueInsuficiente: Se não houver estoque disponível.
+    """
+    for tentativa in range(2):
+        with transaction.atomic():
+            if _reservar(produto, quantidade):
+                return Reserva.objects.create(
+                    produto_id=produto,
+                    quantidade=quantidade,
+                    funcionario=funcionario,
+                    expira_em=validade(minutos),
+                )
+        if not liberar_expiradas(produto=produto):
+            break
+
+    atual = Produto.objects.get(pk=produto)
+    raise EstoqueInsuficiente(
+        [(atual.pk, atual.produto, atual.estoque_disponivel)]
+    )
+
+
+def confirmar_reserva(pk, funcionario, nf=None):
+    """
+    Confirma uma reserva ativa, transformando-a em uma saída de
+    estoque.
+
+    A quantidade reservada é devolvida e retirada em seguida pela
+    saída, na mesma transação, pelo mesmo caminho das demais
+    movimentações.
+
+    Args:
+        pk (int): A pk da reserva.
+        funcionario (User): Usuário responsável pela saída.
+        nf (int): Número da nota fiscal. Opcional.
+
+    Returns:
+        int: A pk da saída criada.
+
+    Raises:
+        ReservaInvalida: Se a reserva não estiver ativa ou já tiver
+        expirado.
+    """
+    with transaction.atomic():
+        agora = timezone.now()
+        reservas = Reserva.objects.filter(pk=pk)
+        if not reservas.filter(status='a', expira_em__gt=agora).update(
+                status='c', atualizado_em=agora):
+            raise ReservaInvalida(pk)
+        produto, quantidade = reservas.values_list(
+            'produto_id', 'quantidade'
+        ).get()
+        _devolver({produto: quantidade})
+
+        estoque = Estoque(funcionario=funcionario, nf=nf, movimento='s')
+        estoque.save()
+        registrar_itens([
+            EstoqueItens(
+                estoque=estoque, produto_id=produto, quantidade=quantidade
+            )
+        ])
+        reservas.update(estoque=estoque)
+    return estoque.pk
+
+
+def liberar_reserva(pk):
+    """
+    Libera uma reserva ativa, devolvendo a quantidade ao estoque
+    disponível.
+
+    Args:
+        pk (int): A pk da reserva.
+
+    Raises:
+        ReservaInvalida: Se a reserva não estiver ativa.
+    """
+    with transaction.atomic():
+        reservas = Reserva.objects.filter(pk=pk)
+        if not reservas.filter(status='a').update(
+                status='l', atualizado_em=timezone.now()):
+            raise ReservaInvalida(pk)
+        produto, quantidade = reservas.values_list(
+            'produto_id', 'quantidade'
+        ).get()
+        _devolver({produto: quantidade})
+
+
+def consulta_vencidas(agora, produto=None):
+    """
+    Monta, sem executar, a consulta das reservas ativas vencidas lidas
+    por `liberar_expiradas`.
+
+    Args:
+        agora (datetime): Reservas que expiram até este instante estão
+        vencidas.
+        produto (int): Limita a consulta a um produto. Opcional.
+
+    Returns:
+        QuerySet: Pk, produto e quantidade de cada reserva, em ordem de
+        expiração.
+    """
+    vencidas = Reserva.objects.filter(status='a', expira_em__lte=agora)
+    if produto is not None:
+        vencidas = vencidas.filter(produto=produto)
+    return vencidas.order_by('expira_em').values_list(
+        'pk', 'produto_id', 'quantidade'
+    )
+
+
+def liberar_expiradas(tamanho_lote=1000, produto=None):
+    """
+    Marca como expiradas as reservas ativas vencidas e devolve as
+    quantidades ao estoque disponível, em lotes.
+
+    Usa o índice parcial de expiração das reservas ativas, então o
+    custo depende só das reservas vencidas. Cada lote é uma transação
+    curta, com um UPDATE das reservas e um por lote de produtos.
+
+    Args:
+        tamanho_lote (int): Quantidade de reservas por transação.
+        produto (int): Limita a limpeza a um produto. Opcional.
+
+    Returns:
+        int: Total de reservas expiradas.
+    """
+    agora = timezone.now()
+    vencidas = consulta_vencidas(agora, produto)
+
+    total = 0
+    while True:
+        with transaction.atomic():
+            linhas = list(vencidas[:tamanho_lote])
+            if not linhas:
+                return total
+
+            pks = [pk for pk, _, _ in linhas]
+            if Reserva.objects.filter(pk__in=pks, status='a').update(
+                    status='x', atualizado_em=agora) != len(pks):
+                # Outra transação encerrou alguma reserva do lote após a
+                # leitura; desfaz e lê o lote de novo
+                transaction.set_rollback(True)
+                continue
+
+            quantidades = defaultdict(int)
+            for _, pk_produto, quantidade in linhas:
+                quantidades[pk_produto] += quantidade
+            _devolver(quantidades)
+        total += len(linhas)
@@ -1,10 +1,67 @@
 from django.contrib import admin
+from django.db.models import Q
 
-from .models import EstoqueEntrada, EstoqueSaida, EstoqueItens
+from .models import (
+    ConferenciaEstoque,
+    EstoqueArquivo,
+    EstoqueEntrada,
+    EstoqueItens,
+    EstoqueItensArquivo,
+    EstoqueSaida,
+    Reserva,
+)
 
 # Register your models here.
 
 
+# Maior número de nota fiscal, o limite do campo inteiro positivo.
+MAIOR_NF = 2147483647
+
+
+class BuscaPorNFMixin:
+    """
+    Busca os movimentos pelo início do número da nota fiscal, como
+    intervalos do índice de nota fiscal, em vez de procurar o texto em
+    qualquer parte do número, o que obriga a ler a tabela inteira.
+
+    "12" encontra as notas 12, 120 a 129, 1200 a 1299 e assim por
+    diante: um intervalo para cada quantidade de dígitos.
+
+    Atributos:
+        filtro_indice_nf (dict): Filtros de igualdade que antecedem a
+        nota fiscal no índice, como o tipo de movimento.
+    """
+    search_fields = ('nf',)
+    filtro_indice_nf = {}
+
+    def get_search_results(self, request, queryset, search_term):
+        termo = search_term.strip()
+        if not termo:
+            return queryset, False
+        # Números não começam por zero, a não ser o próprio zero
+        if not termo.isdigit() or (termo[0] == '0' and termo != '0'):
+            return queryset.none(), False
+        if termo == '0':
+            return queryset.filter(nf=0), False
+
+        inicio = int(termo)
+        if inicio > MAIOR_NF:
+            return queryset.none(), False
+        fim = inicio + 1
+        intervalos = Q()
+        while inicio <= MAIOR_NF:
+            intervalos |= Q(
+                nf__gte=inicio, nf__lt=fim, **self.filtro_indice_nf
+            )
+            inicio *= 10
+            fim *= 10
+        # Os intervalos ficam numa subconsulta só deles: junto dos
+        # filtros e da ordem da listagem, o banco prefere percorrer a
+        # listagem inteira pela data
+        encontrados = self.model._base_manager.filter(intervalos)
+        return queryset.filter(pk__in=encontrados.values('pk')), False
+
+
 class EstoqueItensInline(admin.TabularInline):
     """
     Inline admin para itens de estoque, permitindo edição direta
@@ -21,7 +78,7 @@ class EstoqueItensInline(admin.TabularInline):
 # Decorador que registra o modelo Estoque Entrada
 # com o site de administração do Django.
 @admin.register(EstoqueEntrada)
-class EstoqueEntradaAdmin(admin.ModelAdmin):
+class EstoqueEntradaAdmin(BuscaPorNFMixin, admin.ModelAdmin):
     """
     Configurações de administração para o modelo Estoque.
 
@@ -30,7 +87,7 @@ class EstoqueEntradaAdmin(admin.ModelAdmin):
         de registros de Estoque.
 
         search_fields (tuple): Campos a serem usados na pesquisa 
-        do admin.
+        do admin; a nota fiscal é buscada pelo início do número.
 
         list_filter (tuple): Campos a serem usados para filtragem 
         no admin.
@@ -43,16 +100,16 @@ class EstoqueEntradaAdmin(admin.ModelAdmin):
     """
     inlines = (EstoqueItensInline,)
     list_display = ('__str__', 'nf', 'funcionario',)
-    search_fields = ('nf',)
     list_filter = ('funcionario', )
     date_hierarchy = 'criado_em'
+    filtro_indice_nf = {'movimento': 'e'}
 
 
 
 # Decorador que registra o modelo Estoque Saida
 # com o site de administração do Django.
 @admin.register(EstoqueSaida)
-class EstoqueSaidaAdmin(admin.ModelAdmin):
+class EstoqueSaidaAdmin(BuscaPorNFMixin, admin.ModelAdmin):
     """
     Configurações de administração para o modelo Estoque.
 
@@ -61,7 +118,7 @@ class EstoqueSaidaAdmin(admin.ModelAdmin):
         de registros de Estoque.
 
         search_fields (tuple): Campos a serem usados na pesquisa 
-        do admin.
+        do admin; a nota fiscal é buscada pelo início do número.
 
         list_filter (tuple): Campos a serem usados para filtragem 
         no admin.
@@ -74,7 +131,146 @@ class EstoqueSaidaAdmin(admin.ModelAdmin):
     """
     inlines = (EstoqueItensInline,)
     list_display = ('__str__', 'nf', 'funcionario',)
-    search_fields = ('nf',)
     list_filter = ('funcionario', )
     date_hierarchy = 'criado_em'
-    
\ No newline at end of file
+    filtro_indice_nf = {'movimento': 's'}
+
+
+
+# Decorador que registra o modelo Reserva
+# com o site de administração do Django.
+@admin.register(Reserva)
+class ReservaAdmin(admin.ModelAdmin):
+    """
+    Configurações de administração para o modelo Reserva.
+
+    As reservas só mudam de situação pelas operações de reserva, que
+    mantêm `Produto.reservado`, por isso são somente leitura aqui.
+
+    Attributes:
+        list_display (tuple): Campos a serem exibidos na lista 
+        de reservas.
+
+        list_filter (tuple): Campos a serem usados para filtragem 
+        no admin.
+
+        date_hierarchy (str): Campo a ser usado para navegação por
+        data no admin.
+    """
+    list_display = (
+        '__str__', 'status', 'expira_em', 'funcionario', 'estoque',
+    )
+    list_filter = ('status',)
+    date_hierarchy = 'criado_em'
+
+    def has_add_permission(self, request):
+        """
+        Reservas são criadas somente pela API.
+        """
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        """
+        Reservas não são editadas pelo admin.
+        """
+        return False
+
+
+
+# Decorador que registra o modelo ConferenciaEstoque
+# com o site de administração do Django.
+@admin.register(ConferenciaEstoque)
+class ConferenciaEstoqueAdmin(admin.ModelAdmin):
+    """
+    Configurações de administração para o modelo ConferenciaEstoque,
+    somente para consulta da duração e das divergências de cada
+    conferência.
+
+    Attributes:
+        list_display (tuple): Campos a serem exibidos na lista 
+        de conferências.
+
+        date_hierarchy (str): Campo a ser usado para navegação por
+        data no admin.
+    """
+    list_display = ('criado_em', 'segundos', 'produtos', 'divergentes')
+    date_hierarchy = 'criado_em'
+
+    def has_add_permission(self, request):
+        """
+        Conferências são criadas somente pelo comando.
+        """
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        """
+        Conferências não são editadas pelo admin.
+        """
+        return False
+
+
+
+class EstoqueItensArquivoInline(admin.TabularInline):
+    """
+    Inline admin somente leitura para os itens de um movimento
+    arquivado.
+
+    Attributes:
+        model (Model): Modelo relacionado ao inline.
+        extra (int): Número de linhas extras a serem exibidas.
+    """
+    model = EstoqueItensArquivo
+    extra = 0
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+
+# Decorador que registra o modelo EstoqueArquivo
+# com o site de administração do Django.
+@admin.register(EstoqueArquivo)
+class EstoqueArquivoAdmin(BuscaPorNFMixin, admin.ModelAdmin):
+    """
+    Configurações de administração para os movimentos arquivados,
+    somente para consulta. A navegação por data do arquivo não pesa
+    nas listas de entradas e saídas, que só consultam a tabela atual.
+
+    Attributes:
+        list_display (tuple): Campos a serem exibidos na lista 
+        de movimentos arquivados.
+
+        search_fields (tuple): Campos a serem usados na pesquisa 
+        do admin; a nota fiscal é buscada pelo início do número.
+
+        list_filter (tuple): Campos a serem usados para filtragem 
+        no admin.
+
+        date_hierarchy (str): Campo a ser usado para navegação por
+        data no admin.
+
+        inlines (list): Lista de classes Inline para exibir na página
+        do movimento arquivado.
+    """
+    inlines = (EstoqueItensArquivoInline,)
+    list_display = ('__str__', 'movimento', 'nf', 'funcionario',)
+    list_filter = ('movimento', 'funcionario',)
+    date_hierarchy = 'criado_em'
+
+    def has_add_permission(self, request):
+        """
+        Movimentos são arquivados somente pelo comando.
+        """
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        """
+        Movimentos arquivados não são editados pelo admin.
+        """
+        return False
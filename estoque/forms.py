@@ -1,9 +1,146 @@
 from django import forms
+from django.core.exceptions import ValidationError
+from django.urls import reverse
 
 from .models import Estoque, EstoqueItens
 from produto.models import Produto
 
 
+class ProdutoChoiceField(forms.ModelChoiceField):
+    """
+    Campo de escolha de produto que consulta primeiro os produtos
+    já carregados pelo formset.
+
+    Attributes:
+        produtos (dict): Produtos carregados em lote, indexados pela
+        pk. Quando None, o campo faz a consulta padrão do Django.
+    """
+    produtos = None
+
+    def to_python(self, value):
+        """
+        Converte o valor enviado no produto correspondente sem
+        executar uma consulta por linha quando há produtos carregados.
+        """
+        if self.produtos is None or value in self.empty_values:
+            return super(ProdutoChoiceField, self).to_python(value)
+        try:
+            return self.produtos[int(value)]
+        except (KeyError, TypeError, ValueError):
+            raise ValidationError(
+                self.error_messages['invalid_choice'],
+                code='invalid_choice',
+                params={'value': value},
+            )
+
+
+class ProdutoAutocompletar(forms.Select):
+    """
+    Select de produto que renderiza somente a opção escolhida.
+
+    As demais opções são buscadas pelo navegador no endpoint de
+    autocompletar (atributo `data-url`), com o select2, em vez de
+    virem todas no HTML de cada linha do formset.
+    """
+
+    def optgroups(self, name, value, attrs=None):
+        """
+        Monta a opção vazia e as dos produtos escolhidos, usando os
+        produtos já carregados pelo formset quando houver.
+        """
+        field = self.choices.field
+        pks = [int(valor) for valor in value if str(valor).isdigit()]
+        produtos = dict(getattr(field, 'produtos', None) or {})
+        faltando = [pk for pk in pks if pk not in produtos]
+        if faltando:
+            produtos.update(self.choices.queryset.in_bulk(faltando))
+
+        opcoes = [self.create_option(
+            name, '', field.empty_label or '', not pks, 0, attrs=attrs
+        )]
+        for indice, pk in enumerate(pks, 1):
+            if pk in produtos:
+                opcoes.append(self.create_option(
+                    name, pk, field.label_from_instance(produtos[pk]),
+                    True, indice, attrs=attrs
+                ))
+        return [(None, opcoes, 0)]
+
+
+class EstoqueItensFormSet(forms.BaseInlineFormSet):
+    """
+    Formset dos itens de estoque com validação em lote.
+
+    Todos os produtos referenciados são carregados com uma única
+    consulta antes da validação das linhas, de modo que o número de
+    consultas não depende da quantidade de itens. Também verifica
+    produtos repetidos e, nas saídas, se a quantidade não ultrapassa
+    o estoque disponível.
+    """
+
+    def full_clean(self):
+        """
+        Carrega os produtos de todas as linhas antes de validar.
+        """
+        if self.is_bound:
+            self.carregar_produtos()
+        super(EstoqueItensFormSet, self).full_clean()
+
+    def carregar_produtos(self):
+        """
+        Busca em uma única consulta todos os produtos enviados no
+        formset e os compartilha com o campo produto de cada linha.
+        """
+        forms_produto = [
+            form for form in self.forms if 'produto' in form.fields
+        ]
+        if not forms_produto:
+            return
+
+        pks = set()
+        for form in forms_produto:
+            valor = form['produto'].data
+            if str(valor).isdigit():
+                pks.add(int(valor))
+
+        # Usa o queryset do próprio campo, que pode conter filtros
+        queryset = forms_produto[0].fields['produto'].queryset
+        produtos = queryset.in_bulk(pks)
+        for form in forms_produto:
+            form.fields['produto'].produtos = produtos
+
+    def clean(self):
+        """
+        Valida os itens em conjunto, registrando os erros na
+        linha correspondente.
+        """
+        super(EstoqueItensFormSet, self).clean()
+        saida = getattr(self.form, 'movimento', None) == 's'
+        vistos = set()
+        for form in self.forms:
+            if not hasattr(form, 'cleaned_data'):
+                continue
+            produto = form.cleaned_data.get('produto')
+            quantidade = form.cleaned_data.get('quantidade')
+            if produto is None:
+                continue
+
+            if produto.pk in vistos:
+                form.add_error(
+                    'produto', 'Produto repetido na movimentação.'
+                )
+                continue
+            vistos.add(produto.pk)
+
+            if (saida and quantidade is not None
+                    and quantidade > produto.estoque_disponivel):
+                form.add_error(
+                    'quantidade',
+                    f'Quantidade maior que o estoque disponível '
+                    f'({produto.estoque_disponivel}).'
+                )
+
+
 class EstoqueForm(forms.ModelForm):
     """
     Formulário para o modelo Estoque.
@@ -19,9 +156,9 @@ class EstoqueForm(forms.ModelForm):
         fields = ('nf',)
 
 
-class EstoqueItensSaidaForm(forms.ModelForm):
+class EstoqueItensForm(forms.ModelForm):
     """
-    Formulário para o modelo EstoqueItens.
+    Formulário base para o modelo EstoqueItens.
 
     Utiliza o ModelForm do Django para criar um 
     formulário baseado no modelo EstoqueItens.
@@ -29,29 +166,58 @@ class EstoqueItensSaidaForm(forms.ModelForm):
 
     class Meta:
         model = EstoqueItens
-        # Inclui todos os campos do modelo EstoqueItens
-        # no formulário
-        fields = '__all__'
+        # O saldo é calculado no servidor a partir do estoque
+        # atualizado, por isso não faz parte do formulário
+        fields = ('produto', 'quantidade')
+        field_classes = {'produto': ProdutoChoiceField}
+        widgets = {'produto': ProdutoAutocompletar}
+
+    def _get_validation_exclusions(self):
+        """
+        Dispensa a validação do produto no modelo, que faria uma
+        consulta por linha. O ProdutoChoiceField já garante que o
+        produto existe.
+        """
+        exclusoes = super(EstoqueItensForm, self)._get_validation_exclusions()
+        exclusoes.add('produto')
+        return exclusoes
+
+    # Parâmetros do endpoint de autocompletar de produtos
+    parametros_autocompletar = ''
+
+    def __init__(self, *args, **kwargs):
+        """
+        Lista somente os produtos não removidos.
+        """
+        super(EstoqueItensForm, self).__init__(*args, **kwargs)
+        self.fields['produto'].queryset = Produto.ativos.all()
+        self.fields['produto'].widget.attrs['data-url'] = (
+            reverse('produto:autocompletar') + self.parametros_autocompletar
+        )
+
+
+class EstoqueItensSaidaForm(EstoqueItensForm):
+    """
+    Formulário para os itens de uma saída de estoque.
+    """
+    # Tipo de movimento, usado pelo formset na validação
+    movimento = 's'
+    parametros_autocompletar = '?disponivel=1'
 
     def __init__(self, *args, **kwargs):
         """
         Filtro para ficar disponível para saída do estoque
-        somente produtos com mais itens do que 0.
+        somente produtos com mais itens do que 0. O estoque dos
+        produtos fragmentados só é conhecido somando os fragmentos,
+        por isso eles são sempre listados.
         """
         super(EstoqueItensSaidaForm, self).__init__(*args, **kwargs)
-        self.fields['produto'].queryset = Produto.objects.filter(estoque__gt=0)
+        self.fields['produto'].queryset = Produto.ativos.disponiveis()
 
 
-class EstoqueItensEntradaForm(forms.ModelForm):
+class EstoqueItensEntradaForm(EstoqueItensForm):
     """
-    Formulário para o modelo EstoqueItens.
-
-    Utiliza o ModelForm do Django para criar um 
-    formulário baseado no modelo EstoqueItens.
+    Formulário para os itens de uma entrada de estoque.
     """
-
-    class Meta:
-        model = EstoqueItens
-        # Inclui todos os campos do modelo EstoqueItens
-        # no formulário
-        fields = '__all__'
\ No newline at end of file
+    # Tipo de movimento, usado pelo formset na validação
+    movimento = 'e'
@@ -0,0 +1,30 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+from django.db import connection
+
+
+@contextmanager
+def banco_temporario():
+    """
+    Cria um banco de testes vazio e migrado para os benchmarks, e o
+    remove ao final.
+
+    No SQLite o banco é um arquivo em uma pasta temporária, para que o
+    custo de gravação em disco apareça na medição. Nos demais bancos é
+    usado o banco de testes padrão do Django (test_<nome>).
+    """
+    nome_original = connection.settings_dict['NAME']
+    with tempfile.TemporaryDirectory() as pasta:
+        if connection.vendor == 'sqlite':
+            connection.settings_dict['TEST']['NAME'] = os.path.join(
+                pasta, 'benchmark.sqlite3'
+            )
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(nome_original, verbosity=0)
@@ -0,0 +1,380 @@
+import multiprocessing
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+
+import django
+from django.apps import apps
+from django.db import OperationalError, connection, connections
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+
+# Prefixos do formulário e do formset usados por `add_estoque`.
+PREFIXO_FORM = 'main'
+PREFIXO_FORMSET = 'estoque'
+
+# URL de cada tipo de movimento.
+URLS = {
+    'e': 'estoque:add_estoque_entrada',
+    's': 'estoque:add_estoque_saida',
+}
+
+
+class Resultado:
+    """
+    Resultado de uma carga, somado entre threads e processos.
+
+    Attributes:
+        latencias (list): Duração de cada requisição, em segundos,
+        incluindo as novas tentativas.
+        entradas (Counter): Quantidade aceita em entradas, por produto.
+        saidas (Counter): Quantidade aceita em saídas, por produto.
+        aceitas (int): Requisições gravadas.
+        recusadas (int): Requisições recusadas por falta de estoque.
+        bloqueios (int): Tentativas desfeitas por banco bloqueado ou
+        deadlock, repetidas em seguida.
+        erros (list): Respostas inesperadas.
+    """
+
+    def __init__(self):
+        self.latencias = []
+        self.entradas = Counter()
+        self.saidas = Counter()
+        self.aceitas = 0
+        self.recusadas = 0
+        self.bloqueios = 0
+        self.erros = []
+
+    def somar(self, outro):
+        """
+        Acrescenta o resultado de outra thread ou processo.
+
+        Args:
+            outro (Resultado): O resultado a ser somado.
+        """
+        self.latencias.extend(outro.latencias)
+        self.entradas.update(outro.entradas)
+        self.saidas.update(outro.saidas)
+        self.aceitas += outro.aceitas
+        self.recusadas += outro.recusadas
+        self.bloqueios += outro.bloqueios
+        self.erros.extend(outro.erros)
+
+    def percentil(self, p):
+        """
+        Retorna o percentil das latências, em milissegundos.
+
+        Args:
+            p (float): O percentil, entre 0 e 100.
+
+        Returns:
+            float: A latência no percentil, ou 0 sem requisições.
+        """
+        if not self.latencias:
+            return 0
+        ordenadas = sorted(self.latencias)
+        indice = min(len(ordenadas) - 1, int(len(ordenadas) * p / 100))
+        return ordenadas[indice] * 1000
+
+
+def dados_movimento(itens):
+    """
+    Monta o POST de `add_estoque` para os itens informados.
+
+    Args:
+        itens (list): Tuplas (pk do produto, quantidade).
+
+    Returns:
+        dict: Os campos do formulário, do formset e uma chave de
+        idempotência nova.
+    """
+    dados = {
+        f'{PREFIXO_FORM}-nf': '',
+        'idempotency_key': uuid.uuid4().hex,
+        f'{PREFIXO_FORMSET}-TOTAL_FORMS': len(itens),
+        f'{PREFIXO_FORMSET}-INITIAL_FORMS': 0,
+        f'{PREFIXO_FORMSET}-MIN_NUM_FORMS': 1,
+        f'{PREFIXO_FORMSET}-MAX_NUM_FORMS': 1000,
+    }
+    for indice, (produto, quantidade) in enumerate(itens):
+        dados[f'{PREFIXO_FORMSET}-{indice}-produto'] = produto
+        dados[f'{PREFIXO_FORMSET}-{indice}-quantidade'] = quantidade
+    return dados
+
+
+def _repetir(funcao, resultado):
+    """
+    Executa a função de novo enquanto o banco estiver bloqueado.
+
+    Args:
+        funcao (function): Função sem argumentos.
+        resultado (Resultado): Onde as esperas de bloqueio são
+        contadas.
+
+    Returns:
+        O valor retornado pela função.
+    """
+    while True:
+        try:
+            return funcao()
+        except OperationalError:
+            resultado.bloqueios += 1
+
+
+def _trabalhador(semente, produtos, usuario, parametros, resultado):
+    """
+    Faz movimentações aleatórias pelas views, como um navegador.
+
+    Uma requisição desfeita por bloqueio é reenviada com a mesma chave
+    de idempotência, e conta como uma espera de bloqueio.
+
+    Args:
+        semente (int): Semente do gerador aleatório da thread.
+        produtos (list): Pks dos produtos movimentados.
+        usuario (User): Funcionário das movimentações.
+        parametros (dict): Parâmetros da carga.
+        resultado (Resultado): Onde a thread acumula o resultado.
+    """
+    gerador = random.Random(semente)
+    cliente = Client()
+    try:
+        _repetir(lambda: cliente.force_login(usuario), resultado)
+        for _ in range(parametros['movimentos']):
+            movimento = (
+                'e' if gerador.random() < parametros['entradas'] else 's'
+            )
+            escolhidos = gerador.sample(
+                produtos, gerador.randint(1, parametros['itens'])
+            )
+            itens = [
+                (pk, gerador.randint(1, parametros['quantidade']))
+                for pk in escolhidos
+            ]
+            dados = dados_movimento(itens)
+
+            inicio = time.perf_counter()
+            resposta = _repetir(
+                lambda: cliente.post(reverse(URLS[movimento]), dados),
+                resultado
+            )
+            resultado.latencias.append(time.perf_counter() - inicio)
+
+            if resposta.status_code == 302:
+                resultado.aceitas += 1
+                destino = (
+                    resultado.entradas if movimento == 'e'
+                    else resultado.saidas
+                )
+                destino.update(dict(itens))
+            elif resposta.status_code == 200 and movimento == 's':
+                resultado.recusadas += 1
+            else:
+                resultado.erros.append(
+                    f'{movimento} {itens}: HTTP {resposta.status_code}'
+                )
+    except Exception as erro:
+        # Uma thread interrompida invalidaria a contagem; o erro é
+        # reportado junto com o resultado
+        resultado.erros.append(f'{type(erro).__name__}: {erro}')
+    finally:
+        connection.close()
+
+
+def executar_threads(produtos, usuario, parametros, semente):
+    """
+    Executa a carga em várias threads do processo atual.
+
+    Args:
+        produtos (list): Pks dos produtos movimentados.
+        usuario (User): Funcionário das movimentações.
+        parametros (dict): Parâmetros da carga, com `threads`,
+        `movimentos` (por thread), `itens`, `quantidade` e
+        `entradas` (proporção de entradas, de 0 a 1).
+        semente (int): Semente base dos geradores aleatórios.
+
+    Returns:
+        Resultado: O resultado somado das threads.
+    """
+    parciais = [Resultado() for _ in range(parametros['threads'])]
+    threads = [
+        threading.Thread(
+            target=_trabalhador,
+            args=(semente + i, produtos, usuario, parametros, parcial),
+        )
+        for i, parcial in enumerate(parciais)
+    ]
+    # O Client usa o host 'testserver'. As sessões ficam em cookies
+    # assinados, para que só as movimentações disputem o banco
+    with override_settings(
+            ALLOWED_HOSTS=['testserver'],
+            SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies'):
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    total = Resultado()
+    for parcial in parciais:
+        total.somar(parcial)
+    return total
+
+
+def _processo(nome_banco, produtos, usuario_pk, parametros, semente):
+    """
+    Ponto de entrada de cada processo da carga.
+
+    O processo é iniciado com 'spawn', então configura o Django de
+    novo e aponta a conexão para o banco da carga.
+
+    Returns:
+        Resultado: O resultado somado das threads do processo.
+    """
+    if not apps.ready:
+        django.setup()
+    from django.contrib.auth.models import User
+
+    connections['default'].settings_dict['NAME'] = nome_banco
+    usuario = User.objects.get(pk=usuario_pk)
+    try:
+        return executar_threads(produtos, usuario, parametros, semente)
+    finally:
+        connection.close()
+
+
+def executar_carga(produtos, usuario, parametros, processos=1, semente=0):
+    """
+    Executa a carga em vários processos, cada um com várias threads.
+
+    Com um único processo, as threads rodam no processo atual.
+
+    Args:
+        produtos (list): Pks dos produtos movimentados.
+        usuario (User): Funcionário das movimentações.
+        parametros (dict): Parâmetros da carga (ver
+        `executar_threads`).
+        processos (int): Número de processos.
+        semente (int): Semente base dos geradores aleatórios.
+
+    Returns:
+        tuple: O Resultado somado e o tempo total em segundos.
+    """
+    inicio = time.perf_counter()
+    if processos <= 1:
+        resultado = executar_threads(produtos, usuario, parametros, semente)
+        return resultado, time.perf_counter() - inicio
+
+    nome_banco = connection.settings_dict['NAME']
+    # Os processos filhos abrem as próprias conexões
+    connection.close()
+    contexto = multiprocessing.get_context('spawn')
+    with contexto.Pool(processos) as pool:
+        parciais = pool.starmap(_processo, [
+            (
+                nome_banco, produtos, usuario.pk, parametros,
+                semente + i * parametros['threads'],
+            )
+            for i in range(processos)
+        ])
+    resultado = Resultado()
+    for parcial in parciais:
+        resultado.somar(parcial)
+    return resultado, time.perf_counter() - inicio
+
+
+class AmostradorDeBloqueios:
+    """
+    Conta, no PostgreSQL, as conexões esperando por bloqueios durante
+    a carga, consultando `pg_stat_activity` periodicamente.
+
+    Em outros bancos não faz nada; no SQLite as esperas aparecem como
+    erros "database is locked", contados pelos trabalhadores.
+
+    Attributes:
+        intervalo (float): Segundos entre as amostras.
+        esperas (int): Soma das conexões em espera em cada amostra.
+        amostras (int): Número de amostras feitas.
+    """
+
+    def __init__(self, intervalo=0.05):
+        self.intervalo = intervalo
+        self.esperas = 0
+        self.amostras = 0
+        self._parar = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        if connection.vendor == 'postgresql':
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _loop(self):
+        try:
+            with connection.cursor() as cursor:
+                while not self._parar.wait(self.intervalo):
+                    cursor.execute(
+                        "SELECT count(*) FROM pg_stat_activity "
+                        "WHERE wait_event_type = 'Lock' "
+                        "AND datname = current_database()"
+                    )
+                    self.esperas += cursor.fetchone()[0]
+                    self.amostras += 1
+        finally:
+            connection.close()
+
+
+def verificar_invariante(iniciais, resultado):
+    """
+    Confere, para cada produto, se
+    `estoque == inicial + Σentradas − Σsaídas`, tanto pelas
+    requisições aceitas quanto pelos itens gravados.
+
+    Args:
+        iniciais (dict): Estoque inicial indexado pela pk do produto.
+        resultado (Resultado): O resultado da carga.
+
+    Returns:
+        list: Uma mensagem por divergência; vazia se tudo conferir.
+    """
+    from django.db.models import Q, Sum
+    from produto.models import Produto
+    from estoque.models import EstoqueItens
+
+    razao = {
+        linha['produto']: linha for linha in
+        EstoqueItens.objects.filter(produto__in=list(iniciais))
+        .values('produto')
+        .annotate(
+            entradas=Sum('quantidade', filter=Q(estoque__movimento='e')),
+            saidas=Sum('quantidade', filter=Q(estoque__movimento='s')),
+        )
+    }
+    divergencias = []
+    for produto in Produto.objects.filter(pk__in=list(iniciais)):
+        esperado = (
+            iniciais[produto.pk]
+            + resultado.entradas[produto.pk]
+            - resultado.saidas[produto.pk]
+        )
+        linha = razao.get(produto.pk, {})
+        gravado = (
+            iniciais[produto.pk]
+            + (linha.get('entradas') or 0)
+            - (linha.get('saidas') or 0)
+        )
+        atual = produto.estoque_atual
+        if atual != esperado or atual != gravado or atual < 0:
+            divergencias.append(
+                f'Produto {produto.pk}: estoque {atual}, esperado '
+                f'{esperado} pelas requisições e {gravado} pelos itens.'
+            )
+    return divergencias
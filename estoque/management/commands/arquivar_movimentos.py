@@ -0,0 +1,45 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from estoque.actions.arquivamento import MOVIMENTOS_POR_LOTE, arquivar
+from estoque.actions.posicoes import inicio_do_dia
+
+
+class Command(BaseCommand):
+    """
+    Move as movimentações de um período encerrado, com os seus itens,
+    para as tabelas de arquivo.
+
+    As tabelas atuais ficam só com o período aberto, e o saldo dos
+    movimentos arquivados passa para o saldo de abertura de cada
+    produto. As movimentações arquivadas continuam visíveis no
+    detalhe e nas listas filtradas por data.
+
+    Exemplo:
+        python manage.py arquivar_movimentos --antes-de 2026-01-01
+    """
+    help = 'Arquiva as movimentações anteriores a uma data.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--antes-de', type=date.fromisoformat, required=True,
+            help='Arquiva as movimentações anteriores a este dia '
+                 '(AAAA-MM-DD).'
+        )
+        parser.add_argument(
+            '--lote', type=int, default=MOVIMENTOS_POR_LOTE,
+            help=f'Movimentos por transação. Padrão: {MOVIMENTOS_POR_LOTE}.'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            registro = arquivar(
+                inicio_do_dia(options['antes_de']), options['lote']
+            )
+        except ValueError as erro:
+            raise CommandError(erro)
+        self.stdout.write(self.style.SUCCESS(
+            f'{registro.movimentos} movimentos e {registro.itens} itens '
+            f'anteriores a {options["antes_de"]:%d/%m/%Y} arquivados.'
+        ))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from estoque.actions.colunas import ITENS_POR_LOTE, atualizar, reconstruir
+
+
+class Command(BaseCommand):
+    """
+    Acrescenta ao razão colunar os itens de estoque gravados desde a
+    última execução.
+
+    Deve ser agendado em intervalos curtos, por exemplo a cada minuto,
+    sem execuções simultâneas. Com `--reconstruir`, apaga o razão
+    colunar e o grava de novo a partir do banco.
+
+    Exemplo:
+        python manage.py atualizar_razao_colunar
+        python manage.py atualizar_razao_colunar --reconstruir
+    """
+    help = 'Acrescenta ao razão colunar os itens de estoque novos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reconstruir', action='store_true',
+            help='Apaga o razão colunar e o grava de novo.'
+        )
+        parser.add_argument(
+            '--lote', type=int, default=ITENS_POR_LOTE,
+            help=f'Itens por gravação. Padrão: {ITENS_POR_LOTE}.'
+        )
+
+    def handle(self, *args, **options):
+        executar = reconstruir if options['reconstruir'] else atualizar
+        total = executar(tamanho_lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} itens acrescentados ao razão colunar.'
+        ))
@@ -0,0 +1,133 @@
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.test.utils import override_settings
+
+from produto.actions.fragmentos import consolidar, fragmentar
+from produto.models import Produto
+
+from estoque.management.banco_temporario import banco_temporario
+from estoque.models import Estoque, EstoqueItens
+from estoque.views import gravar_movimento
+
+
+class Command(BaseCommand):
+    """
+    Compara saídas por segundo de um produto muito movimentado com o
+    estoque em uma única linha e com o estoque fragmentado.
+
+    Várias threads fazem saídas de uma unidade do mesmo produto, cada
+    uma com a sua transação. O benchmark roda em um banco temporário,
+    criado e removido pelo próprio comando. No SQLite toda gravação
+    bloqueia o banco inteiro, então a fragmentação só reduz a disputa
+    em bancos com bloqueio por linha, como o PostgreSQL.
+
+    Exemplo:
+        python manage.py benchmark_fragmentos --threads 16 --fragmentos 8
+    """
+    help = 'Mede saídas/segundo de um produto com e sem fragmentação.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--movimentos', type=int, default=400)
+        parser.add_argument('--fragmentos', type=int, default=8)
+
+    def handle(self, *args, **options):
+        with banco_temporario():
+            with override_settings(
+                    ESTOQUE_FRAGMENTOS=options['fragmentos'],
+                    ESTOQUE_GROUP_COMMIT=False):
+                self._executar(options)
+
+    def _executar(self, options):
+        total = options['movimentos']
+        inicial = total * 10
+        usuario = User.objects.create_user('benchmark')
+        simples = Produto.objects.create(
+            produto='Produto simples', ncm='00000000',
+            preco=1, estoque=inicial,
+        )
+        fragmentado = Produto.objects.create(
+            produto='Produto fragmentado', ncm='00000000',
+            preco=1, estoque=inicial,
+        )
+        fragmentar(fragmentado)
+
+        resultados = (
+            ('linha única', self._medir(simples, usuario, options)),
+            ('fragmentado', self._medir(fragmentado, usuario, options)),
+        )
+        consolidar()
+
+        self.stdout.write(
+            f'{total} saídas do mesmo produto, {options["threads"]} '
+            f'threads, {options["fragmentos"]} fragmentos '
+            f'({connection.vendor})'
+        )
+        for nome, (segundos, conflitos) in resultados:
+            self.stdout.write(
+                f'{nome}: {total / segundos:.1f} saídas/s '
+                f'({segundos:.2f}s, {conflitos} conflitos de bloqueio)'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Ganho: {resultados[0][1][0] / resultados[1][1][0]:.1f}x'
+        ))
+
+        for produto in (simples, fragmentado):
+            produto.refresh_from_db()
+            if produto.estoque != inicial - total:
+                raise CommandError(
+                    f'{produto}: estoque {produto.estoque}, esperado '
+                    f'{inicial - total}.'
+                )
+        if EstoqueItens.objects.count() != total * 2:
+            raise CommandError('Quantidade de itens gravados incorreta.')
+
+    def _medir(self, produto, usuario, options):
+        """
+        Executa as saídas em várias threads e mede o tempo.
+
+        Args:
+            produto (Produto): O produto movimentado.
+            usuario (User): Funcionário das movimentações.
+            options (dict): Opções do comando.
+
+        Returns:
+            tuple: Tempo total em segundos e número de tentativas
+            desfeitas por bloqueio ou deadlock.
+        """
+        total = options['movimentos']
+        n_threads = options['threads']
+        conflitos = [0]
+        lock = threading.Lock()
+
+        def trabalhador(indice):
+            try:
+                for _ in range(indice, total, n_threads):
+                    while True:
+                        estoque = Estoque(funcionario=usuario, movimento='s')
+                        item = EstoqueItens(
+                            estoque=estoque, produto=produto, quantidade=1
+                        )
+                        try:
+                            gravar_movimento(estoque, [item])
+                            break
+                        except OperationalError:
+                            with lock:
+                                conflitos[0] += 1
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=trabalhador, args=(i,))
+            for i in range(n_threads)
+        ]
+        inicio = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - inicio, conflitos[0]
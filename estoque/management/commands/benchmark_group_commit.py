@@ -0,0 +1,153 @@
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+
+from produto.models import Produto
+
+from estoque.actions.group_commit import GravadorEmGrupo
+from estoque.management.banco_temporario import banco_temporario
+from estoque.models import Estoque, EstoqueItens
+from estoque.views import gravar_movimento
+
+
+class Command(BaseCommand):
+    """
+    Compara movimentos por segundo com e sem group commit.
+
+    O benchmark roda em um banco SQLite temporário em disco, criado e
+    removido pelo próprio comando, para que o custo do fsync de cada
+    commit apareça na medição. Várias threads gravam movimentações
+    concorrentes: primeiro cada uma com a sua transação, depois
+    enfileirando no GravadorEmGrupo.
+
+    Exemplo:
+        python manage.py benchmark_group_commit --threads 16
+    """
+    help = 'Mede movimentos/segundo com e sem group commit no SQLite.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--movimentos', type=int, default=400)
+        parser.add_argument('--itens', type=int, default=3)
+        parser.add_argument('--janela-ms', type=int, default=5)
+        parser.add_argument('--max-lote', type=int, default=100)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('O benchmark foi feito para o SQLite.')
+
+        with banco_temporario():
+            self._executar(options)
+
+    def _executar(self, options):
+        usuario = User.objects.create_user('benchmark')
+        Produto.objects.bulk_create([
+            Produto(
+                produto=f'Produto {i}', ncm='00000000',
+                preco=1, estoque=1_000_000,
+            )
+            for i in range(100)
+        ])
+        produtos = list(Produto.objects.values_list('pk', flat=True))
+
+        # Cada movimentação com a sua própria transação
+        sem = self._medir(gravar_movimento, usuario, produtos, options)
+
+        # Movimentações enfileiradas no gravador com group commit
+        gravador = GravadorEmGrupo(
+            janela_ms=options['janela_ms'], max_lote=options['max_lote']
+        )
+
+        def gravar_em_grupo(estoque, itens):
+            return gravador.executar(gravar_movimento, estoque, itens)
+
+        try:
+            com = self._medir(gravar_em_grupo, usuario, produtos, options)
+        finally:
+            gravador.parar()
+
+        total = options['movimentos']
+        self.stdout.write(
+            f'{total} movimentos, {options["threads"]} threads, '
+            f'{options["itens"]} itens por movimento'
+        )
+        for nome, (segundos, bloqueios) in (
+                ('sem group commit', sem), ('com group commit', com)):
+            self.stdout.write(
+                f'{nome}: {total / segundos:.1f} movimentos/s '
+                f'({segundos:.2f}s, {bloqueios} "database is locked")'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Ganho: {sem[0] / com[0]:.1f}x'
+        ))
+
+        esperado = Estoque.objects.count()
+        if esperado != total * 2:
+            raise CommandError(
+                f'Esperados {total * 2} movimentos, gravados {esperado}.'
+            )
+        if EstoqueItens.objects.count() != total * 2 * options['itens']:
+            raise CommandError('Quantidade de itens gravados incorreta.')
+
+    def _medir(self, gravar, usuario, produtos, options):
+        """
+        Executa as movimentações em várias threads e mede o tempo.
+
+        Args:
+            gravar (function): Recebe (estoque, itens) e grava.
+            usuario (User): Funcionário das movimentações.
+            produtos (list): Pks dos produtos disponíveis.
+            options (dict): Opções do comando.
+
+        Returns:
+            tuple: Tempo total em segundos e número de vezes em que o
+            banco estava bloqueado.
+        """
+        total = options['movimentos']
+        n_threads = options['threads']
+        bloqueios = [0]
+        lock = threading.Lock()
+
+        def trabalhador(indice):
+            try:
+                for n in range(indice, total, n_threads):
+                    estoque = Estoque(
+                        funcionario=usuario,
+                        movimento='e' if n % 2 else 's',
+                    )
+                    itens = [
+                        EstoqueItens(
+                            estoque=estoque,
+                            produto_id=produtos[(n + i) % len(produtos)],
+                            quantidade=1,
+                        )
+                        for i in range(options['itens'])
+                    ]
+                    while True:
+                        try:
+                            gravar(estoque, itens)
+                            break
+                        except OperationalError:
+                            with lock:
+                                bloqueios[0] += 1
+                            # Descarta as pks da tentativa desfeita
+                            estoque.pk = None
+                            for item in itens:
+                                item.pk = None
+                                item.estoque = estoque
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=trabalhador, args=(i,))
+            for i in range(n_threads)
+        ]
+        inicio = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - inicio, bloqueios[0]
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+
+from estoque.actions.conferencia import conferir
+from produto.models import Produto
+
+
+class Command(BaseCommand):
+    """
+    Confere o estoque dos produtos com o saldo líquido do razão, sem
+    alterar nada, e lista os produtos divergentes.
+
+    Cada execução fica registrada em `ConferenciaEstoque`, com a sua
+    duração. Deve ser agendado (cron) todas as noites; para corrigir
+    as divergências, use `reprocessar_razao`.
+
+    Exemplo:
+        python manage.py conferir_estoque
+    """
+    help = 'Confere o estoque dos produtos com o razão.'
+
+    def handle(self, *args, **options):
+        conferencia = conferir()
+
+        nomes = dict(
+            Produto.objects.filter(
+                pk__in=[pk for pk, _, _ in conferencia.divergencias]
+            ).values_list('pk', 'produto')
+        )
+        for pk, esperado, atual in conferencia.divergencias:
+            self.stdout.write(
+                f'{pk};{nomes.get(pk, "")};esperado {esperado};'
+                f'atual {atual}'
+            )
+        if conferencia.divergentes > len(conferencia.divergencias):
+            self.stdout.write(
+                f'... e mais '
+                f'{conferencia.divergentes - len(conferencia.divergencias)} '
+                f'produtos divergentes.'
+            )
+
+        estilo = (
+            self.style.WARNING if conferencia.divergentes
+            else self.style.SUCCESS
+        )
+        self.stdout.write(estilo(
+            f'{conferencia.divergentes} de {conferencia.produtos} produtos '
+            f'divergentes em {conferencia.segundos:.2f}s.'
+        ))
@@ -0,0 +1,62 @@
+import sys
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from estoque.actions.exportacao import FORMATOS, exportar_razao
+from estoque.actions.posicoes import fechamento, inicio_do_dia
+
+
+class Command(BaseCommand):
+    """
+    Exporta os itens do razão, incluindo os arquivados, em CSV ou
+    NDJSON, gravando o arquivo à medida que as linhas são lidas.
+
+    Sem `--saida`, o arquivo é escrito na saída padrão.
+
+    Exemplo:
+        python manage.py exportar_razao --de 2026-01-01 --saida razao.csv
+        python manage.py exportar_razao --formato ndjson --gzip \
+            --saida razao.ndjson.gz
+    """
+    help = 'Exporta os itens do razão em CSV ou NDJSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--de', type=date.fromisoformat,
+            help='Primeiro dia exportado (AAAA-MM-DD).'
+        )
+        parser.add_argument(
+            '--ate', type=date.fromisoformat,
+            help='Último dia exportado (AAAA-MM-DD).'
+        )
+        parser.add_argument(
+            '--produto', type=int, action='append',
+            help='Pk de um produto exportado. Pode ser repetido.'
+        )
+        parser.add_argument('--movimento', choices=('e', 's'))
+        parser.add_argument(
+            '--formato', choices=tuple(FORMATOS), default='csv'
+        )
+        parser.add_argument(
+            '--gzip', action='store_true', help='Comprime o arquivo.'
+        )
+        parser.add_argument(
+            '--saida', help='Arquivo de destino. Padrão: saída padrão.'
+        )
+
+    def handle(self, *args, **options):
+        partes = exportar_razao(
+            options['formato'],
+            options['gzip'],
+            inicio=inicio_do_dia(options['de']) if options['de'] else None,
+            fim=fechamento(options['ate']) if options['ate'] else None,
+            produtos=options['produto'],
+            movimento=options['movimento'],
+        )
+        if options['saida']:
+            with open(options['saida'], 'wb') as arquivo:
+                arquivo.writelines(partes)
+        else:
+            sys.stdout.buffer.writelines(partes)
+            sys.stdout.buffer.flush()
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from estoque.actions.reservas import liberar_expiradas
+
+
+class Command(BaseCommand):
+    """
+    Expira as reservas ativas vencidas e devolve as quantidades ao
+    estoque disponível, em lotes.
+
+    Deve ser agendado (cron) com frequência, pois reservas vencidas
+    continuam ocupando estoque até serem expiradas.
+
+    Exemplo:
+        python manage.py liberar_reservas_expiradas --lote 5000
+    """
+    help = 'Expira as reservas vencidas e libera o estoque reservado.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        total = liberar_expiradas(tamanho_lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} reservas expiradas.'
+        ))
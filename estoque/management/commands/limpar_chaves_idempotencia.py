@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from estoque.actions.idempotencia import limpar_expiradas
+
+
+class Command(BaseCommand):
+    """
+    Remove as chaves de idempotência expiradas, em lotes.
+
+    Pode ser agendado (cron) para manter a tabela pequena.
+
+    Exemplo:
+        python manage.py limpar_chaves_idempotencia --lote 5000
+    """
+    help = 'Remove as chaves de idempotência expiradas.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        total = limpar_expiradas(tamanho_lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} chaves de idempotência removidas.'
+        ))
@@ -0,0 +1,34 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from estoque.actions.movimentos_diarios import reconstruir
+
+
+class Command(BaseCommand):
+    """
+    Refaz os totais diários de movimentação a partir dos itens de
+    estoque, incluindo os arquivados.
+
+    Deve ser executado uma vez para preencher os totais das
+    movimentações anteriores à sua criação; depois disso eles são
+    mantidos a cada movimentação. Com `--desde`, refaz só os dias a
+    partir da data informada.
+
+    Exemplo:
+        python manage.py reconstruir_movimentos_diarios
+        python manage.py reconstruir_movimentos_diarios --desde 2026-01-01
+    """
+    help = 'Refaz os totais diários de movimentação a partir dos itens.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--desde', type=date.fromisoformat,
+            help='Primeiro dia refeito (AAAA-MM-DD). Padrão: todos.'
+        )
+
+    def handle(self, *args, **options):
+        total = reconstruir(options['desde'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} totais diários gravados.'
+        ))
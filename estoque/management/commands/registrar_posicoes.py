@@ -0,0 +1,46 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from estoque.actions.posicoes import registrar_posicoes
+
+
+class Command(BaseCommand):
+    """
+    Grava a posição de estoque de todos os produtos no fechamento de
+    um dia ou de um intervalo de dias.
+
+    Deve ser agendado (cron) uma vez por dia, após a meia-noite, para
+    gravar a posição do dia anterior; um agendamento mensal também
+    funciona, com consultas de datas passadas proporcionalmente mais
+    lentas. Com `--desde`, preenche as posições dos dias anteriores.
+
+    Exemplo:
+        python manage.py registrar_posicoes
+        python manage.py registrar_posicoes --desde 2026-01-01
+    """
+    help = 'Grava a posição de estoque dos produtos no fechamento do dia.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--desde', type=date.fromisoformat,
+            help='Primeiro dia (AAAA-MM-DD). Padrão: o dia final.'
+        )
+        parser.add_argument(
+            '--ate', type=date.fromisoformat,
+            help='Último dia (AAAA-MM-DD). Padrão: ontem.'
+        )
+
+    def handle(self, *args, **options):
+        fim = options['ate'] or timezone.localdate() - timedelta(days=1)
+        inicio = options['desde'] or fim
+        try:
+            total = registrar_posicoes(inicio, fim)
+        except ValueError as erro:
+            raise CommandError(erro)
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} posições gravadas de {inicio:%d/%m/%Y} '
+            f'a {fim:%d/%m/%Y}.'
+        ))
+
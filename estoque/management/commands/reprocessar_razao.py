@@ -0,0 +1,78 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from estoque.actions.reprocessamento import (
+    PRODUTOS_POR_LOTE,
+    atualiza_no_banco,
+    processos_padrao,
+    reprocessar,
+)
+
+
+class Command(BaseCommand):
+    """
+    Recalcula o saldo de cada item do razão e o estoque de cada
+    produto a partir das entradas e saídas gravadas.
+
+    O saldo corrente é calculado com funções de janela quando o banco
+    tem suporte (no PostgreSQL e no SQLite recente, com um único
+    UPDATE por lote, sem trazer os itens para o Python) e, nos demais,
+    lendo os itens em blocos. Os produtos são divididos em lotes
+    distribuídos entre vários processos.
+
+    Produtos cujo saldo fica negativo no razão, como os cadastrados ou
+    importados já com estoque, não são alterados e são listados ao
+    final. Use `--verificar` para ver as divergências sem gravar.
+
+    Exemplo:
+        python manage.py reprocessar_razao --processos 8 --verificar
+    """
+    help = 'Recalcula os saldos do razão e o estoque dos produtos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processos', type=int,
+            help='Padrão: 1 no SQLite e o número de CPUs nos demais.'
+        )
+        parser.add_argument(
+            '--lote', type=int, default=PRODUTOS_POR_LOTE,
+            help='Produtos por transação.'
+        )
+        parser.add_argument(
+            '--verificar', action='store_true',
+            help='Só conta as divergências, sem gravar.'
+        )
+
+    def handle(self, *args, **options):
+        processos = options['processos'] or processos_padrao()
+        modo = 'UPDATE no banco' if atualiza_no_banco() else 'em Python'
+        self.stdout.write(
+            f'Reprocessando {modo}, {processos} processo(s).'
+        )
+
+        inicio = time.perf_counter()
+        resumo = reprocessar(
+            processos, options['lote'], options['verificar']
+        )
+        segundos = time.perf_counter() - inicio
+
+        verbo = 'divergentes' if options['verificar'] else 'regravados'
+        if resumo.fragmentados:
+            self.stdout.write(self.style.WARNING(
+                f'{resumo.fragmentados} produtos fragmentados divergem do '
+                f'razão; desfragmente-os e reprocesse.'
+            ))
+        if resumo.negativos:
+            # Lista só as primeiras pks, para não inundar a saída
+            pks = ', '.join(map(str, resumo.negativos[:20]))
+            if len(resumo.negativos) > 20:
+                pks += ', ...'
+            self.stdout.write(self.style.WARNING(
+                f'{len(resumo.negativos)} produtos com saldo negativo no '
+                f'razão não foram alterados: {pks}'
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f'{resumo.itens} saldos e {resumo.produtos} estoques {verbo} '
+            f'em {segundos:.1f}s.'
+        ))
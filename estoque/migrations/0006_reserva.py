@@ -0,0 +1,35 @@
+# Generated by Django 5.0.7 on 2026-10-18 19:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0005_chaveidempotencia'),
+        ('produto', '0004_produto_reservado'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reserva',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('criado_em', models.DateTimeField(auto_now_add=True, verbose_name='criado_em')),
+                ('atualizado_em', models.DateTimeField(auto_now=True, verbose_name='atualizado_em')),
+                ('quantidade', models.PositiveIntegerField()),
+                ('status', models.CharField(choices=[('a', 'ativa'), ('c', 'confirmada'), ('l', 'liberada'), ('x', 'expirada')], default='a', max_length=1)),
+                ('expira_em', models.DateTimeField()),
+                ('estoque', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reservas', to='estoque.estoque')),
+                ('funcionario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='produto.produto')),
+            ],
+            options={
+                'ordering': ('-criado_em',),
+                'indexes': [models.Index(condition=models.Q(('status', 'a')), fields=['expira_em'], name='reserva_ativa_expira_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.7 on 2026-10-18 19:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0006_reserva'),
+        ('produto', '0006_alertas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PosicaoEstoque',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField()),
+                ('estoque', models.IntegerField()),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='posicoes', to='produto.produto')),
+            ],
+            options={
+                'verbose_name': 'posição de estoque',
+                'verbose_name_plural': 'posições de estoque',
+                'ordering': ('-data',),
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='posicaoestoque',
+            constraint=models.UniqueConstraint(fields=('produto', 'data'), name='posicao_produto_data_unica'),
+        ),
+    ]
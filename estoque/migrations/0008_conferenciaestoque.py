@@ -0,0 +1,29 @@
+# Generated by Django 5.0.7 on 2026-10-18 19:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0007_posicaoestoque'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConferenciaEstoque',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('criado_em', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('segundos', models.FloatField()),
+                ('produtos', models.PositiveIntegerField()),
+                ('divergentes', models.PositiveIntegerField()),
+                ('divergencias', models.JSONField(default=list)),
+            ],
+            options={
+                'verbose_name': 'conferência de estoque',
+                'verbose_name_plural': 'conferências de estoque',
+                'ordering': ('-criado_em',),
+            },
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.0.7 on 2026-10-18 19:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0008_conferenciaestoque'),
+        ('produto', '0006_alertas'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AberturaEstoque',
+            fields=[
+                ('produto', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='abertura', serialize=False, to='produto.produto')),
+                ('saldo', models.IntegerField(default=0)),
+                ('corte', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'saldo de abertura',
+                'verbose_name_plural': 'saldos de abertura',
+            },
+        ),
+        migrations.CreateModel(
+            name='Arquivamento',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('corte', models.DateTimeField(db_index=True)),
+                ('movimentos', models.PositiveIntegerField(default=0)),
+                ('itens', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ('-corte',),
+            },
+        ),
+        migrations.CreateModel(
+            name='EstoqueArquivo',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('criado_em', models.DateTimeField(db_index=True, verbose_name='criado_em')),
+                ('atualizado_em', models.DateTimeField(verbose_name='atualizado_em')),
+                ('nf', models.PositiveIntegerField(blank=True, null=True, verbose_name='Nota Fiscal')),
+                ('movimento', models.CharField(blank=True, choices=[('e', 'entrada'), ('s', 'saida')], max_length=1)),
+                ('funcionario', models.ForeignKey(blank=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'estoque arquivado',
+                'verbose_name_plural': 'estoque arquivado',
+                'ordering': ('-criado_em',),
+            },
+        ),
+        migrations.CreateModel(
+            name='EstoqueItensArquivo',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('quantidade', models.PositiveIntegerField()),
+                ('saldo', models.PositiveIntegerField(blank=True)),
+                ('estoque', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='estoques', to='estoque.estoquearquivo')),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='produto.produto')),
+            ],
+            options={
+                'ordering': ('pk',),
+            },
+        ),
+    ]
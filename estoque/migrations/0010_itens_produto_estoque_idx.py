@@ -0,0 +1,22 @@
+# Generated by Django 5.0.7 on 2026-10-18 20:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0009_arquivo'),
+        ('produto', '0006_alertas'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='estoqueitens',
+            index=models.Index(fields=['produto', 'estoque'], name='itens_produto_estoque_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='estoqueitensarquivo',
+            index=models.Index(fields=['produto', 'estoque'], name='arquivo_produto_estoque_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.0.7 on 2026-10-18 20:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0010_itens_produto_estoque_idx'),
+        ('produto', '0006_alertas'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovimentoDiario',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('movimento', models.CharField(choices=[('e', 'entrada'), ('s', 'saida')], max_length=1)),
+                ('quantidade', models.PositiveIntegerField(default=0)),
+                ('itens', models.PositiveIntegerField(default=0)),
+                ('funcionario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movimentos_diarios', to='produto.produto')),
+            ],
+            options={
+                'verbose_name': 'movimento diário',
+                'verbose_name_plural': 'movimentos diários',
+                'ordering': ('-dia',),
+                'indexes': [models.Index(fields=['dia'], name='movimento_diario_dia_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='movimentodiario',
+            constraint=models.UniqueConstraint(fields=('produto', 'dia', 'movimento', 'funcionario'), name='movimento_diario_unico'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.7 on 2026-10-18 20:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0012_estoque_movimento_criado_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='estoque',
+            index=models.Index(fields=['movimento', 'nf', 'criado_em'], name='estoque_movimento_nf_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='estoquearquivo',
+            index=models.Index(fields=['movimento', 'criado_em', 'id'], name='arquivo_movimento_criado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='estoquearquivo',
+            index=models.Index(fields=['nf', 'criado_em'], name='arquivo_nf_idx'),
+        ),
+    ]
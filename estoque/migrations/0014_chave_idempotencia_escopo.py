@@ -0,0 +1,53 @@
+# Generated by Django 5.0.7 on 2026-10-18 22:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def preencher_escopo(apps, schema_editor):
+    ChaveIdempotencia = apps.get_model('estoque', 'ChaveIdempotencia')
+    Estoque = apps.get_model('estoque', 'Estoque')
+    estoque = Estoque.objects.filter(pk=OuterRef('estoque_id'))
+    ChaveIdempotencia.objects.update(
+        funcionario_id=Subquery(estoque.values('funcionario_id')),
+        movimento=Subquery(estoque.values('movimento')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0013_indices_consultas'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chaveidempotencia',
+            name='funcionario',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='chaveidempotencia',
+            name='movimento',
+            field=models.CharField(choices=[('e', 'entrada'), ('s', 'saida')], default='', max_length=1),
+            preserve_default=False,
+        ),
+        migrations.RunPython(preencher_escopo, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='chaveidempotencia',
+            name='funcionario',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='chaveidempotencia',
+            name='chave',
+            field=models.CharField(max_length=255),
+        ),
+        migrations.AddConstraint(
+            model_name='chaveidempotencia',
+            constraint=models.UniqueConstraint(fields=('funcionario', 'movimento', 'chave'), name='chave_idempotencia_unica'),
+        ),
+    ]
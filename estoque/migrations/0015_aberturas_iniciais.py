@@ -0,0 +1,92 @@
+# Generated by Django 5.0.7 on 2026-10-18 22:40
+
+from django.db import migrations
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, Sum
+from django.db.models import When
+from django.utils import timezone
+
+
+def abrir_saldos(apps, schema_editor):
+    """
+    Grava o saldo de abertura dos produtos cadastrados com estoque
+    antes de ele ser registrado no cadastro.
+
+    O saldo é o estoque antes do primeiro item não arquivado do razão
+    (o saldo do item menos a sua variação); sem itens, o saldo do
+    último item arquivado; e, sem nenhum item, o estoque atual.
+    """
+    Produto = apps.get_model('produto', 'Produto')
+    FragmentoEstoque = apps.get_model('produto', 'FragmentoEstoque')
+    AberturaEstoque = apps.get_model('estoque', 'AberturaEstoque')
+    EstoqueItens = apps.get_model('estoque', 'EstoqueItens')
+    EstoqueItensArquivo = apps.get_model('estoque', 'EstoqueItensArquivo')
+
+    variacao = Case(
+        When(estoque__movimento='s', then=-F('quantidade')),
+        default=F('quantidade'),
+        output_field=IntegerField()
+    )
+    primeiro = (
+        EstoqueItens.objects.filter(produto=OuterRef('pk'))
+        .order_by('estoque__criado_em', 'estoque_id', 'pk')
+        .annotate(anterior=F('saldo') - variacao)
+        .values('anterior')[:1]
+    )
+    arquivado = (
+        EstoqueItensArquivo.objects.filter(produto=OuterRef('pk'))
+        .order_by('-estoque__criado_em', '-estoque_id', '-pk')
+        .values('saldo')[:1]
+    )
+    fragmentos = (
+        FragmentoEstoque.objects.filter(produto=OuterRef('pk'))
+        .values('produto')
+        .annotate(total=Sum('quantidade'))
+        .values('total')
+    )
+    linhas = Produto.objects.order_by().annotate(
+        primeiro=Subquery(primeiro),
+        arquivado=Subquery(arquivado),
+        somados=Subquery(fragmentos),
+    ).values_list(
+        'pk', 'estoque', 'reservado', 'fragmentado',
+        'primeiro', 'arquivado', 'somados',
+    )
+
+    agora = timezone.now()
+    existentes = set(AberturaEstoque.objects.values_list('pk', flat=True))
+    aberturas = []
+    for (pk, estoque, reservado, fragmentado,
+            primeiro, arquivado, somados) in linhas.iterator():
+        if primeiro is not None:
+            saldo = primeiro
+        elif arquivado is not None:
+            saldo = arquivado
+        elif fragmentado:
+            saldo = (somados or 0) + reservado
+        else:
+            saldo = estoque
+        if saldo or pk in existentes:
+            aberturas.append(
+                AberturaEstoque(produto_id=pk, saldo=saldo, corte=agora)
+            )
+
+    # Os produtos já arquivados mantêm o corte do arquivamento
+    AberturaEstoque.objects.bulk_create(
+        aberturas,
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=('produto',),
+        update_fields=('saldo',),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0014_chave_idempotencia_escopo'),
+        ('produto', '0004_produto_reservado'),
+    ]
+
+    operations = [
+        migrations.RunPython(abrir_saldos, migrations.RunPython.noop),
+    ]
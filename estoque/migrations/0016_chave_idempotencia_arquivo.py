@@ -0,0 +1,19 @@
+# Generated by Django 5.0.7 on 2026-10-18 20:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0015_aberturas_iniciais'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='chaveidempotencia',
+            name='estoque',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='chaves_idempotencia', to='estoque.estoque'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.7 on 2026-10-18 21:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0016_chave_idempotencia_arquivo'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='estoque',
+            index=models.Index(fields=['criado_em', 'id'], name='estoque_criado_idx'),
+        ),
+    ]
@@ -42,8 +42,25 @@ class Estoque(TimeStampModel):
             ordering (tuple): Define a ordenação padrão das 
             instâncias de Estoque. No caso, por 'criado_em' 
             em ordem decrescente.
+            indexes (list): Índices das listagens de entradas e
+            saídas, paginadas por data e pk, da busca por nota fiscal
+            no admin e da leitura em ordem de criação do razão
+            colunar.
         """
         ordering = ('-criado_em',)
+        indexes = [
+            models.Index(
+                fields=('movimento', 'criado_em', 'id'),
+                name='estoque_movimento_criado_idx'
+            ),
+            models.Index(
+                fields=('movimento', 'nf', 'criado_em'),
+                name='estoque_movimento_nf_idx'
+            ),
+            models.Index(
+                fields=('criado_em', 'id'), name='estoque_criado_idx'
+            ),
+        ]
 
     def __str__(self):
         """
@@ -154,8 +171,16 @@ class EstoqueItens(models.Model):
         Attributes:
             ordering (tuple): Define a ordenação padrão das instâncias
             de EstoqueItens. No caso, por 'pk' em ordem crescente.
+            indexes (list): Índice do histórico de cada produto,
+            percorrido em ordem de movimento.
         """
         ordering = ('pk',)
+        indexes = [
+            models.Index(
+                fields=('produto', 'estoque'),
+                name='itens_produto_estoque_idx'
+            ),
+        ]
 
     def __str__(self):
         """
@@ -164,4 +189,480 @@ class EstoqueItens(models.Model):
         Returns:
             str: A descrição do item de estoque incluindo seus IDs.
         """
-        return f'{self.pk} - {self.estoque.pk} - {self.produto}'
\ No newline at end of file
+        return f'{self.pk} - {self.estoque.pk} - {self.produto}'
+
+
+
+class ChaveIdempotencia(models.Model):
+    """
+    Chave de idempotência enviada pelo cliente ao criar uma
+    movimentação de estoque.
+
+    Um reenvio com a mesma chave devolve a movimentação original em
+    vez de criar outra. A chave vale para o funcionário e o tipo de
+    movimento que a enviaram, e é única nesse escopo no banco, então
+    dois envios simultâneos não conseguem gravar a mesma chave.
+
+    Attributes:
+        funcionario (ForeignKey): Usuário que enviou a chave.
+        movimento (CharField): Tipo da movimentação criada.
+        chave (CharField): Valor do cabeçalho `Idempotency-Key` ou do
+        campo `idempotency_key`.
+        estoque (ForeignKey): Movimentação criada com a chave. Sem
+        restrição no banco, para que a chave continue valendo depois
+        que a movimentação é arquivada, com a mesma pk no arquivo.
+        expira_em (DateTimeField): Data e hora a partir da qual a chave
+        deixa de valer e pode ser removida.
+    """
+    funcionario = models.ForeignKey(User, on_delete=models.CASCADE)
+    movimento = models.CharField(max_length=1, choices=MOVIMENTO)
+    chave = models.CharField(max_length=255)
+    estoque = models.ForeignKey(
+        Estoque,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='chaves_idempotencia'
+    )
+    expira_em = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = 'chave de idempotência'
+        verbose_name_plural = 'chaves de idempotência'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('funcionario', 'movimento', 'chave'),
+                name='chave_idempotencia_unica'
+            ),
+        ]
+
+    def __str__(self):
+        """
+        Retorna a representação em string da chave.
+
+        Returns:
+            str: A chave e a pk da movimentação.
+        """
+        return f'{self.chave} - {self.estoque_id}'
+
+
+
+# Define as situações de uma reserva de estoque.
+STATUS_RESERVA = (
+    ('a', 'ativa'),
+    ('c', 'confirmada'),
+    ('l', 'liberada'),
+    ('x', 'expirada'),
+)
+
+
+class Reserva(TimeStampModel):
+    """
+    Modelo que representa uma reserva de estoque para um pedido ainda
+    não faturado.
+
+    Enquanto ativa, a quantidade reservada é somada em
+    `Produto.reservado` e não pode ser usada por outras saídas. Ao ser
+    confirmada, a reserva vira uma saída de estoque; ao ser liberada
+    ou expirar, a quantidade volta a ficar disponível.
+
+    Attributes:
+        produto (ForeignKey): Produto reservado.
+        quantidade (PositiveIntegerField): Quantidade reservada.
+        funcionario (ForeignKey): Usuário que criou a reserva.
+        status (CharField): Situação da reserva ('a' ativa,
+        'c' confirmada, 'l' liberada, 'x' expirada).
+        expira_em (DateTimeField): Data e hora em que a reserva ativa
+        expira.
+        estoque (ForeignKey): Saída criada na confirmação. Opcional.
+    """
+    produto = models.ForeignKey(
+        Produto,
+        on_delete=models.CASCADE,
+        related_name='reservas'
+    )
+    quantidade = models.PositiveIntegerField()
+    funcionario = models.ForeignKey(User, on_delete=models.CASCADE)
+    status = models.CharField(
+        max_length=1, choices=STATUS_RESERVA, default='a'
+    )
+    expira_em = models.DateTimeField()
+    estoque = models.ForeignKey(
+        Estoque,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='reservas'
+    )
+
+    class Meta:
+        """
+        Metadados para o modelo Reserva.
+
+        Attributes:
+            ordering (tuple): Ordena pelas reservas mais recentes.
+            indexes (list): Índice parcial da expiração das reservas
+            ativas, usado pela limpeza das expiradas sem percorrer
+            as reservas já encerradas.
+        """
+        ordering = ('-criado_em',)
+        indexes = [
+            models.Index(
+                fields=('expira_em',),
+                condition=models.Q(status='a'),
+                name='reserva_ativa_expira_idx'
+            ),
+        ]
+
+    def __str__(self):
+        """
+        Retorna a representação em string da reserva.
+
+        Returns:
+            str: A pk da reserva, o produto e a quantidade.
+        """
+        return f'{self.pk} - {self.produto} ({self.quantidade})'
+
+
+
+class PosicaoEstoque(models.Model):
+    """
+    Posição de estoque de um produto no fechamento de um dia.
+
+    As posições são gravadas periodicamente pelo comando
+    `registrar_posicoes`, e servem de ponto de partida para consultar
+    o estoque em uma data passada: basta somar as movimentações feitas
+    depois da posição, em vez de percorrer todo o histórico.
+
+    Attributes:
+        produto (ForeignKey): Produto da posição.
+        data (DateField): Dia cujo fechamento a posição registra.
+        estoque (IntegerField): Estoque do produto ao fim do dia,
+        incluindo as quantidades reservadas.
+    """
+    produto = models.ForeignKey(
+        Produto,
+        on_delete=models.CASCADE,
+        related_name='posicoes'
+    )
+    data = models.DateField()
+    estoque = models.IntegerField()
+
+    class Meta:
+        """
+        Metadados para o modelo PosicaoEstoque.
+
+        Attributes:
+            ordering (tuple): Ordena pelas posições mais recentes.
+            constraints (list): Uma posição por produto e dia. O
+            índice da restrição também localiza a posição mais próxima
+            de uma data.
+        """
+        ordering = ('-data',)
+        verbose_name = 'posição de estoque'
+        verbose_name_plural = 'posições de estoque'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('produto', 'data'),
+                name='posicao_produto_data_unica'
+            ),
+        ]
+
+    def __str__(self):
+        """
+        Retorna a representação em string da posição.
+
+        Returns:
+            str: O produto, a data e o estoque.
+        """
+        return f'{self.produto} - {self.data:%d-%m-%Y}: {self.estoque}'
+
+
+
+class MovimentoDiario(models.Model):
+    """
+    Total movimentado de um produto em um dia, por tipo de movimento e
+    funcionário.
+
+    As linhas são somadas a cada movimentação gravada, então os
+    relatórios por dia, semana ou mês leem estes totais em vez dos
+    itens. O comando `reconstruir_movimentos_diarios` refaz os totais
+    a partir dos itens, inclusive os arquivados.
+
+    Attributes:
+        produto (ForeignKey): Produto movimentado.
+        dia (DateField): Dia das movimentações, no fuso horário local.
+        movimento (CharField): Tipo de movimento ('e' para entrada,
+        's' para saída).
+        funcionario (ForeignKey): Usuário que realizou as
+        movimentações.
+        quantidade (PositiveIntegerField): Quantidade total
+        movimentada.
+        itens (PositiveIntegerField): Número de itens somados.
+    """
+    produto = models.ForeignKey(
+        Produto,
+        on_delete=models.CASCADE,
+        related_name='movimentos_diarios'
+    )
+    dia = models.DateField()
+    movimento = models.CharField(max_length=1, choices=MOVIMENTO)
+    funcionario = models.ForeignKey(User, on_delete=models.CASCADE)
+    quantidade = models.PositiveIntegerField(default=0)
+    itens = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        """
+        Metadados para o modelo MovimentoDiario.
+
+        Attributes:
+            ordering (tuple): Ordena pelos dias mais recentes.
+            constraints (list): Uma linha por produto, dia, movimento
+            e funcionário. O índice da restrição atende as consultas
+            por produto.
+            indexes (list): Índice por dia, para as consultas de
+            todos os produtos de um período.
+        """
+        ordering = ('-dia',)
+        verbose_name = 'movimento diário'
+        verbose_name_plural = 'movimentos diários'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('produto', 'dia', 'movimento', 'funcionario'),
+                name='movimento_diario_unico'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=('dia',), name='movimento_diario_dia_idx'),
+        ]
+
+    def __str__(self):
+        """
+        Retorna a representação em string do total diário.
+
+        Returns:
+            str: O produto, o dia, o movimento e a quantidade.
+        """
+        return (
+            f'{self.produto} - {self.dia:%d-%m-%Y} - '
+            f'{self.get_movimento_display()} {self.quantidade}'
+        )
+
+
+class ConferenciaEstoque(models.Model):
+    """
+    Registro de uma conferência do estoque dos produtos com o razão.
+
+    Guarda a duração de cada execução, para acompanhar o custo da
+    conferência conforme o volume de dados cresce, e as divergências
+    encontradas.
+
+    Attributes:
+        criado_em (DateTimeField): Data e hora da execução.
+        segundos (FloatField): Duração da conferência.
+        produtos (PositiveIntegerField): Produtos conferidos.
+        divergentes (PositiveIntegerField): Produtos cujo estoque
+        difere do razão.
+        divergencias (JSONField): Lista de `[pk, esperado, atual]` dos
+        primeiros produtos divergentes.
+    """
+    criado_em = models.DateTimeField(auto_now_add=True, db_index=True)
+    segundos = models.FloatField()
+    produtos = models.PositiveIntegerField()
+    divergentes = models.PositiveIntegerField()
+    divergencias = models.JSONField(default=list)
+
+    class Meta:
+        """
+        Metadados para o modelo ConferenciaEstoque.
+
+        Attributes:
+            ordering (tuple): Ordena pelas conferências mais recentes.
+        """
+        ordering = ('-criado_em',)
+        verbose_name = 'conferência de estoque'
+        verbose_name_plural = 'conferências de estoque'
+
+    def __str__(self):
+        """
+        Retorna a representação em string da conferência.
+
+        Returns:
+            str: A data, o número de divergências e a duração.
+        """
+        return (
+            f'{self.criado_em:%d-%m-%Y %H:%M} - {self.divergentes} '
+            f'divergências em {self.segundos:.1f}s'
+        )
+
+
+
+class EstoqueArquivo(models.Model):
+    """
+    Movimento de estoque de um período encerrado, retirado da tabela
+    de `Estoque` pelo comando `arquivar_movimentos`.
+
+    Mantém a mesma pk e os mesmos campos do movimento original, para
+    que os detalhes e as listagens consultem o arquivo sem diferença.
+
+    Attributes:
+        id (IntegerField): A pk original do movimento.
+        criado_em (DateTimeField): Data e hora do movimento.
+        atualizado_em (DateTimeField): Data e hora da última
+        atualização do movimento.
+        funcionario (ForeignKey): Usuário que realizou o movimento.
+        nf (PositiveIntegerField): Número da Nota Fiscal, opcional.
+        movimento (CharField): Tipo de movimento de estoque
+        ('e' para entrada, 's' para saída).
+    """
+    id = models.IntegerField(primary_key=True)
+    criado_em = models.DateTimeField('criado_em', db_index=True)
+    atualizado_em = models.DateTimeField('atualizado_em')
+    funcionario = models.ForeignKey(User, on_delete=models.CASCADE, blank=True)
+    nf = models.PositiveIntegerField('Nota Fiscal', null=True, blank=True)
+    movimento = models.CharField(max_length=1, choices=MOVIMENTO, blank=True)
+
+    class Meta:
+        """
+        Metadados para o modelo EstoqueArquivo.
+
+        Attributes:
+            ordering (tuple): Mesma ordenação do modelo Estoque.
+            indexes (list): Índices das listagens por período, que
+            consultam o arquivo, e da busca por nota fiscal no admin.
+        """
+        ordering = ('-criado_em',)
+        verbose_name = 'estoque arquivado'
+        verbose_name_plural = 'estoque arquivado'
+        indexes = [
+            models.Index(
+                fields=('movimento', 'criado_em', 'id'),
+                name='arquivo_movimento_criado_idx'
+            ),
+            models.Index(
+                fields=('nf', 'criado_em'), name='arquivo_nf_idx'
+            ),
+        ]
+
+    # Mesma representação e formatação de um movimento não arquivado
+    __str__ = Estoque.__str__
+    nf_formato = Estoque.nf_formato
+
+
+
+class EstoqueItensArquivo(models.Model):
+    """
+    Item de um movimento de estoque arquivado.
+
+    Attributes:
+        id (IntegerField): A pk original do item.
+        estoque (ForeignKey): Movimento arquivado do item.
+        produto (ForeignKey): Produto movimentado.
+        quantidade (PositiveIntegerField): Quantidade movimentada.
+        saldo (PositiveIntegerField): Saldo do produto após a
+        movimentação.
+    """
+    id = models.IntegerField(primary_key=True)
+    estoque = models.ForeignKey(
+        EstoqueArquivo,
+        on_delete=models.CASCADE,
+        related_name='estoques'
+    )
+    produto = models.ForeignKey(Produto, on_delete=models.CASCADE)
+    quantidade = models.PositiveIntegerField()
+    saldo = models.PositiveIntegerField(blank=True)
+
+    class Meta:
+        """
+        Metadados para o modelo EstoqueItensArquivo.
+
+        Attributes:
+            ordering (tuple): Mesma ordenação do modelo EstoqueItens.
+            indexes (list): Mesmo índice de histórico do modelo
+            EstoqueItens.
+        """
+        ordering = ('pk',)
+        indexes = [
+            models.Index(
+                fields=('produto', 'estoque'),
+                name='arquivo_produto_estoque_idx'
+            ),
+        ]
+
+    __str__ = EstoqueItens.__str__
+
+
+
+class AberturaEstoque(models.Model):
+    """
+    Saldo de abertura de um produto: o estoque com que ele foi
+    cadastrado, carregado dos movimentos arquivados.
+
+    O estoque inicial é gravado no cadastro, e o saldo líquido dos
+    itens arquivados de cada produto é somado aqui a cada
+    arquivamento, de forma que o estoque de um produto continua sendo
+    a abertura mais as movimentações não arquivadas.
+
+    Attributes:
+        produto (OneToOneField): Produto do saldo.
+        saldo (IntegerField): Estoque inicial mais as entradas menos
+        as saídas arquivadas.
+        corte (DateTimeField): Instante do cadastro ou até o qual os
+        movimentos do produto foram arquivados.
+    """
+    produto = models.OneToOneField(
+        Produto,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='abertura'
+    )
+    saldo = models.IntegerField(default=0)
+    corte = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'saldo de abertura'
+        verbose_name_plural = 'saldos de abertura'
+
+    def __str__(self):
+        """
+        Retorna a representação em string do saldo de abertura.
+
+        Returns:
+            str: O produto e o saldo.
+        """
+        return f'{self.produto} - {self.saldo}'
+
+
+
+class Arquivamento(models.Model):
+    """
+    Registro de uma execução do arquivamento de movimentos.
+
+    Attributes:
+        criado_em (DateTimeField): Data e hora da execução.
+        corte (DateTimeField): Os movimentos anteriores a este
+        instante estão no arquivo.
+        movimentos (PositiveIntegerField): Movimentos arquivados.
+        itens (PositiveIntegerField): Itens arquivados.
+    """
+    criado_em = models.DateTimeField(auto_now_add=True)
+    corte = models.DateTimeField(db_index=True)
+    movimentos = models.PositiveIntegerField(default=0)
+    itens = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        """
+        Metadados para o modelo Arquivamento.
+
+        Attributes:
+            ordering (tuple): Ordena pelo corte mais recente.
+        """
+        ordering = ('-corte',)
+
+    def __str__(self):
+        """
+        Retorna a representação em string do arquivamento.
+
+        Returns:
+            str: O corte e o número de movimentos arquivados.
+        """
+        return f'Até {self.corte:%d-%m-%Y} - {self.movimentos} movimentos'
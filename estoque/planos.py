@@ -0,0 +1,135 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from core.paginacao import gerar_cursor
+from core.planos import consulta_critica, pagina_da_listagem
+
+from .actions.colunas import pendentes
+from .actions.historico import consulta_pagina
+from .actions.movimentos_diarios import consulta_totais
+from .actions.reservas import consulta_vencidas
+from .forms import EstoqueItensSaidaForm
+from .models import Estoque, EstoqueArquivo, EstoqueEntrada, EstoqueItens
+from .views import DetalheEstoque, ListaEstoqueEntrada, ListaEstoqueSaida
+
+
+# Consultas críticas do estoque, verificadas pelo comando
+# verificar_planos. Cada uma é montada pela própria view ou ação
+# indicada, com valores quaisquer nos filtros.
+
+
+class EntradasArquivadas(ListaEstoqueEntrada):
+    """
+    Listagem de entradas com todo o período antes do corte do
+    arquivamento, que no banco verificado pode não existir.
+    """
+
+    def get_corte(self):
+        return timezone.now()
+
+
+@consulta_critica('estoque.lista_entradas')
+def lista_entradas():
+    """
+    Página seguinte da listagem de entradas (ListaEstoqueEntrada).
+    """
+    return pagina_da_listagem(
+        ListaEstoqueEntrada, depois=gerar_cursor(timezone.now(), 1)
+    )
+
+
+@consulta_critica('estoque.lista_saidas')
+def lista_saidas():
+    """
+    Primeira página da listagem de saídas (ListaEstoqueSaida).
+    """
+    return pagina_da_listagem(ListaEstoqueSaida)
+
+
+@consulta_critica('estoque.lista_arquivo')
+def lista_arquivo():
+    """
+    Página da listagem de entradas em um período arquivado.
+    """
+    return pagina_da_listagem(
+        EntradasArquivadas, de='2020-01-01', ate='2020-01-31'
+    )
+
+
+def _busca_no_admin(modelo, termo):
+    """
+    Monta a busca do admin de um modelo na ordem da listagem, que
+    desempata a data pela pk.
+    """
+    modelo_admin = admin.site._registry[modelo]
+    queryset, _ = modelo_admin.get_search_results(
+        None, modelo.objects.all(), termo
+    )
+    return queryset.order_by('-criado_em', '-pk')
+
+
+@consulta_critica('estoque.busca_nf')
+def busca_nf():
+    """
+    Busca pelo início da nota fiscal no admin de entradas.
+    """
+    return _busca_no_admin(EstoqueEntrada, '12')
+
+
+@consulta_critica('estoque.busca_nf_arquivo')
+def busca_nf_arquivo():
+    """
+    Busca pelo início da nota fiscal no admin do arquivo.
+    """
+    return _busca_no_admin(EstoqueArquivo, '12')
+
+
+@consulta_critica('estoque.itens_do_movimento')
+def itens_do_movimento():
+    """
+    Página dos itens de um movimento com o produto (DetalheEstoque).
+    """
+    view = DetalheEstoque()
+    view.object = Estoque(pk=1)
+    return view.consulta_itens(depois=1)
+
+
+@consulta_critica('estoque.historico_produto')
+def historico_produto():
+    """
+    Página do histórico de um produto, com o movimento de cada item.
+    """
+    return consulta_pagina(EstoqueItens, 1, (1, 1))
+
+
+@consulta_critica('estoque.produtos_disponiveis')
+def produtos_disponiveis():
+    """
+    Produtos oferecidos no formulário de saída.
+    """
+    return EstoqueItensSaidaForm().fields['produto'].queryset
+
+
+@consulta_critica('estoque.movimentos_diarios')
+def movimentos_diarios():
+    """
+    Totais diários de um período (api_movimentos_por_periodo).
+    """
+    hoje = timezone.localdate()
+    return consulta_totais(inicio=hoje, fim=hoje)
+
+
+@consulta_critica('estoque.reservas_vencidas')
+def reservas_vencidas():
+    """
+    Reservas ativas vencidas, liberadas pela limpeza periódica.
+    """
+    return consulta_vencidas(timezone.now())
+
+
+@consulta_critica('estoque.razao_colunar')
+def razao_colunar():
+    """
+    Itens novos lidos pela atualização do razão colunar.
+    """
+    return pendentes([0, 1], timezone.now())
@@ -1,3 +1,1175 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import os
+import tempfile
+from unittest import mock, skipUnless
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import TokenAPI
+from core.orcamento_consultas import OrcamentoDeConsultasMixin
+from core.paginacao import gerar_cursor
+from produto.models import AlertaAberto, AlertaEstoque, Categoria, Produto
+from produto.views import save_data
+
+from .actions.baixa_estoque import EstoqueInsuficiente, atualizar_estoque
+from .management.carga import executar_carga, verificar_invariante
+from .actions.group_commit import GravadorEmGrupo
+from .actions.historico import historico_produto, ler_cursor
+from .actions.idempotencia import buscar_movimento
+from .actions.movimentos_diarios import reconstruir, totais
+from .actions.arquivamento import arquivar
+from .actions.colunas import (
+    EPOCA, MICROSSEGUNDO, RazaoColunar, _deslocamentos, atualizar,
+)
+from .actions.conferencia import conferir, divergencias
+from .actions.exportacao import exportar_razao
+from .actions.reprocessamento import reprocessar
+from .actions.posicoes import estoque_em, fechamento, registrar_posicoes
+from .actions.reservas import criar_reserva, liberar_expiradas
+from .models import (
+    AberturaEstoque,
+    ChaveIdempotencia,
+    Estoque,
+    EstoqueArquivo,
+    EstoqueItens,
+    EstoqueItensArquivo,
+    MovimentoDiario,
+    PosicaoEstoque,
+    Reserva,
+)
+from .forms import EstoqueItensForm
+from .views import gravar_movimento
+
+
+def movimentar(usuario, movimento, *pares):
+    """
+    Grava uma movimentação pelo mesmo caminho das views, com um item
+    por par (produto, quantidade), e retorna os itens gravados.
+    """
+    estoque = Estoque(funcionario=usuario, movimento=movimento)
+    itens = [
+        EstoqueItens(estoque=estoque, produto=produto, quantidade=quantidade)
+        for produto, quantidade in pares
+    ]
+    gravar_movimento(estoque, itens)
+    return itens
+
+
+class CargaConcorrenteTest(TransactionTestCase):
+    """
+    Movimentações concorrentes pelas views não podem perder
+    atualizações de estoque.
+    """
+
+    def test_invariante_com_threads(self):
+        usuario = User.objects.create_user('carga')
+        Produto.objects.bulk_create([
+            Produto(produto=f'Produto {i}', ncm='1', preco=1, estoque=10)
+            for i in range(5)
+        ])
+        iniciais = dict(Produto.objects.values_list('pk', 'estoque'))
+        parametros = {
+            'threads': 4,
+            'movimentos': 10,
+            'itens': 3,
+            'quantidade': 5,
+            'entradas': 0.4,
+        }
+
+        resultado, _ = executar_carga(list(iniciais), usuario, parametros)
+
+        self.assertEqual(resultado.erros, [])
+        self.assertEqual(resultado.aceitas + resultado.recusadas, 40)
+        self.assertEqual(verificar_invariante(iniciais, resultado), [])
+
+
+class ConsultasDasPaginasTest(OrcamentoDeConsultasMixin, TestCase):
+    """
+    As páginas de movimentos executam a mesma quantidade de consultas
+    qualquer que seja a quantidade de linhas exibidas.
+    """
+
+    def setUp(self):
+        self.produtos = Produto.objects.bulk_create([
+            Produto(produto=f'Produto {i}', ncm='1', preco=1, estoque=0)
+            for i in range(60)
+        ])
+        self.client.force_login(User.objects.create_user('consultas'))
+        for i in range(12):
+            estoque = Estoque(
+                funcionario=User.objects.create_user(f'funcionario {i}'),
+                movimento='e',
+            )
+            gravar_movimento(estoque, [
+                EstoqueItens(estoque=estoque, produto=produto, quantidade=2)
+                for produto in self.produtos[:5 * (i + 1)]
+            ])
+        self.ultimo = estoque
+
+    def test_lista_de_entradas(self):
+        url = reverse('estoque:lista_estoque_entrada')
+        with self.assertMaximoDeConsultas(5):
+            resposta = self.client.get(url)
+        self.assertEqual(len(resposta.context['object_list']), 10)
+        self.assertContains(resposta, 'funcionario 11')
+
+    def test_detalhe_paginado(self):
+        url = reverse('estoque:detalhes_estoque', args=[self.ultimo.pk])
+        with self.assertMaximoDeConsultas(5):
+            resposta = self.client.get(url)
+        self.assertEqual(len(resposta.context['itens']), 50)
+        self.assertEqual(
+            resposta.context['totais'], {'linhas': 60, 'quantidade': 120}
+        )
+
+        resposta = self.client.get(
+            url, {'depois': resposta.context['proximo']}
+        )
+        self.assertEqual(len(resposta.context['itens']), 10)
+        self.assertIsNone(resposta.context['proximo'])
+
+
+class BuscaPorNFTest(TestCase):
+    """
+    A busca do admin encontra os movimentos pelo início do número da
+    nota fiscal.
+    """
+
+    def setUp(self):
+        usuario = User.objects.create_superuser('admin')
+        self.client.force_login(usuario)
+        for nf, movimento in ((12, 'e'), (125, 'e'), (1299, 'e'),
+                              (13, 'e'), (212, 'e'), (0, 'e'),
+                              (12, 's')):
+            Estoque.objects.create(
+                funcionario=usuario, movimento=movimento, nf=nf
+            )
+
+    def buscar(self, termo):
+        resposta = self.client.get(
+            reverse('admin:estoque_estoqueentrada_changelist'),
+            {'q': termo},
+        )
+        return sorted(
+            movimento.nf for movimento in resposta.context['cl'].result_list
+        )
+
+    def test_prefixo(self):
+        self.assertEqual(self.buscar('12'), [12, 125, 1299])
+        self.assertEqual(self.buscar('129'), [1299])
+        self.assertEqual(self.buscar('0'), [0])
+        self.assertEqual(self.buscar(''), [0, 12, 13, 125, 212, 1299])
+
+    def test_termo_invalido(self):
+        self.assertEqual(self.buscar('012'), [])
+        self.assertEqual(self.buscar('1a'), [])
+        self.assertEqual(self.buscar('99999999999'), [])
+
+
+class BaixaDeEstoqueTest(TestCase):
+    """
+    A atualização condicional do estoque recusa as saídas sem saldo e
+    informa os produtos recusados.
+    """
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('baixa')
+        self.produto = Produto.objects.create(
+            produto='Caneta', ncm='1', preco=1, estoque=10
+        )
+
+    def itens(self, movimento, *quantidades):
+        estoque = Estoque.objects.create(
+            funcionario=self.usuario, movimento=movimento
+        )
+        return [
+            EstoqueItens(
+                estoque=estoque, produto=produto, quantidade=quantidade
+            )
+            for produto, quantidade in quantidades
+        ]
+
+    def test_saida_acima_do_estoque(self):
+        with self.assertRaises(EstoqueInsuficiente) as erro:
+            with transaction.atomic():
+                atualizar_estoque(self.itens('s', (self.produto, 11)))
+        self.assertEqual(
+            erro.exception.produtos, [(self.produto.pk, 'Caneta', 10)]
+        )
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.estoque, 10)
+
+    def test_produto_excluido_durante_a_movimentacao(self):
+        itens = self.itens('e', (self.produto, 5))
+        pk = self.produto.pk
+        Produto.objects.filter(pk=pk).delete()
+        with self.assertRaises(EstoqueInsuficiente) as erro:
+            with transaction.atomic():
+                atualizar_estoque(itens)
+        self.assertEqual(
+            erro.exception.produtos, [(pk, f'produto {pk} (excluído)', 0)]
+        )
+        self.assertIn(f'produto {pk} (excluído)', str(erro.exception))
+
+
+class ApiMovimentosTest(TestCase):
+    """
+    O endpoint de movimentos em lote grava cada documento válido e
+    recusa os demais individualmente.
+    """
+
+    def setUp(self):
+        self.token = TokenAPI.objects.create(
+            usuario=User.objects.create_user('api')
+        )
+        self.produto = Produto.objects.create(
+            produto='Caneta', ncm='1', preco=1, estoque=10
+        )
+
+    def enviar(self, documentos):
+        return self.client.post(
+            reverse('estoque:api_movimentos'),
+            json.dumps({'movimentos': documentos}),
+            content_type='application/json',
+            HTTP_AUTHORIZATION=f'Token {self.token.chave}',
+        )
+
+    def test_documentos_aceitos_e_recusados(self):
+        item = {'produto': self.produto.pk, 'quantidade': 6}
+        resposta = self.enviar([
+            {'movimento': 's', 'nf': 1, 'itens': [item]},
+            {'movimento': 's', 'itens': [item]},
+            {'movimento': 'e', 'nf': 0, 'itens': [item]},
+        ])
+
+        resultados = resposta.json()['resultados']
+        self.assertEqual(
+            [resultado['status'] for resultado in resultados],
+            ['ok', 'erro', 'erro'],
+        )
+        self.assertEqual(
+            resultados[2]['erros'], ['nf deve ser um inteiro positivo.']
+        )
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.estoque, 4)
+
+    def test_inteiros_maiores_que_o_banco(self):
+        grande = 10 ** 30
+        resposta = self.enviar([
+            {'movimento': 'e', 'nf': grande, 'itens': [
+                {'produto': self.produto.pk, 'quantidade': 1}
+            ]},
+            {'movimento': 'e', 'itens': [
+                {'produto': grande, 'quantidade': 1}
+            ]},
+            {'movimento': 'e', 'itens': [
+                {'produto': self.produto.pk, 'quantidade': 2 ** 31}
+            ]},
+            {'movimento': 'e', 'nf': 2 ** 31 - 1, 'itens': [
+                {'produto': self.produto.pk, 'quantidade': 1}
+            ]},
+        ])
+
+        self.assertEqual(resposta.status_code, 200)
+        resultados = resposta.json()['resultados']
+        self.assertEqual(
+            [resultado['status'] for resultado in resultados],
+            ['erro', 'erro', 'erro', 'ok'],
+        )
+        self.assertEqual(
+            resultados[2]['erros'],
+            ['itens[0].quantidade deve ser no máximo 2147483647.'],
+        )
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.estoque, 11)
+
+
+class IdempotenciaTest(TestCase):
+    """
+    Um reenvio com a mesma chave de idempotência devolve a
+    movimentação original, no escopo do funcionário e do movimento.
+    """
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('idempotencia')
+        self.produto = Produto.objects.create(
+            produto='Caneta', ncm='1', preco=1, estoque=10
+        )
+
+    def enviar(self, usuario, url, chave):
+        self.client.force_login(usuario)
+        return self.client.post(reverse(url), {
+            'main-nf': '1',
+            'estoque-TOTAL_FORMS': 1,
+            'estoque-INITIAL_FORMS': 0,
+            'estoque-MIN_NUM_FORMS': 1,
+            'estoque-MAX_NUM_FORMS': 1000,
+            'estoque-0-produto': self.produto.pk,
+            'estoque-0-quantidade': 3,
+        }, HTTP_IDEMPOTENCY_KEY=chave)
+
+    def test_reenvio_devolve_a_movimentacao_original(self):
+        primeira = self.enviar(self.usuario, 'estoque:add_estoque_saida', 'k')
+        segunda = self.enviar(self.usuario, 'estoque:add_estoque_saida', 'k')
+
+        self.assertEqual(primeira['Location'], segunda['Location'])
+        self.assertEqual(Estoque.objects.count(), 1)
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.estoque, 7)
+
+    def test_chave_vale_por_funcionario_e_movimento(self):
+        outro = User.objects.create_user('outro')
+        self.enviar(self.usuario, 'estoque:add_estoque_saida', 'k')
+        self.enviar(outro, 'estoque:add_estoque_saida', 'k')
+        self.enviar(self.usuario, 'estoque:add_estoque_entrada', 'k')
+
+        self.assertEqual(Estoque.objects.count(), 3)
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.estoque, 7)
+
+    def test_chave_expirada(self):
+        self.enviar(self.usuario, 'estoque:add_estoque_saida', 'k')
+        ChaveIdempotencia.objects.update(
+            expira_em=timezone.now() - timedelta(hours=1)
+        )
+
+        # A leitura ignora a chave expirada sem removê-la
+        self.assertIsNone(buscar_movimento(self.usuario, 's', 'k'))
+        self.assertEqual(ChaveIdempotencia.objects.count(), 1)
+
+        self.enviar(self.usuario, 'estoque:add_estoque_saida', 'k')
+        self.assertEqual(Estoque.objects.count(), 2)
+        chave = ChaveIdempotencia.objects.get()
+        self.assertEqual(
+            buscar_movimento(self.usuario, 's', 'k'), chave.estoque_id
+        )
+
+
+class ReservasTest(TestCase):
+    """
+    As reservas seguram o estoque até serem confirmadas em uma saída,
+    liberadas ou expiradas.
+    """
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('reservas')
+        self.token = TokenAPI.objects.create(usuario=self.usuario)
+        self.produto = Produto.objects.create(
+            produto='Caneta', ncm='1', preco=1, estoque=10
+        )
+
+    def confirmar(self, reserva, corpo):
+        return self.client.post(
+            reverse('estoque:api_confirmar_reserva', args=[reserva.pk]),
+            corpo,
+            content_type='application/json',
+            HTTP_AUTHORIZATION=f'Token {self.token.chave}',
+        )
+
+    def test_reserva_bloqueia_saida(self):
+        criar_reserva(self.produto.pk, 6, self.usuario)
+        with self.assertRaises(EstoqueInsuficiente):
+            movimentar(self.usuario, 's', (self.produto, 5))
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.estoque_disponivel, 4)
+
+    def test_confirmacao_pela_api(self):
+        reserva = criar_reserva(self.produto.pk, 6, self.usuario)
+
+        resposta = self.confirmar(reserva, '{nf')
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(resposta.json(), {'erro': 'JSON inválido.'})
+        resposta = self.confirmar(reserva, json.dumps({'nf': 0}))
+        self.assertEqual(resposta.status_code, 400)
+
+        resposta = self.confirmar(reserva, json.dumps({'nf': 7}))
+        self.assertEqual(resposta.status_code, 200)
+        self.produto.refresh_from_db()
+        self.assertEqual(
+            (self.produto.estoque, self.produto.reservado), (4, 0)
+        )
+        self.assertEqual(self.confirmar(reserva, '').status_code, 409)
+
+    def test_valores_fora_do_intervalo(self):
+        url = reverse('estoque:api_reservas')
+        for corpo, erro in (
+                ({'quantidade': 10 ** 30},
+                 'quantidade deve ser no máximo 2147483647.'),
+                ({'produto': 10 ** 30},
+                 'produto deve ser no máximo 2147483647.'),
+                ({'minutos': 10 ** 12}, 'minutos deve ser no máximo 43200.')):
+            resposta = self.client.post(
+                url,
+                json.dumps({
+                    'produto': self.produto.pk, 'quantidade': 1, **corpo
+                }),
+                content_type='application/json',
+                HTTP_AUTHORIZATION=f'Token {self.token.chave}',
+            )
+            self.assertEqual(resposta.status_code, 400)
+            self.assertEqual(resposta.json(), {'erros': [erro]})
+        self.assertFalse(Reserva.objects.exists())
+
+    def test_reservas_expiradas(self):
+        criar_reserva(self.produto.pk, 6, self.usuario)
+        Reserva.objects.update(expira_em=timezone.now())
+
+        self.assertEqual(liberar_expiradas(), 1)
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.estoque_disponivel, 10)
+
+
+class ValidacaoDoFormularioTest(OrcamentoDeConsultasMixin, TestCase):
+    """
+    O formset de itens valida todas as linhas com uma consulta de
+    produtos e aponta a linha com o erro.
+    """
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('formulario'))
+        self.produtos = Produto.objects.bulk_create([
+            Produto(produto=f'Produto {i}', ncm='1', preco=1, estoque=10)
+            for i in range(30)
+        ])
+
+    def enviar(self, linhas):
+        dados = {
+            'main-nf': '1',
+            'estoque-TOTAL_FORMS': len(linhas),
+            'estoque-INITIAL_FORMS': 0,
+            'estoque-MIN_NUM_FORMS': 1,
+            'estoque-MAX_NUM_FORMS': 1000,
+        }
+        for indice, (produto, quantidade) in enumerate(linhas):
+            dados[f'estoque-{indice}-produto'] = produto.pk
+            dados[f'estoque-{indice}-quantidade'] = quantidade
+        return self.client.post(reverse('estoque:add_estoque_saida'), dados)
+
+    def test_erros_por_linha(self):
+        resposta = self.enviar([
+            (self.produtos[0], 3),
+            (self.produtos[0], 2),
+            (self.produtos[1], 11),
+        ])
+
+        self.assertEqual(resposta.status_code, 200)
+        erros = resposta.context['formset'].errors
+        self.assertEqual(erros[0], {})
+        self.assertIn('produto', erros[1])
+        self.assertIn('quantidade', erros[2])
+        self.assertFalse(Estoque.objects.exists())
+
+    def test_consultas_independem_das_linhas(self):
+        with self.assertMaximoDeConsultas(5):
+            resposta = self.enviar([
+                (produto, 11) for produto in self.produtos
+            ])
+        self.assertEqual(resposta.status_code, 200)
+
+    def test_select_so_com_o_produto_escolhido(self):
+        produto = self.produtos[3]
+        form = EstoqueItensForm(
+            data={'produto': str(produto.pk), 'quantidade': '1'}
+        )
+        self.assertTrue(form.is_valid())
+        with self.assertNumQueries(1):
+            html = str(form['produto'])
+        self.assertEqual(html.count('<option'), 2)
+        self.assertIn(f'value="{produto.pk}" selected>Produto 3', html)
+        self.assertIn('data-url="/produto/autocompletar/"', html)
+
+        # Com os produtos já carregados pelo formset, não há consulta
+        form.fields['produto'].produtos = {produto.pk: produto}
+        with self.assertNumQueries(0):
+            str(form['produto'])
+
+        form = EstoqueItensForm(data={'produto': 'x', 'quantidade': '1'})
+        self.assertFalse(form.is_valid())
+        with self.assertNumQueries(0):
+            html = str(form['produto'])
+        self.assertEqual(html.count('<option'), 1)
+
+
+class GroupCommitTest(TransactionTestCase):
+    """
+    As gravações enfileiradas no group commit são gravadas em lote, e
+    a falha de uma não desfaz as demais.
+    """
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('grupo')
+        self.produto = Produto.objects.create(
+            produto='Caneta', ncm='1', preco=1, estoque=10
+        )
+        self.gravador = GravadorEmGrupo(janela_ms=200, max_lote=10)
+        self.addCleanup(self.gravador.parar)
+
+    def gravar(self, movimento, quantidade):
+        estoque = Estoque(funcionario=self.usuario, movimento=movimento)
+        itens = [EstoqueItens(
+            estoque=estoque, produto=self.produto, quantidade=quantidade
+        )]
+        try:
+            return self.gravador.executar(gravar_movimento, estoque, itens)
+        except EstoqueInsuficiente:
+            return None
+
+    def test_lote_com_uma_falha(self):
+        with ThreadPoolExecutor(3) as executor:
+            resultados = list(executor.map(
+                self.gravar, ('e', 's', 's'), (5, 8, 20)
+            ))
+
+        self.assertEqual(
+            [resultado is not None for resultado in resultados],
+            [True, True, False],
+        )
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.estoque, 7)
+        self.assertEqual(Estoque.objects.count(), 2)
+
+
+class AlertasDeEstoqueTest(TestCase):
+    """
+    As movimentações geram um evento só quando o estoque cruza o
+    estoque mínimo, e mantêm o conjunto de alertas abertos.
+    """
+
+    def test_cruzamentos(self):
+        usuario = User.objects.create_user('alertas')
+        produto = Produto.objects.create(
+            produto='Caneta', ncm='1', preco=1, estoque=10, estoque_minimo=5
+        )
+
+        movimentar(usuario, 's', (produto, 6))
+        movimentar(usuario, 's', (produto, 1))
+        self.assertTrue(AlertaAberto.objects.filter(produto=produto).exists())
+
+        movimentar(usuario, 'e', (produto, 5))
+        self.assertFalse(AlertaAberto.objects.exists())
+        self.assertEqual(
+            list(
+                AlertaEstoque.objects.order_by('pk')
+                .values_list('tipo', 'estoque')
+            ),
+            [('a', 4), ('n', 8)],
+        )
+
+    def test_importacao_abaixo_do_minimo(self):
+        save_data([
+            {
+                'produto': 'Lápis', 'ncm': '1', 'importado': 'False',
+                'preco': '1', 'estoque': '3', 'estoque_minimo': '5',
+            },
+            {
+                'produto': 'Borracha', 'ncm': '1', 'importado': 'False',
+                'preco': '1', 'estoque': '30', 'estoque_minimo': '5',
+            },
+        ])
+        self.assertEqual(
+            list(AlertaAberto.objects.values_list(
+                'produto__produto', 'alerta__estoque'
+            )),
+            [('Lápis', 3)],
+        )
+
+
+class PosicoesDeEstoqueTest(TestCase):
+    """
+    O estoque numa data passada parte da posição gravada mais recente
+    e soma só as movimentações posteriores.
+    """
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('posicoes')
+        self.produto = Produto.objects.create(
+            produto='Caneta', ncm='1', preco=1, estoque=0
+        )
+        self.hoje = timezone.localdate()
+        for dias, movimento, quantidade in (
+                (3, 'e', 10), (2, 's', 4), (0, 'e', 1)):
+            itens = movimentar(
+                self.usuario, movimento, (self.produto, quantidade)
+            )
+            Estoque.objects.filter(pk=itens[0].estoque_id).update(
+                criado_em=timezone.now() - timedelta(days=dias)
+            )
+
+    def dia(self, dias):
+        return self.hoje - timedelta(days=dias)
+
+    def test_estoque_nas_datas(self):
+        esperados = {3: 10, 2: 6, 1: 6}
+        calculados = {
+            dias: estoque_em(self.produto.pk, fechamento(self.dia(dias)))
+            for dias in esperados
+        }
+        self.assertEqual(calculados, esperados)
+
+        self.assertEqual(registrar_posicoes(self.dia(3), self.dia(1)), 3)
+        self.assertEqual(
+            list(
+                PosicaoEstoque.objects.order_by('data')
+                .values_list('estoque', flat=True)
+            ),
+            [10, 6, 6],
+        )
+        self.assertEqual(
+            estoque_em(self.produto.pk, timezone.now()), 7
+        )
+
+    def test_parte_da_posicao_gravada(self):
+        registrar_posicoes(self.dia(2))
+        PosicaoEstoque.objects.update(estoque=100)
+        self.assertEqual(
+            estoque_em(self.produto.pk, fechamento(self.dia(1))), 100
+        )
+
+    def test_dia_atual_nao_tem_posicao(self):
+        with self.assertRaises(ValueError):
+            registrar_posicoes(self.hoje)
+
+
+class ProdutoCadastradoComEstoqueMixin:
+    """
+    Cadastra um produto com estoque pelo formulário e movimenta +10 e
+    -5, para os testes do razão.
+    """
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('razao')
+        self.client.force_login(self.usuario)
+        self.client.post(reverse('produto:adicionar_produto'), {
+            'produto': 'Caneta',
+            'ncm': '1',
+            'preco': '1',
+            'estoque': '100',
+            'estoque_minimo': '0',
+            'categoria': Categoria.objects.create(categoria='Papelaria').pk,
+        })
+        self.produto = Produto.objects.get()
+        movimentar(self.usuario, 'e', (self.produto, 10))
+        movimentar(self.usuario, 's', (self.produto, 5))
+
+    def estado(self):
+        self.produto.refresh_from_db()
+        saldos = list(
+            EstoqueItens.objects.order_by('pk')
+            .values_list('saldo', flat=True)
+        )
+        return self.produto.estoque, saldos
+
+
+class ReprocessamentoTest(ProdutoCadastradoComEstoqueMixin, TestCase):
+    """
+    O reprocessamento refaz os saldos e o estoque a partir do estoque
+    do cadastro e das movimentações.
+    """
+
+    def test_cadastro_abre_o_saldo(self):
+        self.assertEqual(AberturaEstoque.objects.get().saldo, 100)
+        self.assertEqual(self.estado(), (105, [110, 105]))
+
+        resumo = reprocessar(1)
+        self.assertEqual((resumo.itens, resumo.produtos), (0, 0))
+        self.assertEqual(self.estado(), (105, [110, 105]))
+
+    def test_corrige_razao_divergente(self):
+        EstoqueItens.objects.update(saldo=0)
+        Produto.objects.update(estoque=999)
+
+        resumo = reprocessar(1)
+        self.assertEqual((resumo.itens, resumo.produtos), (2, 1))
+        self.assertEqual(self.estado(), (105, [110, 105]))
+
+    def test_corrige_razao_em_python(self):
+        EstoqueItens.objects.update(saldo=0)
+        Produto.objects.update(estoque=999)
+
+        with mock.patch(
+                'estoque.actions.reprocessamento.atualiza_no_banco',
+                return_value=False):
+            reprocessar(1)
+        self.assertEqual(self.estado(), (105, [110, 105]))
+
+    def test_importacao_abre_o_saldo(self):
+        save_data([{
+            'produto': 'Lápis', 'ncm': '1', 'importado': 'False',
+            'preco': '1', 'estoque': '30', 'estoque_minimo': '0',
+        }])
+        lapis = Produto.objects.get(produto='Lápis')
+        self.assertEqual(lapis.abertura.saldo, 30)
+
+
+class ConferenciaTest(ProdutoCadastradoComEstoqueMixin, TestCase):
+    """
+    A conferência compara o estoque com a abertura mais o razão, e
+    só aponta os produtos que o razão não explica.
+    """
+
+    def test_produto_consistente(self):
+        self.assertEqual(list(divergencias()), [])
+        conferencia = conferir()
+        self.assertEqual(
+            (conferencia.produtos, conferencia.divergentes), (1, 0)
+        )
+
+    def test_produto_divergente(self):
+        Produto.objects.update(estoque=999)
+        self.assertEqual(
+            list(divergencias()), [(self.produto.pk, 105, 999)]
+        )
+
+
+class ArquivamentoTest(TestCase):
+    """
+    O arquivamento move os movimentos antigos para o arquivo sem mudar
+    o estoque, o razão nem as chaves de idempotência.
+    """
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('arquivo')
+        self.client.force_login(self.usuario)
+        self.produto = Produto.objects.create(
+            produto='Caneta', ncm='1', preco=1, estoque=0
+        )
+        self.antiga = self.entrada(10, 'antiga')
+        movimentar(self.usuario, 's', (self.produto, 3))
+        self.corte = timezone.now()
+        Estoque.objects.update(criado_em=self.corte - timedelta(days=30))
+        movimentar(self.usuario, 'e', (self.produto, 2))
+
+    def entrada(self, quantidade, chave):
+        resposta = self.client.post(reverse('estoque:add_estoque_entrada'), {
+            'main-nf': '1',
+            'estoque-TOTAL_FORMS': 1,
+            'estoque-INITIAL_FORMS': 0,
+            'estoque-MIN_NUM_FORMS': 1,
+            'estoque-MAX_NUM_FORMS': 1000,
+            'estoque-0-produto': self.produto.pk,
+            'estoque-0-quantidade': quantidade,
+        }, HTTP_IDEMPOTENCY_KEY=chave)
+        return resposta['Location']
+
+    def test_arquivamento(self):
+        registro = arquivar(self.corte)
+
+        self.assertEqual((registro.movimentos, registro.itens), (2, 2))
+        self.assertEqual(Estoque.objects.count(), 1)
+        self.assertEqual(EstoqueArquivo.objects.count(), 2)
+        self.assertEqual(EstoqueItensArquivo.objects.count(), 2)
+        self.assertEqual(AberturaEstoque.objects.get().saldo, 7)
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.estoque, 9)
+        self.assertEqual(list(divergencias()), [])
+        self.assertEqual(reprocessar(1).itens, 0)
+
+    def test_reenvio_de_movimento_arquivado(self):
+        arquivar(self.corte)
+
+        self.assertEqual(self.entrada(10, 'antiga'), self.antiga)
+        self.assertEqual(self.client.get(self.antiga).status_code, 200)
+        self.assertEqual(Estoque.objects.count(), 1)
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.estoque, 9)
+
+    def test_listagem_une_o_arquivo(self):
+        arquivar(self.corte)
+        url = reverse('estoque:lista_estoque_entrada')
+
+        resposta = self.client.get(url)
+        self.assertEqual(len(resposta.context['object_list']), 1)
+        de = timezone.localdate(self.corte - timedelta(days=31))
+        resposta = self.client.get(url, {'de': de.isoformat()})
+        self.assertEqual(
+            [estoque.pk for estoque in resposta.context['object_list']],
+            list(Estoque.objects.values_list('pk', flat=True))
+            + list(EstoqueArquivo.objects.filter(
+                movimento='e'
+            ).values_list('pk', flat=True)),
+        )
+
+        # Um cursor adulterado lê a primeira página, numa tabela ou na
+        # união das duas
+        for parametros in ({}, {'de': de.isoformat()}):
+            for valor in (None, 'x', [1]):
+                resposta = self.client.get(
+                    url, {**parametros, 'depois': gerar_cursor(valor, 1)}
+                )
+                self.assertEqual(resposta.status_code, 200)
+
+    def test_corte_futuro(self):
+        with self.assertRaises(ValueError):
+            arquivar(timezone.now() + timedelta(days=1))
+
+
+class HistoricoDoProdutoTest(TestCase):
+    """
+    O histórico de um produto é paginado pelo cursor, do movimento
+    mais recente ao mais antigo, e continua pelos itens arquivados.
+    """
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('historico')
+        self.client.force_login(self.usuario)
+        self.produto = Produto.objects.create(
+            produto='Caneta', ncm='1', preco=1, estoque=0
+        )
+        outro = Produto.objects.create(
+            produto='Lápis', ncm='1', preco=1, estoque=0
+        )
+        for quantidade in (10, 20, 30):
+            movimentar(self.usuario, 'e', (self.produto, quantidade))
+        movimentar(self.usuario, 's', (self.produto, 5), (outro, 0))
+        movimentar(self.usuario, 'e', (self.produto, 1), (self.produto, 2))
+
+    def paginas(self, limite):
+        paginas = []
+        cursor = None
+        while True:
+            linhas, proximo = historico_produto(
+                self.produto.pk, cursor, limite
+            )
+            paginas.append([linha['quantidade'] for linha in linhas])
+            if proximo is None:
+                return paginas
+            cursor = ler_cursor(proximo)
+
+    def test_paginas(self):
+        self.assertEqual(self.paginas(2), [[2, 1], [5, 30], [20, 10]])
+        self.assertEqual(self.paginas(6), [[2, 1, 5, 30, 20, 10]])
+        linhas, _ = historico_produto(self.produto.pk)
+        self.assertEqual(
+            [linha['saldo'] for linha in linhas], [58, 56, 55, 60, 30, 10]
+        )
+
+    def test_continua_no_arquivo(self):
+        corte = timezone.now()
+        Estoque.objects.exclude(
+            pk=Estoque.objects.latest('pk').pk
+        ).update(criado_em=corte - timedelta(days=1))
+        arquivar(corte)
+
+        self.assertEqual(self.paginas(2), [[2, 1], [5, 30], [20, 10]])
+        self.assertEqual(self.paginas(1)[1:], [[1], [5], [30], [20], [10]])
+
+    def test_cursor_invalido(self):
+        self.assertIsNone(ler_cursor(None))
+        self.assertIsNone(ler_cursor('abc'))
+        self.assertIsNone(ler_cursor('1-2-3'))
+
+    def test_pagina_da_view(self):
+        url = reverse('produto:detalhe_produto', args=[self.produto.pk])
+        resposta = self.client.get(url, {'antes': '0-0'})
+        self.assertEqual(list(resposta.context['historico']), [])
+        self.assertIsNone(resposta.context['proximo'])
+        resposta = self.client.get(url, {'antes': 'x'})
+        self.assertTrue(resposta.context['primeira_pagina'])
+        self.assertEqual(len(resposta.context['historico']), 6)
+
+    @skipUnless(connection.vendor == 'sqlite', 'Plano do SQLite.')
+    def test_indice(self):
+        plano = EstoqueItens.objects.filter(
+            produto=self.produto
+        ).order_by('-estoque_id', '-pk').explain()
+        self.assertIn('itens_produto_estoque_idx', plano)
+        self.assertNotIn('TEMP B-TREE', plano)
+
+
+class MovimentosDiariosTest(TestCase):
+    """
+    Os totais diários são somados a cada movimentação e refeitos pelo
+    comando de reconstrução com o mesmo resultado.
+    """
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('diario')
+        self.categoria = Categoria.objects.create(categoria='Papelaria')
+        self.caneta = Produto.objects.create(
+            produto='Caneta', ncm='1', preco=1, estoque=0,
+            categoria=self.categoria,
+        )
+        self.lapis = Produto.objects.create(
+            produto='Lápis', ncm='1', preco=1, estoque=0,
+            categoria=self.categoria,
+        )
+        movimentar(self.usuario, 'e', (self.caneta, 10), (self.lapis, 4))
+        movimentar(self.usuario, 'e', (self.caneta, 5))
+        movimentar(self.usuario, 's', (self.caneta, 3), (self.caneta, 2))
+
+    def linhas(self):
+        return sorted(MovimentoDiario.objects.values_list(
+            'produto', 'dia', 'movimento', 'funcionario', 'quantidade',
+            'itens'
+        ))
+
+    def test_acumulados_na_gravacao(self):
+        hoje = timezone.localdate()
+        self.assertEqual(self.linhas(), [
+            (self.caneta.pk, hoje, 'e', self.usuario.pk, 15, 2),
+            (self.caneta.pk, hoje, 's', self.usuario.pk, 5, 2),
+            (self.lapis.pk, hoje, 'e', self.usuario.pk, 4, 1),
+        ])
+        gravados = self.linhas()
+        self.assertEqual(reconstruir(), 3)
+        self.assertEqual(self.linhas(), gravados)
+
+    def test_totais_por_periodo(self):
+        Estoque.objects.filter(movimento='s').update(
+            criado_em=timezone.now() - timedelta(days=40)
+        )
+        reconstruir()
+        hoje = timezone.localdate()
+        antes = hoje - timedelta(days=40)
+
+        self.assertEqual(totais(por='categoria'), [
+            {'periodo': antes, 'chave': self.categoria.pk,
+             'entradas': 0, 'saidas': 5},
+            {'periodo': hoje, 'chave': self.categoria.pk,
+             'entradas': 19, 'saidas': 0},
+        ])
+        self.assertEqual(
+            totais('mes', filtro=[self.caneta.pk], inicio=hoje),
+            [{'periodo': hoje.replace(day=1), 'chave': self.caneta.pk,
+              'entradas': 15, 'saidas': 0}],
+        )
+        semanas = totais('semana', por='funcionario')
+        self.assertEqual(
+            [linha['periodo'].weekday() for linha in semanas], [0, 0]
+        )
+        with self.assertRaises(ValueError):
+            totais('ano')
+
+    def test_reconstruir_desde(self):
+        MovimentoDiario.objects.update(quantidade=0)
+        reconstruir(timezone.localdate() + timedelta(days=1))
+        self.assertEqual(
+            MovimentoDiario.objects.filter(quantidade__gt=0).count(), 0
+        )
+        reconstruir(timezone.localdate())
+        self.assertEqual(
+            MovimentoDiario.objects.filter(quantidade__gt=0).count(), 3
+        )
+
+    def test_api(self):
+        token = TokenAPI.objects.create(usuario=self.usuario)
+        url = reverse('estoque:api_movimentos_por_periodo')
+        cabecalho = {'HTTP_AUTHORIZATION': f'Token {token.chave}'}
+
+        resposta = self.client.get(
+            url, {'por': 'produto', 'id': self.lapis.pk}, **cabecalho
+        )
+        self.assertEqual(resposta.json()['totais'], [{
+            'periodo': timezone.localdate().isoformat(),
+            'chave': self.lapis.pk, 'entradas': 4, 'saidas': 0,
+        }])
+        resposta = self.client.get(url, {'de': '2026-99-01'}, **cabecalho)
+        self.assertEqual(resposta.status_code, 400)
+        resposta = self.client.get(url, {'por': 'nf'}, **cabecalho)
+        self.assertEqual(resposta.status_code, 400)
+
+
+class ExportacaoDoRazaoTest(TestCase):
+    """
+    A exportação do razão envia os itens em partes, com os filtros
+    aplicados, incluindo os arquivados.
+    """
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('exportacao')
+        self.token = TokenAPI.objects.create(usuario=self.usuario)
+        self.caneta = Produto.objects.create(
+            produto='Caneta', ncm='1', preco=1, estoque=0
+        )
+        self.lapis = Produto.objects.create(
+            produto='Lápis', ncm='1', preco=1, estoque=0
+        )
+        movimentar(self.usuario, 'e', (self.caneta, 10), (self.lapis, 4))
+        corte = timezone.now()
+        Estoque.objects.update(criado_em=corte - timedelta(days=10))
+        arquivar(corte)
+        movimentar(self.usuario, 's', (self.caneta, 3))
+
+    def exportar(self, **parametros):
+        return self.client.get(
+            reverse('estoque:api_exportar_razao'), parametros,
+            HTTP_AUTHORIZATION=f'Token {self.token.chave}',
+        )
+
+    def test_csv_com_arquivados(self):
+        resposta = self.exportar()
+        self.assertTrue(resposta.streaming)
+        linhas = list(csv.DictReader(
+            b''.join(resposta.streaming_content).decode().splitlines()
+        ))
+        self.assertEqual(
+            [(linha['produto'], linha['movimento'], linha['quantidade'])
+             for linha in linhas],
+            [('Caneta', 'e', '10'), ('Lápis', 'e', '4'),
+             ('Caneta', 's', '3')],
+        )
+        self.assertEqual(linhas[-1]['funcionario'], 'exportacao')
+
+    def test_ndjson_gzip_com_filtros(self):
+        resposta = self.exportar(
+            formato='ndjson', gzip='1', movimento='e',
+            produto=self.caneta.pk,
+        )
+        self.assertEqual(resposta['Content-Type'], 'application/gzip')
+        conteudo = gzip.decompress(b''.join(resposta.streaming_content))
+        linhas = [json.loads(linha) for linha in conteudo.splitlines()]
+        self.assertEqual(
+            [(linha['produto_id'], linha['quantidade']) for linha in linhas],
+            [(self.caneta.pk, 10)],
+        )
+
+    def test_periodo(self):
+        hoje = timezone.localdate().isoformat()
+        conteudo = b''.join(
+            self.exportar(de=hoje, ate=hoje).streaming_content
+        )
+        self.assertEqual(len(conteudo.decode().splitlines()), 2)
+        self.assertEqual(self.exportar(de='2026-13-01').status_code, 400)
+        self.assertEqual(self.exportar(produto='x').status_code, 400)
+        self.assertEqual(self.exportar(movimento='x').status_code, 400)
+        self.assertEqual(self.exportar(formato='xml').status_code, 400)
+
+    def test_cabecalho_antes_da_consulta(self):
+        partes = exportar_razao('csv', tamanho_lote=1)
+        with self.assertNumQueries(0):
+            self.assertTrue(next(partes).startswith(b'movimento_id,'))
+        self.assertEqual(len(list(partes)), 1)
+        with self.assertRaises(ValueError):
+            exportar_razao('xml')
+
+    def test_comando(self):
+        with tempfile.TemporaryDirectory() as pasta:
+            saida = os.path.join(pasta, 'razao.ndjson')
+            call_command(
+                'exportar_razao', formato='ndjson', movimento='s',
+                saida=saida,
+            )
+            with open(saida, encoding='utf-8') as arquivo:
+                linhas = arquivo.read().splitlines()
+        self.assertEqual(json.loads(linhas[0])['quantidade'], 3)
+
+
+class RazaoColunarTest(TestCase):
+    """
+    O razão colunar lê os itens até o horizonte, sem pular transações
+    confirmadas depois de uma atualização, e agrupa os dias com o
+    deslocamento de cada instante.
+    """
+
+    def setUp(self):
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        self.diretorio = pasta.name
+        self.usuario = User.objects.create_user('colunas')
+        self.produto = Produto.objects.create(
+            produto='Caneta', ncm='1', preco=1, estoque=0
+        )
+        self.agora = timezone.now()
+        patcher = mock.patch(
+            'estoque.actions.colunas.horizonte', return_value=self.agora
+        )
+        self.horizonte = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def movimento(self, quantidade, criado_em, movimento='e'):
+        item, = movimentar(
+            self.usuario, movimento, (self.produto, quantidade)
+        )
+        Estoque.objects.filter(pk=item.estoque_id).update(
+            criado_em=criado_em
+        )
+        return item.pk
+
+    def test_transacao_confirmada_depois(self):
+        # O primeiro item é de uma transação ainda aberta na primeira
+        # atualização, com pk menor que a do segundo
+        aberta = self.movimento(5, self.agora + timedelta(seconds=1))
+        lida = self.movimento(3, self.agora - timedelta(minutes=1), 's')
+
+        self.assertEqual(atualizar(self.diretorio), 1)
+        self.assertEqual(list(RazaoColunar(self.diretorio).item), [lida])
+
+        self.horizonte.return_value = self.agora + timedelta(minutes=1)
+        self.assertEqual(atualizar(self.diretorio), 1)
+        self.assertEqual(atualizar(self.diretorio), 0)
+        razao = RazaoColunar(self.diretorio)
+        self.assertEqual(list(razao.item), [lida, aberta])
+        self.assertEqual(list(razao.quantidade), [-3, 5])
+
+    def test_arquivados(self):
+        antigo = self.movimento(5, self.agora - timedelta(days=10))
+        self.assertEqual(atualizar(self.diretorio), 1)
+        novo = self.movimento(2, self.agora - timedelta(days=9))
+        arquivar(self.agora - timedelta(days=1))
+
+        self.assertEqual(atualizar(self.diretorio), 1)
+        self.assertEqual(
+            list(RazaoColunar(self.diretorio).item), [antigo, novo]
+        )
+
+    def test_estado_anterior_grava_de_novo(self):
+        self.movimento(5, self.agora - timedelta(minutes=1))
+        atualizar(self.diretorio)
+        with open(os.path.join(self.diretorio, 'estado.json'), 'w') as f:
+            json.dump({'linhas': 1, 'ultimo_item': 1}, f)
+
+        self.assertEqual(atualizar(self.diretorio), 1)
+        self.assertEqual(RazaoColunar(self.diretorio).linhas, 1)
+
+    def test_valores_alem_de_32_bits(self):
+        item = self.movimento(5, self.agora - timedelta(minutes=1))
+        EstoqueItens.objects.filter(pk=item).update(quantidade=2 ** 31)
+
+        self.assertEqual(atualizar(self.diretorio), 1)
+        razao = RazaoColunar(self.diretorio)
+        self.assertEqual(list(razao.quantidade), [2 ** 31])
+        self.assertEqual(list(razao.agrupar()['entradas']), [2 ** 31])
+
+    def test_formato_anterior_grava_de_novo(self):
+        self.movimento(5, self.agora - timedelta(minutes=1))
+        atualizar(self.diretorio)
+        with open(os.path.join(self.diretorio, 'estado.json'), 'w') as f:
+            json.dump({'linhas': 1, 'ultimo': [0, 1]}, f)
+
+        self.assertEqual(atualizar(self.diretorio), 1)
+        self.assertEqual(list(RazaoColunar(self.diretorio).quantidade), [5])
+
+    def test_dias_com_horario_de_verao(self):
+        def utc(*data):
+            return datetime(*data, tzinfo=dt_timezone.utc)
+
+        def microssegundos(data):
+            return (data - EPOCA) // MICROSSEGUNDO
+
+        self.movimento(1, utc(2026, 1, 15, 4, 30))
+        self.movimento(2, utc(2026, 7, 1, 4, 30))
+        atualizar(self.diretorio)
+
+        with timezone.override('America/New_York'):
+            dias = RazaoColunar(self.diretorio).agrupar('dia')
+            instantes, _ = _deslocamentos(
+                microssegundos(utc(2026, 3, 7)),
+                microssegundos(utc(2026, 3, 9)),
+            )
+        self.assertEqual(
+            [str(dia) for dia in dias['chave']],
+            ['2026-01-14', '2026-07-01'],
+        )
+        self.assertEqual(list(dias['entradas']), [1, 2])
+        self.assertEqual(
+            list(instantes)[1:], [microssegundos(utc(2026, 3, 8, 7))]
+        )
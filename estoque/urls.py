@@ -42,4 +42,44 @@ urlpatterns = [
     ),
     path('entrada/', include(entrada_patterns)),
     path('saida/', include(saida_patterns)),
+
+    # URL para a view que lista o estoque dos produtos em uma data.
+    path('posicao/', views.EstoqueNaData.as_view(), name='estoque_na_data'),
+
+    # URL para registrar várias movimentações via JSON.
+    path('api/movimentos/', views.api_movimentos, name='api_movimentos'),
+
+    # URL para consultar as entradas e saídas por dia, semana ou mês.
+    path(
+        'api/movimentos/periodo/',
+        views.api_movimentos_por_periodo,
+        name='api_movimentos_por_periodo'
+    ),
+
+    # URL para exportar os itens do razão em CSV ou NDJSON.
+    path(
+        'api/razao/',
+        views.api_exportar_razao,
+        name='api_exportar_razao'
+    ),
+
+    # URL para consultar o estoque de produtos em um momento passado.
+    path(
+        'api/posicao/',
+        views.api_estoque_na_data,
+        name='api_estoque_na_data'
+    ),
+
+    # URLs para criar, confirmar e liberar reservas de estoque.
+    path('api/reservas/', views.api_reservas, name='api_reservas'),
+    path(
+        'api/reservas/<int:pk>/confirmar/',
+        views.api_confirmar_reserva,
+        name='api_confirmar_reserva'
+    ),
+    path(
+        'api/reservas/<int:pk>/liberar/',
+        views.api_liberar_reserva,
+        name='api_liberar_reserva'
+    ),
 ]
\ No newline at end of file
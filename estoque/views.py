@@ -1,18 +1,83 @@
+import json
+import uuid
+
 from django.contrib.auth.decorators import login_required
 
+from django.db import IntegrityError, transaction
+
+from django.db.models import Count, Sum
+
 from django.shortcuts import render, resolve_url
 
 from django.forms import inlineformset_factory
 
-from django.http import HttpResponseRedirect
+from django.http import (
+    Http404,
+    HttpResponseRedirect,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 
-from django.views.generic import ListView, DetailView
+from django.views.decorators.csrf import csrf_exempt
+
+from django.views.decorators.http import require_GET, require_POST
+
+from django.utils import timezone
+
+from django.utils.dateparse import parse_date, parse_datetime
+
+from produto.actions.fragmentos import preencher_estoques
 
 from produto.models import Produto
 
-from .models import EstoqueEntrada, EstoqueSaida, EstoqueItens, Estoque
+from django.views.generic import ListView, DetailView
+
+from core.decorators import token_required
+
+from core.paginacao import PaginacaoPorCursor
+
+from .models import (
+    Estoque,
+    EstoqueArquivo,
+    EstoqueEntrada,
+    EstoqueItens,
+    EstoqueSaida,
+)
+
+from .forms import (
+    EstoqueForm,
+    EstoqueItensEntradaForm,
+    EstoqueItensFormSet,
+    EstoqueItensSaidaForm,
+)
+
+from .actions.baixa_estoque import EstoqueInsuficiente, registrar_itens
 
-from .forms import EstoqueForm, EstoqueItensEntradaForm, EstoqueItensSaidaForm
+from .actions.movimentos_lote import MAX_DOCUMENTOS, registrar_movimentos
+
+from .actions.movimentos_diarios import totais
+
+from .actions.group_commit import executar_gravacao
+
+from .actions.arquivamento import corte_atual
+
+from .actions.exportacao import FORMATOS, exportar_razao
+
+from .actions.posicoes import estoques_em, fechamento, inicio_do_dia
+
+from .actions.reservas import (
+    ReservaInvalida,
+    confirmar_reserva,
+    criar_reserva,
+    liberar_reserva,
+    validar_reserva,
+)
+
+from .actions.idempotencia import (
+    buscar_movimento,
+    obter_chave,
+    registrar_chaves,
+)
 
 # Create your views here.
 
@@ -45,13 +110,25 @@ def add_estoque(request, form_inline, template_name, movimento, url):
         Estoque,
         EstoqueItens,
         form = form_inline,
+        # Valida todas as linhas com uma única consulta de produtos
+        formset = EstoqueItensFormSet,
         extra = 0,
         can_delete=False,
         min_num = 1,
         validate_min = True,
     )
 
+    # Chave de idempotência enviada pelo cliente, se houver
+    chave = obter_chave(request)
+
     if request.method == 'POST':
+        # Um reenvio com a mesma chave devolve a movimentação original,
+        # sem validar os formulários nem alterar o estoque novamente
+        if chave:
+            pk = buscar_movimento(request.user, movimento, chave)
+            if pk:
+                return {'pk': pk}
+
         # Se a requisição for POST, cria os formulários 
         # com os dados enviados
         form = EstoqueForm(
@@ -67,20 +144,33 @@ def add_estoque(request, form_inline, template_name, movimento, url):
 
         # Verifica se os formulários são válidos
         if form.is_valid() and formset.is_valid():
-            # Salva os formulário
-            form = form.save(commit=False)
+            # Prepara os formulário sem gravar no banco
+            estoque = form.save(commit=False)
             # Captura o nome do funcionário
-            form.funcionario = request.user
+            estoque.funcionario = request.user
             # Define o tipo de movimento de estoque (entrada ou saída)
-            form.movimento = movimento
-            form.save()
-            # Salva o formset de itens de estoque
-            formset.save()
-
-            # Chama a função para atualizar o estoque dos 
-            # produtos com base nos dados do formulário
-            baixa_no_estoque(form)
-            return {'pk': form.pk}
+            estoque.movimento = movimento
+            itens = formset.save(commit=False)
+
+            try:
+                # Grava cabeçalho, itens e estoque em uma transação,
+                # ou no lote do group commit quando habilitado
+                pk = executar_gravacao(
+                    gravar_movimento, estoque, itens, chave
+                )
+                return {'pk': pk}
+            except EstoqueInsuficiente as erro:
+                # Outro movimento consumiu o saldo nesse meio tempo
+                form.add_error(None, str(erro))
+            except IntegrityError:
+                # Um envio simultâneo com a mesma chave gravou primeiro
+                pk = (
+                    buscar_movimento(request.user, movimento, chave)
+                    if chave else None
+                )
+                if not pk:
+                    raise
+                return {'pk': pk}
     else:
         # Se a requisição não for POST, cria formulários vazios
         form = EstoqueForm(instance=estoque_form, prefix='main')
@@ -88,8 +178,13 @@ def add_estoque(request, form_inline, template_name, movimento, url):
             instance=estoque_form, 
             prefix='estoque'
         )
-    # Cria o contexto a ser passado para o template
-    contexto = {'form': form, 'formset': formset}
+    # Cria o contexto a ser passado para o template, com a chave
+    # que o formulário reenvia caso o usuário submeta de novo
+    contexto = {
+        'form': form,
+        'formset': formset,
+        'idempotency_key': chave or uuid.uuid4().hex,
+    }
     return contexto
 
 def lista_estoque_entrada(request):
@@ -197,35 +292,59 @@ def add_estoque_entrada(request):
     return render(request, template_name=nome_template, context=contexto)
 
 
-def baixa_no_estoque(form):
+def gravar_movimento(estoque, itens, chave=None):
     """
-    Atualiza o estoque dos produtos com base nas entradas 
-    fornecidas no form.
-
-    Esta função percorre todos os itens do estoque presentes
-    no formulário, atualiza a quantidade em estoque de cada 
-    produto correspondente e salva as alterações no banco de dados.
+    Grava o cabeçalho e os itens de uma movimentação e atualiza o
+    estoque dos produtos.
 
     Args:
-        form: formulário de entrada de estoque
-        contendo os itens de estoque.
+        estoque (Estoque): Registro de Estoque ainda não salvo.
+        itens (list): Itens de estoque ainda não salvos, associados
+        ao registro de Estoque.
+        chave (str): Chave de idempotência a ser gravada junto com a
+        movimentação. Opcional.
+
+    Returns:
+        int: A pk do registro de Estoque criado.
+
+    Raises:
+        EstoqueInsuficiente: Se alguma saída deixaria o estoque
+        negativo.
+        IntegrityError: Se a chave já foi gravada por outro envio.
     """
+    with transaction.atomic():
+        estoque.save()
+        # Grava a chave antes do estoque, para que um envio repetido
+        # falhe no índice único sem alterar nenhum produto
+        if chave:
+            registrar_chaves([(chave, estoque)])
+        baixa_no_estoque(itens)
+    return estoque.pk
 
-    # Obtém todos os itens de estoque associados ao formulário
-    produtos = form.estoques.all()
 
-    # Itera sobre cada item do estoque
-    for item in produtos:
+def baixa_no_estoque(itens):
+    """
+    Atualiza o estoque dos produtos e salva os itens da movimentação.
 
-        # Obtém o produto correspondente usando a chave primária
-        produto = Produto.objects.get(pk=item.produto.pk)
+    O estoque é alterado no servidor por UPDATEs condicionais em lote
+    (`estoque = estoque ± quantidade`), sem ler cada produto. O saldo
+    de cada item é preenchido com o estoque retornado pelo banco, e
+    não com o valor calculado no navegador. Os itens são gravados com
+    um único `bulk_create`.
 
-        # Atualiza a quantidade em estoque do produto
-        produto.estoque = item.saldo
+    Deve ser chamada dentro de uma transação.
 
-        # Salva no Banco de dados
-        produto.save()
-    print('Estoque atualizado')
+    Args:
+        itens (list): Itens de estoque ainda não salvos, já associados
+        ao registro de Estoque.
+
+    Raises:
+        EstoqueInsuficiente: Se alguma saída deixaria o estoque
+        negativo.
+    """
+    # Aplica a variação de estoque, preenche o saldo de cada item e
+    # salva todos os itens de uma vez no banco de dados
+    registrar_itens(itens)
 
 
 def lista_estoque_saida(request):
@@ -334,7 +453,128 @@ def add_estoque_saida(request):
     return render(request, template_name=nome_template, context=contexto)
 
 
-class ListaEstoqueEntrada(ListView):
+def _periodo(request):
+    """
+    Lê o período de uma listagem de movimentos.
+
+    Aceita `de` e `ate` (AAAA-MM-DD), ambos opcionais e inclusivos.
+    Datas inválidas são ignoradas.
+
+    Args:
+        request (HttpRequest): O objeto de solicitação HTTP.
+
+    Returns:
+        tuple: O início e o fim do período, com fuso horário, ou None
+        para o lado sem limite.
+    """
+    limites = []
+    for nome, converter in (('de', inicio_do_dia), ('ate', fechamento)):
+        try:
+            dia = parse_date(request.GET.get(nome, ''))
+        except ValueError:
+            dia = None
+        limites.append(converter(dia) if dia else None)
+    return tuple(limites)
+
+
+class MovimentosPorPeriodo(PaginacaoPorCursor):
+    """
+    Mixin das listagens de movimentos, que filtra pelo período
+    informado em `de` e `ate` e busca no arquivo quando o período
+    começa antes do corte do arquivamento.
+
+    Sem período, só os movimentos não arquivados são listados, então
+    a listagem do dia a dia consulta apenas a tabela atual. A
+    listagem é paginada por cursor, do movimento mais recente para o
+    mais antigo.
+
+    Atributos:
+        movimento (str): Tipo dos movimentos listados
+        ('e' para entrada, 's' para saída).
+    """
+    movimento = None
+    campo_cursor = '-criado_em'
+
+    @staticmethod
+    def _colunas(consulta):
+        """
+        Lê só as colunas exibidas na listagem, com o funcionário no
+        mesmo JOIN, em vez de uma consulta por linha.
+        """
+        return consulta.select_related('funcionario').only(
+            'id', 'criado_em', 'nf', 'movimento', 'funcionario__username'
+        )
+
+    def get_corte(self):
+        """
+        Retorna o instante até o qual os movimentos foram arquivados,
+        ou None se nada foi arquivado.
+        """
+        return corte_atual()
+
+    def get_consultas(self, queryset=None):
+        """
+        Retorna os movimentos do período em cada tabela que os contém:
+        a atual, o arquivo ou as duas.
+
+        Returns:
+            list: Um QuerySet por tabela.
+        """
+        if hasattr(self, '_consultas'):
+            return self._consultas
+        inicio, fim = _periodo(self.request)
+        filtros = {'movimento': self.movimento}
+        if inicio:
+            filtros['criado_em__gte'] = inicio
+        if fim:
+            filtros['criado_em__lt'] = fim
+        atuais = self._colunas(Estoque.objects.filter(**filtros))
+
+        corte = self.get_corte()
+        if inicio is None or corte is None or inicio >= corte:
+            self._consultas = [atuais]
+        else:
+            arquivados = self._colunas(
+                EstoqueArquivo.objects.filter(**filtros)
+            )
+            if fim is not None and fim <= corte:
+                self._consultas = [arquivados]
+            else:
+                self._consultas = [atuais, arquivados]
+        return self._consultas
+
+    def get_queryset(self):
+        """
+        Retorna os movimentos do período, da tabela atual, do arquivo
+        ou da união das duas.
+
+        Returns:
+            QuerySet: Os movimentos, do mais recente ao mais antigo.
+        """
+        consultas = self.get_consultas()
+        if len(consultas) == 1:
+            return consultas[0]
+        # As duas tabelas têm as mesmas colunas, na mesma ordem
+        return (
+            consultas[0].order_by().union(
+                consultas[1].order_by(), all=True
+            ).order_by('-criado_em')
+        )
+
+    def get_context_data(self, **kwargs):
+        """
+        Adiciona ao contexto o período filtrado.
+
+        Returns:
+            dict: Contexto com `de` e `ate`.
+        """
+        context = super().get_context_data(**kwargs)
+        context['de'] = self.request.GET.get('de', '')
+        context['ate'] = self.request.GET.get('ate', '')
+        return context
+
+
+class ListaEstoqueEntrada(MovimentosPorPeriodo, ListView):
     """
     Classe-based view para listar as entradas de estoque.
 
@@ -344,6 +584,7 @@ class ListaEstoqueEntrada(ListView):
         paginate_by (int): Quantidade de itens por página na paginação.
     """
     model = EstoqueEntrada
+    movimento = 'e'
     template_name = 'lista_estoque.html'
     context_object_name = 'object_list'
     # A cada 10 itens terá uma nova página para listagem dos itens
@@ -363,12 +604,13 @@ class ListaEstoqueEntrada(ListView):
         return context
     
 
-class ListaEstoqueSaida(ListView):
+class ListaEstoqueSaida(MovimentosPorPeriodo, ListView):
     """
     Classe-based view para listar as saídas de estoque.
     """
     # Define o modelo a ser usado para listar os objetos
     model = EstoqueSaida
+    movimento = 's'
 
     # Define o template a ser renderizado
     template_name = 'lista_estoque.html'  
@@ -397,12 +639,481 @@ class DetalheEstoque(DetailView):
     Classe-based view para exibir os detalhes de uma entrada ou 
     saída no estoque.
 
+    Os itens são paginados pelo cursor `depois`, a pk do último item
+    da página anterior, e os totais do movimento vêm de uma agregação,
+    então movimentos com muitos itens não são lidos inteiros.
+
     Atributos:
         model (class): O modelo que será utilizado pela view. 
         Neste caso, é o modelo `Estoque`.
         template_name (str): O nome do template que será utilizado 
         para renderizar a página de detalhes.
+        itens_por_pagina (int): Quantidade de itens por página.
     """
     model = Estoque
     template_name = 'detalhes_estoque.html'
+    itens_por_pagina = 50
+
+    def get_object(self, queryset=None):
+        """
+        Busca o movimento na tabela atual e, se ele já tiver sido
+        arquivado, no arquivo, que mantém a mesma pk.
+
+        Returns:
+            Estoque | EstoqueArquivo: O movimento.
+
+        Raises:
+            Http404: Se o movimento não existir em nenhuma das tabelas.
+        """
+        try:
+            return super().get_object(
+                Estoque.objects.select_related('funcionario')
+            )
+        except Http404:
+            return super().get_object(
+                EstoqueArquivo.objects.select_related('funcionario')
+            )
+
+    def consulta_itens(self, depois=None):
+        """
+        Monta, sem executar, a consulta de uma página dos itens do
+        movimento, com um item além da página para saber se há outra.
+
+        Args:
+            depois (int): A pk do último item da página anterior, ou
+            None na primeira página.
+
+        Returns:
+            QuerySet: Os itens da página, com o nome do produto.
+        """
+        pagina = self.object.estoques.select_related('produto').only(
+            'id', 'estoque', 'quantidade', 'saldo', 'produto__produto'
+        ).order_by('pk')
+        if depois is not None:
+            pagina = pagina.filter(pk__gt=depois)
+        return pagina[:self.itens_por_pagina + 1]
+
+    def get_context_data(self, **kwargs):
+        """
+        Adiciona ao contexto uma página dos itens do movimento e os
+        totais de todos os itens.
+
+        Returns:
+            dict: Contexto com `itens`, `totais`, `proximo` e
+            `primeira_pagina`.
+        """
+        context = super().get_context_data(**kwargs)
+        itens = self.object.estoques.all()
+        try:
+            depois = int(self.request.GET.get('depois', ''))
+        except ValueError:
+            depois = None
+
+        pagina = list(self.consulta_itens(depois))
+        proximo = None
+        if len(pagina) > self.itens_por_pagina:
+            pagina = pagina[:self.itens_por_pagina]
+            proximo = pagina[-1].pk
+
+        context['itens'] = pagina
+        context['totais'] = itens.aggregate(
+            linhas=Count('pk'), quantidade=Sum('quantidade', default=0)
+        )
+        context['proximo'] = proximo
+        context['primeira_pagina'] = depois is None
+        return context
+
+
+@csrf_exempt
+@require_POST
+@token_required
+def api_movimentos(request):
+    """
+    Endpoint JSON para registrar várias entradas e saídas de uma vez.
+
+    Autenticado pelo cabeçalho `Authorization: Token <chave>`. O corpo
+    deve ter o formato `{"movimentos": [{"movimento": "e", "nf": 1,
+    "itens": [{"produto": 1, "quantidade": 2}]}, ...]}`. Todos os
+    documentos são gravados em uma única transação, com `bulk_create`
+    e atualização de estoque em lote.
+
+    Args:
+        request (HttpRequest): O objeto de solicitação HTTP.
+
+    Returns:
+        JsonResponse: Um resultado por documento, na mesma ordem, com
+        a pk criada ou os erros encontrados.
+    """
+    try:
+        dados = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'erro': 'JSON inválido.'}, status=400)
+
+    documentos = dados.get('movimentos') if isinstance(dados, dict) else None
+    if not isinstance(documentos, list):
+        return JsonResponse(
+            {'erro': 'Informe a lista "movimentos".'}, status=400
+        )
+    if len(documentos) > MAX_DOCUMENTOS:
+        mensagem = f'Máximo de {MAX_DOCUMENTOS} movimentos por requisição.'
+        return JsonResponse({'erro': mensagem}, status=413)
+
+    try:
+        resultados = executar_gravacao(
+            registrar_movimentos, documentos, request.user
+        )
+    except EstoqueInsuficiente as erro:
+        # Concorrência persistente no mesmo produto; o cliente reenvia
+        return JsonResponse({'erro': str(erro)}, status=409)
+
+    return JsonResponse({'resultados': resultados})
+
+
+
+def _ler_json(request):
+    """
+    Lê o corpo JSON da requisição.
+
+    Args:
+        request (HttpRequest): O objeto de solicitação HTTP.
+
+    Returns:
+        O conteúdo decodificado, ou None se o corpo não for JSON
+        válido. Um corpo vazio é lido como um objeto vazio.
+    """
+    if not request.body:
+        return {}
+    try:
+        return json.loads(request.body)
+    except ValueError:
+        return None
+
+
+@csrf_exempt
+@require_POST
+@token_required
+def api_reservas(request):
+    """
+    Endpoint JSON para reservar estoque de um produto.
+
+    Autenticado pelo cabeçalho `Authorization: Token <chave>`. O corpo
+    deve ter o formato `{"produto": 1, "quantidade": 2, "minutos": 30}`,
+    com `minutos` opcional.
+
+    Args:
+        request (HttpRequest): O objeto de solicitação HTTP.
+
+    Returns:
+        JsonResponse: A pk e a expiração da reserva criada (201), ou
+        o erro encontrado.
+    """
+    dados, erros = validar_reserva(_ler_json(request))
+    if erros:
+        return JsonResponse({'erros': erros}, status=400)
+
+    try:
+        reserva = executar_gravacao(
+            criar_reserva,
+            dados['produto'],
+            dados['quantidade'],
+            request.user,
+            dados['minutos'],
+        )
+    except Produto.DoesNotExist:
+        return JsonResponse({'erro': 'Produto não encontrado.'}, status=404)
+    except EstoqueInsuficiente as erro:
+        return JsonResponse({'erro': str(erro)}, status=409)
+
+    return JsonResponse(
+        {'pk': reserva.pk, 'expira_em': reserva.expira_em.isoformat()},
+        status=201
+    )
+
+
+@csrf_exempt
+@require_POST
+@token_required
+def api_confirmar_reserva(request, pk):
+    """
+    Endpoint JSON que confirma uma reserva, criando a saída de estoque.
 
+    O corpo é opcional e pode informar a nota fiscal, no formato
+    `{"nf": 123}`.
+
+    Args:
+        request (HttpRequest): O objeto de solicitação HTTP.
+        pk (int): A chave primária da reserva.
+
+    Returns:
+        JsonResponse: A pk da saída criada, ou o erro encontrado.
+    """
+    dados = _ler_json(request)
+    if not isinstance(dados, dict):
+        return JsonResponse({'erro': 'JSON inválido.'}, status=400)
+    nf = dados.get('nf')
+    if nf is not None and (
+            not isinstance(nf, int) or isinstance(nf, bool) or nf <= 0):
+        return JsonResponse(
+            {'erro': 'nf deve ser um inteiro positivo.'}, status=400
+        )
+
+    try:
+        estoque = executar_gravacao(
+            confirmar_reserva, pk, request.user, nf
+        )
+    except (ReservaInvalida, EstoqueInsuficiente) as erro:
+        return JsonResponse({'erro': str(erro)}, status=409)
+
+    return JsonResponse({'pk': pk, 'estoque': estoque})
+
+
+@csrf_exempt
+@require_POST
+@token_required
+def api_liberar_reserva(request, pk):
+    """
+    Endpoint JSON que libera uma reserva ativa.
+
+    Args:
+        request (HttpRequest): O objeto de solicitação HTTP.
+        pk (int): A chave primária da reserva.
+
+    Returns:
+        JsonResponse: A pk da reserva liberada, ou o erro encontrado.
+    """
+    try:
+        executar_gravacao(liberar_reserva, pk)
+    except ReservaInvalida as erro:
+        return JsonResponse({'erro': str(erro)}, status=409)
+
+    return JsonResponse({'pk': pk})
+
+
+def _momento_consulta(request):
+    """
+    Lê o momento de uma consulta de estoque passado.
+
+    Aceita `momento` (data e hora ISO 8601) ou `data` (AAAA-MM-DD),
+    lida como o fechamento do dia. Momentos futuros são trocados pelo
+    momento atual.
+
+    Args:
+        request (HttpRequest): O objeto de solicitação HTTP.
+
+    Returns:
+        datetime: O momento com fuso horário, ou None se os parâmetros
+        forem inválidos. Sem parâmetros, retorna o momento atual.
+    """
+    agora = timezone.now()
+    if request.GET.get('momento'):
+        try:
+            momento = parse_datetime(request.GET['momento'])
+        except ValueError:
+            return None
+        if momento is not None and timezone.is_naive(momento):
+            momento = timezone.make_aware(momento)
+    elif request.GET.get('data'):
+        try:
+            dia = parse_date(request.GET['data'])
+        except ValueError:
+            return None
+        momento = fechamento(dia) if dia else None
+    else:
+        return agora
+    return min(momento, agora) if momento else None
+
+
+class EstoqueNaData(ListView):
+    """
+    Classe-based view que lista o estoque dos produtos no fechamento
+    de uma data passada.
+
+    Só os produtos da página são calculados, a partir das posições
+    de estoque gravadas periodicamente.
+
+    Atributos:
+        model (Model): O modelo que será utilizado na listagem.
+        template_name (str): O nome do template que será renderizado.
+        paginate_by (int): Quantidade de itens por página na paginação.
+    """
+    model = Produto
+    queryset = Produto.ativos.all()
+    template_name = 'estoque_na_data.html'
+    paginate_by = 10
+
+    def get_context_data(self, **kwargs):
+        """
+        Adiciona ao contexto a data consultada e o estoque de cada
+        produto da página.
+
+        Returns:
+            dict: Contexto com `data`, `momento` e `linhas`, uma tupla
+            (produto, estoque na data) por produto da página.
+        """
+        context = super().get_context_data(**kwargs)
+        momento = _momento_consulta(self.request) or timezone.now()
+        produtos = preencher_estoques(context['object_list'])
+        estoques = estoques_em([produto.pk for produto in produtos], momento)
+        context['data'] = timezone.localdate(momento)
+        context['momento'] = momento
+        context['linhas'] = [
+            (produto, estoques.get(produto.pk)) for produto in produtos
+        ]
+        return context
+
+
+@require_GET
+@token_required
+def api_estoque_na_data(request):
+    """
+    Endpoint JSON que informa o estoque de produtos em um momento
+    passado.
+
+    Autenticado pelo cabeçalho `Authorization: Token <chave>`. Recebe
+    um ou mais parâmetros `produto` e `data` (AAAA-MM-DD, o fechamento
+    do dia) ou `momento` (data e hora ISO 8601), por exemplo
+    `?produto=1&produto=2&data=2026-03-31`.
+
+    Args:
+        request (HttpRequest): O objeto de solicitação HTTP.
+
+    Returns:
+        JsonResponse: O momento consultado e o estoque de cada produto
+        encontrado, ou o erro encontrado.
+    """
+    momento = _momento_consulta(request)
+    if momento is None:
+        return JsonResponse({'erro': 'Data ou momento inválido.'}, status=400)
+
+    try:
+        pks = [int(pk) for pk in request.GET.getlist('produto')]
+    except ValueError:
+        pks = []
+    if not pks:
+        return JsonResponse(
+            {'erro': 'Informe um ou mais produtos.'}, status=400
+        )
+    if len(pks) > MAX_DOCUMENTOS:
+        mensagem = f'Máximo de {MAX_DOCUMENTOS} produtos por requisição.'
+        return JsonResponse({'erro': mensagem}, status=413)
+
+    estoques = estoques_em(pks, momento)
+    return JsonResponse({
+        'momento': momento.isoformat(),
+        'estoques': [
+            {'produto': pk, 'estoque': estoques[pk]}
+            for pk in dict.fromkeys(pks) if pk in estoques
+        ],
+    })
+
+
+@require_GET
+@token_required
+def api_movimentos_por_periodo(request):
+    """
+    Endpoint JSON que informa as entradas e saídas por dia, semana ou
+    mês, lidas dos totais diários de movimentação.
+
+    Autenticado pelo cabeçalho `Authorization: Token <chave>`. Recebe
+    `periodo` ('dia', 'semana' ou 'mes'), `por` ('produto',
+    'categoria' ou 'funcionario'), `de` e `ate` (AAAA-MM-DD) e um ou
+    mais `id` para limitar os produtos, categorias ou funcionários,
+    por exemplo `?periodo=mes&por=categoria&de=2026-01-01`.
+
+    Args:
+        request (HttpRequest): O objeto de solicitação HTTP.
+
+    Returns:
+        JsonResponse: Os totais de cada período e chave, ou o erro
+        encontrado.
+    """
+    try:
+        inicio = parse_date(request.GET.get('de', ''))
+        fim = parse_date(request.GET.get('ate', ''))
+        filtro = [int(pk) for pk in request.GET.getlist('id')] or None
+    except ValueError:
+        return JsonResponse({'erro': 'Parâmetros inválidos.'}, status=400)
+    if filtro and len(filtro) > MAX_DOCUMENTOS:
+        mensagem = f'Máximo de {MAX_DOCUMENTOS} ids por requisição.'
+        return JsonResponse({'erro': mensagem}, status=413)
+
+    try:
+        linhas = totais(
+            request.GET.get('periodo', 'dia'),
+            request.GET.get('por', 'produto'),
+            inicio, fim, filtro
+        )
+    except ValueError as erro:
+        return JsonResponse({'erro': str(erro)}, status=400)
+    return JsonResponse({
+        'totais': [
+            {**linha, 'periodo': linha['periodo'].isoformat()}
+            for linha in linhas
+        ],
+    })
+
+
+@require_GET
+@token_required
+def api_exportar_razao(request):
+    """
+    Exporta os itens do razão, com o movimento, o produto e o
+    funcionário de cada um, em CSV ou NDJSON.
+
+    Autenticado pelo cabeçalho `Authorization: Token <chave>`. Recebe
+    `de` e `ate` (AAAA-MM-DD, inclusivos), um ou mais `produto`,
+    `movimento` ('e' ou 's'), `formato` ('csv' ou 'ndjson') e
+    `gzip=1` para comprimir o arquivo. A resposta é enviada em
+    partes, à medida que as linhas são lidas do banco.
+
+    Args:
+        request (HttpRequest): O objeto de solicitação HTTP.
+
+    Returns:
+        StreamingHttpResponse: O arquivo exportado, ou JsonResponse
+        com o erro encontrado.
+    """
+    try:
+        inicio = parse_date(request.GET.get('de', ''))
+        fim = parse_date(request.GET.get('ate', ''))
+        produtos = [int(pk) for pk in request.GET.getlist('produto')]
+    except ValueError:
+        inicio = fim = produtos = None
+    # Uma data inválida exportaria o razão inteiro, então é recusada
+    if produtos is None or (
+        (request.GET.get('de') and inicio is None)
+        or (request.GET.get('ate') and fim is None)
+    ):
+        return JsonResponse({'erro': 'Parâmetros inválidos.'}, status=400)
+    movimento = request.GET.get('movimento') or None
+    if movimento not in (None, 'e', 's'):
+        return JsonResponse(
+            {'erro': "Movimento deve ser 'e' ou 's'."}, status=400
+        )
+    formato = request.GET.get('formato', 'csv')
+    gzip = request.GET.get('gzip') == '1'
+
+    try:
+        partes = exportar_razao(
+            formato,
+            gzip,
+            inicio=inicio_do_dia(inicio) if inicio else None,
+            fim=fechamento(fim) if fim else None,
+            produtos=produtos or None,
+            movimento=movimento,
+        )
+    except ValueError as erro:
+        return JsonResponse({'erro': str(erro)}, status=400)
+
+    nome = f'razao_{timezone.localdate():%Y-%m-%d}.{formato}'
+    resposta = StreamingHttpResponse(
+        partes,
+        content_type=(
+            'application/gzip' if gzip
+            else f'{FORMATOS[formato]}; charset=utf-8'
+        ),
+    )
+    if gzip:
+        nome += '.gz'
+    resposta['Content-Disposition'] = f'attachment; filename="{nome}"'
+    return resposta
@@ -0,0 +1,102 @@
+from django.db.models import F
+
+from ..models import AlertaAberto, AlertaEstoque, Produto
+
+
+def registrar_cruzamentos(linhas):
+    """
+    Registra os produtos cujo estoque cruzou o estoque mínimo.
+
+    Somente os produtos que mudaram de lado geram evento, então uma
+    movimentação sem cruzamento não faz nenhuma consulta. Os eventos
+    são gravados com um `bulk_create`, e o conjunto de alertas abertos
+    é atualizado com um INSERT e um DELETE.
+
+    Deve ser chamada na mesma transação que alterou o estoque.
+
+    Args:
+        linhas (iterable): Tuplas (pk, se estava abaixo do mínimo,
+        estoque atual, estoque mínimo atual) dos produtos alterados.
+    """
+    eventos = [
+        AlertaEstoque(
+            produto_id=pk,
+            tipo='a' if estoque < minimo else 'n',
+            estoque=estoque,
+            estoque_minimo=minimo,
+        )
+        for pk, estava_abaixo, estoque, minimo in linhas
+        if estava_abaixo != (estoque < minimo)
+    ]
+    if not eventos:
+        return
+
+    AlertaEstoque.objects.bulk_create(eventos)
+    abertos = [evento for evento in eventos if evento.tipo == 'a']
+    fechados = [evento.produto_id for evento in eventos if evento.tipo == 'n']
+    if fechados:
+        AlertaAberto.objects.filter(produto__in=fechados).delete()
+    if abertos:
+        AlertaAberto.objects.bulk_create(
+            [
+                AlertaAberto(produto_id=evento.produto_id, alerta=evento)
+                for evento in abertos
+            ],
+            ignore_conflicts=True
+        )
+
+
+def registrar_importados(produtos):
+    """
+    Abre o alerta dos produtos recém-importados abaixo do estoque
+    mínimo, como no cadastro pelo formulário.
+
+    O estoque e o mínimo são lidos do banco, com uma consulta, pois
+    nas importações os objetos ainda guardam os valores do arquivo,
+    como texto ou número decimal.
+
+    Deve ser chamada na mesma transação que criou os produtos.
+
+    Args:
+        produtos (list): Os produtos criados, já com a pk.
+    """
+    registrar_cruzamentos(
+        (pk, False, estoque, minimo)
+        for pk, estoque, minimo in Produto.objects.filter(
+            pk__in=[produto.pk for produto in produtos],
+            estoque__lt=F('estoque_minimo'),
+        ).values_list('pk', 'estoque', 'estoque_minimo')
+    )
+
+
+def recalcular():
+    """
+    Refaz o conjunto de alertas abertos comparando estoque e estoque
+    mínimo em todos os produtos.
+
+    Percorre o catálogo inteiro, por isso só deve ser usada para
+    preencher o conjunto pela primeira vez ou corrigi-lo. No dia a
+    dia ele é mantido por `registrar_cruzamentos`.
+
+    Returns:
+        int: Número de alertas abertos.
+    """
+    abaixo = list(
+        Produto.objects.filter(estoque__lt=F('estoque_minimo'))
+        .values_list('pk', 'estoque', 'estoque_minimo')
+    )
+    AlertaAberto.objects.exclude(
+        produto__estoque__lt=F('produto__estoque_minimo')
+    ).delete()
+    ja_abertos = set(AlertaAberto.objects.values_list('produto', flat=True))
+    eventos = AlertaEstoque.objects.bulk_create([
+        AlertaEstoque(
+            produto_id=pk, tipo='a', estoque=estoque, estoque_minimo=minimo
+        )
+        for pk, estoque, minimo in abaixo if pk not in ja_abertos
+    ])
+    AlertaAberto.objects.bulk_create([
+        AlertaAberto(produto_id=evento.produto_id, alerta=evento)
+        for evento in eventos
+    ])
+    return len(abaixo)
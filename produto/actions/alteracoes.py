@@ -0,0 +1,196 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from ..models import AlteracaoProduto
+
+
+# Quantidade padrão e máxima de alterações por página do feed.
+LIMITE_PADRAO = 500
+LIMITE_MAXIMO = 5000
+
+# Chave do bloqueio do PostgreSQL que impede duas publicações
+# simultâneas de darem posições intercaladas.
+BLOQUEIO_PUBLICACAO = 170170
+
+
+def registrar_movimentos(finais, deltas):
+    """
+    Registra o estoque final dos produtos movimentados.
+
+    Deve ser chamada na mesma transação que alterou o estoque.
+
+    Args:
+        finais (dict): Estoque final indexado pela pk do produto.
+        deltas (dict): Variação de estoque indexada pela pk do
+        produto. Produtos sem variação não são registrados.
+    """
+    AlteracaoProduto.objects.bulk_create([
+        AlteracaoProduto(
+            produto=pk, tipo='m', estoque=finais[pk], variacao=delta
+        )
+        for pk, delta in deltas.items() if delta and pk in finais
+    ])
+
+
+def registrar_cadastros(produtos):
+    """
+    Registra produtos recém-cadastrados, com o estoque inicial.
+
+    Deve ser chamada na mesma transação que gravou os produtos.
+
+    Args:
+        produtos (iterable): Produtos já salvos.
+    """
+    AlteracaoProduto.objects.bulk_create([
+        AlteracaoProduto(
+            produto=produto.pk,
+            tipo='c',
+            estoque=produto.estoque,
+            dados={'produto': produto.produto},
+        )
+        for produto in produtos
+    ])
+
+
+def registrar_edicao(pk, valores):
+    """
+    Registra os campos alterados na edição de um produto.
+
+    Deve ser chamada na mesma transação que gravou a edição.
+
+    Args:
+        pk (int): A pk do produto.
+        valores (dict): Novo valor de cada campo alterado, indexado
+        pelo nome da coluna.
+    """
+    AlteracaoProduto.objects.create(produto=pk, tipo='e', dados=valores)
+
+
+def registrar_edicoes(alteracoes):
+    """
+    Registra os campos alterados de vários produtos de uma vez, como
+    `registrar_edicao`.
+
+    Deve ser chamada na mesma transação que gravou as alterações.
+
+    Args:
+        alteracoes (dict): Novo valor de cada campo alterado, indexado
+        pela pk do produto e depois pelo nome da coluna.
+    """
+    AlteracaoProduto.objects.bulk_create([
+        AlteracaoProduto(produto=pk, tipo='e', dados=valores)
+        for pk, valores in alteracoes.items()
+    ])
+
+
+def publicar():
+    """
+    Dá uma posição no feed aos registros confirmados que ainda não
+    têm, sempre depois da maior posição já dada.
+
+    Um registro só é visível depois que a sua transação é confirmada,
+    então o de uma transação longa recebe uma posição posterior às já
+    lidas pelos consumidores, em vez de ficar atrás do cursor deles
+    como aconteceria com a pk. As posições são crescentes, com
+    lacunas, e são dadas por um único UPDATE.
+
+    Returns:
+        int: Número de registros publicados.
+    """
+    pendentes = AlteracaoProduto.objects.filter(sequencia__isnull=True)
+    menor = pendentes.order_by('pk').values('pk')[:1]
+    maior = AlteracaoProduto.objects.filter(
+        sequencia__isnull=False
+    ).order_by('-sequencia').values('sequencia')[:1]
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT pg_advisory_xact_lock(%s)', [BLOQUEIO_PUBLICACAO]
+                )
+        return pendentes.update(
+            sequencia=F('pk') - Subquery(menor)
+            + Coalesce(Subquery(maior), Value(0)) + 1
+        )
+
+
+def consulta_alteracoes(depois=0):
+    """
+    Monta, sem executar, a consulta de `ler_alteracoes`: as alterações
+    publicadas depois do cursor.
+
+    Args:
+        depois (int): O cursor recebido na leitura anterior.
+
+    Returns:
+        QuerySet: As alterações, em ordem de publicação.
+    """
+    return AlteracaoProduto.objects.filter(
+        sequencia__gt=depois
+    ).order_by('sequencia')
+
+
+def ler_alteracoes(depois=0, limite=LIMITE_PADRAO):
+    """
+    Lê as alterações posteriores a um cursor, em ordem de publicação.
+
+    Os registros confirmados desde a leitura anterior são publicados
+    antes, então nenhuma transação confirmada depois de uma leitura
+    fica atrás do cursor devolvido por ela. A leitura percorre o
+    índice da posição a partir do cursor, e o custo depende só da
+    quantidade de alterações novas.
+
+    Args:
+        depois (int): O cursor recebido na leitura anterior; 0 para
+        ler desde o registro mais antigo mantido.
+        limite (int): Quantidade máxima de alterações, até
+        `LIMITE_MAXIMO`.
+
+    Returns:
+        tuple: A lista de alterações, o cursor da próxima leitura e se
+        há mais alterações disponíveis.
+    """
+    limite = max(1, min(limite, LIMITE_MAXIMO))
+    publicar()
+    alteracoes = list(consulta_alteracoes(depois)[:limite + 1])
+    mais = len(alteracoes) > limite
+    alteracoes = alteracoes[:limite]
+    cursor = alteracoes[-1].sequencia if alteracoes else depois
+    return alteracoes, cursor, mais
+
+
+def podar(dias=None, tamanho_lote=1000):
+    """
+    Remove as alterações mais antigas que a retenção, em lotes, para
+    não manter uma transação longa sobre a tabela.
+
+    Consumidores que ficarem parados por mais tempo que a retenção
+    perdem alterações e devem refazer a carga completa.
+
+    Args:
+        dias (int): Dias de retenção. Quando None, usa
+        `PRODUTO_ALTERACOES_RETENCAO_DIAS`.
+        tamanho_lote (int): Quantidade de alterações por DELETE.
+
+    Returns:
+        int: Total de alterações removidas.
+    """
+    if dias is None:
+        dias = settings.PRODUTO_ALTERACOES_RETENCAO_DIAS
+    limite = timezone.now() - timedelta(days=dias)
+    total = 0
+    while True:
+        pks = list(
+            AlteracaoProduto.objects.filter(criado_em__lt=limite)
+            .order_by('pk')
+            .values_list('pk', flat=True)[:tamanho_lote]
+        )
+        if not pks:
+            return total
+        AlteracaoProduto.objects.filter(pk__in=pks).delete()
+        total += len(pks)
@@ -0,0 +1,314 @@
+from bisect import bisect_left, bisect_right
+from itertools import islice
+import threading
+import time
+
+from django.conf import settings
+
+from core.horizonte import horizonte
+from core.paginacao import gerar_cursor
+
+from ..models import Produto
+from .busca import termos
+from .fragmentos import preencher_estoques
+
+
+# Quantidade padrão e máxima de produtos por página das sugestões.
+LIMITE_PADRAO = 20
+LIMITE_MAXIMO = 50
+
+# Letras guardadas de cada chave do índice. Buscas mais longas usam só
+# o início.
+TAMANHO_CHAVE = 40
+
+# Palavras do nome a partir das quais um produto pode ser encontrado.
+PALAVRAS_POR_NOME = 8
+
+# Leituras do banco por página, para que uma busca cujos candidatos
+# ficam quase todos fora do filtro (como os produtos sem estoque nas
+# saídas) não percorra o índice inteiro de uma vez.
+LEITURAS_POR_PAGINA = 5
+
+
+def chave(texto):
+    """
+    Normaliza um texto como as chaves do índice: minúsculas, sem
+    acentos e com as palavras separadas por um espaço.
+
+    Args:
+        texto (str): O texto.
+
+    Returns:
+        str: A chave.
+    """
+    return ' '.join(termos(texto))[:TAMANHO_CHAVE]
+
+
+def chaves_do_produto(nome, ncm):
+    """
+    Retorna as chaves de um produto: o nome a partir de cada uma das
+    primeiras palavras, para que "azul" encontre "Caneta azul", e o
+    NCM.
+
+    Args:
+        nome (str): O nome do produto.
+        ncm (str): O NCM do produto.
+
+    Returns:
+        set: As chaves.
+    """
+    palavras = termos(nome)
+    chaves = {
+        ' '.join(palavras[inicio:])[:TAMANHO_CHAVE]
+        for inicio in range(min(len(palavras), PALAVRAS_POR_NOME))
+    }
+    if ncm:
+        chaves.add(chave(ncm))
+    return chaves
+
+
+def _entrada(chave_produto, pk):
+    """
+    Monta uma entrada do índice. O separador vem antes de qualquer
+    letra, então as entradas ficam na ordem das chaves.
+    """
+    return f'{chave_produto}\x00{pk}'
+
+
+class IndicePrefixos:
+    """
+    Índice em memória dos produtos ativos, com as chaves de cada
+    produto em ordem alfabética, para encontrar por busca binária os
+    produtos cujo nome ou NCM começa com o texto digitado.
+
+    O índice não é alterado depois de criado, para que possa ser lido
+    por várias requisições ao mesmo tempo; `atualizado` retorna um
+    novo índice com as alterações.
+
+    Attributes:
+        entradas (list): A chave, um caractere nulo e a pk de cada
+        entrada, em ordem.
+        produtos (dict): Nome e NCM de cada produto, indexados pela pk.
+        lido_em (datetime): Horizonte da leitura dos produtos no banco:
+        as alterações a partir dele são lidas de novo na atualização.
+        criado_em (float): Momento da criação, em `time.monotonic`.
+    """
+
+    def __init__(self, produtos, lido_em, entradas=None):
+        """
+        Args:
+            produtos (dict): Nome e NCM de cada produto, indexados pela
+            pk.
+            lido_em (datetime): Horizonte da leitura dos produtos.
+            entradas (list): As entradas já ordenadas. Quando None, são
+            geradas a partir dos produtos.
+        """
+        if entradas is None:
+            entradas = sorted(
+                _entrada(chave_produto, pk)
+                for pk, (nome, ncm) in produtos.items()
+                for chave_produto in chaves_do_produto(nome, ncm)
+            )
+        self.produtos = produtos
+        self.entradas = entradas
+        self.lido_em = lido_em
+        self.criado_em = time.monotonic()
+
+    def atualizado(self, alterados, lido_em):
+        """
+        Retorna um novo índice com os produtos alterados.
+
+        Args:
+            alterados (iterable): Tuplas (pk, nome, NCM, data de
+            remoção) dos produtos incluídos, editados ou removidos.
+            lido_em (datetime): Horizonte da leitura das alterações.
+
+        Returns:
+            IndicePrefixos: O novo índice.
+        """
+        produtos = self.produtos
+        removidas = set()
+        incluidas = []
+        for pk, nome, ncm, removido_em in alterados:
+            if produtos is self.produtos:
+                produtos = dict(self.produtos)
+            anterior = produtos.pop(pk, None)
+            if anterior is not None:
+                removidas.update(
+                    _entrada(chave_produto, pk)
+                    for chave_produto in chaves_do_produto(*anterior)
+                )
+            if removido_em is None:
+                produtos[pk] = (nome, ncm)
+                incluidas.extend(
+                    _entrada(chave_produto, pk)
+                    for chave_produto in chaves_do_produto(nome, ncm)
+                )
+        if produtos is self.produtos:
+            return IndicePrefixos(produtos, lido_em, self.entradas)
+
+        # As entradas mantidas já estão em ordem, então a ordenação só
+        # intercala as incluídas
+        entradas = [
+            entrada for entrada in self.entradas if entrada not in removidas
+        ]
+        entradas.extend(incluidas)
+        entradas.sort()
+        return IndicePrefixos(produtos, lido_em, entradas)
+
+    def candidatos(self, prefixo, depois=None):
+        """
+        Percorre os produtos com alguma chave começando pelo prefixo,
+        em ordem de chave. Cada produto aparece uma vez, na sua menor
+        chave com o prefixo.
+
+        Args:
+            prefixo (str): O prefixo, já normalizado por `chave`.
+            depois (tuple): A chave e a pk a partir das quais continuar,
+            ou None para começar do início.
+
+        Yields:
+            tuple: A chave e a pk de cada produto.
+        """
+        posicao = bisect_left(self.entradas, prefixo)
+        if depois is not None:
+            # Um cursor de antes do prefixo, que não vem de uma página
+            # desta busca, recomeça do início
+            posicao = max(
+                posicao, bisect_right(self.entradas, _entrada(*depois))
+            )
+        for posicao in range(posicao, len(self.entradas)):
+            chave_produto, _, pk = self.entradas[posicao].partition('\x00')
+            if not chave_produto.startswith(prefixo):
+                break
+            pk = int(pk)
+            menor = min(
+                outra for outra in chaves_do_produto(*self.produtos[pk])
+                if outra.startswith(prefixo)
+            )
+            if menor == chave_produto:
+                yield chave_produto, pk
+
+
+_indice = None
+_atualizando = threading.Lock()
+
+
+def construir_indice():
+    """
+    Lê os produtos ativos e constrói um novo índice de prefixos.
+
+    Returns:
+        IndicePrefixos: O índice.
+    """
+    lido_em = horizonte()
+    produtos = Produto.ativos.order_by().values_list(
+        'pk', 'produto', 'ncm'
+    ).iterator(chunk_size=10000)
+    return IndicePrefixos(
+        {pk: (nome, ncm) for pk, nome, ncm in produtos}, lido_em
+    )
+
+
+def atualizar_indice(indice):
+    """
+    Lê os produtos alterados desde a leitura do índice, pela data de
+    alteração usada na sincronia, e retorna o índice atualizado.
+
+    A leitura recomeça do `horizonte` da leitura anterior, e não do
+    momento dela, para que uma transação ainda aberta naquele momento
+    não fique para trás; as alterações já aplicadas são aplicadas de
+    novo, sem efeito.
+
+    Args:
+        indice (IndicePrefixos): O índice atual.
+
+    Returns:
+        IndicePrefixos: O novo índice.
+    """
+    lido_em = horizonte()
+    alterados = Produto.objects.filter(
+        atualizado_em__gte=indice.lido_em
+    ).order_by().values_list('pk', 'produto', 'ncm', 'removido_em')
+    return indice.atualizado(alterados, lido_em)
+
+
+def indice_atual():
+    """
+    Retorna o índice de prefixos do processo, atualizado a cada
+    `PRODUTO_AUTOCOMPLETAR_SEGUNDOS`.
+
+    Só a primeira construção faz as requisições esperarem. Depois, a
+    requisição que encontra o índice vencido lê as alterações,
+    enquanto as demais continuam usando o anterior.
+
+    Returns:
+        IndicePrefixos: O índice.
+    """
+    global _indice
+    indice = _indice
+    if indice is None:
+        with _atualizando:
+            if _indice is None:
+                _indice = construir_indice()
+            return _indice
+    idade = time.monotonic() - indice.criado_em
+    if (idade > settings.PRODUTO_AUTOCOMPLETAR_SEGUNDOS
+            and _atualizando.acquire(blocking=False)):
+        try:
+            _indice = indice = atualizar_indice(_indice)
+        finally:
+            _atualizando.release()
+    return indice
+
+
+def sugerir(texto, queryset, depois=None, limite=LIMITE_PADRAO):
+    """
+    Retorna uma página dos produtos cujo nome, ou uma das palavras do
+    nome, ou o NCM começa com o texto digitado.
+
+    Os candidatos vêm do índice em memória; o banco só é lido para
+    aplicar o filtro do queryset e trazer o estoque atual dos produtos
+    da página, pela pk.
+
+    Args:
+        texto (str): O texto digitado.
+        queryset (QuerySet): Os produtos aceitos, como os disponíveis
+        para saída.
+        depois (tuple): O cursor (chave, pk) da página anterior, ou
+        None para a primeira página.
+        limite (int): Quantidade máxima de produtos na página.
+
+    Returns:
+        tuple: (lista de dicionários com pk, produto e estoque, cursor
+        da próxima página, se há mais produtos). O cursor é None na
+        última página.
+    """
+    prefixo = chave(texto)
+    if not prefixo:
+        return [], None, False
+
+    candidatos = indice_atual().candidatos(prefixo, depois)
+    queryset = queryset.order_by().only(
+        'pk', 'produto', 'estoque', 'fragmentado', 'reservado'
+    )
+    registros = []
+    ultimo = None
+    for _ in range(LEITURAS_POR_PAGINA):
+        lote = list(islice(candidatos, limite))
+        if not lote:
+            return registros, None, False
+        encontrados = queryset.in_bulk([pk for _, pk in lote])
+        preencher_estoques(encontrados.values())
+        for entrada in lote:
+            if len(registros) == limite:
+                return registros, gerar_cursor(*ultimo), True
+            ultimo = entrada
+            produto = encontrados.get(entrada[1])
+            if produto is not None:
+                registros.append({
+                    'pk': produto.pk,
+                    'produto': produto.produto,
+                    'estoque': produto.estoque_atual,
+                })
+    return registros, gerar_cursor(*ultimo), True
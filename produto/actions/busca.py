@@ -0,0 +1,362 @@
+import re
+import unicodedata
+
+from django.db import connections, transaction
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models import FloatField, Value
+from django.db.models.expressions import RawSQL
+
+
+# Tabela do índice de busca, mantida por gatilhos no banco a cada
+# inclusão, edição ou remoção de produto, inclusive nas importações
+# com `bulk_create` e nos `update` de QuerySets.
+TABELA = 'produto_busca'
+
+# Peso do nome, do NCM e da categoria na relevância.
+PESOS = (10.0, 5.0, 2.0)
+
+# Índice FTS5 com os acentos removidos na tokenização e índices de
+# prefixo para as buscas com poucas letras.
+SQLITE_INSTALAR = (
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {TABELA} USING fts5(
+        produto, ncm, categoria,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    """,
+    f"DELETE FROM {TABELA}",
+    f"""
+    INSERT INTO {TABELA} ({TABELA}, rank)
+    VALUES ('rank', 'bm25({", ".join(map(str, PESOS))})')
+    """,
+    f"""
+    INSERT INTO {TABELA} (rowid, produto, ncm, categoria)
+    SELECT p.id, p.produto, p.ncm, c.categoria
+    FROM produto_produto p
+    LEFT JOIN produto_categoria c ON c.id = p.categoria_id
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABELA}_incluir
+    AFTER INSERT ON produto_produto
+    BEGIN
+        INSERT INTO {TABELA} (rowid, produto, ncm, categoria)
+        VALUES (
+            new.id, new.produto, new.ncm,
+            (SELECT categoria FROM produto_categoria
+             WHERE id = new.categoria_id)
+        );
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABELA}_editar
+    AFTER UPDATE OF produto, ncm, categoria_id ON produto_produto
+    WHEN old.produto IS NOT new.produto OR old.ncm IS NOT new.ncm
+        OR old.categoria_id IS NOT new.categoria_id
+    BEGIN
+        UPDATE {TABELA} SET
+            produto = new.produto,
+            ncm = new.ncm,
+            categoria = (SELECT categoria FROM produto_categoria
+                         WHERE id = new.categoria_id)
+        WHERE rowid = new.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABELA}_excluir
+    AFTER DELETE ON produto_produto
+    BEGIN
+        DELETE FROM {TABELA} WHERE rowid = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABELA}_categoria
+    AFTER UPDATE OF categoria ON produto_categoria
+    WHEN old.categoria IS NOT new.categoria
+    BEGIN
+        UPDATE {TABELA} SET categoria = new.categoria
+        WHERE rowid IN (
+            SELECT id FROM produto_produto WHERE categoria_id = new.id
+        );
+    END
+    """,
+)
+
+SQLITE_REMOVER = (
+    f"DROP TRIGGER IF EXISTS {TABELA}_incluir",
+    f"DROP TRIGGER IF EXISTS {TABELA}_editar",
+    f"DROP TRIGGER IF EXISTS {TABELA}_excluir",
+    f"DROP TRIGGER IF EXISTS {TABELA}_categoria",
+    f"DROP TABLE IF EXISTS {TABELA}",
+)
+
+# No PostgreSQL, um tsvector com os pesos A, B e C e um índice GIN.
+# A tabela não tem chave estrangeira para o produto, para não impedir
+# o TRUNCATE dos testes; os registros órfãos somem na junção da busca.
+POSTGRESQL_INSTALAR = (
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    f"""
+    CREATE TABLE IF NOT EXISTS {TABELA} (
+        produto_id integer PRIMARY KEY,
+        documento tsvector NOT NULL
+    )
+    """,
+    f"""
+    CREATE INDEX IF NOT EXISTS {TABELA}_documento_idx
+    ON {TABELA} USING gin (documento)
+    """,
+    f"""
+    CREATE OR REPLACE FUNCTION {TABELA}_documento(
+        nome text, ncm text, categoria text
+    ) RETURNS tsvector AS $$
+        SELECT
+            setweight(to_tsvector('simple', unaccent(coalesce(nome, ''))),
+                      'A')
+            || setweight(to_tsvector('simple', coalesce(ncm, '')), 'B')
+            || setweight(
+                to_tsvector('simple', unaccent(coalesce(categoria, ''))),
+                'C'
+            )
+    $$ LANGUAGE sql STABLE
+    """,
+    f"TRUNCATE {TABELA}",
+    f"""
+    INSERT INTO {TABELA} (produto_id, documento)
+    SELECT p.id, {TABELA}_documento(p.produto, p.ncm, c.categoria)
+    FROM produto_produto p
+    LEFT JOIN produto_categoria c ON c.id = p.categoria_id
+    """,
+    f"""
+    CREATE OR REPLACE FUNCTION {TABELA}_produto() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            DELETE FROM {TABELA} WHERE produto_id = OLD.id;
+            RETURN NULL;
+        END IF;
+        INSERT INTO {TABELA} (produto_id, documento)
+        VALUES (
+            NEW.id,
+            {TABELA}_documento(
+                NEW.produto, NEW.ncm,
+                (SELECT categoria FROM produto_categoria
+                 WHERE id = NEW.categoria_id)
+            )
+        )
+        ON CONFLICT (produto_id)
+        DO UPDATE SET documento = EXCLUDED.documento;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    f"""
+    CREATE OR REPLACE FUNCTION {TABELA}_categoria() RETURNS trigger AS $$
+    BEGIN
+        UPDATE {TABELA} b
+        SET documento = {TABELA}_documento(p.produto, p.ncm, NEW.categoria)
+        FROM produto_produto p
+        WHERE p.categoria_id = NEW.id AND b.produto_id = p.id;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    f"DROP TRIGGER IF EXISTS {TABELA}_incluir ON produto_produto",
+    f"""
+    CREATE TRIGGER {TABELA}_incluir
+    AFTER INSERT OR DELETE ON produto_produto
+    FOR EACH ROW EXECUTE FUNCTION {TABELA}_produto()
+    """,
+    f"DROP TRIGGER IF EXISTS {TABELA}_editar ON produto_produto",
+    f"""
+    CREATE TRIGGER {TABELA}_editar
+    AFTER UPDATE OF produto, ncm, categoria_id ON produto_produto
+    FOR EACH ROW
+    WHEN (OLD.produto IS DISTINCT FROM NEW.produto
+          OR OLD.ncm IS DISTINCT FROM NEW.ncm
+          OR OLD.categoria_id IS DISTINCT FROM NEW.categoria_id)
+    EXECUTE FUNCTION {TABELA}_produto()
+    """,
+    f"DROP TRIGGER IF EXISTS {TABELA}_categoria ON produto_categoria",
+    f"""
+    CREATE TRIGGER {TABELA}_categoria
+    AFTER UPDATE OF categoria ON produto_categoria
+    FOR EACH ROW
+    WHEN (OLD.categoria IS DISTINCT FROM NEW.categoria)
+    EXECUTE FUNCTION {TABELA}_categoria()
+    """,
+)
+
+POSTGRESQL_REMOVER = (
+    f"DROP TRIGGER IF EXISTS {TABELA}_incluir ON produto_produto",
+    f"DROP TRIGGER IF EXISTS {TABELA}_editar ON produto_produto",
+    f"DROP TRIGGER IF EXISTS {TABELA}_categoria ON produto_categoria",
+    f"DROP FUNCTION IF EXISTS {TABELA}_produto()",
+    f"DROP FUNCTION IF EXISTS {TABELA}_categoria()",
+    f"DROP TABLE IF EXISTS {TABELA}",
+    f"DROP FUNCTION IF EXISTS {TABELA}_documento(text, text, text)",
+)
+
+COMANDOS = {
+    'sqlite': (SQLITE_INSTALAR, SQLITE_REMOVER),
+    'postgresql': (POSTGRESQL_INSTALAR, POSTGRESQL_REMOVER),
+}
+
+# Consulta dos gatilhos do índice existentes no banco, e os gatilhos
+# que devem existir.
+GATILHOS = {
+    'sqlite': (
+        "SELECT name FROM sqlite_master WHERE type = 'trigger'",
+        {
+            f'{TABELA}_incluir', f'{TABELA}_editar', f'{TABELA}_excluir',
+            f'{TABELA}_categoria',
+        },
+    ),
+    'postgresql': (
+        "SELECT tgname FROM pg_trigger WHERE NOT tgisinternal",
+        {f'{TABELA}_incluir', f'{TABELA}_editar', f'{TABELA}_categoria'},
+    ),
+}
+
+# Migração que cria o índice de busca.
+MIGRACAO = ('produto', '0010_busca')
+
+
+def instalar(connection):
+    """
+    Cria o índice de busca e os gatilhos que o mantêm, e indexa os
+    produtos cadastrados. Pode ser executado de novo para reconstruir
+    o índice.
+
+    No SQLite, migrações que recriam a tabela de produtos (como a
+    alteração de um campo) removem os gatilhos junto com a tabela
+    antiga; `reinstalar_apos_migracao` os recria ao fim do migrate.
+
+    Args:
+        connection: A conexão com o banco.
+    """
+    if connection.vendor in COMANDOS:
+        with connection.cursor() as cursor:
+            for sql in COMANDOS[connection.vendor][0]:
+                cursor.execute(sql)
+
+
+def remover(connection):
+    """
+    Remove o índice de busca e os seus gatilhos.
+
+    Args:
+        connection: A conexão com o banco.
+    """
+    if connection.vendor in COMANDOS:
+        with connection.cursor() as cursor:
+            for sql in COMANDOS[connection.vendor][1]:
+                cursor.execute(sql)
+
+
+def gatilhos_ausentes(connection):
+    """
+    Retorna os gatilhos do índice de busca que não existem no banco.
+
+    Args:
+        connection: A conexão com o banco.
+
+    Returns:
+        set: Os nomes dos gatilhos ausentes; vazio em bancos sem
+        índice de busca.
+    """
+    if connection.vendor not in GATILHOS:
+        return set()
+    sql, esperados = GATILHOS[connection.vendor]
+    with connection.cursor() as cursor:
+        cursor.execute(sql)
+        return esperados - {linha[0] for linha in cursor.fetchall()}
+
+
+def reinstalar_apos_migracao(sender, using, **kwargs):
+    """
+    Recria o índice de busca ao fim do migrate quando falta algum
+    gatilho, como depois de uma migração do SQLite que recriou a
+    tabela de produtos, e indexa de novo os produtos, que podem ter
+    sido alterados sem os gatilhos.
+
+    Receptor do sinal `post_migrate` do app de produtos. Nada é feito
+    enquanto a migração que cria o índice não estiver aplicada.
+
+    Args:
+        sender (AppConfig): O app de produtos.
+        using (str): O alias do banco migrado.
+    """
+    connection = connections[using]
+    if not gatilhos_ausentes(connection):
+        return
+    if MIGRACAO in MigrationRecorder(connection).applied_migrations():
+        with transaction.atomic(using=using):
+            instalar(connection)
+
+
+def termos(texto):
+    """
+    Separa as palavras de uma busca, em minúsculas e sem acentos,
+    como no índice.
+
+    Args:
+        texto (str): O texto digitado.
+
+    Returns:
+        list: As palavras, na ordem do texto.
+    """
+    decomposto = unicodedata.normalize('NFKD', texto.lower())
+    sem_acentos = ''.join(
+        letra for letra in decomposto if not unicodedata.combining(letra)
+    )
+    return re.findall(r'\w+', sem_acentos)
+
+
+def buscar(queryset, texto):
+    """
+    Filtra os produtos que contêm todas as palavras da busca no nome,
+    no NCM ou na categoria, e os ordena por relevância.
+
+    Cada palavra vale também como prefixo, então "lap" encontra
+    "Lápis". A relevância fica na anotação `relevancia`, menor nos
+    produtos mais relevantes, e pode ser usada como campo de cursor.
+    Em bancos sem índice de busca, filtra o nome com `icontains`, e a
+    relevância é a mesma em todos os produtos, assim como numa busca
+    sem palavras, que não encontra nada.
+
+    Args:
+        queryset (QuerySet): Os produtos buscados.
+        texto (str): O texto digitado.
+
+    Returns:
+        QuerySet: Os produtos encontrados, do mais relevante ao menos
+        relevante.
+    """
+    # Relevância das buscas sem índice, para que o cursor funcione
+    sem_relevancia = Value(0.0, output_field=FloatField())
+    palavras = termos(texto)
+    if not palavras:
+        return queryset.none().annotate(relevancia=sem_relevancia)
+
+    vendor = connections[queryset.db].vendor
+    tabela = queryset.model._meta.db_table
+    if vendor == 'sqlite':
+        consulta = ' '.join(f'"{palavra}"*' for palavra in palavras)
+        juncao = f'{TABELA}.rowid = {tabela}.id'
+        condicao = f'{TABELA} MATCH %s'
+        relevancia = RawSQL(f'{TABELA}.rank', (), output_field=FloatField())
+    elif vendor == 'postgresql':
+        consulta = ' & '.join(f"'{palavra}':*" for palavra in palavras)
+        juncao = f'{TABELA}.produto_id = {tabela}.id'
+        condicao = f"{TABELA}.documento @@ to_tsquery('simple', %s)"
+        relevancia = RawSQL(
+            f"-ts_rank({TABELA}.documento, to_tsquery('simple', %s))",
+            (consulta,), output_field=FloatField()
+        )
+    else:
+        return queryset.filter(produto__icontains=texto).annotate(
+            relevancia=sem_relevancia
+        ).order_by('relevancia', 'pk')
+
+    return queryset.extra(
+        tables=[TABELA], where=[juncao, condicao], params=[consulta]
+    ).annotate(relevancia=relevancia).order_by('relevancia', 'pk')
@@ -0,0 +1,297 @@
+import random
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import (
+    Case, F, IntegerField, OuterRef, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Coalesce
+
+from ..models import FragmentoEstoque, Produto, chave_cache_estoque
+from .alteracoes import registrar_edicoes
+
+
+# Chave de cache com o conjunto de pks dos produtos fragmentados.
+CHAVE_FRAGMENTADOS = 'produtos_fragmentados'
+
+# Quantidade de produtos por UPDATE da consolidação.
+TAMANHO_LOTE = 250
+
+
+def numero_fragmentos():
+    """
+    Retorna quantos fragmentos são criados por produto, de acordo com
+    `ESTOQUE_FRAGMENTOS`.
+
+    Returns:
+        int: O número de fragmentos.
+    """
+    return max(1, getattr(settings, 'ESTOQUE_FRAGMENTOS', 8))
+
+
+def tempo_cache():
+    """
+    Retorna por quantos segundos as somas dos fragmentos ficam em
+    cache, de acordo com `ESTOQUE_FRAGMENTOS_CACHE_SEGUNDOS`.
+
+    Returns:
+        int: O tempo de cache em segundos.
+    """
+    return getattr(settings, 'ESTOQUE_FRAGMENTOS_CACHE_SEGUNDOS', 5)
+
+
+def fragmentados_em_cache():
+    """
+    Retorna as pks dos produtos fragmentados, guardadas em cache.
+
+    O conjunto pode estar desatualizado por até `tempo_cache()`
+    segundos em outros processos. Quem grava o estoque deve confirmar
+    com `produtos_fragmentados` quando uma atualização não encontrar
+    a linha esperada.
+
+    Returns:
+        set: As pks dos produtos fragmentados.
+    """
+    pks = cache.get(CHAVE_FRAGMENTADOS)
+    if pks is None:
+        pks = set(
+            Produto.objects.filter(fragmentado=True)
+            .values_list('pk', flat=True)
+        )
+        cache.set(CHAVE_FRAGMENTADOS, pks, tempo_cache())
+    return pks
+
+
+def produtos_fragmentados(pks):
+    """
+    Consulta no banco quais dos produtos informados são fragmentados.
+
+    Args:
+        pks (iterable): As pks dos produtos.
+
+    Returns:
+        set: As pks dos produtos fragmentados.
+    """
+    return set(
+        Produto.objects.filter(pk__in=list(pks), fragmentado=True)
+        .values_list('pk', flat=True)
+    )
+
+
+def somar(pks):
+    """
+    Soma os fragmentos dos produtos informados, com uma consulta, e
+    atualiza o cache das somas. A soma é o estoque disponível, sem as
+    reservas.
+
+    Args:
+        pks (iterable): As pks dos produtos fragmentados.
+
+    Returns:
+        dict: Estoque somado indexado pela pk do produto.
+    """
+    pks = list(pks)
+    if not pks:
+        return {}
+    totais = dict.fromkeys(pks, 0)
+    totais.update(
+        FragmentoEstoque.objects.filter(produto__in=pks)
+        .values_list('produto')
+        .annotate(total=Sum('quantidade'))
+        .values_list('produto', 'total')
+    )
+    cache.set_many(
+        {chave_cache_estoque(pk): total for pk, total in totais.items()},
+        tempo_cache()
+    )
+    return totais
+
+
+def preencher_estoques(produtos):
+    """
+    Lê de uma vez as somas dos fragmentos dos produtos fragmentados de
+    uma listagem, do cache ou com uma única consulta, para que
+    `Produto.estoque_atual` não consulte o banco a cada linha.
+
+    Args:
+        produtos (iterable): Os produtos da página.
+
+    Returns:
+        list: Os mesmos produtos.
+    """
+    produtos = list(produtos)
+    fragmentados = [produto for produto in produtos if produto.fragmentado]
+    if not fragmentados:
+        return produtos
+    chaves = {
+        chave_cache_estoque(produto.pk): produto.pk
+        for produto in fragmentados
+    }
+    totais = {
+        chaves[chave]: total
+        for chave, total in cache.get_many(list(chaves)).items()
+    }
+    totais.update(somar(
+        produto.pk for produto in fragmentados if produto.pk not in totais
+    ))
+    for produto in fragmentados:
+        produto._estoque_fragmentos = totais[produto.pk]
+    return produtos
+
+
+def movimentar(pk, delta):
+    """
+    Aplica uma variação de estoque em um produto fragmentado.
+
+    Entradas somam em um fragmento aleatório. Saídas tentam primeiro
+    um fragmento aleatório com saldo suficiente; se ele não tiver,
+    bloqueiam os fragmentos do produto e retiram dos maiores até
+    completar a quantidade. Nenhum fragmento fica negativo.
+
+    Deve ser chamada dentro de uma transação.
+
+    Args:
+        pk (int): A pk do produto.
+        delta (int): Variação de estoque, negativa para saídas.
+
+    Returns:
+        bool: False se o produto não tiver fragmentos ou não tiver
+        saldo suficiente.
+    """
+    # A soma em cache deixa de valer quando a transação for confirmada
+    transaction.on_commit(partial(cache.delete, chave_cache_estoque(pk)))
+
+    fragmentos = FragmentoEstoque.objects.filter(produto=pk)
+    indice = random.randrange(numero_fragmentos())
+    if delta >= 0:
+        # Se ESTOQUE_FRAGMENTOS mudou após a fragmentação, o índice
+        # sorteado pode não existir; usa o primeiro fragmento
+        return bool(
+            fragmentos.filter(indice=indice)
+            .update(quantidade=F('quantidade') + delta)
+            or fragmentos.filter(indice=0)
+            .update(quantidade=F('quantidade') + delta)
+        )
+
+    retirar = -delta
+    if fragmentos.filter(indice=indice, quantidade__gte=retirar).update(
+            quantidade=F('quantidade') - retirar):
+        return True
+
+    # O fragmento sorteado não tem saldo: retira de vários
+    saldos = list(
+        fragmentos.select_for_update()
+        .order_by('-quantidade')
+        .values_list('pk', 'quantidade')
+    )
+    if sum(quantidade for _, quantidade in saldos) < retirar:
+        return False
+    for fragmento, quantidade in saldos:
+        parte = min(quantidade, retirar)
+        if parte:
+            FragmentoEstoque.objects.filter(pk=fragmento).update(
+                quantidade=F('quantidade') - parte
+            )
+            retirar -= parte
+        if not retirar:
+            break
+    return True
+
+
+def fragmentar(produto):
+    """
+    Divide o estoque atual do produto em `ESTOQUE_FRAGMENTOS`
+    fragmentos de tamanhos iguais.
+
+    Args:
+        produto (Produto): O produto a ser fragmentado.
+    """
+    with transaction.atomic():
+        produto = Produto.objects.select_for_update().get(pk=produto.pk)
+        if produto.fragmentado:
+            return
+        # As quantidades reservadas ficam fora dos fragmentos
+        n = numero_fragmentos()
+        parte, resto = divmod(produto.estoque - produto.reservado, n)
+        FragmentoEstoque.objects.bulk_create([
+            FragmentoEstoque(
+                produto=produto,
+                indice=indice,
+                quantidade=parte + (1 if indice < resto else 0),
+            )
+            for indice in range(n)
+        ])
+        Produto.objects.filter(pk=produto.pk).update(fragmentado=True)
+    cache.delete_many([CHAVE_FRAGMENTADOS, chave_cache_estoque(produto.pk)])
+
+
+def desfragmentar(produto):
+    """
+    Devolve a soma dos fragmentos, mais as reservas, ao campo
+    `estoque` do produto e remove os fragmentos.
+
+    Args:
+        produto (Produto): O produto fragmentado.
+    """
+    with transaction.atomic():
+        produto = Produto.objects.select_for_update().get(pk=produto.pk)
+        if not produto.fragmentado:
+            return
+        total = sum(
+            produto.fragmentos.select_for_update()
+            .values_list('quantidade', flat=True)
+        )
+        produto.fragmentos.all().delete()
+        Produto.objects.filter(pk=produto.pk).update(
+            estoque=F('reservado') + total, fragmentado=False
+        )
+    cache.delete_many([CHAVE_FRAGMENTADOS, chave_cache_estoque(produto.pk)])
+
+
+def consolidar():
+    """
+    Copia a soma dos fragmentos, mais as reservas, para o campo
+    `estoque` dos produtos fragmentados em que ele está diferente.
+
+    Os fragmentos não são alterados, então a consolidação não disputa
+    as linhas gravadas pelas movimentações. Cada campo regravado é
+    registrado como edição no feed de alterações; não como
+    movimentação, pois as movimentações dos fragmentos já foram
+    registradas com o estoque resultante.
+
+    Returns:
+        int: Número de produtos consolidados.
+    """
+    soma = (
+        FragmentoEstoque.objects.filter(produto=OuterRef('pk'))
+        .values('produto')
+        .annotate(total=Sum('quantidade'))
+        .values('total')
+    )
+    with transaction.atomic():
+        consolidados = dict(
+            Produto.objects.filter(fragmentado=True)
+            .annotate(somados=Coalesce(Subquery(soma), 0) + F('reservado'))
+            .exclude(estoque=F('somados'))
+            .values_list('pk', 'somados')
+        )
+        pks = list(consolidados)
+        for i in range(0, len(pks), TAMANHO_LOTE):
+            lote = pks[i:i + TAMANHO_LOTE]
+            Produto.objects.filter(pk__in=lote).update(
+                estoque=Case(
+                    *[
+                        When(pk=pk, then=Value(consolidados[pk]))
+                        for pk in lote
+                    ],
+                    default=F('estoque'),
+                    output_field=IntegerField()
+                )
+            )
+        registrar_edicoes({
+            pk: {'estoque': estoque} for pk, estoque in consolidados.items()
+        })
+    cache.delete(CHAVE_FRAGMENTADOS)
+    return len(consolidados)
@@ -1,6 +1,12 @@
 import xlrd
 
+from django.db import transaction
+
+from estoque.actions.arquivamento import registrar_aberturas
+
 from ..models import Categoria, Produto
+from .alertas import registrar_importados
+from .alteracoes import registrar_cadastros
 
 
 def importar_xlsx(filename):
@@ -34,7 +40,7 @@ def importar_xlsx(filename):
         estoque = sheet.row(row)[4].value
         estoque_minimo = sheet.row(row)[5].value
         _categoria = sheet.row(row)[6].value
-        categoria = Categoria.objects.filter(categoria=_categoria).first()
+        categoria = Categoria.ativos.filter(categoria=_categoria).first()
         produto = dict(
             produto=produto,
             ncm=ncm,
@@ -48,6 +54,10 @@ def importar_xlsx(filename):
         else:
             obj = Produto(**produto)
         aux.append(obj)
-    Produto.objects.bulk_create(aux)
+    with transaction.atomic():
+        produtos = Produto.objects.bulk_create(aux)
+        registrar_importados(produtos)
+        registrar_cadastros(produtos)
+        registrar_aberturas(produtos)
 
 
@@ -0,0 +1,145 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from core.horizonte import horizonte
+
+from ..models import Categoria, Produto
+
+
+# Quantidade padrão e máxima de registros por página da sincronia.
+LIMITE_PADRAO = 500
+LIMITE_MAXIMO = 5000
+
+# Campos enviados de cada modelo sincronizado. Registros removidos
+# levam só a pk e as datas.
+CAMPOS = {
+    'produtos': (
+        Produto,
+        (
+            'pk', 'produto', 'ncm', 'importado', 'preco',
+            'estoque_minimo', 'categoria',
+        ),
+    ),
+    'categorias': (Categoria, ('pk', 'categoria')),
+}
+
+# Início da contagem de microssegundos dos cursores.
+EPOCA = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def gerar_cursor(atualizado_em, pk):
+    """
+    Gera o cursor que aponta para um registro da sincronia.
+
+    Args:
+        atualizado_em (datetime): A data de alteração do registro.
+        pk (int): A pk do registro.
+
+    Returns:
+        str: O cursor no formato `<microssegundos>-<pk>`.
+    """
+    microssegundos = (atualizado_em - EPOCA) // timedelta(microseconds=1)
+    return f'{microssegundos}-{pk}'
+
+
+def ler_cursor(valor):
+    """
+    Lê um cursor gerado por `gerar_cursor`.
+
+    Args:
+        valor (str): O cursor.
+
+    Returns:
+        tuple: (data de alteração, pk), ou None se o cursor estiver
+        vazio.
+
+    Raises:
+        ValueError: Se o cursor for inválido.
+    """
+    if not valor:
+        return None
+    microssegundos, pk = (int(parte) for parte in valor.split('-'))
+    try:
+        return EPOCA + timedelta(microseconds=microssegundos), pk
+    except OverflowError as erro:
+        raise ValueError('Cursor fora do intervalo de datas.') from erro
+
+
+def consulta_alterados(modelo, cursor=None):
+    """
+    Monta, sem executar, a consulta de `alterados_desde`: os registros
+    alterados antes do `horizonte` e depois do cursor.
+
+    Args:
+        modelo (str): 'produtos' ou 'categorias'.
+        cursor (tuple): (data de alteração, pk) do último registro da
+        leitura anterior, ou None para ler tudo.
+
+    Returns:
+        QuerySet: Os campos de cada registro, com `atualizado_em` e
+        `removido_em`, em ordem de alteração.
+
+    Raises:
+        ValueError: Se o modelo for inválido.
+    """
+    if modelo not in CAMPOS:
+        raise ValueError(f'Modelo deve ser um de {", ".join(CAMPOS)}.')
+    classe, campos = CAMPOS[modelo]
+    registros = classe.objects.filter(atualizado_em__lt=horizonte())
+    if cursor is not None:
+        atualizado_em, pk = cursor
+        # Registros alterados no mesmo instante continuam pela pk
+        registros = registros.filter(
+            atualizado_em__gte=atualizado_em
+        ).exclude(atualizado_em=atualizado_em, pk__lte=pk)
+    return registros.order_by('atualizado_em', 'pk').values(
+        *campos, 'atualizado_em', 'removido_em'
+    )
+
+
+def alterados_desde(modelo, cursor=None, limite=LIMITE_PADRAO):
+    """
+    Lê os produtos ou categorias alterados ou removidos depois de um
+    cursor, em ordem de alteração.
+
+    A leitura percorre o índice (atualizado_em, id) a partir do
+    cursor, então o custo depende só da quantidade de registros
+    alterados. Só são lidos os registros alterados antes do
+    `horizonte`; os demais ficam para a próxima leitura, para que uma
+    transação ainda aberta não fique para trás do cursor.
+
+    Args:
+        modelo (str): 'produtos' ou 'categorias'.
+        cursor (tuple): (data de alteração, pk) do último registro da
+        leitura anterior, ou None para ler tudo.
+        limite (int): Quantidade máxima de registros, até
+        `LIMITE_MAXIMO`.
+
+    Returns:
+        tuple: A lista de registros, o cursor da próxima leitura e se
+        há mais registros disponíveis. Registros removidos vêm com
+        `removido` verdadeiro e sem os demais campos.
+
+    Raises:
+        ValueError: Se o modelo for inválido.
+    """
+    limite = max(1, min(limite, LIMITE_MAXIMO))
+    linhas = list(consulta_alterados(modelo, cursor)[:limite + 1])
+    mais = len(linhas) > limite
+    linhas = linhas[:limite]
+
+    resultado = []
+    for linha in linhas:
+        removido_em = linha.pop('removido_em')
+        if removido_em is not None:
+            linha = {
+                'pk': linha['pk'], 'atualizado_em': linha['atualizado_em']
+            }
+        linha['removido'] = removido_em is not None
+        resultado.append(linha)
+
+    proximo = (
+        gerar_cursor(linhas[-1]['atualizado_em'], linhas[-1]['pk'])
+        if linhas else
+        (gerar_cursor(*cursor) if cursor else None)
+    )
+    return resultado, proximo, mais
@@ -0,0 +1,107 @@
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from ..models import Produto
+from .alertas import registrar_cruzamentos
+from .alteracoes import registrar_edicao
+
+
+# Número de vezes que a gravação é repetida quando outra edição, em
+# campos diferentes, é confirmada entre a leitura e a gravação.
+TENTATIVAS = 3
+
+
+class ConflitoDeVersao(Exception):
+    """
+    Exceção levantada quando o produto foi alterado por outra edição
+    nos mesmos campos, ou removido, desde a leitura.
+    """
+
+    def __init__(self, produto):
+        self.produto = produto
+        super().__init__(
+            f'O produto {produto} foi alterado por outro usuário. '
+            f'Confira os dados atuais e refaça a alteração.'
+        )
+
+
+def _avaliar_minimo(pk, minimo_anterior):
+    """
+    Gera o alerta de estoque mínimo quando a alteração do mínimo faz o
+    produto mudar de lado.
+
+    Args:
+        pk (int): A pk do produto.
+        minimo_anterior (int): O estoque mínimo antes da edição.
+    """
+    atual = Produto.objects.get(pk=pk)
+    estoque = atual.estoque_atual
+    registrar_cruzamentos([(
+        pk, estoque < (minimo_anterior or 0), estoque, atual.estoque_minimo
+    )])
+
+
+def atualizar_com_versao(produto, campos, originais):
+    """
+    Grava somente os campos alterados do produto, com compare-and-swap
+    na versão.
+
+    O UPDATE só é aplicado se a versão no banco ainda for a lida
+    (`WHERE versao = produto.versao`), e incrementa a versão. Se outra
+    edição foi confirmada antes, o produto é relido: quando ela não
+    mexeu nos mesmos campos, a gravação é repetida sobre a nova versão,
+    até `TENTATIVAS` vezes. Nenhuma linha é bloqueada, e o estoque,
+    alterado pelas movimentações com UPDATEs relativos, nunca é
+    gravado aqui. Se o estoque mínimo mudar, o alerta de estoque
+    mínimo é atualizado na mesma transação, assim como o registro da
+    edição para os sistemas externos.
+
+    Args:
+        produto (Produto): O produto com os novos valores e a versão
+        lida.
+        campos (iterable): Nomes dos campos alterados.
+        originais (dict): Valor de cada campo alterado na versão lida,
+        indexado pelo nome do campo (como em `form.initial`).
+
+    Raises:
+        ConflitoDeVersao: Se outra edição alterou os mesmos campos ou
+        removeu o produto.
+    """
+    valores = {}
+    anteriores = {}
+    for nome in campos:
+        attname = Produto._meta.get_field(nome).attname
+        valores[attname] = getattr(produto, attname)
+        anteriores[attname] = originais.get(nome)
+    if not valores:
+        return
+
+    versao = produto.versao
+    for tentativa in range(TENTATIVAS):
+        with transaction.atomic():
+            gravado = Produto.objects.filter(
+                pk=produto.pk, versao=versao
+            ).update(
+                versao=F('versao') + 1, atualizado_em=timezone.now(),
+                **valores
+            )
+            if gravado and 'estoque_minimo' in valores:
+                _avaliar_minimo(produto.pk, anteriores['estoque_minimo'])
+            if gravado:
+                registrar_edicao(produto.pk, valores)
+        if gravado:
+            produto.versao = versao + 1
+            return
+
+        atual = Produto.objects.filter(pk=produto.pk).values(
+            'versao', 'removido_em', *valores
+        ).first()
+        if (atual is None
+                or atual['removido_em'] != produto.removido_em
+                or any(atual[campo] != anteriores[campo]
+                       for campo in valores)):
+            raise ConflitoDeVersao(produto)
+        versao = atual['versao']
+
+    raise ConflitoDeVersao(produto)
@@ -1,9 +1,31 @@
 import csv
 from datetime import datetime
 import xlwt
-from django.contrib import admin
-from django.http import HttpResponse
-from .models import Categoria, Produto
+from django.contrib import admin, messages
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
+from django.http import HttpResponse, HttpResponseRedirect
+from estoque.actions.arquivamento import registrar_aberturas
+from .actions.alertas import registrar_cruzamentos
+from .actions.alteracoes import registrar_cadastros
+from .actions.busca import buscar
+from .actions.fragmentos import desfragmentar, fragmentar
+from .actions.versao import ConflitoDeVersao, atualizar_com_versao
+from .forms import ProdutoAdminForm
+from .models import AlertaEstoque, Categoria, Produto, remover
+
+class ListaPorRelevancia(ChangeList):
+    """
+    Listagem do admin que ordena o resultado de uma pesquisa pela
+    relevância do índice de busca, a não ser que outra ordenação seja
+    escolhida na listagem.
+    """
+    def get_ordering(self, request, queryset):
+        # A ordenação é aplicada antes da pesquisa; sem ordenação, fica
+        # a da relevância, aplicada por `get_search_results`
+        if self.query.strip() and ORDER_VAR not in self.params:
+            return []
+        return super().get_ordering(request, queryset)
+
 
 # Register your models here.
 @admin.register(Produto)
@@ -13,16 +35,22 @@ class ProdutoAdmin(admin.ModelAdmin):
     Produto.
 
     Attributes:
+        form (Form): Formulário com a versão lida do produto, para
+        detectar edições concorrentes.
+
         list_display (tuple): Campos a serem exibidos na 
         listagem do modelo.
 
         search_fields (tuple): Campos pelos quais a pesquisa pode 
-        ser feita.
+        ser feita. A pesquisa usa o índice de busca, que também cobre
+        o NCM e a categoria.
 
         list_filter (tuple): Campos pelos quais a lista pode ser 
         filtrada.
     """
     
+    form = ProdutoAdminForm
+
     list_display = (
         '__str__',
         'importado',
@@ -35,9 +63,18 @@ class ProdutoAdmin(admin.ModelAdmin):
 
     search_fields = ('produto',)
 
-    list_filter = ('importado',)
+    list_filter = (
+        'importado',
+        'fragmentado',
+        ('removido_em', admin.EmptyFieldListFilter),
+    )
 
-    actions = ('export_as_csv', 'export_as_xlsx')
+    actions = (
+        'export_as_csv',
+        'export_as_xlsx',
+        'fragmentar_estoque',
+        'desfragmentar_estoque',
+    )
 
     class Media:
         js = (
@@ -45,6 +82,91 @@ class ProdutoAdmin(admin.ModelAdmin):
             '/static/js/estoque_admin.js'
         )
 
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Pesquisa pelo índice de busca, sem acentos e com prefixos, em
+        vez do `LIKE '%termo%'`, que lê a tabela inteira.
+        """
+        if not search_term.strip():
+            return queryset, False
+        # Mantém a ordenação escolhida na listagem, se houver
+        ordenacao = queryset.query.order_by
+        resultado = buscar(queryset, search_term)
+        if ordenacao:
+            resultado = resultado.order_by(*ordenacao)
+        return resultado, False
+
+    def get_changelist(self, request, **kwargs):
+        """
+        Usa a listagem que ordena as pesquisas por relevância.
+        """
+        return ListaPorRelevancia
+
+    def get_readonly_fields(self, request, obj=None):
+        """
+        Na edição, o estoque é somente leitura, pois só muda pelas
+        entradas e saídas.
+        """
+        if obj is not None:
+            return ('estoque',)
+        return ()
+
+    def save_model(self, request, obj, form, change):
+        """
+        Na edição, grava somente os campos alterados, com
+        compare-and-swap na versão do produto, para não sobrescrever
+        o estoque alterado por movimentações concorrentes.
+
+        Se o produto mudou desde a abertura do formulário, nada é
+        gravado e o conflito fica no objeto, para `response_change`.
+        """
+        if change:
+            try:
+                if form.cleaned_data.get('versao_lida') != obj.versao:
+                    raise ConflitoDeVersao(obj)
+                campos = [
+                    campo for campo in form.changed_data
+                    if campo != 'versao_lida'
+                ]
+                atualizar_com_versao(obj, campos, form.initial)
+            except ConflitoDeVersao as erro:
+                obj.conflito = erro
+        else:
+            super().save_model(request, obj, form, change)
+            registrar_cruzamentos(
+                [(obj.pk, False, obj.estoque, obj.estoque_minimo)]
+            )
+            registrar_cadastros([obj])
+            registrar_aberturas([obj])
+
+    def log_change(self, request, obj, message):
+        """
+        Não registra no histórico a edição recusada por conflito.
+        """
+        if getattr(obj, 'conflito', None) is None:
+            return super().log_change(request, obj, message)
+
+    def response_change(self, request, obj):
+        """
+        Numa edição recusada por conflito, exibe o erro no lugar da
+        mensagem de sucesso e abre de novo o formulário, com os dados
+        e a versão atuais.
+        """
+        conflito = getattr(obj, 'conflito', None)
+        if conflito is None:
+            return super().response_change(request, obj)
+        self.message_user(request, str(conflito), level=messages.ERROR)
+        return HttpResponseRedirect(request.path)
+
+    def delete_queryset(self, request, queryset):
+        """
+        Remove os produtos selecionados logicamente, com um único
+        UPDATE, mantendo o histórico de movimentações.
+        """
+        # Numa pesquisa, o queryset junta o índice de busca, que o
+        # UPDATE não inclui; os produtos são filtrados por subconsulta
+        remover(Produto.objects.filter(pk__in=queryset.values('pk')))
+
     def export_as_csv(self, request, queryset):
         """
         Exporta os produtos selecionados como um arquivo CSV.
@@ -148,6 +270,36 @@ class ProdutoAdmin(admin.ModelAdmin):
 
     export_as_xlsx.short_description = 'Exportar XLSX'
 
+    def fragmentar_estoque(self, request, queryset):
+        """
+        Divide o estoque dos produtos selecionados em fragmentos, para
+        produtos com muitas movimentações simultâneas.
+
+        Args:
+            request: Objeto HttpRequest.
+            queryset: Conjunto de objetos selecionados na interface 
+            de administração.
+        """
+        for produto in queryset:
+            fragmentar(produto)
+
+    fragmentar_estoque.short_description = 'Fragmentar estoque'
+
+    def desfragmentar_estoque(self, request, queryset):
+        """
+        Devolve o estoque dos produtos selecionados para uma única
+        linha e remove os fragmentos.
+
+        Args:
+            request: Objeto HttpRequest.
+            queryset: Conjunto de objetos selecionados na interface 
+            de administração.
+        """
+        for produto in queryset:
+            desfragmentar(produto)
+
+    desfragmentar_estoque.short_description = 'Desfragmentar estoque'
+
 
 @admin.register(Categoria)
 class CategoriaAdmin(admin.ModelAdmin):
@@ -165,3 +317,41 @@ class CategoriaAdmin(admin.ModelAdmin):
     """
     list_display = ('__str__',)
     search_fields = ('categoria',)
+    list_filter = (('removido_em', admin.EmptyFieldListFilter),)
+
+    def delete_queryset(self, request, queryset):
+        """
+        Remove as categorias selecionadas logicamente, com um único
+        UPDATE.
+        """
+        remover(queryset)
+
+
+@admin.register(AlertaEstoque)
+class AlertaEstoqueAdmin(admin.ModelAdmin):
+    """
+    Configura a interface de administração do Django para os eventos
+    de estoque mínimo, somente para consulta.
+
+    Attributes:
+        list_display (tuple): Campos a serem exibidos na listagem 
+        do modelo.
+        list_filter (tuple): Campos pelos quais a lista pode ser 
+        filtrada.
+        date_hierarchy (str): Campo usado para navegação por data.
+    """
+    list_display = ('__str__', 'estoque', 'estoque_minimo', 'criado_em')
+    list_filter = ('tipo',)
+    date_hierarchy = 'criado_em'
+
+    def has_add_permission(self, request):
+        """
+        Eventos são gerados somente pelas movimentações.
+        """
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        """
+        Eventos não são editados pelo admin.
+        """
+        return False
@@ -1,5 +1,15 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+from .actions.busca import reinstalar_apos_migracao
 
 
 class ProdutoConfig(AppConfig):
     name = 'produto'
+
+    def ready(self):
+        """
+        Recria o índice de busca ao fim do migrate, se alguma migração
+        removeu os seus gatilhos.
+        """
+        post_migrate.connect(reinstalar_apos_migracao, sender=self)
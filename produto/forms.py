@@ -1,5 +1,5 @@
 from django import forms
-from .models import Produto
+from .models import Categoria, Produto
 
 class ProdutoForm(forms.ModelForm):
     """
@@ -7,7 +7,14 @@ class ProdutoForm(forms.ModelForm):
 
     Este formulário é baseado no modelo Produto e inclui 
     todos os campos do modelo.
+
+    Na edição, o estoque é somente leitura, pois só muda pelas
+    entradas e saídas, e a versão lida é enviada em um campo oculto
+    para detectar edições concorrentes.
     """
+    versao = forms.IntegerField(
+        widget=forms.HiddenInput, required=False, min_value=0
+    )
 
     class Meta:
         """
@@ -22,4 +29,38 @@ class ProdutoForm(forms.ModelForm):
         # Define o modelo que será utilizado no formulário, 
         # que neste caso é o Produto
         model = Produto
-        fields = '__all__' # Inclui todos os campos do modelo Produto
\ No newline at end of file
+        fields = '__all__' # Inclui todos os campos do modelo Produto
+
+    def __init__(self, *args, **kwargs):
+        """
+        Preenche a versão lida e bloqueia o estoque na edição.
+        """
+        super(ProdutoForm, self).__init__(*args, **kwargs)
+        self.fields['categoria'].queryset = Categoria.ativos.all()
+        if self.instance.pk:
+            self.fields['versao'].initial = self.instance.versao
+            self.fields['estoque'].disabled = True
+
+
+class ProdutoAdminForm(forms.ModelForm):
+    """
+    Formulário do produto no admin, com a versão lida em um campo
+    oculto para detectar edições concorrentes, como em `ProdutoForm`.
+    O campo não se chama `versao` porque o admin não aceita campos
+    com o nome de um campo não editável do modelo.
+    """
+    versao_lida = forms.IntegerField(
+        widget=forms.HiddenInput, required=False, min_value=0
+    )
+
+    class Meta:
+        model = Produto
+        fields = '__all__'
+
+    def __init__(self, *args, **kwargs):
+        """
+        Preenche a versão lida na edição.
+        """
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.fields['versao_lida'].initial = self.instance.versao
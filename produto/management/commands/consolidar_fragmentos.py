@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from produto.actions.fragmentos import consolidar
+
+
+class Command(BaseCommand):
+    """
+    Copia a soma dos fragmentos para o campo `estoque` dos produtos
+    fragmentados.
+
+    Pode ser agendado (cron) ou rodar continuamente com --intervalo.
+
+    Exemplo:
+        python manage.py consolidar_fragmentos --intervalo 60
+    """
+    help = 'Consolida o estoque dos produtos fragmentados.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--intervalo', type=int, default=0,
+            help='Segundos entre consolidações; 0 executa uma vez.',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            total = consolidar()
+            self.stdout.write(self.style.SUCCESS(
+                f'{total} produtos fragmentados consolidados.'
+            ))
+            if not options['intervalo']:
+                break
+            time.sleep(options['intervalo'])
@@ -0,0 +1,36 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from produto.actions.alteracoes import LIMITE_PADRAO, ler_alteracoes
+
+
+class Command(BaseCommand):
+    """
+    Escreve as alterações de estoque e cadastro dos produtos
+    posteriores a um cursor, uma por linha em JSON.
+
+    Lê todas as páginas disponíveis e informa, ao final, o cursor a
+    ser usado na próxima execução.
+
+    Exemplo:
+        python manage.py ler_alteracoes --depois 1520 > alteracoes.json
+    """
+    help = 'Escreve as alterações dos produtos posteriores a um cursor.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--depois', type=int, default=0,
+            help='Cursor da execução anterior. Padrão: 0, desde o início.'
+        )
+        parser.add_argument('--lote', type=int, default=LIMITE_PADRAO)
+
+    def handle(self, *args, **options):
+        cursor, mais = options['depois'], True
+        while mais:
+            alteracoes, cursor, mais = ler_alteracoes(
+                cursor, options['lote']
+            )
+            for alteracao in alteracoes:
+                self.stdout.write(json.dumps(alteracao.dict_to_json()))
+        self.stderr.write(f'Próximo cursor: {cursor}')
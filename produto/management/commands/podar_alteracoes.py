@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from produto.actions.alteracoes import podar
+
+
+class Command(BaseCommand):
+    """
+    Remove as alterações de produtos mais antigas que a retenção, em
+    lotes.
+
+    Deve ser agendado (cron) diariamente. A retenção padrão vem de
+    `PRODUTO_ALTERACOES_RETENCAO_DIAS`.
+
+    Exemplo:
+        python manage.py podar_alteracoes --dias 14
+    """
+    help = 'Remove as alterações de produtos mais antigas que a retenção.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int)
+        parser.add_argument('--lote', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        total = podar(options['dias'], options['lote'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} alterações removidas.'
+        ))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from produto.actions.alertas import recalcular
+
+
+class Command(BaseCommand):
+    """
+    Refaz o conjunto de alertas abertos a partir do catálogo.
+
+    Necessário uma vez após a migração, e depois de importações em
+    lote que criam produtos já abaixo do estoque mínimo.
+
+    Exemplo:
+        python manage.py recalcular_alertas
+    """
+    help = 'Refaz os alertas de produtos abaixo do estoque mínimo.'
+
+    def handle(self, *args, **options):
+        total = recalcular()
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} produtos abaixo do estoque mínimo.'
+        ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from produto.actions.busca import instalar
+
+
+class Command(BaseCommand):
+    """
+    Recria o índice de busca de produtos e os gatilhos que o mantêm,
+    indexando de novo todos os produtos.
+
+    O migrate já recria o índice quando uma migração remove os
+    gatilhos, como as que recriam a tabela de produtos no SQLite; o
+    comando serve para reconstruí-lo fora de uma migração.
+
+    Exemplo:
+        python manage.py reconstruir_busca
+    """
+    help = 'Recria o índice de busca de produtos.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            instalar(connection)
+        self.stdout.write(self.style.SUCCESS(
+            'Índice de busca de produtos reconstruído.'
+        ))
@@ -0,0 +1,29 @@
+from django.db import models
+from django.db.models import Q
+
+
+class AtivosManager(models.Manager):
+    """
+    Manager que retorna somente os registros não removidos.
+
+    A remoção de produtos e categorias é lógica: o registro fica na
+    tabela, com a data da remoção, para que a sincronia informe a
+    remoção aos sistemas externos.
+    """
+    def get_queryset(self):
+        """
+        Retorna o conjunto de consultas sem os registros removidos.
+        """
+        return super(AtivosManager, self).get_queryset().filter(
+            removido_em__isnull=True
+        )
+
+    def disponiveis(self):
+        """
+        Retorna os produtos disponíveis para saída: os com estoque e
+        os fragmentados, cujo estoque só é conhecido somando os
+        fragmentos.
+        """
+        return self.get_queryset().filter(
+            Q(estoque__gt=0) | Q(fragmentado=True)
+        )
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.7 on 2026-10-18 19:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produto', '0002_categoria_produto_categoria'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produto',
+            name='fragmentado',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.CreateModel(
+            name='FragmentoEstoque',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('indice', models.PositiveSmallIntegerField()),
+                ('quantidade', models.IntegerField(default=0)),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fragmentos', to='produto.produto')),
+            ],
+            options={
+                'ordering': ('produto', 'indice'),
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='fragmentoestoque',
+            constraint=models.UniqueConstraint(fields=('produto', 'indice'), name='fragmento_produto_indice_unico'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-18 19:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produto', '0004_produto_reservado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produto',
+            name='versao',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.0.7 on 2026-10-18 19:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produto', '0005_produto_versao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertaEstoque',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('a', 'abaixo do mínimo'), ('n', 'normalizado')], max_length=1)),
+                ('estoque', models.IntegerField()),
+                ('estoque_minimo', models.PositiveIntegerField()),
+                ('criado_em', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alertas', to='produto.produto')),
+            ],
+            options={
+                'verbose_name': 'alerta de estoque',
+                'verbose_name_plural': 'alertas de estoque',
+                'ordering': ('-criado_em',),
+            },
+        ),
+        migrations.CreateModel(
+            name='AlertaAberto',
+            fields=[
+                ('produto', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='alerta_aberto', serialize=False, to='produto.produto')),
+                ('alerta', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='produto.alertaestoque')),
+            ],
+            options={
+                'verbose_name': 'alerta aberto',
+                'verbose_name_plural': 'alertas abertos',
+                'ordering': ('alerta',),
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.7 on 2026-10-18 20:06
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produto', '0006_alertas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlteracaoProduto',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('produto', models.IntegerField()),
+                ('tipo', models.CharField(choices=[('m', 'movimentação'), ('c', 'cadastro'), ('e', 'edição')], max_length=1)),
+                ('estoque', models.IntegerField(null=True)),
+                ('variacao', models.IntegerField(null=True)),
+                ('dados', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('criado_em', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'alteração de produto',
+                'verbose_name_plural': 'alterações de produtos',
+                'ordering': ('pk',),
+            },
+        ),
+    ]
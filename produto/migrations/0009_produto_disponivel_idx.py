@@ -0,0 +1,17 @@
+# Generated by Django 5.0.7 on 2026-10-18 20:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produto', '0008_sincronia'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(condition=models.Q(('removido_em__isnull', True), models.Q(('estoque__gt', 0), ('fragmentado', True), _connector='OR')), fields=['produto'], name='produto_disponivel_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.7 on 2026-10-18 21:02
+
+from django.db import migrations
+
+from produto.actions import busca
+
+
+def instalar(apps, schema_editor):
+    busca.instalar(schema_editor.connection)
+
+
+def remover(apps, schema_editor):
+    busca.remover(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produto', '0009_produto_disponivel_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(instalar, remover),
+    ]
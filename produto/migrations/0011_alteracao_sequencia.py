@@ -0,0 +1,30 @@
+# Generated by Django 5.0.7 on 2026-10-18 20:57
+
+from django.db import migrations, models
+
+
+def publicar(apps, schema_editor):
+    # Os registros existentes mantêm a pk como posição no feed, então
+    # os cursores já entregues aos consumidores continuam valendo
+    AlteracaoProduto = apps.get_model('produto', 'AlteracaoProduto')
+    AlteracaoProduto.objects.update(sequencia=models.F('pk'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produto', '0010_busca'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alteracaoproduto',
+            name='sequencia',
+            field=models.BigIntegerField(null=True, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='alteracaoproduto',
+            index=models.Index(condition=models.Q(('sequencia__isnull', True)), fields=['id'], name='alteracao_pendente_idx'),
+        ),
+        migrations.RunPython(publicar, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.0.7 on 2026-10-18 20:59
+
+from django.db import migrations, models
+
+from produto.actions import busca
+
+
+# No SQLite, a alteração dos campos recria as tabelas de produtos e
+# categorias, o que falha com os gatilhos do índice de busca apontando
+# para elas. O índice é removido antes e reconstruído depois.
+
+def instalar_busca(apps, schema_editor):
+    busca.instalar(schema_editor.connection)
+
+
+def remover_busca(apps, schema_editor):
+    busca.remover(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produto', '0011_alteracao_sequencia'),
+    ]
+
+    operations = [
+        migrations.RunPython(remover_busca, instalar_busca),
+        migrations.AlterField(
+            model_name='categoria',
+            name='categoria',
+            field=models.CharField(max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='produto',
+            name='produto',
+            field=models.CharField(max_length=100),
+        ),
+        migrations.AddConstraint(
+            model_name='categoria',
+            constraint=models.UniqueConstraint(condition=models.Q(('removido_em__isnull', True)), fields=('categoria',), name='categoria_nome_unico', violation_error_message='Já existe uma categoria com este nome.'),
+        ),
+        migrations.AddConstraint(
+            model_name='produto',
+            constraint=models.UniqueConstraint(condition=models.Q(('removido_em__isnull', True)), fields=('produto',), name='produto_nome_unico', violation_error_message='Já existe um produto com este nome.'),
+        ),
+        migrations.RunPython(instalar_busca, remover_busca),
+    ]
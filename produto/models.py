@@ -1,10 +1,36 @@
-from django.db import models
+from django.conf import settings
+
+from django.core.cache import cache
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from django.db import models, transaction
+
+from django.db.models import F, Sum
 
 from django.urls import reverse_lazy
 
+from django.utils import timezone
+
+from .managers import AtivosManager
+
 # Create your models here.
 
-class Produto(models.Model):
+class NomeUnicoEntreAtivosMixin:
+    """
+    Valida o nome único entre os registros não removidos também nos
+    formulários, que deixam de fora o campo `removido_em` por ele não
+    ser editável.
+    """
+
+    def validate_constraints(self, exclude=None):
+        # Sem o campo da condição, o Django pula a restrição
+        if exclude:
+            exclude = set(exclude) - {'removido_em'}
+        super().validate_constraints(exclude)
+
+
+class Produto(NomeUnicoEntreAtivosMixin, models.Model):
 
     """
     Representa um produto no sistema de estoque.
@@ -13,7 +39,8 @@ class Produto(models.Model):
         importado (bool): Indica se o produto é importado.
         ncm (str): Nomenclatura Comum do Mercosul, usado para 
         classificação fiscal.
-        produto (str): Nome do produto, deve ser único.
+        produto (str): Nome do produto, único entre os produtos não
+        removidos.
         preco (Decimal): Preço do produto com até 5 dígitos antes do
         ponto decimal e 2 dígitos após o ponto decimal.
         estoque (int): Quantidade de unidades disponíveis em estoque.
@@ -21,10 +48,22 @@ class Produto(models.Model):
         categoria (ForeignKey): Referência à categoria do produto. Pode 
         ser nulo, se a categoria for removida, o campo é definido como 
         null.
+        reservado (PositiveIntegerField): Soma das reservas ativas do
+        produto, mantida pelas operações de reserva.
+        versao (PositiveIntegerField): Versão do cadastro, incrementada
+        a cada edição e usada para detectar edições concorrentes.
+        fragmentado (bool): Indica se o estoque do produto está
+        dividido em fragmentos (FragmentoEstoque), para distribuir as
+        gravações de produtos muito movimentados.
+        atualizado_em (DateTimeField): Data e hora da última alteração
+        do cadastro, usada pela sincronia. As movimentações de estoque
+        não a alteram; elas são informadas pelo feed de alterações.
+        removido_em (DateTimeField): Data e hora da remoção do
+        produto, ou None se ele estiver ativo.
     """
     importado = models.BooleanField(default=False)
     ncm = models.CharField('NCM', max_length=8)
-    produto = models.CharField(max_length=100, unique=True)
+    produto = models.CharField(max_length=100)
     preco = models.DecimalField('preco', max_digits=7, decimal_places=2)
     estoque = models.IntegerField('estoque')
     estoque_minimo = models.PositiveIntegerField('estoque min', default=0)
@@ -33,6 +72,15 @@ class Produto(models.Model):
         on_delete=models.SET_NULL, 
         null=True
     )
+    reservado = models.PositiveIntegerField(default=0, editable=False)
+    versao = models.PositiveIntegerField(default=0, editable=False)
+    fragmentado = models.BooleanField(default=False, editable=False)
+    atualizado_em = models.DateTimeField(auto_now=True)
+    removido_em = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = models.Manager()
+    # Somente os produtos não removidos
+    ativos = AtivosManager()
 
     class Meta:
         """
@@ -42,9 +90,39 @@ class Produto(models.Model):
             ordering (tuple): Define a ordenação padrão das instâncias
             de Produto. No caso, os produtos serão ordenados pelo 
             campo 'produto' em ordem crescente.
+            indexes (list): Índice da sincronia, que lê os produtos
+            em ordem de alteração, e índice parcial dos produtos
+            disponíveis para saída, já em ordem de nome.
+            constraints (list): Nome único entre os produtos não
+            removidos, para que um produto removido possa ser
+            cadastrado de novo.
 
         """
         ordering = ('produto',)
+        constraints = [
+            models.UniqueConstraint(
+                fields=('produto',),
+                condition=models.Q(removido_em__isnull=True),
+                name='produto_nome_unico',
+                violation_error_message='Já existe um produto com este nome.',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=('atualizado_em', 'id'),
+                name='produto_sincronia_idx'
+            ),
+            # Mesma condição do formulário de saída, para que o SQLite
+            # e o PostgreSQL reconheçam o índice
+            models.Index(
+                fields=('produto',),
+                name='produto_disponivel_idx',
+                condition=(
+                    models.Q(removido_em__isnull=True)
+                    & (models.Q(estoque__gt=0) | models.Q(fragmentado=True))
+                ),
+            ),
+        ]
 
     def __str__(self):
         """
@@ -63,8 +141,58 @@ class Produto(models.Model):
             str: A URL para a visualização de detalhe do produto.
         """
         return reverse_lazy('produto:detalhe_produto', kwargs={'pk':self.pk})
+
+    def delete(self, *args, **kwargs):
+        """
+        Remove o produto logicamente, mantendo o registro para a
+        sincronia e o histórico de movimentações.
+        """
+        remover(Produto.objects.filter(pk=self.pk))
     
 
+    @property
+    def estoque_atual(self):
+        """
+        Retorna o estoque físico do produto, incluindo as reservas.
+
+        Para produtos fragmentados, soma os fragmentos e guarda o
+        resultado em cache por `ESTOQUE_FRAGMENTOS_CACHE_SEGUNDOS`, já
+        que o campo `estoque` só é atualizado na consolidação. As
+        quantidades reservadas desses produtos ficam fora dos
+        fragmentos.
+
+        Returns:
+            int: A quantidade em estoque.
+        """
+        if not self.fragmentado:
+            return self.estoque
+        # Nas listagens, as somas da página já foram lidas de uma vez
+        # por `fragmentos.preencher_estoques`
+        total = getattr(self, '_estoque_fragmentos', None)
+        if total is None:
+            total = cache.get(chave_cache_estoque(self.pk))
+        if total is None:
+            total = self.fragmentos.aggregate(
+                total=Sum('quantidade')
+            )['total'] or 0
+            cache.set(
+                chave_cache_estoque(self.pk),
+                total,
+                getattr(settings, 'ESTOQUE_FRAGMENTOS_CACHE_SEGUNDOS', 5)
+            )
+        return total + self.reservado
+
+    @property
+    def estoque_disponivel(self):
+        """
+        Retorna o estoque que pode ser movimentado ou reservado, isto
+        é, o estoque descontadas as reservas ativas.
+
+        Returns:
+            int: A quantidade disponível.
+        """
+        return self.estoque_atual - self.reservado
+
     def dict_to_json(self):
         """
         Retorna um dicionário representando os dados do produto
@@ -82,26 +210,115 @@ class Produto(models.Model):
         return {
             'pk': self.pk,
             'produto': self.produto,
-            'estoque': self.estoque,
+            'estoque': self.estoque_atual,
+            'disponivel': self.estoque_disponivel,
         }
     
 
-class Categoria(models.Model):
+def chave_cache_estoque(pk):
+    """
+    Retorna a chave de cache do estoque somado de um produto
+    fragmentado.
+
+    Args:
+        pk (int): A chave primária do produto.
+
+    Returns:
+        str: A chave usada no cache.
+    """
+    return f'produto:{pk}:estoque'
+
+
+class FragmentoEstoque(models.Model):
+    """
+    Parte do estoque de um produto fragmentado.
+
+    O estoque de produtos muito movimentados pode ser dividido em
+    vários fragmentos. Cada movimentação altera um fragmento escolhido
+    aleatoriamente, em vez de disputar a mesma linha de Produto. O
+    estoque disponível do produto é a soma dos fragmentos, e nenhum
+    fragmento fica negativo.
+
+    Attributes:
+        produto (ForeignKey): Produto ao qual o fragmento pertence.
+        indice (PositiveSmallIntegerField): Número do fragmento,
+        de 0 a N-1.
+        quantidade (IntegerField): Parte do estoque guardada no
+        fragmento.
+    """
+    produto = models.ForeignKey(
+        Produto,
+        on_delete=models.CASCADE,
+        related_name='fragmentos'
+    )
+    indice = models.PositiveSmallIntegerField()
+    quantidade = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ('produto', 'indice')
+        constraints = [
+            models.UniqueConstraint(
+                fields=('produto', 'indice'),
+                name='fragmento_produto_indice_unico'
+            ),
+        ]
+
+    def __str__(self):
+        """
+        Retorna a representação em string do fragmento.
+
+        Returns:
+            str: O produto e o número do fragmento.
+        """
+        return f'{self.produto_id} - {self.indice}'
+
+
+class Categoria(NomeUnicoEntreAtivosMixin, models.Model):
     """
     Representa uma categoria de produtos.
 
     Attributes:
-        categoria (str): O nome da categoria. Deve ser único e
-        tem um tamanho máximo de 100 caracteres.
+        categoria (str): O nome da categoria, único entre as
+        categorias não removidas, com no máximo 100 caracteres.
+        atualizado_em (DateTimeField): Data e hora da última
+        alteração, usada pela sincronia.
+        removido_em (DateTimeField): Data e hora da remoção da
+        categoria, ou None se ela estiver ativa.
 
     Meta:
         ordering (tuple): Define a ordenação padrão para as instâncias
         do modelo pela categoria em ordem alfabética.
+        indexes (list): Índice da sincronia, que lê as categorias em
+        ordem de alteração.
+        constraints (list): Nome único entre as categorias não
+        removidas.
     """
-    categoria = models.CharField(max_length=100, unique=True)
+    categoria = models.CharField(max_length=100)
+    atualizado_em = models.DateTimeField(auto_now=True)
+    removido_em = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = models.Manager()
+    # Somente as categorias não removidas
+    ativos = AtivosManager()
 
     class Meta:
         ordering = ('categoria',)
+        constraints = [
+            models.UniqueConstraint(
+                fields=('categoria',),
+                condition=models.Q(removido_em__isnull=True),
+                name='categoria_nome_unico',
+                violation_error_message=(
+                    'Já existe uma categoria com este nome.'
+                ),
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=('atualizado_em', 'id'),
+                name='categoria_sincronia_idx'
+            ),
+        ]
 
     def __str__(self):
         """
@@ -110,4 +327,216 @@ class Categoria(models.Model):
         Returns:
             str: O nome da categoria.
         """
-        return self.categoria
\ No newline at end of file
+        return self.categoria
+
+    def delete(self, *args, **kwargs):
+        """
+        Remove a categoria logicamente, mantendo o registro para a
+        sincronia. Os produtos continuam apontando para ela.
+        """
+        remover(Categoria.objects.filter(pk=self.pk))
+
+# Define os tipos de evento de estoque mínimo.
+TIPO_ALERTA = (
+    ('a', 'abaixo do mínimo'),
+    ('n', 'normalizado'),
+)
+
+
+class AlertaEstoque(models.Model):
+    """
+    Evento gerado quando o estoque de um produto cruza o estoque
+    mínimo, em qualquer direção.
+
+    Attributes:
+        produto (ForeignKey): Produto que cruzou o estoque mínimo.
+        tipo (CharField): 'a' quando ficou abaixo do mínimo e 'n'
+        quando voltou ao mínimo ou acima.
+        estoque (IntegerField): Estoque logo após o cruzamento.
+        estoque_minimo (PositiveIntegerField): Estoque mínimo na
+        data do evento.
+        criado_em (DateTimeField): Data e hora do evento.
+    """
+    produto = models.ForeignKey(
+        Produto,
+        on_delete=models.CASCADE,
+        related_name='alertas'
+    )
+    tipo = models.CharField(max_length=1, choices=TIPO_ALERTA)
+    estoque = models.IntegerField()
+    estoque_minimo = models.PositiveIntegerField()
+    criado_em = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ('-criado_em',)
+        verbose_name = 'alerta de estoque'
+        verbose_name_plural = 'alertas de estoque'
+
+    def __str__(self):
+        """
+        Retorna a representação em string do evento.
+
+        Returns:
+            str: O produto e o tipo do evento.
+        """
+        return f'{self.produto} - {self.get_tipo_display()}'
+
+
+class AlertaAberto(models.Model):
+    """
+    Conjunto dos produtos atualmente abaixo do estoque mínimo.
+
+    Mantido a cada movimentação pelos eventos de AlertaEstoque, para
+    que a tela de alertas leia uma tabela pequena em vez de comparar
+    estoque e estoque mínimo em todos os produtos.
+
+    Attributes:
+        produto (OneToOneField): Produto abaixo do mínimo.
+        alerta (ForeignKey): Evento que abriu o alerta.
+    """
+    produto = models.OneToOneField(
+        Produto,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='alerta_aberto'
+    )
+    alerta = models.ForeignKey(AlertaEstoque, on_delete=models.CASCADE)
+
+    class Meta:
+        ordering = ('alerta',)
+        verbose_name = 'alerta aberto'
+        verbose_name_plural = 'alertas abertos'
+
+    def __str__(self):
+        """
+        Retorna a representação em string do alerta aberto.
+
+        Returns:
+            str: O nome do produto.
+        """
+        return str(self.produto)
+
+
+# Define os tipos de alteração registrados para os sistemas externos.
+TIPO_ALTERACAO = (
+    ('m', 'movimentação'),
+    ('c', 'cadastro'),
+    ('e', 'edição'),
+)
+
+
+class AlteracaoProduto(models.Model):
+    """
+    Registro de uma alteração de estoque ou de cadastro de um produto,
+    gravado na mesma transação da alteração (outbox).
+
+    Os sistemas externos leem os registros em ordem de sequência a
+    partir do último cursor recebido, em vez de comparar o catálogo
+    inteiro. A sequência é dada na leitura, só aos registros já
+    confirmados, então segue a ordem de confirmação das transações e
+    não a da pk. Os registros antigos são removidos pelo comando
+    `podar_alteracoes`.
+
+    Attributes:
+        produto (IntegerField): A pk do produto. Não é uma chave
+        estrangeira, para que o registro sobreviva ao produto.
+        tipo (CharField): 'm' para movimentação, 'c' para cadastro e
+        'e' para edição.
+        estoque (IntegerField): Estoque após a alteração, nas
+        movimentações e cadastros.
+        variacao (IntegerField): Variação de estoque da movimentação.
+        dados (JSONField): Campos alterados e os novos valores, nas
+        edições e cadastros.
+        criado_em (DateTimeField): Data e hora da alteração.
+        sequencia (BigIntegerField): Posição do registro no feed, dada
+        por `publicar`. Nula enquanto o registro não foi publicado.
+    """
+    id = models.BigAutoField(primary_key=True)
+    produto = models.IntegerField()
+    tipo = models.CharField(max_length=1, choices=TIPO_ALTERACAO)
+    estoque = models.IntegerField(null=True)
+    variacao = models.IntegerField(null=True)
+    dados = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    criado_em = models.DateTimeField(auto_now_add=True, db_index=True)
+    sequencia = models.BigIntegerField(null=True, unique=True)
+
+    class Meta:
+        ordering = ('pk',)
+        verbose_name = 'alteração de produto'
+        verbose_name_plural = 'alterações de produtos'
+        indexes = [
+            models.Index(
+                fields=('id',),
+                condition=models.Q(sequencia__isnull=True),
+                name='alteracao_pendente_idx'
+            ),
+        ]
+
+    def __str__(self):
+        """
+        Retorna a representação em string da alteração.
+
+        Returns:
+            str: A pk, o produto e o tipo da alteração.
+        """
+        return f'{self.pk} - {self.produto} - {self.get_tipo_display()}'
+
+    def dict_to_json(self):
+        """
+        Retorna a alteração como dicionário para o feed de alterações.
+
+        Returns:
+            dict: Os campos da alteração, omitindo os vazios.
+        """
+        dados = {
+            'cursor': self.sequencia,
+            'produto': self.produto,
+            'tipo': self.tipo,
+            'criado_em': self.criado_em.isoformat(),
+        }
+        if self.estoque is not None:
+            dados['estoque'] = self.estoque
+        if self.variacao is not None:
+            dados['variacao'] = self.variacao
+        if self.dados:
+            dados['dados'] = self.dados
+        return dados
+
+
+def remover(queryset):
+    """
+    Remove logicamente os registros de um conjunto de consultas de
+    produtos ou categorias, marcando a data da remoção.
+
+    A data de alteração também é atualizada, para que a remoção
+    apareça na sincronia, e a remoção de produtos é registrada como
+    edição no feed de alterações. Nos produtos a versão é
+    incrementada, para que um formulário aberto antes da remoção seja
+    recusado como conflito.
+
+    Args:
+        queryset (QuerySet): Os produtos ou categorias removidos.
+
+    Returns:
+        int: Número de registros removidos.
+    """
+    agora = timezone.now()
+    with transaction.atomic():
+        pks = list(
+            queryset.filter(removido_em__isnull=True)
+            .values_list('pk', flat=True)
+        )
+        valores = {'removido_em': agora, 'atualizado_em': agora}
+        if queryset.model is Produto:
+            valores['versao'] = F('versao') + 1
+        total = queryset.model.objects.filter(
+            pk__in=pks, removido_em__isnull=True
+        ).update(**valores)
+        if queryset.model is Produto:
+            AlteracaoProduto.objects.bulk_create([
+                AlteracaoProduto(
+                    produto=pk, tipo='e', dados={'removido_em': agora}
+                )
+                for pk in pks
+            ])
+    return total
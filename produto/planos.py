@@ -0,0 +1,43 @@
+from core.paginacao import gerar_cursor
+from core.planos import consulta_critica, pagina_da_listagem
+
+from .actions.alteracoes import consulta_alteracoes
+from .actions.sincronia import EPOCA, consulta_alterados
+from .views import ProdutoList
+
+
+# Consultas críticas dos produtos, verificadas pelo comando
+# verificar_planos. Cada uma é montada pela própria view ou ação
+# indicada, com valores quaisquer nos filtros.
+
+
+@consulta_critica('produto.lista')
+def lista():
+    """
+    Página seguinte da listagem de produtos (ProdutoList).
+    """
+    return pagina_da_listagem(ProdutoList, depois=gerar_cursor('a', 1))
+
+
+@consulta_critica('produto.busca')
+def busca():
+    """
+    Primeira página da busca de produtos (ProdutoList com `search`).
+    """
+    return pagina_da_listagem(ProdutoList, search='lapis preto')
+
+
+@consulta_critica('produto.sincronia')
+def sincronia():
+    """
+    Página da sincronia de produtos a partir de um cursor.
+    """
+    return consulta_alterados('produtos', (EPOCA, 1))[:501]
+
+
+@consulta_critica('produto.alteracoes')
+def alteracoes():
+    """
+    Página do feed de alterações a partir de um cursor.
+    """
+    return consulta_alteracoes(1)[:501]
@@ -1,3 +1,709 @@
-from django.test import TestCase
+import base64
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.sql import emit_post_migrate_signal
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import TokenAPI
+from core.orcamento_consultas import OrcamentoDeConsultasMixin
+from core.paginacao import gerar_cursor, ler_cursor as ler_cursor_lista
+from estoque.actions.arquivamento import registrar_aberturas
+from estoque.actions.baixa_estoque import (
+    EstoqueInsuficiente,
+    registrar_itens,
+)
+from estoque.actions.reprocessamento import reprocessar
+from estoque.actions.reservas import criar_reserva, liberar_reserva
+from estoque.models import Estoque, EstoqueItens
+
+from .actions.alteracoes import ler_alteracoes, podar
+from .actions.autocompletar import (
+    LEITURAS_POR_PAGINA,
+    atualizar_indice,
+    construir_indice,
+    sugerir,
+)
+from .actions.busca import buscar, gatilhos_ausentes
+from .actions.fragmentos import consolidar, desfragmentar, fragmentar
+from .actions.sincronia import alterados_desde, ler_cursor
+from .actions.versao import ConflitoDeVersao, atualizar_com_versao
+from .forms import ProdutoForm
+from .models import AlteracaoProduto, Categoria, FragmentoEstoque, Produto
+
+
+@override_settings(ESTOQUE_FRAGMENTOS=4)
+class EstoqueDosFragmentadosTest(OrcamentoDeConsultasMixin, TestCase):
+    """
+    A listagem de produtos soma os fragmentos de todos os produtos da
+    página de uma vez, e não um produto por linha.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_user('fragmentos'))
+        for i in range(10):
+            fragmentar(Produto.objects.create(
+                produto=f'Produto {i}', ncm='1', preco=1, estoque=10 + i
+            ))
+        cache.clear()
+
+    def test_lista_sem_cache(self):
+        with self.assertMaximoDeConsultas(5):
+            resposta = self.client.get(reverse('produto:lista_produtos'))
+        self.assertEqual(
+            [produto.estoque_atual
+             for produto in resposta.context['object_list']],
+            list(range(10, 20)),
+        )
+
+
+@override_settings(ESTOQUE_FRAGMENTOS=4)
+class MovimentacaoDosFragmentadosTest(TestCase):
+    """
+    As movimentações de um produto fragmentado alteram um fragmento
+    sorteado, e as saídas que ele não cobre retiram dos maiores, sem
+    deixar fragmento negativo.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = User.objects.create_user('fragmentados')
+        self.produto = Produto.objects.create(
+            produto='Caneta', ncm='1', preco=1, estoque=10
+        )
+        # Fragmentos com 3, 3, 2 e 2
+        fragmentar(self.produto)
+
+    def sortear(self, indice):
+        sorteio = mock.patch(
+            'produto.actions.fragmentos.random.randrange',
+            return_value=indice,
+        )
+        sorteio.start()
+        self.addCleanup(sorteio.stop)
+
+    def movimentar(self, movimento, quantidade):
+        with transaction.atomic():
+            estoque = Estoque.objects.create(
+                funcionario=self.usuario, movimento=movimento
+            )
+            registrar_itens([EstoqueItens(
+                estoque=estoque, produto=self.produto, quantidade=quantidade
+            )])
+
+    def fragmentos(self):
+        return list(
+            FragmentoEstoque.objects.filter(produto=self.produto)
+            .order_by('indice').values_list('quantidade', flat=True)
+        )
+
+    def test_entrada_no_fragmento_sorteado(self):
+        self.sortear(2)
+        self.movimentar('e', 5)
+        self.assertEqual(self.fragmentos(), [3, 3, 7, 2])
+
+    def test_saida_pelo_fragmento_sorteado(self):
+        self.sortear(1)
+        self.movimentar('s', 3)
+        self.assertEqual(self.fragmentos(), [3, 0, 2, 2])
+
+    def test_saida_retira_dos_maiores(self):
+        self.sortear(3)
+        self.movimentar('s', 5)
+        fragmentos = self.fragmentos()
+        self.assertEqual(sorted(fragmentos), [0, 1, 2, 2])
+        # Os fragmentos sorteado e menores não foram tocados
+        self.assertEqual(fragmentos[2:], [2, 2])
+
+    def test_saida_recusada(self):
+        self.sortear(0)
+        with self.assertRaises(EstoqueInsuficiente):
+            self.movimentar('s', 11)
+        self.assertEqual(self.fragmentos(), [3, 3, 2, 2])
+        self.assertFalse(EstoqueItens.objects.exists())
+
+    def test_reserva_e_liberacao(self):
+        self.sortear(2)
+        reserva = criar_reserva(self.produto.pk, 4, self.usuario)
+        self.assertEqual(sum(self.fragmentos()), 6)
+        self.assertTrue(all(
+            quantidade >= 0 for quantidade in self.fragmentos()
+        ))
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.reservado, 4)
+
+        liberar_reserva(reserva.pk)
+        self.assertEqual(sum(self.fragmentos()), 10)
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.reservado, 0)
+
+    def test_desfragmentar(self):
+        self.sortear(0)
+        criar_reserva(self.produto.pk, 4, self.usuario)
+        self.movimentar('s', 1)
+
+        desfragmentar(self.produto)
+        self.produto.refresh_from_db()
+        self.assertFalse(self.produto.fragmentado)
+        self.assertEqual(
+            (self.produto.estoque, self.produto.reservado), (9, 4)
+        )
+        self.assertEqual(self.fragmentos(), [])
+
+
+class EdicaoNoAdminTest(TestCase):
+    """
+    A edição de produtos no admin não sobrescreve o estoque nem uma
+    edição concorrente.
+    """
+
+    def setUp(self):
+        self.client.force_login(
+            User.objects.create_superuser('admin', password='x')
+        )
+        self.categoria = Categoria.objects.create(categoria='Papelaria')
+        self.produto = Produto.objects.create(
+            produto='Caneta', ncm='1', preco=1, estoque=10,
+            categoria=self.categoria,
+        )
+        self.url = reverse(
+            'admin:produto_produto_change', args=[self.produto.pk]
+        )
+
+    def editar(self, versao, **valores):
+        dados = {
+            'produto': 'Caneta',
+            'ncm': '1',
+            'preco': '1',
+            'estoque_minimo': '0',
+            'categoria': self.categoria.pk,
+            'versao_lida': versao,
+        }
+        dados.update(valores)
+        return self.client.post(self.url, dados, follow=True)
+
+    def test_formulario_envia_a_versao(self):
+        self.assertContains(
+            self.client.get(self.url), 'name="versao_lida" value="0"'
+        )
+
+    def test_edicao(self):
+        Produto.objects.filter(pk=self.produto.pk).update(estoque=4)
+        resposta = self.editar(0, ncm='2')
+
+        self.assertContains(resposta, 'com sucesso')
+        self.produto.refresh_from_db()
+        self.assertEqual(
+            (self.produto.ncm, self.produto.estoque, self.produto.versao),
+            ('2', 4, 1),
+        )
+
+    def test_conflito(self):
+        Produto.objects.filter(pk=self.produto.pk).update(
+            preco=2, versao=1
+        )
+        resposta = self.editar(0, ncm='2')
+
+        self.assertRedirects(resposta, self.url)
+        mensagens = [
+            str(mensagem) for mensagem in resposta.context['messages']
+        ]
+        self.assertEqual(len(mensagens), 1)
+        self.assertIn('alterado por outro usuário', mensagens[0])
+        self.assertContains(resposta, 'name="versao_lida" value="1"')
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.ncm, '1')
+
+    def test_formulario_aberto_antes_da_remocao(self):
+        lido = Produto.objects.get(pk=self.produto.pk)
+        self.produto.delete()
+
+        resposta = self.editar(0, ncm='2')
+        self.assertContains(resposta, 'alterado por outro usuário')
+        with self.assertRaises(ConflitoDeVersao):
+            atualizar_com_versao(lido, ['ncm'], {'ncm': '1'})
+        url = reverse('produto:editar_produto', args=[self.produto.pk])
+        self.assertEqual(
+            self.client.post(url, {'produto': 'Outra', 'versao': 0})
+            .status_code,
+            404,
+        )
+        self.produto.refresh_from_db()
+        self.assertEqual(
+            (self.produto.produto, self.produto.ncm), ('Caneta', '1')
+        )
+
+
+@override_settings(ESTOQUE_FRAGMENTOS=2)
+class FeedDeAlteracoesTest(TestCase):
+    """
+    O feed entrega as alterações em ordem de publicação, inclusive as
+    de transações confirmadas depois de uma leitura, e registra as
+    alterações feitas fora das movimentações e edições.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.produto = Produto.objects.create(
+            produto='Caneta', ncm='1', preco=1, estoque=10
+        )
+        AlteracaoProduto.objects.bulk_create([
+            AlteracaoProduto(pk=pk, produto=self.produto.pk, tipo='e')
+            for pk in (10, 11, 12)
+        ])
+
+    def ler(self, depois=0, limite=100):
+        alteracoes, cursor, mais = ler_alteracoes(depois, limite)
+        return [alteracao.pk for alteracao in alteracoes], cursor, mais
+
+    def test_paginas(self):
+        pks, cursor, mais = self.ler(limite=2)
+        self.assertEqual((pks, mais), ([10, 11], True))
+        pks, cursor, mais = self.ler(cursor, 2)
+        self.assertEqual((pks, mais), ([12], False))
+        self.assertEqual(self.ler(cursor), ([], cursor, False))
+
+    def test_transacao_confirmada_depois_da_leitura(self):
+        _, cursor, _ = self.ler()
+        # Pk reservada antes da leitura por uma transação que só foi
+        # confirmada depois dela
+        AlteracaoProduto.objects.create(
+            pk=5, produto=self.produto.pk, tipo='e'
+        )
+        AlteracaoProduto.objects.create(produto=self.produto.pk, tipo='e')
+
+        pks, proximo, _ = self.ler(cursor)
+        self.assertEqual(pks, [5, 13])
+        self.assertGreater(proximo, cursor)
+
+    def test_reprocessamento(self):
+        registrar_aberturas([self.produto])
+        Produto.objects.update(estoque=7)
+        AlteracaoProduto.objects.all().delete()
+
+        reprocessar(1)
+        alteracao = AlteracaoProduto.objects.get()
+        self.assertEqual(
+            (alteracao.tipo, alteracao.estoque, alteracao.variacao),
+            ('m', 10, 3),
+        )
+
+    def test_consolidacao(self):
+        fragmentar(self.produto)
+        FragmentoEstoque.objects.filter(indice=0).update(quantidade=1)
+        AlteracaoProduto.objects.all().delete()
+
+        self.assertEqual(consolidar(), 1)
+        self.assertEqual(consolidar(), 0)
+        alteracao = AlteracaoProduto.objects.get()
+        self.assertEqual(
+            (alteracao.tipo, alteracao.dados), ('e', {'estoque': 6})
+        )
+
+    def test_remocao(self):
+        AlteracaoProduto.objects.all().delete()
+        self.produto.delete()
+        self.produto.delete()
+
+        alteracao = AlteracaoProduto.objects.get()
+        self.assertEqual(alteracao.produto, self.produto.pk)
+        self.assertEqual(list(alteracao.dados), ['removido_em'])
+
+    def test_api_e_comando(self):
+        token = TokenAPI.objects.create(
+            usuario=User.objects.create_user('feed')
+        )
+        resposta = self.client.get(
+            reverse('produto:api_alteracoes'), {'limite': 'x'},
+            HTTP_AUTHORIZATION=f'Token {token.chave}',
+        )
+        self.assertEqual(resposta.status_code, 400)
+        resposta = self.client.get(
+            reverse('produto:api_alteracoes'), {'limite': 2},
+            HTTP_AUTHORIZATION=f'Token {token.chave}',
+        )
+        dados = resposta.json()
+        self.assertEqual(len(dados['alteracoes']), 2)
+        self.assertEqual(
+            dados['cursor'], dados['alteracoes'][-1]['cursor']
+        )
+        self.assertTrue(dados['mais'])
+
+        saida = StringIO()
+        call_command(
+            'ler_alteracoes', depois=dados['cursor'], stdout=saida,
+            stderr=StringIO(),
+        )
+        self.assertEqual(len(saida.getvalue().splitlines()), 1)
+
+    def test_poda(self):
+        AlteracaoProduto.objects.filter(pk=10).update(
+            criado_em=timezone.now() - timedelta(days=8)
+        )
+        self.assertEqual(podar(7, tamanho_lote=1), 1)
+        self.assertEqual(self.ler()[0], [11, 12])
+
+
+class SincroniaTest(TestCase):
+    """
+    A sincronia entrega só os registros alterados depois do cursor e
+    antes do horizonte, e os nomes de registros removidos podem ser
+    usados de novo.
+    """
+
+    def setUp(self):
+        self.caneta = Produto.objects.create(
+            produto='Caneta', ncm='1', preco=1, estoque=10
+        )
+        self.lapis = Produto.objects.create(
+            produto='Lápis', ncm='1', preco=1, estoque=10
+        )
+        self.depois = timezone.now() + timedelta(seconds=1)
+        horizonte = mock.patch(
+            'produto.actions.sincronia.horizonte', return_value=self.depois
+        )
+        self.horizonte = horizonte.start()
+        self.addCleanup(horizonte.stop)
+
+    def ler(self, cursor=None, limite=10, modelo='produtos'):
+        registros, proximo, mais = alterados_desde(
+            modelo, ler_cursor(cursor), limite
+        )
+        return [registro['pk'] for registro in registros], proximo, mais
+
+    def test_paginas_e_remocao(self):
+        pks, cursor, mais = self.ler(limite=1)
+        self.assertEqual((pks, mais), ([self.caneta.pk], True))
+        pks, cursor, mais = self.ler(cursor)
+        self.assertEqual((pks, mais), ([self.lapis.pk], False))
+        self.assertEqual(self.ler(cursor), ([], cursor, False))
+
+        self.caneta.delete()
+        self.horizonte.return_value = timezone.now() + timedelta(seconds=1)
+        registros, _, _ = alterados_desde('produtos', ler_cursor(cursor))
+        self.assertEqual(registros, [{
+            'pk': self.caneta.pk,
+            'atualizado_em': Produto.objects.get(
+                pk=self.caneta.pk
+            ).atualizado_em,
+            'removido': True,
+        }])
+
+    def test_nao_passa_do_horizonte(self):
+        _, cursor, _ = self.ler()
+        # Alteração de uma transação aberta durante a leitura, que o
+        # horizonte deixou para a próxima
+        Produto.objects.filter(pk=self.caneta.pk).update(
+            atualizado_em=self.depois
+        )
+        self.assertEqual(self.ler(cursor)[0], [])
+
+        self.horizonte.return_value = self.depois + timedelta(seconds=1)
+        self.assertEqual(self.ler(cursor)[0], [self.caneta.pk])
+
+    def test_nome_de_removido(self):
+        categoria = Categoria.objects.create(categoria='Papelaria')
+        dados = {
+            'ncm': '1', 'preco': '1', 'estoque': '5', 'estoque_minimo': '0',
+            'categoria': categoria.pk,
+        }
+        self.caneta.delete()
+        form = ProdutoForm(data={'produto': 'Caneta', **dados})
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+
+        form = ProdutoForm(data={'produto': 'Lápis', **dados})
+        self.assertFalse(form.is_valid())
+        self.assertIn('Já existe um produto', str(form.errors))
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Produto.objects.create(
+                produto='Lápis', ncm='1', preco=1, estoque=0
+            )
+
+        categoria.delete()
+        Categoria.objects.create(categoria='Papelaria')
+        self.assertEqual(
+            self.ler(modelo='categorias')[0],
+            list(Categoria.objects.order_by('pk').values_list(
+                'pk', flat=True
+            )),
+        )
+
+    def test_api(self):
+        token = TokenAPI.objects.create(
+            usuario=User.objects.create_user('sincronia')
+        )
+        url = reverse('produto:api_sincronia', args=['produtos'])
+        cabecalho = {'HTTP_AUTHORIZATION': f'Token {token.chave}'}
+
+        dados = self.client.get(url, {'limite': 1}, **cabecalho).json()
+        self.assertEqual(
+            ([registro['pk'] for registro in dados['registros']],
+             dados['mais']),
+            ([self.caneta.pk], True),
+        )
+        for cursor in ('x', f'{10 ** 30}-1'):
+            resposta = self.client.get(url, {'cursor': cursor}, **cabecalho)
+            self.assertEqual(resposta.status_code, 400)
+        url = reverse('produto:api_sincronia', args=['estoques'])
+        self.assertEqual(self.client.get(url, **cabecalho).status_code, 400)
+
+
+class BuscaDeProdutosTest(TestCase):
+    """
+    A busca encontra os produtos pelo índice mantido pelos gatilhos,
+    em ordem de relevância, e o migrate recria os gatilhos removidos.
+    """
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('busca'))
+        self.papelaria = Categoria.objects.create(categoria='Caneta')
+        self.lapis = Produto.objects.create(
+            produto='Lápis preto', ncm='1', preco=1, estoque=0,
+            categoria=self.papelaria,
+        )
+        self.caneta = Produto.objects.create(
+            produto='Caneta azul', ncm='2', preco=1, estoque=0
+        )
+
+    def buscar(self, texto):
+        return list(
+            buscar(Produto.ativos.all(), texto).values_list('pk', flat=True)
+        )
+
+    def test_relevancia(self):
+        # O nome pesa mais que a categoria
+        self.assertEqual(
+            self.buscar('caneta'), [self.caneta.pk, self.lapis.pk]
+        )
+        self.assertEqual(self.buscar('lap pret'), [self.lapis.pk])
+        self.assertEqual(self.buscar('lapis azul'), [])
+        self.assertEqual(self.buscar('...'), [])
+
+    def test_paginas_por_relevancia(self):
+        Produto.objects.bulk_create([
+            Produto(produto=f'Caderno {i}', ncm='1', preco=1, estoque=0)
+            for i in range(15)
+        ])
+        url = reverse('produto:lista_produtos')
+        lidos = []
+        parametros = {'search': 'caderno'}
+        while True:
+            pagina = self.client.get(url, parametros).context['page_obj']
+            lidos += [produto.produto for produto in pagina.object_list]
+            if pagina.proximo is None:
+                break
+            parametros['depois'] = pagina.proximo
+        self.assertEqual(len(lidos), 15)
+        self.assertEqual(len(set(lidos)), 15)
+
+    def test_cursor_adulterado(self):
+        url = reverse('produto:lista_produtos')
+        for parametros in ({}, {'search': 'caneta'}):
+            for valor in (None, 'x', [1]):
+                resposta = self.client.get(
+                    url, {**parametros, 'depois': gerar_cursor(valor, 1)}
+                )
+                self.assertEqual(resposta.status_code, 200)
+
+    def test_busca_so_com_pontuacao(self):
+        url = reverse('produto:lista_produtos')
+        for texto in ('*', '(', '"'):
+            resposta = self.client.get(url, {'search': texto})
+            self.assertEqual(resposta.status_code, 200)
+            self.assertEqual(
+                list(resposta.context['page_obj'].object_list), []
+            )
+
+    def test_gatilhos(self):
+        novo = Produto.objects.create(
+            produto='Borracha', ncm='3', preco=1, estoque=0
+        )
+        self.assertEqual(self.buscar('borracha'), [novo.pk])
+
+        novo.produto = 'Apontador'
+        novo.save()
+        self.assertEqual(self.buscar('borracha'), [])
+        self.assertEqual(self.buscar('apontador'), [novo.pk])
+
+        self.papelaria.categoria = 'Escolar'
+        self.papelaria.save()
+        self.assertEqual(self.buscar('escolar'), [self.lapis.pk])
+
+        # A remoção lógica mantém o produto no índice, mas fora dos
+        # ativos
+        novo.delete()
+        self.assertEqual(self.buscar('apontador'), [])
+        self.assertEqual(
+            list(buscar(Produto.objects.all(), 'apontador')), [novo]
+        )
+
+    @skipUnless(connection.vendor == 'sqlite', 'Gatilhos do SQLite.')
+    def test_migrate_recria_gatilhos(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER IF EXISTS produto_busca_incluir')
+        self.assertEqual(
+            gatilhos_ausentes(connection), {'produto_busca_incluir'}
+        )
+        Produto.objects.create(
+            produto='Régua', ncm='4', preco=1, estoque=0
+        )
+        self.assertEqual(self.buscar('regua'), [])
+
+        emit_post_migrate_signal(0, False, 'default')
+        self.assertEqual(gatilhos_ausentes(connection), set())
+        self.assertEqual(len(self.buscar('regua')), 1)
+
+
+class AutocompletarTest(TestCase):
+    """
+    As sugestões vêm do índice de prefixos em memória, que acompanha
+    as alterações pelo horizonte, e são paginadas por cursor.
+    """
+
+    def setUp(self):
+        indice = mock.patch('produto.actions.autocompletar._indice', None)
+        indice.start()
+        self.addCleanup(indice.stop)
+        self.client.force_login(User.objects.create_user('autocompletar'))
+        self.azul = Produto.objects.create(
+            produto='Caneta azul', ncm='9608', preco=1, estoque=5
+        )
+        self.vermelha = Produto.objects.create(
+            produto='Caneta vermelha', ncm='9608', preco=1, estoque=0
+        )
+        self.lapis = Produto.objects.create(
+            produto='Lápis azul', ncm='9609', preco=1, estoque=5
+        )
+
+    def sugerir(self, texto, cursor=None, limite=10, queryset=None):
+        registros, proximo, mais = sugerir(
+            texto, queryset or Produto.ativos.all(),
+            ler_cursor_lista(cursor) if cursor else None,
+            limite,
+        )
+        return [registro['pk'] for registro in registros], proximo, mais
+
+    def test_indice(self):
+        indice = construir_indice()
+
+        def pks(prefixo):
+            return [pk for _, pk in indice.candidatos(prefixo)]
+
+        # Pelo nome, por uma palavra do nome e pelo NCM, cada produto
+        # uma vez
+        self.assertEqual(pks('caneta'), [self.azul.pk, self.vermelha.pk])
+        self.assertEqual(pks('azul'), [self.azul.pk, self.lapis.pk])
+        self.assertEqual(
+            pks('960'), [self.azul.pk, self.vermelha.pk, self.lapis.pk]
+        )
+        self.assertEqual(pks('lapis a'), [self.lapis.pk])
+        self.assertEqual(pks('borracha'), [])
+
+        atualizado = indice.atualizado([
+            (self.azul.pk, 'Borracha', '4016', None),
+            (self.vermelha.pk, 'Caneta vermelha', '9608', timezone.now()),
+        ], indice.lido_em)
+        self.assertEqual(
+            [pk for _, pk in atualizado.candidatos('caneta')], []
+        )
+        self.assertEqual(
+            [pk for _, pk in atualizado.candidatos('borr')], [self.azul.pk]
+        )
+        # O índice anterior não muda
+        self.assertEqual(pks('caneta'), [self.azul.pk, self.vermelha.pk])
+
+    def test_atualizacao_pelo_horizonte(self):
+        inicio = timezone.now()
+        with mock.patch('produto.actions.autocompletar.horizonte',
+                        return_value=inicio):
+            indice = construir_indice()
+        self.assertEqual(indice.lido_em, inicio)
+
+        # Alteração de uma transação que estava aberta na leitura, com
+        # data anterior à leitura seguinte
+        Produto.objects.filter(pk=self.azul.pk).update(
+            produto='Borracha', atualizado_em=inicio
+        )
+        depois = inicio + timedelta(seconds=5)
+        with mock.patch('produto.actions.autocompletar.horizonte',
+                        return_value=depois):
+            indice = atualizar_indice(indice)
+        self.assertEqual(indice.lido_em, depois)
+        self.assertEqual(
+            [pk for _, pk in indice.candidatos('borr')], [self.azul.pk]
+        )
+
+    def test_paginas(self):
+        # Página exatamente cheia: sem próxima
+        self.assertEqual(
+            self.sugerir('caneta', limite=2),
+            ([self.azul.pk, self.vermelha.pk], None, False),
+        )
+        pks, cursor, mais = self.sugerir('9', limite=2)
+        self.assertEqual(
+            (pks, mais), ([self.azul.pk, self.vermelha.pk], True)
+        )
+        self.assertEqual(
+            self.sugerir('9', cursor, limite=2),
+            ([self.lapis.pk], None, False),
+        )
+
+    def test_ultima_leitura_da_pagina(self):
+        Produto.objects.bulk_create([
+            Produto(produto=f'Caneta {i:02}', ncm='1', preco=1, estoque=0)
+            for i in range(LEITURAS_POR_PAGINA)
+        ])
+        disponiveis = Produto.ativos.disponiveis()
+        # As leituras da página acabam nos produtos sem estoque; a
+        # próxima continua de onde parou
+        pks, cursor, mais = self.sugerir(
+            'caneta', limite=1, queryset=disponiveis
+        )
+        self.assertEqual((pks, mais), ([], True))
+        pks, cursor, mais = self.sugerir(
+            'caneta', cursor, limite=1, queryset=disponiveis
+        )
+        self.assertEqual((pks, mais), ([self.azul.pk], True))
+        self.assertEqual(
+            self.sugerir('caneta', cursor, limite=1, queryset=disponiveis),
+            ([], None, False),
+        )
+
+    def test_cursor_de_outra_busca(self):
+        _, cursor, _ = self.sugerir('azul', limite=1)
+        # Um cursor de antes do prefixo recomeça do início; um de
+        # depois, termina a busca
+        self.assertEqual(
+            self.sugerir('caneta', cursor, limite=1)[0], [self.azul.pk]
+        )
+        cursor = gerar_cursor('lapis azul', self.lapis.pk)
+        self.assertEqual(self.sugerir('caneta', cursor), ([], None, False))
+
+    def test_view(self):
+        url = reverse('produto:autocompletar')
+        dados = self.client.get(url, {'q': 'caneta'}).json()
+        self.assertEqual(
+            [registro['pk'] for registro in dados['registros']],
+            [self.azul.pk, self.vermelha.pk],
+        )
+        self.assertEqual(dados['registros'][0]['estoque'], 5)
+        dados = self.client.get(url, {'q': 'caneta', 'disponivel': '1'})
+        self.assertEqual(
+            [registro['pk'] for registro in dados.json()['registros']],
+            [self.azul.pk],
+        )
+
+        forjado = base64.urlsafe_b64encode(b'[1]').decode()
+        for parametros in ({'cursor': 'x'}, {'cursor': forjado},
+                           {'limite': '0'}, {'limite': 'a'}):
+            resposta = self.client.get(url, {'q': 'caneta', **parametros})
+            self.assertEqual(resposta.status_code, 400)
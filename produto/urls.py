@@ -10,6 +10,13 @@ urlpatterns = [
     # URL para a view que lista todos os produtos
     path('', views.ProdutoList.as_view(), name='lista_produtos'),
 
+    # URL para a view que lista os produtos abaixo do estoque mínimo
+    path(
+        'alertas/',
+        views.AlertasEstoque.as_view(),
+        name='alertas_estoque'
+    ),
+
     # URL para a view de detalhe de um produto específico
     path('<int:pk>/', views.detalhe_produto, name='detalhe_produto'),
 
@@ -27,6 +34,19 @@ urlpatterns = [
     # URL para retornar os detalhes do produto em formato JSON
     path('<int:pk>/json/', views.produto_json, name='produto_json'),
 
+    # URL do feed de alterações de estoque e cadastro dos produtos
+    path('api/alteracoes/', views.api_alteracoes, name='api_alteracoes'),
+
+    # URL da sincronia incremental de produtos e categorias
+    path(
+        'api/sincronia/<str:modelo>/',
+        views.api_sincronia,
+        name='api_sincronia'
+    ),
+
+    # URL das sugestões de produtos dos formulários de estoque
+    path('autocompletar/', views.autocompletar, name='autocompletar'),
+
     path('import/csv/', views.import_csv, name='import_csv'),
 
     path('export/csv/', views.export_csv, name='export_csv'),
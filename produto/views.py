@@ -3,14 +3,45 @@ from datetime import datetime
 import io
 
 from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.db import transaction
 from django.shortcuts import render
 from django.views.generic import CreateView, UpdateView, ListView
 from django.http import JsonResponse, HttpResponseRedirect
 from django.urls import reverse
+from django.views.decorators.http import require_GET
 import pandas as pd
 
-from .models import Produto
+from core.decorators import token_required
+from core.paginacao import PaginacaoPorCursor, ler_cursor as ler_cursor_lista
+
+from estoque.actions.arquivamento import registrar_aberturas
+from estoque.actions.historico import historico_produto, ler_cursor
+
+from .models import AlertaAberto, Produto
 from .forms import ProdutoForm
+from produto.actions.alertas import (
+    registrar_cruzamentos,
+    registrar_importados,
+)
+from produto.actions.autocompletar import (
+    LIMITE_MAXIMO as LIMITE_AUTOCOMPLETAR,
+    LIMITE_PADRAO as LIMITE_PADRAO_AUTOCOMPLETAR,
+    sugerir,
+)
+from produto.actions.busca import buscar
+from produto.actions.fragmentos import preencher_estoques
+from produto.actions.alteracoes import (
+    LIMITE_PADRAO,
+    ler_alteracoes,
+    registrar_cadastros,
+)
+from produto.actions.sincronia import (
+    LIMITE_PADRAO as LIMITE_SINCRONIA,
+    alterados_desde,
+    ler_cursor as ler_cursor_sincronia,
+)
+from produto.actions.versao import ConflitoDeVersao, atualizar_com_versao
 from produto.actions.import_xlsx import importar_xlsx as actions_importar_xlsx
 from produto.actions.export_xlsx import exportar_xlsx as actions_exportar_xlsx
 
@@ -29,13 +60,13 @@ def lista_produtos(request):
     """
     nome_template = 'lista_produtos.html'
 
-    # Recupera todos os objetos do modelo Produto
-    objetos = Produto.objects.all()
+    # Recupera todos os produtos não removidos
+    objetos = Produto.ativos.all()
 
-    # Procura por um item no campo de busca
+    # Procura por um item no campo de busca, pelo índice de busca
     search = request.GET.get('search')
     if search:
-        objetos = objetos.filter(produto__icontains=search)
+        objetos = buscar(objetos, search)
     
     # Define o contexto a ser passado para o template
     contexto = {'lista_objetos': objetos}
@@ -44,23 +75,89 @@ def lista_produtos(request):
     return render(request, template_name=nome_template, context=contexto)
 
 
-class ProdutoList(ListView):
+class ProdutoList(PaginacaoPorCursor, ListView):
     """
-    Classe-based view para listar produtos.
+    Classe-based view para listar produtos, paginada por cursor em
+    ordem de nome, ou de relevância quando há uma busca.
     
     Atributos:
         model (Model): O modelo que será utilizado na listagem.
         template_name (str): O nome do template que será renderizado.
         paginate_by (int): Quantidade de itens por página na paginação.
+        campo_cursor (str): Campo de ordenação da paginação.
     """
     model = Produto
+    # Os produtos removidos ficam fora da listagem
+    queryset = Produto.ativos.all()
     template_name = 'lista_produtos.html'
     paginate_by = 10
+    campo_cursor = 'produto'
+
+    def get_queryset(self):
+        """
+        Retorna os produtos da listagem. Com o parâmetro `search`,
+        retorna os encontrados pelo índice de busca, paginados pela
+        relevância.
+        """
+        queryset = super().get_queryset()
+        search = self.request.GET.get('search', '').strip()
+        if not search:
+            return queryset
+        self.campo_cursor = 'relevancia'
+        return buscar(queryset, search)
+
+    def get_context_data(self, **kwargs):
+        """
+        Lê de uma vez o estoque dos produtos fragmentados da página.
+        """
+        context = super().get_context_data(**kwargs)
+        preencher_estoques(context['object_list'])
+        return context
+
+
+class AlertasEstoque(ListView):
+    """
+    Classe-based view para listar os produtos abaixo do estoque
+    mínimo.
+
+    Lê o conjunto de alertas abertos, mantido a cada movimentação,
+    em vez de comparar estoque e estoque mínimo em todos os produtos.
+
+    Atributos:
+        template_name (str): O nome do template que será renderizado.
+        paginate_by (int): Quantidade de itens por página na paginação.
+    """
+    template_name = 'alertas_estoque.html'
+    paginate_by = 10
+
+    def get_queryset(self):
+        """
+        Retorna os alertas abertos com o produto e o evento que abriu
+        o alerta, em uma única consulta.
+        """
+        return AlertaAberto.objects.select_related(
+            'produto', 'alerta'
+        ).order_by('-alerta__criado_em')
+
+    def get_context_data(self, **kwargs):
+        """
+        Lê de uma vez o estoque dos produtos fragmentados da página.
+        """
+        context = super().get_context_data(**kwargs)
+        preencher_estoques(
+            alerta.produto for alerta in context['object_list']
+        )
+        return context
 
 
 def detalhe_produto(request, pk):
     """
-    View para exibir os detalhes de um produto específico.
+    View para exibir os detalhes de um produto específico e uma
+    página do seu histórico de movimentações.
+
+    O histórico é paginado pelo cursor `antes`, que aponta para o
+    último movimento da página anterior, então qualquer página custa
+    o mesmo, sem contagem nem OFFSET.
     
     Args:
         request (HttpRequest): O objeto de solicitação HTTP.
@@ -74,9 +171,18 @@ def detalhe_produto(request, pk):
 
     # Recupera o objeto Produto com a chave primária fornecida
     obj = Produto.objects.get(pk=pk)
+
+    # Recupera a página do histórico a partir do cursor, se houver
+    cursor = ler_cursor(request.GET.get('antes'))
+    historico, proximo = historico_produto(obj.pk, cursor)
     
     # Define o contexto a ser passado para o template
-    contexto = {'objeto': obj}
+    contexto = {
+        'objeto': obj,
+        'historico': historico,
+        'proximo': proximo,
+        'primeira_pagina': cursor is None,
+    }
 
     # Renderiza o template com o contexto
     return render(request, template_name=nome_template, context=contexto)
@@ -93,14 +199,38 @@ class CriarProduto(CreateView):
 
     Atributos:
         model (Model): O modelo que será utilizado na view.
+        queryset (QuerySet): Os produtos editáveis, sem os removidos.
         template_name (str): O nome do template que será renderizado.
         form_class (Form): O formulário que será utilizado 
         para criar o objeto.
     """
     model = Produto
+    queryset = Produto.ativos.all()
     template_name = 'formulario_produto.html'
     form_class = ProdutoForm
 
+    def form_valid(self, form):
+        """
+        Salva o produto, abre o alerta de estoque mínimo se ele já
+        for cadastrado abaixo do mínimo e registra o cadastro para os
+        sistemas externos.
+
+        Args:
+            form (ProdutoForm): O formulário validado.
+
+        Returns:
+            HttpResponse: Redireciona para o produto criado.
+        """
+        with transaction.atomic():
+            resposta = super(CriarProduto, self).form_valid(form)
+            registrar_cruzamentos([(
+                self.object.pk, False,
+                self.object.estoque, self.object.estoque_minimo,
+            )])
+            registrar_cadastros([self.object])
+            registrar_aberturas([self.object])
+        return resposta
+
 
 class EditarProduto(UpdateView):
     """
@@ -108,14 +238,52 @@ class EditarProduto(UpdateView):
 
     Atributos:
         model (Model): O modelo que será utilizado na view.
+        queryset (QuerySet): Os produtos editáveis, sem os removidos.
         template_name (str): O nome do template que será renderizado.
         form_class (Form): O formulário que será utilizado 
         para criar o objeto.
     """
     model = Produto
+    queryset = Produto.ativos.all()
     template_name = 'formulario_produto.html'
     form_class = ProdutoForm
 
+    def form_valid(self, form):
+        """
+        Grava somente os campos alterados, com compare-and-swap na
+        versão do produto.
+
+        Se o produto foi editado por outro usuário depois que o
+        formulário foi aberto, ou se outra edição nos mesmos campos
+        for confirmada durante a gravação, o formulário é exibido de
+        novo com os dados atuais e uma mensagem de conflito.
+
+        Args:
+            form (ProdutoForm): O formulário validado.
+
+        Returns:
+            HttpResponse: Redireciona para o produto, ou exibe o
+            formulário com o conflito.
+        """
+        try:
+            if form.cleaned_data.get('versao') != self.object.versao:
+                raise ConflitoDeVersao(self.object)
+            campos = [
+                campo for campo in form.changed_data if campo != 'versao'
+            ]
+            atualizar_com_versao(self.object, campos, form.initial)
+        except ConflitoDeVersao as erro:
+            self.object = Produto.ativos.filter(pk=self.object.pk).first()
+            if self.object is None:
+                return HttpResponseRedirect(
+                    reverse('produto:lista_produtos')
+                )
+            form = self.get_form_class()(instance=self.object)
+            return self.render_to_response(
+                self.get_context_data(form=form, conflito=str(erro))
+            )
+        return HttpResponseRedirect(self.get_success_url())
+
 
 def produto_json(request, pk):
     """
@@ -139,6 +307,119 @@ def produto_json(request, pk):
     return JsonResponse({'data': data})
 
 
+@require_GET
+@token_required
+def api_alteracoes(request):
+    """
+    Feed JSON das alterações de estoque e de cadastro dos produtos.
+
+    Autenticado pelo cabeçalho `Authorization: Token <chave>`. Recebe
+    `depois`, o cursor devolvido na leitura anterior (0 ou ausente na
+    primeira), e `limite`, a quantidade de alterações por página. O
+    consumidor repete a leitura com o novo cursor enquanto `mais` for
+    verdadeiro.
+
+    Args:
+        request (HttpRequest): O objeto de solicitação HTTP.
+
+    Returns:
+        JsonResponse: As alterações, o próximo cursor e se há mais
+        alterações, ou o erro encontrado.
+    """
+    try:
+        depois = int(request.GET.get('depois', 0))
+        limite = int(request.GET.get('limite', LIMITE_PADRAO))
+    except ValueError:
+        return JsonResponse(
+            {'erro': 'Cursor ou limite inválido.'}, status=400
+        )
+
+    alteracoes, cursor, mais = ler_alteracoes(depois, limite)
+    return JsonResponse({
+        'alteracoes': [alteracao.dict_to_json() for alteracao in alteracoes],
+        'cursor': cursor,
+        'mais': mais,
+    })
+
+
+@require_GET
+@token_required
+def api_sincronia(request, modelo):
+    """
+    Sincronia incremental de produtos ou categorias.
+
+    Autenticado pelo cabeçalho `Authorization: Token <chave>`. Recebe
+    `cursor`, devolvido na leitura anterior (ausente na primeira), e
+    `limite`, a quantidade de registros por página. Registros
+    removidos vêm com `removido` verdadeiro, para que o cliente os
+    apague da sua cópia. O estoque não faz parte da sincronia; suas
+    alterações vêm do feed `api_alteracoes`.
+
+    Args:
+        request (HttpRequest): O objeto de solicitação HTTP.
+        modelo (str): 'produtos' ou 'categorias'.
+
+    Returns:
+        JsonResponse: Os registros alterados, o próximo cursor e se há
+        mais registros, ou o erro encontrado.
+    """
+    try:
+        cursor = ler_cursor_sincronia(request.GET.get('cursor'))
+        limite = int(request.GET.get('limite', LIMITE_SINCRONIA))
+        registros, cursor, mais = alterados_desde(modelo, cursor, limite)
+    except ValueError:
+        return JsonResponse(
+            {'erro': 'Modelo, cursor ou limite inválido.'}, status=400
+        )
+    return JsonResponse({
+        'registros': registros,
+        'cursor': cursor,
+        'mais': mais,
+    })
+
+
+@login_required
+@require_GET
+def autocompletar(request):
+    """
+    Sugere produtos para o campo de produto dos formulários de
+    estoque, a partir do texto digitado.
+
+    Parâmetros:
+        q: O início do nome, de uma palavra do nome ou do NCM.
+        cursor: O cursor retornado na página anterior. Opcional.
+        limite: Quantidade de produtos por página. Opcional.
+        disponivel: Com '1', só os produtos disponíveis para saída.
+
+    Returns:
+        JsonResponse: Os produtos da página, com pk, produto e
+        estoque, o cursor da próxima página e se há mais produtos, ou
+        o erro encontrado.
+    """
+    cursor = request.GET.get('cursor')
+    depois = ler_cursor_lista(cursor) if cursor else None
+    try:
+        limite = int(request.GET.get('limite', LIMITE_PADRAO_AUTOCOMPLETAR))
+    except ValueError:
+        limite = 0
+    if (cursor and depois is None) or not 0 < limite <= LIMITE_AUTOCOMPLETAR:
+        return JsonResponse(
+            {'erro': 'Cursor ou limite inválido.'}, status=400
+        )
+
+    if request.GET.get('disponivel') == '1':
+        queryset = Produto.ativos.disponiveis()
+    else:
+        queryset = Produto.ativos.all()
+    registros, cursor, mais = sugerir(
+        request.GET.get('q', ''), queryset, depois, limite
+    )
+    return JsonResponse({
+        'registros': registros,
+        'cursor': cursor,
+        'mais': mais,
+    })
+
 def save_data(data):
     '''
     Salva os dados no banco.
@@ -163,7 +444,11 @@ def save_data(data):
             estoque_minimo=estoque_minimo,
         )
         aux.append(obj)
-    Produto.objects.bulk_create(aux)
+    with transaction.atomic():
+        produtos = Produto.objects.bulk_create(aux)
+        registrar_importados(produtos)
+        registrar_cadastros(produtos)
+        registrar_aberturas(produtos)
 
 
 def import_csv(request):
@@ -231,7 +516,7 @@ def export_csv(request):
 
     # Obtém todos os produtos do banco de dados, selecionando 
     # apenas os campos definidos no cabeçalho
-    produtos = Produto.objects.all().values_list(*header)
+    produtos = Produto.ativos.all().values_list(*header)
     with open('fix/produtos_exportados.csv', 'w') as csvfile:
         produto_writer = csv.writer(csvfile)
         produto_writer.writerow(header)
@@ -286,7 +571,7 @@ def export_xlsx(request):
     filename_final = f'{_filename[0]}_{data}.{_filename[1]}'
 
     # Obtem os dados dos produtos a serem exportados
-    queryset = Produto.objects.all().values_list(
+    queryset = Produto.ativos.all().values_list(
         'importado',
         'ncm',
         'produto',
@@ -326,6 +611,10 @@ def import_csv_with_pandas(request):
             estoque_minimo = row[5]
         )
         aux.append(obj)
-    Produto.objects.bulk_create(aux)
+    with transaction.atomic():
+        produtos = Produto.objects.bulk_create(aux)
+        registrar_importados(produtos)
+        registrar_cadastros(produtos)
+        registrar_aberturas(produtos)
     messages.success(request, 'Produtos importados com sucesso.')
     return HttpResponseRedirect(reverse('produto:lista_produtos'))
\ No newline at end of file